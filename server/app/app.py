@@ -20,6 +20,7 @@ from app.constants import (
     QUALITY,
     VERSION,
 )
+from app.metadata.AnalysisJobQueue import AnalysisJobQueue
 from app.metadata.RecordedScanTask import RecordedScanTask
 from app.models.Channel import Channel
 from app.models.Program import Program
@@ -43,6 +44,7 @@ from app.routers import (
     VideoStreamsRouter,
 )
 from app.streams.LiveStream import LiveStream
+from app.streams.VideoStream import VideoStream
 from app.utils.edcb.EDCBTuner import EDCBTuner
 from app.utils.FastAPITaskUtil import repeat_every
 
@@ -327,6 +329,10 @@ async def Startup():
         for quality in QUALITY:
             LiveStream(channel.display_channel_id, quality)
 
+    # 録画ファイルのバックグラウンド解析のジョブキューを開始
+    ## 前回のサーバーの終了時に実行待ち・実行中だったジョブもここで再開される
+    await AnalysisJobQueue().start()
+
     # 録画フォルダ監視・メタデータ更新/同期タスクを開始
     ## 録画ファイルの量次第では録画ファイルの更新確認に時間がかかるため、非同期で実行する
     # ref: https://docs.astral.sh/ruff/rules/asyncio-dangling-task/
@@ -378,6 +384,11 @@ async def Shutdown():
     for live_stream in LiveStream.getAllLiveStreams():
         live_stream.setStatus('Offline', 'ライブストリームは Offline です。', True)
 
+    # 全ての録画視聴セッションを終了する
+    ## 一時ファイルに退避していた HLS セグメントもここで削除される
+    for video_stream in VideoStream.getAllVideoStreams():
+        await video_stream.destroy()
+
     # 全てのチューナーインスタンスを終了する (EDCB バックエンドのみ)
     if CONFIG.general.backend == 'EDCB':
         await EDCBTuner.closeAll()
@@ -388,6 +399,10 @@ async def Shutdown():
         await recorded_scan_task.stop()
         recorded_scan_task = None
 
+    # バックグラウンド解析のジョブキューを停止
+    ## 実行中のジョブは次回のサーバー起動時に再開される
+    await AnalysisJobQueue().stop()
+
     # Discord Bot を停止する
     ## Discord 連携が有効な場合のみ停止処理を行う
     if CONFIG.discord.enabled and CONFIG.discord.token:
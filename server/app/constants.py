@@ -30,6 +30,10 @@ ACCOUNT_ICON_DIR = DATA_DIR / 'account-icons'
 THUMBNAILS_DIR = DATA_DIR / 'thumbnails'
 ## サーバー終了時に再起動が必要なことを伝えるロックファイルのパス
 RESTART_REQUIRED_LOCK_PATH = DATA_DIR / 'restart_required.lock'
+## 録画フォルダの一括スキャン結果を保持するスキャンインデックスのパス
+RECORDED_SCAN_INDEX_PATH = DATA_DIR / 'recorded_scan_index.json'
+## 録画ファイルの FFprobe による解析結果のキャッシュがあるディレクトリ
+FFPROBE_CACHE_DIR = DATA_DIR / 'ffprobe-cache'
 
 # スタティックディレクトリ
 STATIC_DIR = BASE_DIR / 'static'
@@ -356,6 +360,13 @@ QUALITY: dict[QUALITY_TYPES, Quality] = {
     ),
 }
 
+# 録画番組のストリーミングでのみ利用できる品質の種類 (型定義)
+## 'original' は再エンコードを行わず、録画ファイルの H.264 / H.265 映像をキーフレーム単位で HLS セグメントに分割してそのまま配信する
+VIDEO_QUALITY_TYPES = Literal[QUALITY_TYPES, 'original']
+
+# 再エンコードを行わずに配信する品質
+VIDEO_PASSTHROUGH_QUALITY: Literal['original'] = 'original'
+
 # ニコニコ OAuth の Client ID
 NICONICO_OAUTH_CLIENT_ID = '4JTJdyBZLwMJwaI7'
 
@@ -0,0 +1,519 @@
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import ClassVar, Literal
+from zoneinfo import ZoneInfo
+
+import anyio
+from tortoise.expressions import F, Q
+
+from app import logging, schemas
+from app.constants import THUMBNAILS_DIR
+from app.metadata.CMSectionsDetector import CMSectionsDetector
+from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.metadata.RecordedAnalysisPipeline import RecordedAnalysisPipeline
+from app.metadata.ThumbnailGenerator import ThumbnailGenerator
+from app.models.AnalysisJob import AnalysisJob
+from app.models.RecordedProgram import RecordedProgram
+from app.models.RecordedVideo import RecordedVideo
+from app.utils.DriveIOLimiter import DriveIOLimiter
+from app.utils.ProcessLimiter import ProcessLimiter, ProcessSemaphore
+
+
+class AnalysisJobQueue:
+    """
+    録画ファイルのバックグラウンド解析 (キーフレーム解析・CM 区間検出・サムネイル生成) のジョブを DB に永続化して実行するジョブキュー
+    - ジョブは analysis_jobs テーブルに記録されるため、サーバーを再起動しても実行待ち・実行中だったジョブは再開される
+    - ProcessLimiter と DriveIOLimiter の制限の範囲内で、優先度の高いジョブから順に並行して実行する
+    - 失敗したジョブは、指数関数的に間隔を空けながら MAX_ATTEMPTS 回まで再試行する
+    """
+
+    # シングルトンインスタンス
+    __instance: ClassVar[AnalysisJobQueue | None] = None
+
+    # ジョブの優先度 (値が大きいジョブほど優先して実行される)
+    ## ユーザーが明示的に再解析を要求した録画ファイル
+    PRIORITY_USER_REQUEST: ClassVar[int] = 200
+    ## 録画が完了したばかりの録画ファイル
+    PRIORITY_NEW_RECORDING: ClassVar[int] = 100
+    ## 一括スキャンやメンテナンス API で見つかった、解析が済んでいない既存の録画ファイル
+    PRIORITY_BACKLOG: ClassVar[int] = 0
+
+    # ジョブを実行する最大の回数 (この回数失敗したジョブは Failed として再試行しない)
+    MAX_ATTEMPTS: ClassVar[int] = 5
+
+    # 失敗したジョブを再試行するまでの待機時間の基準値 (秒)
+    ## 再試行のたびに2倍になり、RETRY_MAX_DELAY_SECONDS 秒で頭打ちになる
+    RETRY_BASE_DELAY_SECONDS: ClassVar[int] = 60
+    RETRY_MAX_DELAY_SECONDS: ClassVar[int] = 6 * 60 * 60  # 6時間
+
+    # 実行可能なジョブがないときに、新たなジョブの追加やジョブの完了を待つ最大の時間 (秒)
+    IDLE_POLL_INTERVAL_SECONDS: ClassVar[int] = 30
+
+    # 次に実行するジョブを選ぶ際に、優先度順に取得する実行待ちのジョブの数
+    ## 先頭のジョブの録画ファイルがあるドライブが使用中の場合は、別のドライブのジョブを先に実行する
+    DISPATCH_CANDIDATE_COUNT: ClassVar[int] = 50
+
+    # 完了したジョブを DB に残しておく期間 (日)
+    COMPLETED_JOB_RETENTION_DAYS: ClassVar[int] = 7
+
+    # スループットの集計対象とする期間 (秒)
+    THROUGHPUT_WINDOW_SECONDS: ClassVar[int] = 60 * 60  # 1時間
+
+
+    def __new__(cls) -> AnalysisJobQueue:
+        """
+        シングルトンインスタンスを作成または取得する
+        既にインスタンスが存在する場合はそれを返し、存在しない場合は新規作成する
+
+        Returns:
+            AnalysisJobQueue: シングルトンインスタンス
+        """
+
+        if cls.__instance is None:
+            cls.__instance = super().__new__(cls)
+        return cls.__instance
+
+
+    def __init__(self) -> None:
+        """
+        バックグラウンド解析のジョブキューを初期化する
+        """
+
+        # 初期化済みの場合は何もしない
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+
+        # ジョブを実行するタスクの状態管理
+        self._dispatcher_task: asyncio.Task[None] | None = None
+        self._job_tasks: set[asyncio.Task[None]] = set()
+
+        # 実行中のジョブの録画ファイルのパス (同じ録画ファイルのジョブを同時に実行しないようにする)
+        self._running_file_paths: set[str] = set()
+
+        # 実行待ちのジョブの有無の確認と追加を直列化するロック
+        ## enqueue() が並行して呼ばれた場合 (録画ファイルの変更の検知と再解析 API の同時実行など) に、
+        ## 同じ録画ファイルの同じ種類の実行待ちのジョブが重複して追加されないようにする
+        self._enqueue_lock = asyncio.Lock()
+
+        # ジョブの追加・完了をジョブの実行を管理するタスクに通知するイベント
+        self._wake_event = asyncio.Event()
+
+        # ジョブ ID ごとに、ジョブの完了 (または失敗) を waitForJobs() に通知するイベント
+        ## waitForJobs() で待たれているジョブのみを保持し、ジョブの実行が終わった時点で取り除く
+        self._job_finished_events: dict[int, asyncio.Event] = {}
+
+        # 初期化済みフラグをセット
+        self._initialized = True
+
+
+    async def start(self) -> None:
+        """
+        ジョブの実行を開始する
+        サーバーの起動前に実行中だったジョブは、途中で中断されているため実行待ちに戻して再開する
+        このメソッドはサーバー起動時に app.py から自動的に呼ばれる
+        """
+
+        # 既に実行中の場合は何もしない
+        if self._dispatcher_task is not None:
+            return
+
+        now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+
+        # 前回のサーバーの終了時に実行中だったジョブを実行待ちに戻す
+        ## 実行中に同じ録画ファイルの同じ種類のジョブが新たに追加されていた場合は、重複しないよう中断されたジョブを取り除く
+        ## 中断されたジョブは失敗したわけではないため、実行開始時に加算した実行回数を元に戻す
+        queued_job_keys = {
+            (queued_job.job_type, queued_job.file_path)
+            for queued_job in await AnalysisJob.filter(status='Queued').only('job_type', 'file_path')
+        }
+        for running_job in await AnalysisJob.filter(status='Running'):
+            if (running_job.job_type, running_job.file_path) in queued_job_keys:
+                await running_job.delete()
+        resumed_count = await AnalysisJob.filter(status='Running').update(
+            status = 'Queued',
+            attempts = F('attempts') - 1,
+            next_run_at = now,
+        )
+        if resumed_count > 0:
+            logging.info(f'Resumed {resumed_count} background analysis jobs interrupted by the previous shutdown.')
+
+        # 保持期間を過ぎた完了済みのジョブを削除する
+        await AnalysisJob.filter(
+            status = 'Completed',
+            finished_at__lt = now - timedelta(days=self.COMPLETED_JOB_RETENTION_DAYS),
+        ).delete()
+
+        self._dispatcher_task = asyncio.create_task(self.__dispatchJobs())
+
+
+    async def stop(self) -> None:
+        """
+        ジョブの実行を停止する
+        実行中のジョブはキャンセルされ、次回のサーバー起動時に再開される
+        このメソッドはサーバー終了時に app.py から自動的に呼ばれる
+        """
+
+        if self._dispatcher_task is None:
+            return
+
+        tasks = [self._dispatcher_task, *self._job_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher_task = None
+        self._job_tasks.clear()
+        self._running_file_paths.clear()
+
+
+    async def enqueue(
+        self,
+        job_type: Literal['RecordedAnalysis', 'KeyFrameAnalysis', 'CMSectionsDetection', 'ThumbnailGeneration'],
+        file_path: str,
+        priority: int,
+    ) -> int:
+        """
+        ジョブを実行待ちとして追加する
+        同じ録画ファイルの同じ種類のジョブが既に実行待ちの場合は新たに追加せず、優先度のみ引き上げる
+
+        Args:
+            job_type (Literal['RecordedAnalysis', 'KeyFrameAnalysis', 'CMSectionsDetection', 'ThumbnailGeneration']): ジョブの種類
+            file_path (str): 解析対象の録画ファイルのパス
+            priority (int): ジョブの優先度
+
+        Returns:
+            int: 追加された (または既に実行待ちだった) ジョブの ID
+        """
+
+        async with self._enqueue_lock:
+            now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+
+            # 既に実行待ちのジョブがあればそのジョブを使う
+            ## 実行中のジョブは実行後に録画ファイルが変更されている可能性があるため、新たに追加する
+            existing_job = await AnalysisJob.filter(job_type=job_type, file_path=file_path, status='Queued').first()
+            if existing_job is not None:
+                if existing_job.priority < priority:
+                    existing_job.priority = priority
+                    await existing_job.save(update_fields=['priority', 'updated_at'])
+                    self._wake_event.set()
+                return existing_job.id
+
+            # 以前に再試行の上限まで失敗したジョブは、新たに追加するジョブで置き換える
+            await AnalysisJob.filter(job_type=job_type, file_path=file_path, status='Failed').delete()
+
+            job = await AnalysisJob.create(
+                job_type = job_type,
+                file_path = file_path,
+                priority = priority,
+                status = 'Queued',
+                attempts = 0,
+                next_run_at = now,
+            )
+            logging.debug(f'{file_path}: Enqueued {job_type} job. (priority: {priority})')
+            self._wake_event.set()
+            return job.id
+
+
+    async def relocateJobs(self, old_file_path: str, new_file_path: str) -> int:
+        """
+        移動・リネームされた録画ファイルの実行待ち・実行中のジョブを、移動先の録画ファイルのジョブとして引き継ぐ
+        実行中のジョブは移動前の録画ファイルが見つからず中断されるため、移動先の録画ファイルに対して同じジョブを新たに追加する
+
+        Args:
+            old_file_path (str): 移動前の録画ファイルのパス
+            new_file_path (str): 移動先の録画ファイルのパス
+
+        Returns:
+            int: 引き継いだジョブの数
+        """
+
+        async with self._enqueue_lock:
+            # 移動先の録画ファイルに同じ種類の実行待ちのジョブが既にある場合は、重複しないよう移動前のジョブを取り除く
+            queued_job_types = await AnalysisJob.filter(file_path=new_file_path, status='Queued').values_list('job_type', flat=True)
+            if len(queued_job_types) > 0:
+                await AnalysisJob.filter(file_path=old_file_path, status='Queued', job_type__in=queued_job_types).delete()
+            relocated_count = await AnalysisJob.filter(file_path=old_file_path, status='Queued').update(file_path=new_file_path)
+            running_jobs = await AnalysisJob.filter(file_path=old_file_path, status='Running')
+        for running_job in running_jobs:
+            await self.enqueue(running_job.job_type, new_file_path, running_job.priority)
+            relocated_count += 1
+        if relocated_count > 0:
+            logging.debug(f'{new_file_path}: Relocated {relocated_count} jobs from {old_file_path}.')
+            self._wake_event.set()
+        return relocated_count
+
+
+    async def waitForJobs(self, job_ids: list[int]) -> None:
+        """
+        指定されたジョブがすべて完了するまで待つ
+        失敗して再試行待ちになったジョブ・再試行の上限まで失敗したジョブも、それ以上待たずに完了したものとして扱う
+
+        Args:
+            job_ids (list[int]): 完了を待つジョブの ID のリスト
+        """
+
+        if len(job_ids) == 0:
+            return
+
+        # DB を確認している間にジョブの実行が終わっても取りこぼさないよう、先にイベントを登録しておく
+        events = {job_id: self._job_finished_events.setdefault(job_id, asyncio.Event()) for job_id in job_ids}
+
+        # 実行中のジョブと、まだ一度も実行されていない実行待ちのジョブが残っていれば、それらの実行が終わるまで待つ
+        ## 以降はジョブの実行が終わるたびに DB を確認し直さず、ジョブ ID ごとのイベントのみで待つ
+        remaining_job_ids = await AnalysisJob.filter(
+            Q(status='Running') | Q(status='Queued', attempts=0),
+            id__in = job_ids,
+        ).values_list('id', flat=True)
+        for job_id in job_ids:
+            # 既に実行が終わっていたジョブのイベントは、以降通知されることがないため取り除く
+            if job_id not in remaining_job_ids:
+                self._job_finished_events.pop(job_id, None)
+        for job_id in remaining_job_ids:
+            await events[job_id].wait()
+
+
+    async def getStatus(self) -> schemas.AnalysisJobQueueStatus:
+        """
+        ジョブキューの状態 (キューの深さとスループット) を取得する
+
+        Returns:
+            schemas.AnalysisJobQueueStatus: ジョブキューの状態
+        """
+
+        now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+        window_started_at = now - timedelta(seconds=self.THROUGHPUT_WINDOW_SECONDS)
+
+        queued_count = await AnalysisJob.filter(status='Queued', next_run_at__lte=now).count()
+        retry_waiting_count = await AnalysisJob.filter(status='Queued', next_run_at__gt=now).count()
+        running_count = await AnalysisJob.filter(status='Running').count()
+        failed_count = await AnalysisJob.filter(status='Failed').count()
+
+        # 直近 THROUGHPUT_WINDOW_SECONDS 秒間に完了したジョブから、スループットと平均処理時間を求める
+        completed_jobs = await AnalysisJob.filter(
+            status = 'Completed',
+            finished_at__gte = window_started_at,
+        ).values_list('started_at', 'finished_at')
+        processing_seconds = [
+            (finished_at - started_at).total_seconds()
+            for started_at, finished_at in completed_jobs
+            if started_at is not None and finished_at is not None
+        ]
+
+        return schemas.AnalysisJobQueueStatus(
+            queued_count = queued_count,
+            retry_waiting_count = retry_waiting_count,
+            running_count = running_count,
+            failed_count = failed_count,
+            completed_count_last_hour = len(completed_jobs),
+            jobs_per_hour = len(completed_jobs) * (60 * 60) / self.THROUGHPUT_WINDOW_SECONDS,
+            average_processing_seconds = sum(processing_seconds) / len(processing_seconds) if len(processing_seconds) > 0 else None,
+        )
+
+
+    async def __dispatchJobs(self) -> None:
+        """
+        実行可能なジョブを優先度順に取り出し、ProcessLimiter の空きがある限り並行して実行する
+        """
+
+        # ProcessLimiter で稼働中のバックグラウンド解析の同時実行数を、CPU の空き具合とライブ視聴・録画番組の視聴のエンコードの状況に応じて制限
+        process_semaphore = ProcessLimiter.getSemaphore('RecordedScanTask')
+
+        while True:
+            try:
+                self._wake_event.clear()
+
+                # 空きができるまで待ってから、その時点で最も優先度の高いジョブを選ぶ
+                ## 空きを待っている間に録画が完了した録画ファイルのジョブが追加されても、既存のジョブより先に実行される
+                await process_semaphore.acquire()
+                try:
+                    job = await self.__claimNextJob()
+                except BaseException:
+                    process_semaphore.release()
+                    raise
+
+                if job is None:
+                    process_semaphore.release()
+                    # 新たなジョブの追加・ジョブの完了・リトライ待ちのジョブの実行可能日時のいずれかまで待つ
+                    wait_seconds = float(self.IDLE_POLL_INTERVAL_SECONDS)
+                    next_job = await AnalysisJob.filter(status='Queued').order_by('next_run_at').first()
+                    if next_job is not None:
+                        now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+                        wait_seconds = min(wait_seconds, max((next_job.next_run_at - now).total_seconds(), 1.0))
+                    try:
+                        await asyncio.wait_for(self._wake_event.wait(), timeout=wait_seconds)
+                    except TimeoutError:
+                        pass
+                    continue
+
+                # ジョブを実行する (ProcessLimiter の ProcessSemaphore はジョブの完了時に解放される)
+                task = asyncio.create_task(self.__runJob(job, process_semaphore))
+                self._job_tasks.add(task)
+                task.add_done_callback(self._job_tasks.discard)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logging.error('Error in background analysis job dispatcher:', exc_info=ex)
+                await asyncio.sleep(self.IDLE_POLL_INTERVAL_SECONDS)
+
+
+    async def __claimNextJob(self) -> AnalysisJob | None:
+        """
+        実行可能なジョブのうち最も優先度の高いものを選び、実行中としてマークする
+        同じ録画ファイルのジョブが実行中の場合や、DriveIOLimiter によって録画ファイルのあるドライブが使用中の場合は、次のジョブを選ぶ
+
+        Returns:
+            AnalysisJob | None: 実行するジョブ (実行可能なジョブがない場合は None)
+        """
+
+        now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+        candidate_jobs = await AnalysisJob.filter(
+            status = 'Queued',
+            next_run_at__lte = now,
+        ).order_by('-priority', 'id').limit(self.DISPATCH_CANDIDATE_COUNT)
+
+        for job in candidate_jobs:
+            if job.file_path in self._running_file_paths:
+                continue
+            if DriveIOLimiter.getScheduler(anyio.Path(job.file_path)).locked():
+                continue
+
+            job.status = 'Running'
+            job.attempts += 1
+            job.started_at = now
+            job.finished_at = None
+            await job.save(update_fields=['status', 'attempts', 'started_at', 'finished_at', 'updated_at'])
+            self._running_file_paths.add(job.file_path)
+            return job
+
+        return None
+
+
+    async def __runJob(self, job: AnalysisJob, process_semaphore: ProcessSemaphore) -> None:
+        """
+        ジョブを実行し、結果を DB に記録する
+        失敗した場合は、MAX_ATTEMPTS 回に達するまで指数関数的に間隔を空けて再試行するよう実行待ちに戻す
+
+        Args:
+            job (AnalysisJob): 実行するジョブ
+            process_semaphore (ProcessSemaphore): ジョブの完了時に解放する ProcessLimiter の ProcessSemaphore
+        """
+
+        file_path = anyio.Path(job.file_path)
+        try:
+            logging.info(f'{file_path}: Starting {job.job_type} job... (attempt {job.attempts}/{self.MAX_ATTEMPTS})')
+            try:
+                # DriveIOLimiter で同一ドライブに対してのバックグラウンド解析の同時実行数を、ドライブの種類と負荷に応じて制限
+                async with DriveIOLimiter.getScheduler(file_path):
+                    await self.__executeJob(job)
+                job.status = 'Completed'
+                job.last_error = None
+                logging.info(f'{file_path}: {job.job_type} job completed.')
+
+            except FileNotFoundError as ex:
+                # 録画ファイルや DB のレコードが既に削除されている場合は再試行しない
+                job.status = 'Failed'
+                job.last_error = f'{type(ex).__name__}: {ex}'
+                logging.warning(f'{file_path}: {job.job_type} job was abandoned because the recorded file no longer exists.')
+
+            except Exception as ex:
+                job.last_error = f'{type(ex).__name__}: {ex}'
+                if job.attempts >= self.MAX_ATTEMPTS:
+                    job.status = 'Failed'
+                    logging.error(f'{file_path}: {job.job_type} job failed {job.attempts} times. Giving up:', exc_info=ex)
+                else:
+                    # 再試行のたびに待機時間を2倍にする
+                    retry_delay = min(self.RETRY_BASE_DELAY_SECONDS * (2 ** (job.attempts - 1)), self.RETRY_MAX_DELAY_SECONDS)
+                    job.status = 'Queued'
+                    job.next_run_at = datetime.now(tz=ZoneInfo('Asia/Tokyo')) + timedelta(seconds=retry_delay)
+                    logging.warning(f'{file_path}: {job.job_type} job failed. Retrying in {retry_delay} seconds:', exc_info=ex)
+
+            job.finished_at = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+            async with self._enqueue_lock:
+                # 実行中に同じ録画ファイルの同じ種類のジョブが新たに追加されていた場合は、重複しないよう再試行せずそちらに任せる
+                if job.status == 'Queued' and await AnalysisJob.filter(
+                    job_type = job.job_type,
+                    file_path = job.file_path,
+                    status = 'Queued',
+                ).exclude(id=job.id).exists():
+                    job.status = 'Failed'
+                    logging.info(f'{file_path}: {job.job_type} job will not be retried because a newer job is already queued.')
+                await job.save(update_fields=['status', 'last_error', 'next_run_at', 'finished_at', 'updated_at'])
+
+        except asyncio.CancelledError:
+            # サーバーの終了時にキャンセルされたジョブは、次回のサーバー起動時に start() で実行待ちに戻される
+            raise
+        except Exception as ex:
+            logging.error(f'{file_path}: Error in background analysis job:', exc_info=ex)
+        finally:
+            self._running_file_paths.discard(job.file_path)
+            process_semaphore.release()
+            # ジョブの完了を通知する
+            self._wake_event.set()
+            job_finished_event = self._job_finished_events.pop(job.id, None)
+            if job_finished_event is not None:
+                job_finished_event.set()
+
+
+    async def __executeJob(self, job: AnalysisJob) -> None:
+        """
+        ジョブの種類に応じた解析処理を実行し、解析結果が保存されたことを確認する
+        各解析処理は失敗しても例外を送出せずにログを出力して終了するため、解析結果が保存されていない場合は例外を送出する
+
+        Args:
+            job (AnalysisJob): 実行するジョブ
+
+        Raises:
+            FileNotFoundError: 録画ファイルまたは DB のレコードが存在しない場合
+            RuntimeError: 解析結果が保存されなかった場合
+        """
+
+        file_path = anyio.Path(job.file_path)
+        if not await file_path.is_file():
+            raise FileNotFoundError(f'{file_path} does not exist.')
+
+        # 録画番組情報を取得
+        db_recorded_video = await RecordedVideo.get_or_none(file_path=job.file_path)
+        if db_recorded_video is None:
+            raise FileNotFoundError(f'RecordedVideo for {file_path} does not exist.')
+        if db_recorded_video.status != 'Recorded':
+            raise RuntimeError(f'{file_path} is not recorded yet. (status: {db_recorded_video.status})')
+        db_recorded_program = await RecordedProgram.all() \
+            .select_related('recorded_video') \
+            .select_related('channel') \
+            .get_or_none(id=db_recorded_video.recorded_program_id)
+        if db_recorded_program is None:
+            raise FileNotFoundError(f'RecordedProgram for {file_path} does not exist.')
+        # RecordedProgram モデルを schemas.RecordedProgram に変換
+        recorded_program = schemas.RecordedProgram.model_validate(db_recorded_program, from_attributes=True)
+
+        if job.job_type == 'RecordedAnalysis':
+            # キーフレーム情報の解析・CM 区間の検出・シークバー用サムネイルと代表サムネイルの生成を行い、それぞれ保存する
+            ## 録画ファイルは1回だけ先頭からシーケンシャルに読み込まれ、そのデータが各解析処理に供給される
+            await RecordedAnalysisPipeline(recorded_program).runAndSave()
+        elif job.job_type == 'KeyFrameAnalysis':
+            await KeyFrameAnalyzer(file_path, db_recorded_video.container_format).analyzeAndSave()
+        elif job.job_type == 'CMSectionsDetection':
+            await CMSectionsDetector(file_path, db_recorded_video.duration).detectAndSave()
+        elif job.job_type == 'ThumbnailGeneration':
+            # 解析済みのキーフレーム情報があれば、各候補フレームをキーフレームの位置から直接抽出する
+            await ThumbnailGenerator.fromRecordedProgram(
+                recorded_program,
+                key_frames = db_recorded_video.key_frames,
+                pat_pmt_index = db_recorded_video.pat_pmt_index,
+            ).generateAndSave()
+
+        # 解析結果が保存されたことを確認する
+        ## CM 区間は検出に失敗した場合も [] が保存されるため確認しない
+        if job.job_type in ('RecordedAnalysis', 'KeyFrameAnalysis'):
+            await db_recorded_video.refresh_from_db(fields=['key_frames'])
+            if not db_recorded_video.has_key_frames:
+                raise RuntimeError('Key frames were not saved.')
+        if job.job_type in ('RecordedAnalysis', 'ThumbnailGeneration'):
+            thumbnail_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{db_recorded_video.file_hash}.webp'
+            thumbnail_tile_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{db_recorded_video.file_hash}_tile.webp'
+            if (not await thumbnail_path.is_file() or
+                (not await thumbnail_tile_path.is_file() and not await thumbnail_tile_path.with_suffix('.jpg').is_file())):
+                raise RuntimeError('Thumbnails were not saved.')
@@ -2,6 +2,7 @@
 import asyncio
 import json
 import time
+from collections.abc import Callable
 from pathlib import Path
 from typing import Literal
 
@@ -12,13 +13,16 @@ from tortoise import Tortoise
 from app import logging, schemas
 from app.config import LoadConfig
 from app.constants import DATABASE_CONFIG, LIBRARY_PATH
+from app.metadata.MP4KeyFrameIndexer import MP4KeyFrameIndexer
+from app.metadata.TSKeyFrameIndexer import TSKeyFrameIndexer
 from app.models.RecordedVideo import RecordedVideo
 
 
 class KeyFrameAnalyzer:
     """
     録画ファイルのキーフレーム情報を解析するクラス
-    ffprobe を使用して、録画ファイルのキーフレーム情報を取得し、DB に保存する
+    録画ファイルのキーフレーム情報を取得し、DB に保存する
+    MPEG-TS 形式は TSKeyFrameIndexer、MPEG-4 形式は MP4KeyFrameIndexer で直接解析し、Fragmented MP4 のみ ffprobe を使う
     解析した情報はストリーミング再生時に活用される
     """
 
@@ -35,18 +39,33 @@ class KeyFrameAnalyzer:
         self.container_format = container_format
 
 
-    async def analyzeAndSave(self) -> None:
+    async def analyzeAndSave(self, chunk_callback: Callable[[memoryview], None] | None = None) -> None:
         """
         録画ファイルのキーフレーム情報を解析し、データベースに保存する
-        ffprobe を使い、録画ファイルから以下の情報を取得して、DB に保存する
+        録画ファイルから以下の情報を取得して、DB に保存する
         - キーフレームの位置 (ファイル内のバイトオフセット)
         - キーフレームの DTS (Decoding Time Stamp)
+        - PAT/PMT の内容が変化する位置と、その時点の PAT/PMT の TS パケット (MPEG-TS 形式のみ)
+        MPEG-TS 形式の場合は TSKeyFrameIndexer、MPEG-4 形式の場合は MP4KeyFrameIndexer で録画ファイルを直接解析する
+
+        Args:
+            chunk_callback (Callable[[memoryview], None] | None, optional): MPEG-TS 形式の場合に、解析のため録画ファイルから読み込んだデータを順に受け取るコールバック (別スレッドから呼ばれる). Defaults to None.
         """
 
         start_time = time.time()
         logging.info(f'{self.file_path}: Analyzing keyframes...')
+
         try:
-            if self.container_format != 'MPEG-TS':
+            # MPEG-TS 形式の場合は、映像の PES ヘッダーと ES の先頭だけを見てキーフレーム情報を抽出する
+            ## ffprobe で全パケットの情報を JSON で出力させてからパースするのと比べ、メモリ使用量が一定に保たれ、解析も高速
+            ## PAT/PMT の位置もキーフレームと同じ1回の読み込みで解析される
+            ## 解析処理は同期 I/O で実装されているため、スレッドで実行する
+            ts_key_frame_indexer: TSKeyFrameIndexer | None = None
+            if self.container_format == 'MPEG-TS':
+                ts_key_frame_indexer = TSKeyFrameIndexer(self.file_path)
+                key_frames = await asyncio.to_thread(ts_key_frame_indexer.index, True, chunk_callback)
+
+            else:
                 # エンコードタスクで psisimux を使用するので、予めオープンできない形式ならばキーフレームの取得を中断する
                 options = [
                     # 1バイトだけ出力
@@ -81,103 +100,17 @@ class KeyFrameAnalyzer:
                     logging.error(f'{self.file_path}: psisimux execution failed with return code {psisimux_process.returncode}. Error: {error_message}')
                     return
 
-            # ffprobe のオプションを設定
-            ## -i: 入力ファイルを指定
-            ## -select_streams v:0: 最初の映像ストリームのみを選択
-            ## -show_packets: パケット情報を表示
-            ## -show_entries packet=pos,dts,flags: パケットの位置, DTS, フラグを表示
-            ## -of json: JSON 形式で出力
-            options = [
-                '-i', str(self.file_path),
-                '-select_streams', 'v:0',
-                '-show_packets',
-                # MPEG-TS 形式でない場合、時間で効率よくシークできるためパケットの位置は出力しない
-                # MPEG-TS 形式でない場合、time_base も出力する
-                '-show_entries', 'packet=pos,dts,flags' if self.container_format == 'MPEG-TS' else 'packet=dts,flags:stream=time_base',
-                '-of', 'json',
-            ]
-
-            # FFprobe プロセスを非同期で実行
-            ffprobe_process = await asyncio.subprocess.create_subprocess_exec(
-                LIBRARY_PATH['FFprobe'],
-                *options,
-                # 明示的に標準入力を無効化しないと、親プロセスの標準入力が引き継がれてしまう
-                stdin = asyncio.subprocess.DEVNULL,
-                # 標準出力・標準エラー出力をパイプで受け取る
-                stdout = asyncio.subprocess.PIPE,
-                stderr = asyncio.subprocess.PIPE,
-            )
-
-            # プロセスの出力を取得
-            stdout, stderr = await ffprobe_process.communicate()
-
-            # 終了コードを確認
-            if ffprobe_process.returncode != 0:
-                error_message = stderr.decode('utf-8', errors='ignore')
-                logging.error(f'{self.file_path}: ffprobe analysis failed with return code {ffprobe_process.returncode}. Error: {error_message}')
-                return
-
-            # ffprobe の出力を JSON としてパース
-            try:
-                ffprobe_json = json.loads(stdout.decode('utf-8'))
-                packets = ffprobe_json['packets']
-                if self.container_format != 'MPEG-TS':
-                    streams = ffprobe_json['streams']
-                else:
-                    streams = None
-            except (json.JSONDecodeError, KeyError) as ex:
-                logging.error(f'{self.file_path}: Failed to parse ffprobe output:', exc_info=ex)
-                return
+                # moov ボックス内のサンプルテーブル (stss/stts) から、キーフレーム情報を抽出する
+                ## mdat 内のフレームデータを読まずに済むため、ffprobe で全パケットを解析するよりはるかに高速
+                mp4_key_frames = await asyncio.to_thread(MP4KeyFrameIndexer(self.file_path).index)
 
-            # MPEG-TS 形式でない場合は time_base を取得
-            if self.container_format != 'MPEG-TS':
-                # time_base が見つからなかった場合
-                if not streams or 'time_base' not in streams[0] or len(streams[0]['time_base'].split('/')) != 2:
-                    logging.error(f'{self.file_path}: No time_base found in streams of ffprobe output.')
-                    return
-                # 分数をパース
-                time_base = (int(streams[0]['time_base'].split('/')[0]), int(streams[0]['time_base'].split('/')[1]))
-                if time_base[0] <= 0 or time_base[1] <= 0:
-                    logging.error(f'{self.file_path}: Invalid time_base in streams of ffprobe output.')
-            else:
-                time_base = None
-
-            # キーフレーム情報を抽出
-            ## pos はファイル内のバイトオフセット
-            ## dts は Decoding Time Stamp (デコード時刻)
-            ## flags に 'K' が含まれているパケットがキーフレーム
-            key_frames: list[schemas.KeyFrame] = []
-            first_dts: int | None = None
-            for packet in packets:
-                # 必要なフィールドが存在することを確認（存在しないパケットは無視）
-                if 'flags' not in packet or 'dts' not in packet or \
-                   (self.container_format == 'MPEG-TS' and 'pos' not in packet):
-                    continue
-                # キーフレームのみを抽出
-                # ただし、最後のフレームが非キーフレームの場合、シーク可能性のために追加
-                if 'K' in packet['flags'] or packet is packets[-1]:
-                    # MPEG-TS 形式の場合
-                    if self.container_format == 'MPEG-TS':
-                        key_frames.append({
-                            'offset': int(packet['pos']),
-                            'dts': int(packet['dts']),
-                        })
-                    # MPEG-TS 形式でない場合
-                    else:
-                        assert time_base is not None
-                        if first_dts is None:
-                            first_dts = int(packet['dts'])
-                        # offset: 添え字と同値とする
-                        # dts: time_base を 90000Hz に変換したもの
-                        key_frames.append({
-                            'offset': len(key_frames),
-                            'dts': (int(packet['dts']) - first_dts) * time_base[0] * 90000 // time_base[1],
-                        })
-
-            # パケットが1つも見つからなかった場合
-            if not packets:
-                logging.error(f'{self.file_path}: No packets found in ffprobe output.')
-                return
+                # サンプルテーブルを持たない Fragmented MP4 などの場合は、ffprobe でキーフレーム情報を解析する
+                if mp4_key_frames is None:
+                    logging.info(f'{self.file_path}: Sample tables are not available. Falling back to ffprobe.')
+                    mp4_key_frames = await self.analyzeKeyFramesWithFFprobe()
+                    if mp4_key_frames is None:
+                        return
+                key_frames = mp4_key_frames
 
             # キーフレームが1つも見つからなかった場合
             if not key_frames:
@@ -190,6 +123,10 @@ class KeyFrameAnalyzer:
             if db_recorded_video is not None:
                 # キーフレーム情報を更新
                 db_recorded_video.key_frames = key_frames
+                # PAT/PMT の位置情報を更新
+                ## 見つからなかった場合は空のままとし、エンコード開始時に従来通りファイルを遡って PAT/PMT を探す
+                if ts_key_frame_indexer is not None:
+                    db_recorded_video.pat_pmt_index = ts_key_frame_indexer.pat_pmt_index
                 await db_recorded_video.save()
                 logging.info(f'{self.file_path}: Keyframe analysis completed. ({len(key_frames)} keyframes found / {time.time() - start_time:.2f} sec)')
             else:
@@ -199,6 +136,116 @@ class KeyFrameAnalyzer:
             logging.error(f'{self.file_path}: Error in keyframe analysis:', exc_info=ex)
 
 
+    async def analyzeKeyFramesWithFFprobe(self) -> list[schemas.KeyFrame] | None:
+        """
+        ffprobe を使い、録画ファイルのキーフレーム情報を解析する
+        サンプルテーブルを持たない Fragmented MP4 の解析に使うほか、ベンチマークでの比較対象としても使う
+
+        Returns:
+            list[schemas.KeyFrame] | None: キーフレーム情報のリスト (解析に失敗した場合は None)
+        """
+
+        # ffprobe のオプションを設定
+        ## -i: 入力ファイルを指定
+        ## -select_streams v:0: 最初の映像ストリームのみを選択
+        ## -show_packets: パケット情報を表示
+        ## -show_entries packet=pos,dts,flags: パケットの位置, DTS, フラグを表示
+        ## -of json: JSON 形式で出力
+        options = [
+            '-i', str(self.file_path),
+            '-select_streams', 'v:0',
+            '-show_packets',
+            # MPEG-TS 形式でない場合、時間で効率よくシークできるためパケットの位置は出力しない
+            # MPEG-TS 形式でない場合、time_base も出力する
+            '-show_entries', 'packet=pos,dts,flags' if self.container_format == 'MPEG-TS' else 'packet=dts,flags:stream=time_base',
+            '-of', 'json',
+        ]
+
+        # FFprobe プロセスを非同期で実行
+        ffprobe_process = await asyncio.subprocess.create_subprocess_exec(
+            LIBRARY_PATH['FFprobe'],
+            *options,
+            # 明示的に標準入力を無効化しないと、親プロセスの標準入力が引き継がれてしまう
+            stdin = asyncio.subprocess.DEVNULL,
+            # 標準出力・標準エラー出力をパイプで受け取る
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.PIPE,
+        )
+
+        # プロセスの出力を取得
+        stdout, stderr = await ffprobe_process.communicate()
+
+        # 終了コードを確認
+        if ffprobe_process.returncode != 0:
+            error_message = stderr.decode('utf-8', errors='ignore')
+            logging.error(f'{self.file_path}: ffprobe analysis failed with return code {ffprobe_process.returncode}. Error: {error_message}')
+            return None
+
+        # ffprobe の出力を JSON としてパース
+        try:
+            ffprobe_json = json.loads(stdout.decode('utf-8'))
+            packets = ffprobe_json['packets']
+            if self.container_format != 'MPEG-TS':
+                streams = ffprobe_json['streams']
+            else:
+                streams = None
+        except (json.JSONDecodeError, KeyError) as ex:
+            logging.error(f'{self.file_path}: Failed to parse ffprobe output:', exc_info=ex)
+            return None
+
+        # MPEG-TS 形式でない場合は time_base を取得
+        if self.container_format != 'MPEG-TS':
+            # time_base が見つからなかった場合
+            if not streams or 'time_base' not in streams[0] or len(streams[0]['time_base'].split('/')) != 2:
+                logging.error(f'{self.file_path}: No time_base found in streams of ffprobe output.')
+                return None
+            # 分数をパース
+            time_base = (int(streams[0]['time_base'].split('/')[0]), int(streams[0]['time_base'].split('/')[1]))
+            if time_base[0] <= 0 or time_base[1] <= 0:
+                logging.error(f'{self.file_path}: Invalid time_base in streams of ffprobe output.')
+        else:
+            time_base = None
+
+        # パケットが1つも見つからなかった場合
+        if not packets:
+            logging.error(f'{self.file_path}: No packets found in ffprobe output.')
+            return None
+
+        # キーフレーム情報を抽出
+        ## pos はファイル内のバイトオフセット
+        ## dts は Decoding Time Stamp (デコード時刻)
+        ## flags に 'K' が含まれているパケットがキーフレーム
+        key_frames: list[schemas.KeyFrame] = []
+        first_dts: int | None = None
+        for packet in packets:
+            # 必要なフィールドが存在することを確認（存在しないパケットは無視）
+            if 'flags' not in packet or 'dts' not in packet or \
+               (self.container_format == 'MPEG-TS' and 'pos' not in packet):
+                continue
+            # キーフレームのみを抽出
+            # ただし、最後のフレームが非キーフレームの場合、シーク可能性のために追加
+            if 'K' in packet['flags'] or packet is packets[-1]:
+                # MPEG-TS 形式の場合
+                if self.container_format == 'MPEG-TS':
+                    key_frames.append({
+                        'offset': int(packet['pos']),
+                        'dts': int(packet['dts']),
+                    })
+                # MPEG-TS 形式でない場合
+                else:
+                    assert time_base is not None
+                    if first_dts is None:
+                        first_dts = int(packet['dts'])
+                    # offset: 添え字と同値とする
+                    # dts: time_base を 90000Hz に変換したもの
+                    key_frames.append({
+                        'offset': len(key_frames),
+                        'dts': (int(packet['dts']) - first_dts) * time_base[0] * 90000 // time_base[1],
+                    })
+
+        return key_frames
+
+
 if __name__ == '__main__':
     # デバッグ用: 録画ファイルのパスを引数に取り、そのファイルのキーフレーム情報を解析する
     # Usage: poetry run python -m app.metadata.KeyFrameAnalyzer /path/to/recorded_file.ts
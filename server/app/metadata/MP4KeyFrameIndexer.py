@@ -0,0 +1,226 @@
+
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO, ClassVar
+
+import anyio
+import numpy as np
+
+from app import logging, schemas
+
+
+class MP4KeyFrameIndexer:
+    """
+    MPEG-4 形式の録画ファイルの moov ボックス内のサンプルテーブルから、映像トラックのキーフレーム情報を抽出するクラス
+    キーフレーム (同期サンプル) は stss、DTS は stts から求められるため、mdat 内のフレームデータを一切読まずに済む
+    moov ボックスにサンプルテーブルを持たない Fragmented MP4 には対応しない (呼び出し側で ffprobe にフォールバックする)
+    """
+
+    # 読み込みを許容する moov ボックスの最大サイズ (バイト)
+    ## 通常は長時間の録画でも数 MB 程度に収まる
+    MAX_MOOV_BOX_SIZE: ClassVar[int] = 256 * 1024 * 1024  # 256MB
+
+
+    def __init__(self, file_path: anyio.Path | Path | str) -> None:
+        """
+        MPEG-4 形式の録画ファイルのキーフレーム情報を抽出するクラスを初期化する
+
+        Args:
+            file_path (anyio.Path | Path | str): 解析対象の録画ファイルのパス
+        """
+
+        self.file_path = str(file_path)
+
+
+    def index(self) -> list[schemas.KeyFrame] | None:
+        """
+        moov ボックス内のサンプルテーブルから、最初の映像トラックのキーフレーム情報を抽出する (同期関数)
+        ffprobe で解析していた頃の形式に合わせ、offset にはキーフレームの添え字、dts には最初のサンプルからの経過時間を 90kHz 単位で格納する
+        最後のサンプルがキーフレームでない場合も、シーク用に追加する
+
+        Returns:
+            list[schemas.KeyFrame] | None: キーフレーム情報のリスト (Fragmented MP4 など、サンプルテーブルから抽出できない場合は None)
+        """
+
+        with open(self.file_path, 'rb') as file:
+            moov = self.readMoovBox(file)
+        if moov is None:
+            logging.debug(f'{self.file_path}: moov box not found.')
+            return None
+
+        # moov ボックス直下に mvex ボックスがある場合は Fragmented MP4 なので、サンプルテーブルは使えない
+        if any(box_type == b'mvex' for box_type, _ in self.iterateBoxes(moov)):
+            logging.debug(f'{self.file_path}: Fragmented MP4 is not supported.')
+            return None
+
+        # 最初の映像トラックを探す
+        for box_type, trak in self.iterateBoxes(moov):
+            if box_type != b'trak':
+                continue
+            mdia = self.findBox(trak, b'mdia')
+            if mdia is None:
+                continue
+            hdlr = self.findBox(mdia, b'hdlr')
+            # hdlr: version/flags (4) + pre_defined (4) + handler_type (4)
+            if hdlr is None or hdlr[8:12] != b'vide':
+                continue
+            mdhd = self.findBox(mdia, b'mdhd')
+            stbl = self.findBox(mdia, b'minf', b'stbl')
+            if mdhd is None or stbl is None:
+                return None
+            return self.__buildKeyFrames(mdhd, stbl)
+
+        logging.debug(f'{self.file_path}: Video track not found.')
+        return None
+
+
+    def __buildKeyFrames(self, mdhd: bytes, stbl: bytes) -> list[schemas.KeyFrame] | None:
+        """
+        映像トラックの mdhd ボックスと stbl ボックスから、キーフレーム情報を組み立てる
+
+        Args:
+            mdhd (bytes): mdhd ボックスのペイロード
+            stbl (bytes): stbl ボックスのペイロード
+
+        Returns:
+            list[schemas.KeyFrame] | None: キーフレーム情報のリスト (サンプルが存在しない場合は None)
+        """
+
+        # タイムスケール (1秒あたりのタイムスタンプの単位数) を取得
+        ## version 0 では creation_time / modification_time が 4 バイト、version 1 では 8 バイト
+        timescale_offset = 20 if mdhd[0] == 1 else 12
+        timescale = struct.unpack_from('>I', mdhd, timescale_offset)[0]
+        if timescale <= 0:
+            return None
+
+        # stts: サンプルごとの DTS の差分 (sample_count, sample_delta) の組
+        stts = self.findBox(stbl, b'stts')
+        if stts is None:
+            return None
+        stts_entry_count = struct.unpack_from('>I', stts, 4)[0]
+        stts_entries = np.frombuffer(stts, dtype='>u4', count=stts_entry_count * 2, offset=8).reshape(-1, 2).astype(np.int64)
+        sample_count = int(stts_entries[:, 0].sum())
+        if sample_count == 0:
+            return None
+
+        # 各サンプルの DTS を求める (最初のサンプルを 0 とする)
+        dts = np.zeros(sample_count, dtype=np.int64)
+        np.cumsum(np.repeat(stts_entries[:, 1], stts_entries[:, 0])[:-1], out=dts[1:])
+
+        # stss: 同期サンプル (キーフレーム) のサンプル番号 (1 から始まる)
+        ## stss ボックスがない場合は、すべてのサンプルが同期サンプル
+        stss = self.findBox(stbl, b'stss')
+        if stss is not None:
+            stss_entry_count = struct.unpack_from('>I', stss, 4)[0]
+            sync_samples = np.frombuffer(stss, dtype='>u4', count=stss_entry_count, offset=8).astype(np.int64) - 1
+            sync_samples = sync_samples[(sync_samples >= 0) & (sync_samples < sample_count)]
+        else:
+            sync_samples = np.arange(sample_count, dtype=np.int64)
+
+        # 最後のサンプルがキーフレームでない場合も、シーク用に追加する
+        if len(sync_samples) == 0 or sync_samples[-1] != sample_count - 1:
+            sync_samples = np.append(sync_samples, sample_count - 1)
+
+        # DTS を 90kHz 単位に変換する
+        key_frame_dts = dts[sync_samples] * 90000 // timescale
+        return [
+            {'offset': index, 'dts': int(key_frame_dts_value)}
+            for index, key_frame_dts_value in enumerate(key_frame_dts)
+        ]
+
+
+    def readMoovBox(self, file: BinaryIO) -> bytes | None:
+        """
+        ファイルのトップレベルのボックスをヘッダーだけ辿り、moov ボックスのペイロードを読み込む
+        mdat ボックスはヘッダーだけを読んで読み飛ばすため、moov ボックスがファイル末尾にあっても高速に読み込める
+
+        Args:
+            file (BinaryIO): MPEG-4 形式のファイル
+
+        Returns:
+            bytes | None: moov ボックスのペイロード (見つからなかった場合は None)
+        """
+
+        file.seek(0, 2)
+        file_size = file.tell()
+        position = 0
+        while position + 8 <= file_size:
+            file.seek(position)
+            header = file.read(16)
+            if len(header) < 8:
+                return None
+            box_size, box_type = struct.unpack_from('>I4s', header, 0)
+            header_size = 8
+            if box_size == 1:
+                if len(header) < 16:
+                    return None
+                box_size = struct.unpack_from('>Q', header, 8)[0]
+                header_size = 16
+            elif box_size == 0:
+                box_size = file_size - position
+            if box_size < header_size:
+                return None
+
+            if box_type == b'moov':
+                payload_size = box_size - header_size
+                if payload_size > self.MAX_MOOV_BOX_SIZE:
+                    return None
+                file.seek(position + header_size)
+                payload = file.read(payload_size)
+                return payload if len(payload) == payload_size else None
+
+            position += box_size
+
+        return None
+
+
+    @staticmethod
+    def iterateBoxes(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+        """
+        ボックスのペイロード内に含まれる子ボックスを順に返す
+
+        Args:
+            data (bytes): 親ボックスのペイロード
+
+        Yields:
+            tuple[bytes, bytes]: (ボックスの種類, ボックスのペイロード)
+        """
+
+        position = 0
+        while position + 8 <= len(data):
+            box_size, box_type = struct.unpack_from('>I4s', data, position)
+            header_size = 8
+            if box_size == 1:
+                if position + 16 > len(data):
+                    return
+                box_size = struct.unpack_from('>Q', data, position + 8)[0]
+                header_size = 16
+            elif box_size == 0:
+                box_size = len(data) - position
+            if box_size < header_size or position + box_size > len(data):
+                return
+            yield box_type, data[position + header_size:position + box_size]
+            position += box_size
+
+
+    @classmethod
+    def findBox(cls, data: bytes, *box_types: bytes) -> bytes | None:
+        """
+        ボックスのペイロード内から、指定された経路の子孫ボックスを探す
+
+        Args:
+            data (bytes): 親ボックスのペイロード
+            *box_types (bytes): 子孫ボックスまでの経路 (ex: b'minf', b'stbl')
+
+        Returns:
+            bytes | None: 見つかったボックスのペイロード (見つからなかった場合は None)
+        """
+
+        current: bytes | None = data
+        for box_type in box_types:
+            assert current is not None
+            current = next((payload for child_type, payload in cls.iterateBoxes(current) if child_type == box_type), None)
+            if current is None:
+                return None
+        return current
@@ -1,20 +1,24 @@
 
+import errno
 import hashlib
 import json
+import os
 import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, ClassVar, Literal, cast
+from typing import Any, BinaryIO, ClassVar, Literal, cast
 from zoneinfo import ZoneInfo
 
+import numpy as np
 import typer
 from biim.mpeg2ts import ts
+from numpy.typing import NDArray
 from pydantic import BaseModel, field_validator
 from rich import print
 
 from app import logging, schemas
 from app.config import Config, LoadConfig
-from app.constants import LIBRARY_PATH
+from app.constants import FFPROBE_CACHE_DIR, LIBRARY_PATH
 from app.metadata.TSInfoAnalyzer import TSInfoAnalyzer
 from app.utils import ClosestMultiple
 from app.utils.TSInformation import TSInformation
@@ -201,15 +205,28 @@ class MetadataAnalyzer:
     FFPROBE_ANALYZE_DURATION_US: ClassVar[str] = str(30 * 1_000_000)
     FFPROBE_PROBESIZE: ClassVar[str] = '80M'
 
-    def __init__(self, recorded_file_path: Path) -> None:
+    # FFprobe による解析結果のキャッシュのフォーマットのバージョン (互換性のない変更を加えた場合はインクリメントする)
+    FFPROBE_CACHE_VERSION: ClassVar[int] = 1
+
+    # ハッシュの算出対象の領域がすべてゼロ埋めされている録画ファイルのハッシュ
+    ## 内容が異なっていてもファイルサイズが同じならキーが衝突してしまうため、FFprobe の解析結果をキャッシュしない
+    ZERO_FILLED_FILE_HASH: ClassVar[str] = hashlib.md5(bytes(1024 * 1024 * 3), usedforsecurity=False).hexdigest()
+
+    def __init__(self, recorded_file_path: Path, use_ffprobe_cache: bool = True) -> None:
         """
         録画ファイルのメタデータを解析するクラスを初期化する
 
         Args:
             recorded_file_path (Path): 録画ファイルのパス
+            use_ffprobe_cache (bool): 録画ファイルのハッシュとファイルサイズが一致する FFprobe の解析結果のキャッシュがあれば使うかどうか (デフォルト: True)
         """
 
         self.recorded_file_path = recorded_file_path
+        self.use_ffprobe_cache = use_ffprobe_cache
+
+        # calculateFingerprint() で算出した録画ファイルのハッシュと、その算出に使った有効な TS データの終了位置
+        ## analyze() で同じ有効な TS データの終了位置からハッシュを算出する場合は、ハッシュを算出し直さずにこの値を使う
+        self._fingerprint: tuple[str, int | None] | None = None
 
 
     def analyze(self) -> schemas.RecordedProgram | None:
@@ -479,8 +496,12 @@ class MetadataAnalyzer:
                     return None
 
         # ファイルハッシュを計算
+        ## FFprobe の解析結果のキャッシュを参照する際に算出したハッシュと同じ範囲が対象であれば、算出し直さずに使う
         try:
-            file_hash = self.__calculateFileHash(end_ts_offset)
+            if self._fingerprint is not None and self._fingerprint[1] == end_ts_offset:
+                file_hash = self._fingerprint[0]
+            else:
+                file_hash = self.__calculateFileHash(end_ts_offset)
         except ValueError:
             logging.warning(f'{self.recorded_file_path}: File size is too small. ignored.')
             return None
@@ -598,6 +619,40 @@ class MetadataAnalyzer:
         return recorded_program
 
 
+    def calculateFingerprint(self) -> str | None:
+        """
+        FFprobe や ariblib による解析を行わずに、analyze() で算出されるものと同じ録画ファイルのハッシュを計算する
+        録画ファイルの移動・リネームを検出する際に、移動前の録画ファイルのレコードと同一の内容かを安価に照合するために使う
+        このメソッドは同期的なため、非同期メソッドから実行する際は asyncio.to_thread() などで実行すること
+
+        Returns:
+            str | None: 録画ファイルのハッシュ (ハッシュを計算できない場合は None が返される)
+        """
+
+        end_ts_offset: int | None = None
+        try:
+            with self.recorded_file_path.open('rb') as f:
+                # analyze() と同様に、MPEG-TS 形式で25%位置のサンプルが全てゼロ埋めされている場合のみ、
+                # ゼロ埋め領域を除いた有効な TS データ領域を対象にハッシュを計算する
+                if f.read(1) == ts.SYNC_BYTE:
+                    file_size = self.recorded_file_path.stat().st_size
+                    f.seek(ClosestMultiple(int(file_size * 0.25), ts.PACKET_SIZE))
+                    sample_size = ClosestMultiple(18 * 1024 * 1024 * 30 // 8, ts.PACKET_SIZE)
+                    # 大半の録画ファイルはサンプルの先頭からゼロ埋めされていないため、まず先頭の 4KB だけを確認する
+                    sample_head = f.read(4096)
+                    if sample_head and not np.any(np.frombuffer(sample_head, dtype=np.uint8)):
+                        sample_data = f.read(sample_size - len(sample_head))
+                        if not np.any(np.frombuffer(sample_data, dtype=np.uint8)):
+                            duration_result = self.__calculateTSFileDuration()
+                            if duration_result is None:
+                                return None
+                            _, end_ts_offset = duration_result
+            self._fingerprint = (self.__calculateFileHash(end_ts_offset), end_ts_offset)
+            return self._fingerprint[0]
+        except (OSError, ValueError):
+            return None
+
+
     def __calculateFileHash(self, end_ts_offset: int | None, chunk_size: int = 1024 * 1024, num_chunks: int = 3) -> str:
         """
         録画ファイルのハッシュを計算する
@@ -664,6 +719,7 @@ class MetadataAnalyzer:
         MediaInfo から再生時間を取得できなかった場合のフォールバックとして利用する
         録画ファイルは録画時にスパースファイル（ゼロ埋めされた領域を含む）となる可能性があるため、
         ファイル末尾はゼロ埋め領域を高速に検出し、実際にデータが存在する部分と区別している
+        TS パケットの同期・PCR の抽出・ゼロ埋め領域の検出は、いずれも NumPy でブロック単位にまとめて行う
 
         Args:
             search_block_size (int): PCR 抽出時に読み込むブロックサイズ (バイト単位). デフォルト: 1MB
@@ -681,60 +737,27 @@ class MetadataAnalyzer:
                 # --- 先頭ブロックからの PCR 抽出 ---
                 # 基本的にはファイル先頭の最初の TS パケットから PCR を取得する
                 f.seek(0)
-                head_data = f.read(search_block_size)
-                # 先頭ブロックが TS 同期バイト (0x47) で始まっていない場合、1バイトずつ探索して
-                # 最初の同期バイトの位置を特定する
-                if head_data and head_data[0] != ts.SYNC_BYTE[0]:
-                    logging.info('Head data is not aligned; searching for sync byte...')
-                    corrected_offset = None
-                    for idx in range(len(head_data)):
-                        if head_data[idx] == ts.SYNC_BYTE[0]:
-                            corrected_offset = idx
-                            break
-                    if corrected_offset is not None:
-                        head_data = head_data[corrected_offset:]
-                    else:
-                        logging.error('Failed to find sync byte in head data.')
-                        return None
-
-                first_timestamp: float | None = None
-                for i in range(0, len(head_data), ts.PACKET_SIZE):
-                    packet = head_data[i : i + ts.PACKET_SIZE]
-                    if len(packet) < ts.PACKET_SIZE:
-                        break
-                    if packet[0] != ts.SYNC_BYTE[0]:
-                        continue
-                    pcr_val = ts.pcr(packet)
-                    if pcr_val is not None:
-                        # PCR 値を ts.HZ (90000Hz) で割り、秒単位に変換する
-                        first_timestamp = pcr_val / ts.HZ
-                        break
+                head_data = np.frombuffer(f.read(search_block_size), dtype=np.uint8)
+                # 先頭ブロックが TS 同期バイト (0x47) で始まっていない場合、188 バイト間隔で同期バイトが並ぶ位置を探し、
+                # 最初の TS パケットの位置を特定する
+                head_offset = self.__findTSPacketOffset(head_data)
+                if head_offset is None:
+                    logging.error('Failed to find sync byte in head data.')
+                    return None
+                if head_offset != 0:
+                    logging.info(f'Head data is not aligned; found sync byte at offset {head_offset}.')
 
-                if first_timestamp is None:
+                head_pcrs = self.__extractPCRs(head_data, head_offset)
+                if len(head_pcrs) == 0:
                     logging.error('Failed to extract first PCR timestamp.')
                     return None
+                # PCR 値を ts.HZ (90000Hz) で割り、秒単位に変換する
+                first_timestamp = int(head_pcrs[0]) / ts.HZ
 
-                # --- 末尾のゼロ埋め領域の境界をバイナリサーチで検出 ---
+                # --- 末尾のゼロ埋め領域の境界を検出 ---
                 # TS ファイルは録画後にゼロ埋め領域が存在する場合があるため、
                 # 正常なデータが存在する最後のオフセット (valid_data_end) を求める
-                block_check_size = 4096  # ゼロ埋め判定用の小ブロックサイズ (4KB)
-                low = 0
-                high = file_size
-                zero_boundary = file_size  # もしゼロブロックが見つからなければ有効データはファイル全体とする
-
-                while low <= high:
-                    mid = (low + high) // 2
-                    f.seek(mid)
-                    candidate = f.read(block_check_size)
-                    if candidate and all(byte == 0 for byte in candidate):
-                        # candidate が全て 0x00 ならば、ゼロ埋め領域の一部と見なし、境界を mid に更新
-                        zero_boundary = mid
-                        high = mid - 1
-                    else:
-                        low = mid + 1
-
-                # valid_data_end はゼロ埋めが始まる境界、つまり有効データの終了位置
-                valid_data_end = zero_boundary if zero_boundary < file_size else file_size
+                valid_data_end = self.__findValidDataEnd(f, file_size, search_block_size)
 
                 # --- 末尾領域から最後の有効な PCR の取得 ---
                 # 有効データ領域の終端から search_block_size 分の範囲を読み込み、TS パケット単位で同期を取る
@@ -744,32 +767,19 @@ class MetadataAnalyzer:
                 # TS パケット境界に合わせるため、start_offset を ts.PACKET_SIZE の倍数に補正
                 start_offset = (start_offset // ts.PACKET_SIZE) * ts.PACKET_SIZE
                 f.seek(start_offset)
-                tail_chunk = f.read(valid_data_end - start_offset)
+                tail_data = np.frombuffer(f.read(valid_data_end - start_offset), dtype=np.uint8)
 
                 # --- TS パケット同期の調整 ---
-                # 読み込んだ tail_chunk の先頭が TS 同期バイト (0x47) でない場合、同期位置を調整する
-                offset_in_chunk = 0
-                if tail_chunk and tail_chunk[0] != ts.SYNC_BYTE[0]:
-                    for idx in range(len(tail_chunk)):
-                        if tail_chunk[idx] == ts.SYNC_BYTE[0]:
-                            offset_in_chunk = idx
-                            break
-
-                # --- tail_chunk 内の TS パケットから有効な PCR 値を収集 ---
-                valid_pcrs: list[float] = []
-                for j in range(offset_in_chunk, len(tail_chunk) - ts.PACKET_SIZE + 1, ts.PACKET_SIZE):
-                    packet = tail_chunk[j : j + ts.PACKET_SIZE]
-                    if packet[0] != ts.SYNC_BYTE[0]:
-                        continue
-                    pcr_val = ts.pcr(packet)
-                    if pcr_val is not None:
-                        valid_pcrs.append(pcr_val / ts.HZ)
+                # 読み込んだ tail_data の先頭が TS パケットの境界でない場合、同期位置を調整する
+                tail_offset = self.__findTSPacketOffset(tail_data)
 
-                if not valid_pcrs:
+                # --- tail_data 内の TS パケットから最後の有効な PCR 値を取得 ---
+                tail_pcrs = self.__extractPCRs(tail_data, tail_offset) if tail_offset is not None else None
+                if tail_pcrs is None or len(tail_pcrs) == 0:
                     logging.error('Failed to extract last PCR in tail region.')
                     return None
 
-                last_timestamp = valid_pcrs[-1]
+                last_timestamp = int(tail_pcrs[-1]) / ts.HZ
 
                 # --- PCR ラップアラウンドの補正 ---
                 # もし末尾の PCR が先頭の PCR より小さい場合は、PCR のラップアラウンドが発生しているとみなし、
@@ -790,6 +800,137 @@ class MetadataAnalyzer:
             return None
 
 
+    @staticmethod
+    def __findTSPacketOffset(data: NDArray[np.uint8], check_packet_count: int = 8) -> int | None:
+        """
+        データ内で TS 同期バイト (0x47) が 188 バイト間隔で check_packet_count 個連続して並ぶ最初の位置を探す
+        ペイロード中に偶然現れた 0x47 を TS パケットの先頭と誤認しないよう、1バイトずつではなく 188 バイト間隔で判定する
+
+        Args:
+            data (NDArray[np.uint8]): TS データ
+            check_packet_count (int): 同期バイトが連続して並んでいることを確認する TS パケットの数
+
+        Returns:
+            int | None: 最初の TS パケットの位置 (見つからなかった場合は None)
+        """
+
+        # データが短い場合は、確認する TS パケットの数を減らす
+        packet_count = min(check_packet_count, len(data) // ts.PACKET_SIZE)
+        if packet_count < 1:
+            return None
+
+        # 後続の TS パケットの同期バイトがデータ内に収まる範囲で、同期バイトの位置を候補とする
+        ## 通常は先頭 188 バイト以内に最初の TS パケットがあるため、まずその範囲のみを確認する
+        ## 先頭に TS パケットではないデータが 188 バイト以上付いている場合に限り、データ全体から探す
+        search_end = len(data) - ts.PACKET_SIZE * (packet_count - 1)
+        for candidate_end in (min(ts.PACKET_SIZE, search_end), search_end):
+            candidates = np.flatnonzero(data[:candidate_end] == ts.SYNC_BYTE[0])
+            # 188 バイト間隔で同期バイトが並んでいない候補を順に取り除く
+            for packet_index in range(1, packet_count):
+                candidates = candidates[data[candidates + ts.PACKET_SIZE * packet_index] == ts.SYNC_BYTE[0]]
+            if len(candidates) > 0:
+                return int(candidates[0])
+        return None
+
+
+    @staticmethod
+    def __extractPCRs(data: NDArray[np.uint8], offset: int) -> NDArray[np.int64]:
+        """
+        offset から始まる TS パケット列のうち、PCR を含む TS パケットの PCR 値 (90kHz 単位) をまとめて抽出する
+        アダプテーションフィールドを持ち、PCR フラグが立っている TS パケットをマスクで選び出し、PCR_base (33bit) を組み立てる
+
+        Args:
+            data (NDArray[np.uint8]): TS データ
+            offset (int): 最初の TS パケットの位置
+
+        Returns:
+            NDArray[np.int64]: PCR 値の配列 (ファイル内の出現順)
+        """
+
+        packet_count = (len(data) - offset) // ts.PACKET_SIZE
+        packets = data[offset:offset + packet_count * ts.PACKET_SIZE].reshape(packet_count, ts.PACKET_SIZE)
+
+        # 同期バイトで始まり、adaptation_field_control でアダプテーションフィールドがあることが示されていて、
+        # adaptation_field_length が 0 より大きく、PCR_flag が立っている TS パケットのみを選ぶ
+        mask = ((packets[:, 0] == ts.SYNC_BYTE[0]) &
+                ((packets[:, 3] & 0x20) != 0) &
+                (packets[:, 4] > 0) &
+                ((packets[:, 5] & 0x10) != 0))
+        pcr_bytes = packets[mask, 6:11].astype(np.int64)
+
+        # PCR_base (33bit) を組み立てる (PCR_extension は 27MHz 単位の端数のため使わない)
+        return ((pcr_bytes[:, 0] << 25) |
+                (pcr_bytes[:, 1] << 17) |
+                (pcr_bytes[:, 2] << 9) |
+                (pcr_bytes[:, 3] << 1) |
+                (pcr_bytes[:, 4] >> 7))
+
+
+    @staticmethod
+    def __findValidDataEnd(f: BinaryIO, file_size: int, search_block_size: int, block_check_size: int = 4096) -> int:
+        """
+        録画ファイル末尾のゼロ埋め領域を除いた、有効なデータの終了位置 (最後の 0 でないバイトの次の位置) を求める
+        1. SEEK_HOLE / SEEK_DATA に対応したファイルシステムでは、末尾のホール (ディスク上に実体のない領域) を読まずに除外する
+        2. 残りの領域の末尾 search_block_size バイトを読み込み、0 でない最後のバイトを逆方向に探す
+        3. 末尾ブロックがすべて 0 の場合 (実際に 0 が書き込まれた広いゼロ埋め領域がある場合) は、4KB ずつの二分探索で境界を求める
+
+        Args:
+            f (BinaryIO): 録画ファイルのファイルオブジェクト
+            file_size (int): 録画ファイルのサイズ
+            search_block_size (int): 逆方向に探索する末尾ブロックのサイズ (バイト単位)
+            block_check_size (int): 二分探索時にゼロ埋めかどうかを判定するブロックのサイズ (バイト単位)
+
+        Returns:
+            int: 有効なデータの終了位置
+        """
+
+        # 末尾のホールの開始位置を求める
+        ## 最初のホールより後ろにデータがない場合のみ、そのホールを末尾のゼロ埋め領域とみなす
+        data_end = file_size
+        if hasattr(os, 'SEEK_HOLE') and hasattr(os, 'SEEK_DATA'):
+            try:
+                hole_offset = os.lseek(f.fileno(), 0, os.SEEK_HOLE)
+                if hole_offset < file_size:
+                    try:
+                        os.lseek(f.fileno(), hole_offset, os.SEEK_DATA)
+                    except OSError as ex:
+                        # ENXIO: ホールより後ろにデータがない
+                        if ex.errno == errno.ENXIO:
+                            data_end = hole_offset
+            except OSError:
+                # SEEK_HOLE / SEEK_DATA に対応していないファイルシステム
+                pass
+
+        # 有効データ領域の末尾ブロックから、0 でない最後のバイトを探す
+        block_start = max(data_end - search_block_size, 0)
+        f.seek(block_start)
+        ## 逆順に並べたブロックで最初に 0 でないバイトを argmax で探す (bool 配列の argmax は最初の True で打ち切られる)
+        reversed_block = np.frombuffer(f.read(data_end - block_start), dtype=np.uint8)[::-1]
+        if len(reversed_block) > 0:
+            last_nonzero_index = int(np.argmax(reversed_block != 0))
+            if reversed_block[last_nonzero_index] != 0:
+                return data_end - last_nonzero_index
+        if block_start == 0:
+            return 0
+
+        # 末尾ブロックがすべて 0 の場合は、ゼロ埋め領域の境界を二分探索で検出する
+        low = 0
+        high = block_start
+        zero_boundary = block_start
+        while low <= high:
+            mid = (low + high) // 2
+            f.seek(mid)
+            candidate = f.read(block_check_size)
+            if candidate and not np.any(np.frombuffer(candidate, dtype=np.uint8)):
+                # candidate が全て 0x00 ならば、ゼロ埋め領域の一部と見なし、境界を mid に更新
+                zero_boundary = mid
+                high = mid - 1
+            else:
+                low = mid + 1
+
+        return zero_boundary
+
+
     def __analyzeMediaInfo(self) -> tuple[FFprobeResult, FFprobeSampleResult, int | None] | None:
         """
         録画ファイルのメディア情報を FFprobe を使って解析する
@@ -801,6 +942,20 @@ class MetadataAnalyzer:
                 (KonomiTV で再生可能なファイルではない場合は None が返される)
         """
 
+        # 録画ファイルのハッシュとファイルサイズが一致する解析結果のキャッシュがあれば、FFprobe を実行せずにそれを使う
+        ## メディア情報は録画ファイルの内容が変わらない限り変化しないため、再解析 API や録画完了後の解析では FFprobe の実行を省略できる
+        cache_path: Path | None = None
+        cache_file_size = 0
+        if self.use_ffprobe_cache is True:
+            file_hash = self.calculateFingerprint()
+            if file_hash is not None and file_hash != self.ZERO_FILLED_FILE_HASH:
+                cache_file_size = self.recorded_file_path.stat().st_size
+                cache_path = FFPROBE_CACHE_DIR / f'{file_hash}_{cache_file_size}.json'
+                cached_result = self.__loadFFprobeCache(cache_path, cache_file_size)
+                if cached_result is not None:
+                    logging.debug(f'{self.recorded_file_path}: Reused cached ffprobe result.')
+                    return cached_result
+
         # 全体解析: 録画ファイル全体のメディア情報を取得する
         args_full = [
             '-hide_banner',
@@ -854,7 +1009,7 @@ class MetadataAnalyzer:
                     sample_size = ClosestMultiple(18 * 1024 * 1024 * 30 // 8, ts.PACKET_SIZE)  # TS パケットサイズに合わせて切り出す
                     sample_data = f.read(sample_size)
                     # サンプルデータが全てゼロ埋めされているかチェック
-                    if sample_data and all(byte == 0 for byte in sample_data):
+                    if sample_data and not np.any(np.frombuffer(sample_data, dtype=np.uint8)):
                         # ゼロ埋め領域の境界を取得するため calculateTSFileDuration を実行
                         duration_result = self.__calculateTSFileDuration()
                         if duration_result is None:
@@ -900,11 +1055,81 @@ class MetadataAnalyzer:
         # 解析処理中に calculateTSFileDuration() を実行した場合は、有効な TS データの終了位置も一緒に返す
         ## calculateTSFileDuration() が実行されている時点で、当該録画ファイルの後半部分にゼロ埋めデータが存在することを示す
         ## この値は TSInfoAnalyzer で番組情報を解析する際に参照される
+        end_ts_offset: int | None = None
         if duration_result is not None:
             _, end_ts_offset = duration_result
-            return (full_probe, sample_probe, end_ts_offset)
-        else:
-            return (full_probe, sample_probe, None)
+
+        # 次回以降の解析のために解析結果をキャッシュする
+        if cache_path is not None:
+            self.__saveFFprobeCache(cache_path, cache_file_size, full_probe, sample_probe, end_ts_offset)
+
+        return (full_probe, sample_probe, end_ts_offset)
+
+
+    def __loadFFprobeCache(self, cache_path: Path, file_size: int) -> tuple[FFprobeResult, FFprobeSampleResult, int | None] | None:
+        """
+        FFprobe による解析結果のキャッシュを読み込む
+        キャッシュが存在しない場合や、フォーマットのバージョン・ファイルサイズが一致しない場合は None を返す
+
+        Args:
+            cache_path (Path): キャッシュファイルのパス
+            file_size (int): 録画ファイルの現在のファイルサイズ
+
+        Returns:
+            tuple[FFprobeResult, FFprobeSampleResult, int | None] | None: 全体解析と部分解析の結果、有効な TS データの終了位置のタプル
+        """
+
+        try:
+            with open(cache_path, encoding='utf-8') as file:
+                cache = json.load(file)
+            if cache.get('version') != self.FFPROBE_CACHE_VERSION or cache.get('file_size') != file_size:
+                return None
+            return (
+                FFprobeResult.model_validate(cache['full_probe']),
+                FFprobeSampleResult.model_validate(cache['sample_probe']),
+                cache['end_ts_offset'],
+            )
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logging.warning(f'{cache_path}: Failed to load ffprobe cache. Ignored:', exc_info=ex)
+            return None
+
+
+    def __saveFFprobeCache(
+        self,
+        cache_path: Path,
+        file_size: int,
+        full_probe: FFprobeResult,
+        sample_probe: FFprobeSampleResult,
+        end_ts_offset: int | None,
+    ) -> None:
+        """
+        FFprobe による解析結果をキャッシュに保存する
+        複数のプロセスから同時に保存されても壊れたキャッシュが読み込まれないよう、一時ファイルに書き込んでから置き換える
+
+        Args:
+            cache_path (Path): キャッシュファイルのパス
+            file_size (int): 解析した時点の録画ファイルのファイルサイズ
+            full_probe (FFprobeResult): 全体解析の結果
+            sample_probe (FFprobeSampleResult): 部分解析の結果
+            end_ts_offset (int | None): 有効な TS データの終了位置
+        """
+
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({
+                    'version': self.FFPROBE_CACHE_VERSION,
+                    'file_size': file_size,
+                    'full_probe': full_probe.model_dump(mode='json'),
+                    'sample_probe': sample_probe.model_dump(mode='json'),
+                    'end_ts_offset': end_ts_offset,
+                }, file, ensure_ascii=False)
+            os.replace(temp_path, cache_path)
+        except Exception as ex:
+            logging.warning(f'{cache_path}: Failed to save ffprobe cache:', exc_info=ex)
 
 
     def __runFFprobe(self, args: list[str], input_bytes: bytes | None = None) -> dict[str, Any] | None:
@@ -939,7 +1164,7 @@ if __name__ == '__main__':
     # Usage: poetry run python -m app.metadata.MetadataAnalyzer /path/to/recorded_file.ts
     def main(recorded_file_path: Path = typer.Argument(..., exists=True, file_okay=True, dir_okay=False, readable=True, resolve_path=True)):
         LoadConfig(bypass_validation=True)  # 一度実行しておかないと設定値を参照できない
-        metadata_analyzer = MetadataAnalyzer(recorded_file_path)
+        metadata_analyzer = MetadataAnalyzer(recorded_file_path, use_ffprobe_cache=False)
         result = metadata_analyzer.analyze()
         if result is not None:
             print(result)
@@ -0,0 +1,147 @@
+
+import asyncio
+import threading
+from typing import ClassVar
+
+import anyio
+
+from app import logging, schemas
+from app.metadata.CMSectionsDetector import CMSectionsDetector
+from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.metadata.ThumbnailGenerator import ThumbnailGenerator
+
+
+class RecordedAnalysisPipeline:
+    """
+    録画完了後のバックグラウンド解析 (キーフレーム解析・CM 区間検出・サムネイル生成) を、録画ファイルの1回のシーケンシャルな読み込みで行うクラス
+    MPEG-TS 形式の録画ファイルでは、キーフレーム解析のために読み込んだデータをそのまま、サムネイルの候補フレームを抽出する FFmpeg の標準入力に流し込む
+    各解析処理が個別に録画ファイルを読み込まなくなるため、HDD 上の録画ファイルでもヘッドの奪い合いが起きない
+    """
+
+    # キーフレーム解析が FFmpeg への書き込みを待たずに先行して読み込める、未書き込みのデータのチャンク数
+    ## 1チャンクは TSKeyFrameIndexer.READ_SIZE (約 6MB) で、FFmpeg のデコードの一時的な遅れはこの範囲で吸収する
+    SAMPLER_BUFFER_CHUNKS: ClassVar[int] = 8
+
+    # バッファが一杯のときに、キーフレーム解析が FFmpeg のデコードに追いつくのを待つ最大の時間 (秒)
+    ## これを超えて FFmpeg のデータの消費が止まっている場合は FFmpeg へのデータの供給を打ち切り、キーフレーム解析を優先する
+    ## 打ち切った場合、サムネイルの候補フレームは録画ファイルから改めて抽出する
+    SAMPLER_FEED_TIMEOUT_SECONDS: ClassVar[float] = 5.0
+
+    def __init__(self, recorded_program: schemas.RecordedProgram) -> None:
+        """
+        録画完了後のバックグラウンド解析を行うクラスを初期化する
+
+        Args:
+            recorded_program (schemas.RecordedProgram): 解析対象の録画番組情報
+        """
+
+        self.recorded_program = recorded_program
+        self.file_path = anyio.Path(recorded_program.recorded_video.file_path)
+        self.container_format = recorded_program.recorded_video.container_format
+
+
+    async def runAndSave(self) -> None:
+        """
+        録画ファイルのキーフレーム解析・CM 区間検出・サムネイル生成を行い、結果をそれぞれ保存する
+        MPEG-4 形式の録画ファイルでは、キーフレーム情報を moov ボックスから取得でき録画ファイル全体を読み込むことはないため、従来通り各解析処理を同時に実行する
+        """
+
+        key_frame_analyzer = KeyFrameAnalyzer(self.file_path, self.container_format)
+        cm_sections_detector = CMSectionsDetector(self.file_path, self.recorded_program.recorded_video.duration)
+        thumbnail_generator = ThumbnailGenerator.fromRecordedProgram(self.recorded_program)
+
+        if self.container_format != 'MPEG-TS':
+            await asyncio.gather(
+                key_frame_analyzer.analyzeAndSave(),
+                cm_sections_detector.detectAndSave(),
+                thumbnail_generator.generateAndSave(),
+            )
+            return
+
+        # サムネイルの候補フレームを抽出する FFmpeg を起動する
+        ## 起動に失敗した場合でも、キーフレーム解析は続行し、サムネイルは録画ファイルから改めて抽出する
+        try:
+            sampler_process = await thumbnail_generator.startCandidateFrameSampler()
+        except Exception as ex:
+            logging.error(f'{self.file_path}: Failed to start candidate frame sampler:', exc_info=ex)
+            await asyncio.gather(
+                key_frame_analyzer.analyzeAndSave(),
+                cm_sections_detector.detectAndSave(),
+            )
+            await thumbnail_generator.generateAndSave()
+            return
+        assert sampler_process.stdin is not None
+        sampler_stdin = sampler_process.stdin
+        candidate_tile_task = asyncio.create_task(thumbnail_generator.readCandidateFramesFromStream(sampler_process))
+
+        loop = asyncio.get_running_loop()
+        # FFmpeg にまだ書き込んでいないデータのチャンクと、その空き枠
+        ## キーフレーム解析のスレッドは空き枠がある限り FFmpeg の消費を待たずにデータを積み、空き枠が空かなくなったら供給を打ち切る
+        sampler_queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+        sampler_queue_slots = threading.BoundedSemaphore(self.SAMPLER_BUFFER_CHUNKS)
+        is_sampler_alive = True
+        is_sampler_fed = True
+        fed_size = 0
+
+        async def WriteToSampler() -> None:
+            """ キューに積まれたデータを、サムネイルの候補フレームを抽出する FFmpeg の標準入力に書き込む """
+            nonlocal is_sampler_alive, fed_size
+            while (chunk := await sampler_queue.get()) is not None:
+                # FFmpeg が途中で終了した後も、キーフレーム解析のスレッドが空き枠を待ち続けないよう、キューは最後まで取り出す
+                if is_sampler_alive is True:
+                    try:
+                        sampler_stdin.write(chunk)
+                        await sampler_stdin.drain()
+                        fed_size += len(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # FFmpeg が途中で終了した場合は、以降のデータを書き込まない (失敗は readCandidateFramesFromStream() で検知される)
+                        is_sampler_alive = False
+                sampler_queue_slots.release()
+
+        def FeedChunk(chunk: memoryview) -> None:
+            """ キーフレーム解析のために読み込まれたデータを、ほかの解析処理にも供給する (キーフレーム解析のスレッドから呼ばれる) """
+            nonlocal is_sampler_fed
+            if is_sampler_fed is False:
+                return
+            # SAMPLER_FEED_TIMEOUT_SECONDS 秒待っても空き枠ができない (FFmpeg のデータの消費が止まっている) 場合は、以降の供給を打ち切る
+            if sampler_queue_slots.acquire(timeout=self.SAMPLER_FEED_TIMEOUT_SECONDS) is False:
+                is_sampler_fed = False
+                logging.debug(f'{self.file_path}: Candidate frame sampler fell behind. Stopped feeding data.')
+                return
+            loop.call_soon_threadsafe(sampler_queue.put_nowait, bytes(chunk))
+
+        writer_task = asyncio.create_task(WriteToSampler())
+        try:
+            # キーフレーム解析と CM 区間検出を同時に実行する
+            ## 現状の CM 区間検出はチャプターファイルのみを読み込むため、録画ファイルは読み込まない
+            await asyncio.gather(
+                key_frame_analyzer.analyzeAndSave(chunk_callback=FeedChunk),
+                cm_sections_detector.detectAndSave(),
+            )
+        except BaseException:
+            # キャンセルされた場合などは FFmpeg を終了させてから戻る
+            writer_task.cancel()
+            candidate_tile_task.cancel()
+            try:
+                sampler_process.kill()
+            except ProcessLookupError:
+                pass
+            raise
+        else:
+            # キューに残っているデータをすべて書き込む
+            sampler_queue.put_nowait(None)
+            await writer_task
+        finally:
+            # 標準入力を閉じ、FFmpeg に入力の終端を伝える
+            sampler_stdin.close()
+
+        # 録画ファイルの末尾まで FFmpeg に流し込めた場合のみ、抽出された候補フレームを使う
+        ## キーフレーム解析が途中で失敗した場合などは、録画ファイルから改めて抽出する
+        candidate_tile = await candidate_tile_task
+        file_size = (await self.file_path.stat()).st_size
+        if candidate_tile is None or fed_size < file_size:
+            logging.warning(f'{self.file_path}: Candidate frames could not be sampled in a single pass. Falling back to extraction from the recorded file.')
+            candidate_tile = None
+
+        # シークバー用サムネイルとリスト表示用の代表サムネイルの両方を生成
+        await thumbnail_generator.generateAndSave(candidate_tile=candidate_tile)
@@ -0,0 +1,255 @@
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, ClassVar
+
+from app import logging
+from app.constants import RECORDED_SCAN_INDEX_PATH
+
+
+@dataclass(slots=True)
+class ScannedRecordedFile:
+    """
+    RecordedScanIndex.scan() で見つかった録画ファイル
+    - canonical_path: シンボリックリンクを解決した実体のパス
+    - original_path: 録画フォルダを辿って見つかった元のパス
+    - stat: ファイルの (inode, デバイス ID, サイズ, 最終更新日時 (ナノ秒)) (シンボリックリンクの場合は None)
+    - recorded_video_id: 前回のスキャン時から変更されていない場合、前回のスキャン時に対応していた RecordedVideo の ID (変更された or 不明な場合は None)
+    """
+
+    canonical_path: str
+    original_path: str
+    stat: tuple[int, int, int, int] | None
+    recorded_video_id: int | None
+
+
+class RecordedScanIndex:
+    """
+    録画フォルダの一括スキャン結果を保持し、次回の一括スキャンで変更のないディレクトリやファイルの処理を省略するためのスキャンインデックス
+    - ディレクトリごとに最終更新日時と、その直下のサブディレクトリ・録画ファイルの名前を記録する
+    - 録画ファイルごとに (inode, デバイス ID, サイズ, 最終更新日時) と、対応する RecordedVideo の ID を記録する
+    ディレクトリの最終更新日時は直下のエントリが追加・削除・リネームされた場合にのみ変化するため、
+    最終更新日時が前回から変化していないディレクトリは列挙を行わずに前回の結果を使う
+    ただし既存のファイルへの書き込みはディレクトリの最終更新日時に反映されないため、録画ファイルごとの stat は常に行う
+    """
+
+    # スキャンインデックスのフォーマットのバージョン (互換性のない変更を加えた場合はインクリメントする)
+    INDEX_VERSION: ClassVar[int] = 1
+
+
+    def __init__(self, index_path: Path = RECORDED_SCAN_INDEX_PATH, scan_target_extensions: list[str] | None = None) -> None:
+        """
+        スキャンインデックスを初期化する
+
+        Args:
+            index_path (Path): スキャンインデックスを保存するファイルのパス
+            scan_target_extensions (list[str] | None): スキャン対象の録画ファイルの拡張子 (小文字)
+        """
+
+        self.index_path = index_path
+        self.scan_target_extensions = set(scan_target_extensions) if scan_target_extensions is not None else set()
+
+        # 前回のスキャン時のディレクトリと録画ファイルの情報
+        ## key: ディレクトリのパス / value: {'mtime_ns': 最終更新日時, 'directories': サブディレクトリ名のリスト, 'files': 録画ファイル名のリスト}
+        self._directories: dict[str, dict[str, Any]] = {}
+        ## key: 録画ファイルの実体のパス / value: [inode, デバイス ID, サイズ, 最終更新日時, RecordedVideo の ID]
+        self._files: dict[str, list[int]] = {}
+
+        # 今回のスキャンで見つかったディレクトリと録画ファイルの情報
+        self._scanned_directories: dict[str, dict[str, Any]] = {}
+        self._scanned_files: list[ScannedRecordedFile] = []
+
+
+    def load(self) -> None:
+        """
+        保存されているスキャンインデックスを読み込む (同期関数)
+        読み込みに失敗した場合やフォーマットのバージョンが異なる場合は、空のスキャンインデックスとして扱う
+        """
+
+        try:
+            with open(self.index_path, encoding='utf-8') as file:
+                index = json.load(file)
+            if index.get('version') != self.INDEX_VERSION:
+                return
+            self._directories = index['directories']
+            self._files = index['files']
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            logging.warning(f'{self.index_path}: Failed to load recorded scan index. Ignored:', exc_info=ex)
+            self._directories = {}
+            self._files = {}
+
+
+    def scan(self, folders: list[str]) -> list[ScannedRecordedFile]:
+        """
+        録画フォルダ以下を os.scandir() で辿り、録画ファイルを列挙する (同期関数)
+        最終更新日時が前回のスキャン時から変化していないディレクトリは列挙せず、前回記録した録画ファイルをそのまま使う
+        シンボリックリンクのディレクトリは辿らない (pathlib の rglob() と同じ挙動)
+
+        Args:
+            folders (list[str]): 録画フォルダのパスのリスト
+
+        Returns:
+            list[ScannedRecordedFile]: 見つかった録画ファイルのリスト
+        """
+
+        self._scanned_directories = {}
+        self._scanned_files = []
+        for folder in folders:
+            self.__scanDirectory(folder)
+        return self._scanned_files
+
+
+    def __scanDirectory(self, directory: str) -> None:
+        """
+        ディレクトリ以下の録画ファイルを再帰的に列挙する
+
+        Args:
+            directory (str): ディレクトリのパス
+        """
+
+        if directory in self._scanned_directories:
+            return
+        try:
+            directory_mtime_ns = os.stat(directory).st_mtime_ns
+            real_directory = os.path.realpath(directory)
+        except OSError as ex:
+            logging.warning(f'{directory}: Failed to stat directory:', exc_info=ex)
+            return
+
+        # 前回のスキャン時から最終更新日時が変化していないディレクトリは、前回記録したエントリをそのまま使う
+        ## シンボリックリンクのエントリを含むディレクトリは、リンク先の変化を検知できないため毎回列挙する
+        previous_entry = self._directories.get(directory)
+        if (previous_entry is not None and
+            previous_entry['mtime_ns'] == directory_mtime_ns and
+            len(previous_entry['symlinks']) == 0):
+            self._scanned_directories[directory] = previous_entry
+            # 既存のファイルへの書き込みではディレクトリの最終更新日時は変化しないため、ファイルごとの stat は省略せずに変更を確認する
+            for file_name in previous_entry['files']:
+                self.__appendFile(directory, real_directory, file_name, is_symlink=False)
+            for directory_name in previous_entry['directories']:
+                self.__scanDirectory(os.path.join(directory, directory_name))
+            return
+
+        # ディレクトリを列挙する
+        directory_names: list[str] = []
+        file_names: list[str] = []
+        symlink_names: list[str] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        # Mac の metadata ファイルをスキップ
+                        if entry.name.startswith('._'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            directory_names.append(entry.name)
+                            continue
+                        # 対象拡張子のファイル以外をスキップ
+                        if os.path.splitext(entry.name)[1].lower() not in self.scan_target_extensions:
+                            continue
+                        if entry.is_symlink():
+                            if entry.is_file():
+                                symlink_names.append(entry.name)
+                        elif entry.is_file(follow_symlinks=False):
+                            file_names.append(entry.name)
+                    except OSError:
+                        # 列挙後に削除されたエントリなど
+                        continue
+        except OSError as ex:
+            logging.warning(f'{directory}: Failed to scan directory:', exc_info=ex)
+            return
+
+        self._scanned_directories[directory] = {
+            'mtime_ns': directory_mtime_ns,
+            'directories': directory_names,
+            'files': file_names,
+            'symlinks': symlink_names,
+        }
+        for file_name in file_names:
+            self.__appendFile(directory, real_directory, file_name, is_symlink=False)
+        for symlink_name in symlink_names:
+            self.__appendFile(directory, real_directory, symlink_name, is_symlink=True)
+        for directory_name in directory_names:
+            self.__scanDirectory(os.path.join(directory, directory_name))
+
+
+    def __appendFile(self, directory: str, real_directory: str, file_name: str, is_symlink: bool) -> None:
+        """
+        録画ファイルを stat し、前回のスキャン時から変更されていないかを確認した上で、見つかった録画ファイルとして追加する
+
+        Args:
+            directory (str): 録画ファイルがあるディレクトリのパス
+            real_directory (str): 録画ファイルがあるディレクトリの実体のパス
+            file_name (str): 録画ファイルの名前
+            is_symlink (bool): 録画ファイルがシンボリックリンクかどうか
+        """
+
+        original_path = os.path.join(directory, file_name)
+
+        # シンボリックリンクは実体のパスに解決して、常に処理対象とする
+        if is_symlink is True:
+            self._scanned_files.append(ScannedRecordedFile(
+                canonical_path = os.path.realpath(original_path),
+                original_path = original_path,
+                stat = None,
+                recorded_video_id = None,
+            ))
+            return
+
+        canonical_path = os.path.join(real_directory, file_name)
+        try:
+            stat_result = os.stat(canonical_path)
+        except OSError:
+            # 列挙後に削除された録画ファイルなど
+            return
+        stat = (stat_result.st_ino, stat_result.st_dev, stat_result.st_size, stat_result.st_mtime_ns)
+
+        # (inode, デバイス ID, サイズ, 最終更新日時) が前回と一致する場合のみ、前回対応していた RecordedVideo の ID を引き継ぐ
+        previous_file = self._files.get(canonical_path)
+        recorded_video_id = None
+        if previous_file is not None and tuple(previous_file[:4]) == stat:
+            recorded_video_id = previous_file[4]
+        self._scanned_files.append(ScannedRecordedFile(
+            canonical_path = canonical_path,
+            original_path = original_path,
+            stat = stat,
+            recorded_video_id = recorded_video_id,
+        ))
+
+
+    def save(self, recorded_video_ids: dict[str, int]) -> None:
+        """
+        今回のスキャン結果と、スキャン後の DB の内容からスキャンインデックスを作成し、保存する (同期関数)
+        録画完了済みとして DB に登録されている録画ファイルのみを記録し、それ以外の録画ファイルは次回のスキャンでも処理対象とする
+
+        Args:
+            recorded_video_ids (dict[str, int]): 録画完了済みの RecordedVideo のファイルパスと ID のマッピング
+        """
+
+        files: dict[str, list[int]] = {}
+        for scanned_file in self._scanned_files:
+            if scanned_file.stat is None:
+                continue
+            recorded_video_id = recorded_video_ids.get(scanned_file.canonical_path)
+            if recorded_video_id is None:
+                continue
+            files[scanned_file.canonical_path] = [*scanned_file.stat, recorded_video_id]
+
+        # 一時ファイルに書き込んでから置き換えることで、書き込み途中で中断されても壊れたインデックスが残らないようにする
+        temporary_path = self.index_path.with_suffix('.tmp')
+        try:
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump({
+                    'version': self.INDEX_VERSION,
+                    'directories': self._scanned_directories,
+                    'files': files,
+                }, file, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporary_path, self.index_path)
+        except Exception as ex:
+            logging.warning(f'{self.index_path}: Failed to save recorded scan index:', exc_info=ex)
+        self._directories = self._scanned_directories
+        self._files = files
@@ -2,30 +2,35 @@
 from __future__ import annotations
 
 import asyncio
+import bisect
 import concurrent.futures
+import os
 import pathlib
-from dataclasses import dataclass
+import time
+from collections import Counter
+from collections.abc import Coroutine, Iterator
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import ClassVar, Literal, cast
+from typing import Any, ClassVar, Literal, cast
 from zoneinfo import ZoneInfo
 
 import anyio
+import psutil
 from fastapi import HTTPException, status
 from tortoise import transactions
 from watchfiles import Change, awatch
 
 from app import logging, schemas
 from app.config import Config
-from app.constants import THUMBNAILS_DIR
-from app.metadata.CMSectionsDetector import CMSectionsDetector
-from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.constants import FFPROBE_CACHE_DIR, THUMBNAILS_DIR
+from app.metadata.AnalysisJobQueue import AnalysisJobQueue
 from app.metadata.MetadataAnalyzer import MetadataAnalyzer
-from app.metadata.ThumbnailGenerator import ThumbnailGenerator
+from app.metadata.RecordedScanIndex import RecordedScanIndex
+from app.metadata.TSKeyFrameIndexer import TSKeyFrameIndexer
 from app.models.Channel import Channel
 from app.models.RecordedProgram import RecordedProgram
 from app.models.RecordedVideo import RecordedVideo
 from app.utils.DriveIOLimiter import DriveIOLimiter
-from app.utils.ProcessLimiter import ProcessLimiter
 
 
 @dataclass(slots=True)
@@ -35,11 +40,39 @@ class FileRecordingInfo:
     - last_checked: ファイルの最終チェック日時
     - file_size: ファイルのサイズ
     - mtime_continuous_start_at: ファイルの最終更新日時が継続的に更新されている場合の継続更新の開始日時
+    - keyframe_indexer: 追っかけ再生用に、録画中ファイルのキーフレーム情報を前回解析した位置の続きから解析するインデクサー
+    - keyframe_indexed_at: 録画中ファイルのキーフレーム情報を最後に解析した日時
+    - key_frames: 録画中ファイルからこれまでに解析したキーフレーム情報 (追っかけ再生中の VideoStream はここから新しいキーフレームのみを読み出す)
+    - key_frames_saved_at: 録画中ファイルのキーフレーム情報を最後に DB に保存した日時
+    - recorded_video_id: 録画中ファイルに対応する RecordedVideo の ID
+    - last_event_at: ファイルシステム監視でファイルの変更イベントを最後に受け取った日時 (録画完了の判定に使う)
     """
     last_modified: datetime
     last_checked: datetime
     file_size: int
     mtime_continuous_start_at: datetime | None
+    keyframe_indexer: TSKeyFrameIndexer | None = None
+    keyframe_indexed_at: datetime | None = None
+    key_frames: list[schemas.KeyFrame] = field(default_factory=list)
+    key_frames_saved_at: datetime | None = None
+    recorded_video_id: int | None = None
+    last_event_at: datetime | None = None
+
+
+@dataclass(slots=True)
+class PendingFileChange:
+    """
+    RecordedScanTask.watchRecordedFolders() 内で、まとめて処理するために待機中のファイルの変更イベント
+    - change_type: 最後に受け取った変更の種類 (同じファイルへの変更イベントは、最後に受け取ったものに集約する)
+    - original_file_path: 監視で検知した元のファイルパス
+    - first_event_at: 未処理の変更イベントのうち、最初の変更イベントを受け取った時刻 (time.monotonic() の値)
+    - last_event_at: 最後に変更イベントを受け取った時刻 (time.monotonic() の値)
+    """
+
+    change_type: Change
+    original_file_path: anyio.Path
+    first_event_at: float
+    last_event_at: float
 
 
 @dataclass(slots=True)
@@ -60,6 +93,20 @@ class RecordedVideoSummary:
     file_hash: str
 
 
+@dataclass(slots=True)
+class PendingRecordedMetadataWrite:
+    """
+    RecordedScanTask.runBatchScan() 内で、まとめて DB に書き込むために待機中のメタデータ解析結果
+    - recorded_program: 保存する録画番組情報
+    - existing_db_recorded_video: 既に DB に永続化されている録画ファイルの RecordedVideo レコード
+    - future: DB への書き込みが完了した (または失敗した) ことを通知する Future
+    """
+
+    recorded_program: schemas.RecordedProgram
+    existing_db_recorded_video: RecordedVideo | None
+    future: asyncio.Future[None]
+
+
 class RecordedScanTask:
     """
     録画フォルダの監視とメタデータの DB への同期を行うタスク
@@ -93,6 +140,45 @@ class RecordedScanTask:
     # 継続更新を強制的に完了とする時間 (秒)
     CONTINUOUS_UPDATE_MAX_SECONDS: ClassVar[int] = 86400  # 24時間
 
+    # 録画中ファイルのキーフレーム情報を追記する間隔 (秒)
+    ## 録画中の番組を追っかけ再生する際、この間隔で新たに録画されたキーフレームが再生可能になる
+    RECORDING_KEYFRAME_INDEX_INTERVAL_SECONDS: ClassVar[int] = 10
+
+    # 録画中ファイルのキーフレーム情報を DB に保存する間隔 (秒)
+    ## 追っかけ再生中の VideoStream はメモリ上のキーフレーム情報を直接読み出すため、DB への保存はサーバー再起動時の解析再開用に間引く
+    ## key_frames は JSON フィールドで追記ができず毎回全体を書き直すことになるため、長時間の録画ほど書き込み量が大きくなる
+    RECORDING_KEYFRAME_SAVE_INTERVAL_SECONDS: ClassVar[int] = 60
+
+    # ファイルの変更イベントを集約する待機時間 (秒)
+    ## 同じファイルへの変更イベントは、この時間だけ新たな変更イベントが途絶えるまで待ってから1回だけ処理する
+    FILE_CHANGE_DEBOUNCE_SECONDS: ClassVar[int] = 3
+
+    # ファイルの変更イベントの処理を先送りする最大の時間 (秒)
+    ## 録画中ファイルのように変更イベントが途絶えない場合も、少なくともこの間隔で1回は処理する
+    FILE_CHANGE_MAX_DEFER_SECONDS: ClassVar[int] = 30
+
+    # ファイルの変更イベントを同時に処理するファイルの最大数
+    FILE_CHANGE_MAX_CONCURRENCY: ClassVar[int] = 4
+
+    # 一括スキャン時に、同一ドライブ上の録画ファイルを並行して処理するワーカーの数
+    ## メタデータ解析はファイルの先頭・末尾付近などの一部しか読み込まないため、一方が解析 (CPU) 中にもう一方が I/O を待てる程度に留める
+    BATCH_SCAN_WORKERS_PER_DRIVE: ClassVar[int] = 2
+
+    # 一括スキャン時に、1トランザクションでまとめて DB に書き込むメタデータ解析結果の最大数
+    BATCH_SCAN_DB_WRITE_BATCH_SIZE: ClassVar[int] = 50
+
+    # 一括スキャン時に、1クエリでまとめて削除するレコードの最大数
+    ## SQLite のバインド変数の上限 (999) を超えないようにする
+    BATCH_SCAN_DB_DELETE_CHUNK_SIZE: ClassVar[int] = 500
+
+    # 一括スキャンの進捗をログに出力する間隔 (秒)
+    BATCH_SCAN_PROGRESS_LOG_INTERVAL_SECONDS: ClassVar[int] = 10
+
+    # ファイル削除イベントを受け取ってから、録画ファイルのレコードを DB から削除するまでの猶予時間 (秒)
+    ## この間に同じファイルサイズ・ハッシュの録画ファイルが追加された場合は、録画ファイルが移動・リネームされたとみなし、
+    ## 既存のレコードを移動先のパスに付け替えてメタデータ解析とバックグラウンド解析を省略する
+    MOVE_DETECTION_GRACE_SECONDS: ClassVar[int] = 60
+
     # 既知のハッシュ衝突が発生しうる file_hash の集合
     KNOWN_COLLISION_FILE_HASHES: ClassVar[set[str]] = {
         'd1dd210d6b1312cb342b56d02bd5e651',
@@ -136,18 +222,40 @@ class RecordedScanTask:
         # 録画フォルダ以下の一括スキャンを実行中かどうか
         self._is_batch_scan_running = False
 
-        # バックグラウンドタスクの状態管理
-        self._background_tasks: dict[anyio.Path, asyncio.Task[None]] = {}
+        # 録画中ファイルのキーフレーム情報を追記するタスクの状態管理
+        self._keyframe_index_tasks: dict[anyio.Path, asyncio.Task[None]] = {}
 
         # シンボリックリンクの元パスと実体パスのマッピング
         self._symlink_path_map: dict[str, str] = {}
         self._symlink_path_map_lock = asyncio.Lock()
 
+        # ファイルシステム監視で検知したパスと、シンボリックリンクを解決した実体パスのキャッシュ
+        ## 録画中ファイルには変更イベントが絶え間なく届くため、イベントごとにシンボリックリンクを解決しないようにする
+        ## 対象拡張子のファイルのみを保持し、追加・削除イベントを受け取った際に破棄する
+        self._resolved_path_cache: dict[str, anyio.Path] = {}
+
+        # 処理待ちのファイルの変更イベントと、ファイルごとに変更イベントを集約して処理するタスクの状態管理
+        self._pending_file_changes: dict[anyio.Path, PendingFileChange] = {}
+        self._file_change_tasks: dict[anyio.Path, asyncio.Task[None]] = {}
+        self._file_change_semaphore = asyncio.Semaphore(self.FILE_CHANGE_MAX_CONCURRENCY)
+        # 処理待ちの集約を終え、削除イベントを処理中のタスク
+        ## 移動・リネームで同時に届いた追加イベントの処理を、削除イベントの処理が終わるまで待たせるために使う
+        self._file_deletion_tasks: set[asyncio.Task[None]] = set()
+
         # ファイルパスごとのロックを管理する辞書
         self._file_locks: dict[anyio.Path, asyncio.Lock] = {}
         # _file_locks 辞書自体へのアクセスを保護するためのロック
         self._file_locks_dict_lock = asyncio.Lock()
 
+        # 録画ファイルが見つからなくなった録画済みのレコードの、(ファイルサイズ, ハッシュ) をキーとした索引
+        ## 追加された録画ファイルが、移動・リネームされた既存の録画ファイルかを照合するために使う
+        ## 大半の追加された録画ファイルはハッシュを算出するまでもなくファイルサイズで除外できるよう、ファイルサイズごとの件数も保持する
+        self._missing_recorded_videos: dict[tuple[int, str], list[RecordedVideoSummary]] = {}
+        self._missing_recorded_video_sizes: Counter[int] = Counter()
+
+        # ファイル削除イベントを受け取った録画ファイルのレコードを、猶予時間の経過後に削除するタスク (キーは RecordedVideo の ID)
+        self._deferred_deletion_tasks: dict[int, asyncio.Task[None]] = {}
+
         # 初期化済みフラグをセット
         self._initialized = True
 
@@ -215,7 +323,7 @@ class RecordedScanTask:
         """
         録画フォルダ以下の一括スキャンと DB への同期を実行する
         - 録画フォルダ内の全 TS ファイルをスキャン
-        - 追加・変更があったファイルのみメタデータを解析し、DB に永続化
+        - 追加・変更があったファイルのみメタデータを解析し、DB に永続化 (物理ドライブごとに並行して処理する)
         - 存在しない録画ファイルに対応するレコードを一括削除
         """
 
@@ -267,42 +375,33 @@ class RecordedScanTask:
                 await asyncio.sleep(0)
 
         # 同一ファイルパスに対応するレコードが複数存在する場合、最新のものを保持して残りを削除する
-        ## 重複削除処理をトランザクション配下で実行
         logging.info('Checking for duplicate recorded video records...')
         duplicates_found = False
-        total_deleted_count = 0
-        async with transactions.in_transaction():
-            for index, (file_path, videos) in enumerate(videos_by_path.items(), start=1):
-                if len(videos) > 1:
-                    duplicates_found = True
-                    logging.warning(f'{file_path}: Found {len(videos)} duplicate records. Keeping the latest one.')
-                    # created_at でソートして最新のレコードを特定
-                    videos.sort(key=lambda v: v.created_at, reverse=True)
-                    latest_video = videos[0]
-                    videos_to_keep.append(latest_video)  # 最新のものを保持リストに追加
-                    # 最新以外のレコードを削除
-                    for video_to_delete in videos[1:]:
-                        try:
-                            # RecordedProgram を削除 (CASCADE により RecordedVideo も削除される)
-                            await RecordedProgram.filter(id=video_to_delete.recorded_program_id).delete()
-                            logging.info(
-                                f'{file_path}: Deleted duplicate record. [deleted recorded_program_id: {video_to_delete.recorded_program_id}] '
-                                f'[kept recorded_program_id: {latest_video.recorded_program_id}]'
-                            )
-                        except Exception as ex_del:
-                            logging.error(
-                                f'{file_path}: Failed to delete duplicate record. [deleted recorded_program_id: {video_to_delete.recorded_program_id}]',
-                                exc_info=ex_del,
-                            )
-                    # 削除対象のレコード数をカウント
-                    deleted_count = len(videos) - 1  # -1 は最新のレコードを除いた数
-                    total_deleted_count += deleted_count
-                else:
-                    # 重複がない場合も保持リストに追加
-                    videos_to_keep.append(videos[0])
-                if index % 50 == 0:
-                    # 重複チェックがループを占有し続けないよう適宜制御を返す
-                    await asyncio.sleep(0)
+        duplicate_recorded_program_ids: list[int] = []
+        for index, (file_path, videos) in enumerate(videos_by_path.items(), start=1):
+            if len(videos) > 1:
+                duplicates_found = True
+                logging.warning(f'{file_path}: Found {len(videos)} duplicate records. Keeping the latest one.')
+                # created_at でソートして最新のレコードを特定
+                videos.sort(key=lambda v: v.created_at, reverse=True)
+                latest_video = videos[0]
+                videos_to_keep.append(latest_video)  # 最新のものを保持リストに追加
+                # 最新以外のレコードを削除対象に追加
+                for video_to_delete in videos[1:]:
+                    duplicate_recorded_program_ids.append(video_to_delete.recorded_program_id)
+                    logging.info(
+                        f'{file_path}: Deleting duplicate record. [deleted recorded_program_id: {video_to_delete.recorded_program_id}] '
+                        f'[kept recorded_program_id: {latest_video.recorded_program_id}]'
+                    )
+            else:
+                # 重複がない場合も保持リストに追加
+                videos_to_keep.append(videos[0])
+            if index % 1000 == 0:
+                # 重複チェックがループを占有し続けないよう適宜制御を返す
+                await asyncio.sleep(0)
+        # 削除対象のレコードをまとめて削除
+        ## RecordedProgram を削除すると、CASCADE 制約により RecordedVideo も同時に削除される
+        total_deleted_count = await self.__deleteRecordedProgramsInChunks(duplicate_recorded_program_ids)
         if duplicates_found:
             logging.info(f'Duplicate record cleanup finished. Total {total_deleted_count} duplicate records were deleted.')
         else:
@@ -310,64 +409,89 @@ class RecordedScanTask:
 
         # 現在登録されている全ての RecordedVideo レコードをキャッシュ
         ## 重複削除処理で保持すると判断されたレコードのみを使う
-        existing_db_recorded_videos = {}
-        for video in videos_to_keep:
-            # 既存レコードのファイルパスもシンボリックリンクを解決して正規化する
-            canonical_path = await self.resolveRecordedPath(anyio.Path(video.file_path))
-            video.file_path = str(canonical_path)
+        ## 既存レコードのファイルパスもシンボリックリンクを解決して正規化する (レコードごとにスレッドを切り替えないよう、まとめて解決する)
+        def ResolvePaths(file_paths: list[str]) -> list[str]:
+            """ シンボリックリンクを含むファイルパスを実体のパスに解決する (解決に失敗した場合は元のパスを返す) """
+            resolved_paths: list[str] = []
+            for file_path in file_paths:
+                try:
+                    resolved_paths.append(str(pathlib.Path(file_path).resolve()))
+                except (OSError, RuntimeError):
+                    resolved_paths.append(file_path)
+            return resolved_paths
+        existing_db_recorded_videos: dict[anyio.Path, RecordedVideoSummary] = {}
+        resolved_paths = await asyncio.to_thread(ResolvePaths, [video.file_path for video in videos_to_keep])
+        for video, resolved_path in zip(videos_to_keep, resolved_paths):
+            video.file_path = resolved_path
             existing_db_recorded_videos[anyio.Path(video.file_path)] = video
 
-        # 各録画フォルダをスキャン
+        # 各録画フォルダをスキャンし、処理対象の録画ファイルを列挙する
+        ## スキャンインデックスを使い、前回の一括スキャン時から変更のないディレクトリは列挙せず、変更のない録画ファイルは処理を省略する
         logging.info('Scanning recorded folders...')
+        scan_index = RecordedScanIndex(scan_target_extensions=self.SCAN_TARGET_EXTENSIONS)
+        await asyncio.to_thread(scan_index.load)
+        scanned_files = await asyncio.to_thread(scan_index.scan, [str(folder) for folder in self.recorded_folders])
         processed_canonical_paths: set[str] = set()
-        for folder in self.recorded_folders:
-            async for file_path in folder.rglob('*'):
-                try:
-                    # Mac の metadata ファイルをスキップ
-                    if file_path.name.startswith('._'):
-                        continue
-                    # シンボリックリンクを含むパスは実体に解決して処理する
-                    canonical_path = await self.resolveRecordedPath(file_path)
-                    original_path_str = str(file_path)
-                    canonical_path_str = str(canonical_path)
-                    # シンボリックリンクのマッピングを更新する
-                    await self.__updateSymlinkMapping(original_path_str, canonical_path_str)
-                    if await canonical_path.is_dir():
-                        continue
-                    # 対象拡張子のファイル以外をスキップ
-                    if canonical_path.suffix.lower() not in self.SCAN_TARGET_EXTENSIONS:
-                        continue
-                    # 録画ファイルが確実に存在することを確認する
-                    ## 環境次第では、稀に glob で取得したファイルが既に存在しなくなっているケースがある
-                    if not await self.isFileExists(canonical_path):
-                        continue
-                    if canonical_path_str in processed_canonical_paths:
-                        continue
-                    processed_canonical_paths.add(canonical_path_str)
+        target_files: list[tuple[anyio.Path, anyio.Path]] = []  # (実体パス, 元パス)
+        unchanged_count = 0
+        for index, scanned_file in enumerate(scanned_files, start=1):
+            # シンボリックリンクのマッピングを更新する
+            await self.__updateSymlinkMapping(scanned_file.original_path, scanned_file.canonical_path)
+            if scanned_file.canonical_path in processed_canonical_paths:
+                continue
+            processed_canonical_paths.add(scanned_file.canonical_path)
+            canonical_path = anyio.Path(scanned_file.canonical_path)
+            # 前回の一括スキャン時から変更がなく、対応する録画完了済みのレコードも変わっていない録画ファイルは処理しない
+            if scanned_file.recorded_video_id is not None:
+                existing_recorded_video_summary = existing_db_recorded_videos.get(canonical_path)
+                if (existing_recorded_video_summary is not None and
+                    existing_recorded_video_summary.id == scanned_file.recorded_video_id and
+                    existing_recorded_video_summary.status == 'Recorded'):
+                    existing_db_recorded_videos.pop(canonical_path)
+                    unchanged_count += 1
+                    continue
+            target_files.append((canonical_path, anyio.Path(scanned_file.original_path)))
+            if index % 1000 == 0:
+                # 起動時にイベントループが他のタスクを処理できるよう定期的に制御を返す
+                await asyncio.sleep(0)
+        logging.info(f'Found {len(processed_canonical_paths)} recorded files. ({unchanged_count} unchanged since the last scan)')
 
-                    # 見つかったファイルを処理
-                    await self.processRecordedFile(
-                        file_path = canonical_path,
-                        original_path = file_path,
-                        existing_db_recorded_videos = existing_db_recorded_videos,
-                    )
-                except Exception as ex:
-                    logging.error(f'{file_path}: Failed to process recorded file:', exc_info=ex)
+        # 録画フォルダ内に見つからなかった録画済みの録画ファイルのレコードを、移動・リネームの照合対象として索引に登録する
+        ## 前回の起動時から録画ファイルが移動・リネームされていた場合、移動先の録画ファイルの処理時に既存のレコードが付け替えられる
+        missing_recorded_video_summaries: list[RecordedVideoSummary] = []
+        for file_path, existing_recorded_video_summary in existing_db_recorded_videos.items():
+            if existing_recorded_video_summary.status == 'Recorded' and str(file_path) not in processed_canonical_paths:
+                self.__addMissingRecordedVideo(existing_recorded_video_summary)
+                missing_recorded_video_summaries.append(existing_recorded_video_summary)
+
+        # 見つかった録画ファイルを処理
+        await self.__processTargetFilesInParallel(target_files, existing_db_recorded_videos)
+
+        # 付け替えられなかったレコードは、後続の処理で存在しない録画ファイルのレコードとして削除されるため索引から除く
+        for missing_recorded_video_summary in missing_recorded_video_summaries:
+            self.__removeMissingRecordedVideo(missing_recorded_video_summary)
 
         # 存在しない録画ファイルに対応するレコードを一括削除
-        ## トランザクション配下に入れることでパフォーマンスが向上する
         logging.info('Deleting records for non-existent files...')
-        async with transactions.in_transaction():
-            for index, (file_path, existing_recorded_video_summary) in enumerate(existing_db_recorded_videos.items(), start=1):
-                # ファイルの存在確認を非同期に行う
-                if not await self.isFileExists(file_path):
-                    # RecordedVideo の親テーブルである RecordedProgram を削除すると、
-                    # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
-                    await RecordedProgram.filter(id=existing_recorded_video_summary.recorded_program_id).delete()
-                    logging.info(f'{file_path}: Deleted record for non-existent file.')
-                if index % 50 == 0:
-                    # 既存レコードの走査が長時間化しないよう適宜制御を返す
-                    await asyncio.sleep(0)
+        non_existent_recorded_program_ids: list[int] = []
+        for index, (file_path, existing_recorded_video_summary) in enumerate(existing_db_recorded_videos.items(), start=1):
+            # ファイルの存在確認を非同期に行う
+            if not await self.isFileExists(file_path):
+                non_existent_recorded_program_ids.append(existing_recorded_video_summary.recorded_program_id)
+                logging.info(f'{file_path}: Deleting record for non-existent file.')
+            if index % 50 == 0:
+                # 既存レコードの走査が長時間化しないよう適宜制御を返す
+                await asyncio.sleep(0)
+        # RecordedVideo の親テーブルである RecordedProgram を削除すると、
+        # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
+        await self.__deleteRecordedProgramsInChunks(non_existent_recorded_program_ids)
+
+        # 次回の一括スキャンに向けて、スキャンインデックスを更新する
+        recorded_video_rows = cast(
+            list[tuple[int, str]],
+            await RecordedVideo.filter(status='Recorded').values_list('id', 'file_path'),
+        )
+        await asyncio.to_thread(scan_index.save, {file_path: recorded_video_id for recorded_video_id, file_path in recorded_video_rows})
 
         # DB に存在する全ての RecordedVideo レコードのハッシュを取得
         logging.info('Gathering all recorded video hashes...')
@@ -379,7 +503,10 @@ class RecordedScanTask:
         logging.info('Deleting orphaned thumbnail files...')
         thumbnails_dir = anyio.Path(str(THUMBNAILS_DIR))
         if await thumbnails_dir.is_dir():
-            async for thumbnail_path in thumbnails_dir.glob('*'):
+            # ファイルごとにスレッドを切り替えないよう、ファイル名の一覧はまとめて取得する
+            thumbnail_file_names = await asyncio.to_thread(os.listdir, str(THUMBNAILS_DIR))
+            for thumbnail_file_name in thumbnail_file_names:
+                thumbnail_path = thumbnails_dir / thumbnail_file_name
                 try:
                     # .git から始まるファイルは無視
                     if thumbnail_path.name.startswith('.git'):
@@ -401,6 +528,21 @@ class RecordedScanTask:
                 except Exception as ex:
                     logging.error(f'{thumbnail_path}: Error deleting orphaned thumbnail file:', exc_info=ex)
 
+        # FFprobe の解析結果のキャッシュフォルダ内の全ファイルをスキャンし、DB に存在しないハッシュのキャッシュを削除
+        ## キャッシュのファイル名は "{hash}_{file_size}.json" の形式
+        ## 録画中に解析した時点のキャッシュなど、DB のレコードに対応しないキャッシュはここで削除される
+        logging.info('Deleting orphaned ffprobe cache files...')
+        ffprobe_cache_dir = anyio.Path(str(FFPROBE_CACHE_DIR))
+        if await ffprobe_cache_dir.is_dir():
+            ffprobe_cache_file_names = await asyncio.to_thread(os.listdir, str(FFPROBE_CACHE_DIR))
+            for ffprobe_cache_file_name in ffprobe_cache_file_names:
+                ffprobe_cache_path = ffprobe_cache_dir / ffprobe_cache_file_name
+                try:
+                    if ffprobe_cache_path.stem.rsplit('_', 1)[0] not in db_recorded_video_hashes:
+                        await ffprobe_cache_path.unlink()
+                except Exception as ex:
+                    logging.error(f'{ffprobe_cache_path}: Error deleting orphaned ffprobe cache file:', exc_info=ex)
+
         # かつてのバグで RecordedVideo.file_hash が衝突している録画ファイルのメタデータを再解析する
         ## トランザクション配下に入れることでパフォーマンスが向上する
         ## ref: https://github.com/tsukumijima/KonomiTV/commit/92e8630f41b6440ebd10defa5fdde1489ac7376a
@@ -440,6 +582,152 @@ class RecordedScanTask:
         self._is_batch_scan_running = False
 
 
+    async def __deleteRecordedProgramsInChunks(self, recorded_program_ids: list[int]) -> int:
+        """
+        指定された RecordedProgram レコードを、BATCH_SCAN_DB_DELETE_CHUNK_SIZE 件ずつまとめて削除する
+        RecordedProgram を削除すると、CASCADE 制約により RecordedVideo も同時に削除される
+
+        Args:
+            recorded_program_ids (list[int]): 削除する RecordedProgram の ID のリスト
+
+        Returns:
+            int: 削除したレコード数
+        """
+
+        deleted_count = 0
+        for index in range(0, len(recorded_program_ids), self.BATCH_SCAN_DB_DELETE_CHUNK_SIZE):
+            chunk = recorded_program_ids[index:index + self.BATCH_SCAN_DB_DELETE_CHUNK_SIZE]
+            try:
+                # トランザクション配下に入れることでパフォーマンスが向上する
+                async with transactions.in_transaction():
+                    deleted_count += await RecordedProgram.filter(id__in=chunk).delete()
+            except Exception as ex:
+                logging.error(f'Failed to delete recorded program records. [recorded_program_ids: {chunk}]', exc_info=ex)
+        return deleted_count
+
+
+    async def __processTargetFilesInParallel(
+        self,
+        target_files: list[tuple[anyio.Path, anyio.Path]],
+        existing_db_recorded_videos: dict[anyio.Path, RecordedVideoSummary],
+    ) -> None:
+        """
+        一括スキャンで見つかった録画ファイルを、物理ドライブごとに並行して処理する
+        - 録画ファイルを DriveIOLimiter.getDriveID() で物理ドライブごとに分け、ドライブごとに BATCH_SCAN_WORKERS_PER_DRIVE 個のワーカーで処理する
+        - メタデータ解析 (ariblib による番組情報の解析・PCR の探索・ハッシュの算出) は、一括スキャンの間使い回すプロセスプールで実行する
+        - DB への書き込みは1つのタスクに集約し、溜まった解析結果を1トランザクションでまとめて書き込む
+        - 処理の進捗 (処理済みファイル数・処理速度・残り時間の目安) を定期的にログに出力する
+
+        Args:
+            target_files (list[tuple[anyio.Path, anyio.Path]]): 処理対象の録画ファイルの (実体パス, 元パス) のリスト
+            existing_db_recorded_videos (dict[anyio.Path, RecordedVideoSummary]): 既に DB に永続化されている録画ファイルパスと RecordedVideo のサマリーデータのマッピング
+        """
+
+        if len(target_files) == 0:
+            return
+
+        # 録画ファイルを物理ドライブごとに分ける
+        ## DriveIOLimiter.getDriveID() はマウントポイントの一覧を毎回取得するため、結果をディレクトリごとにキャッシュする
+        drive_ids_by_directory: dict[anyio.Path, str] = {}
+        target_files_by_drive: dict[str, list[tuple[anyio.Path, anyio.Path]]] = {}
+        for canonical_path, original_path in target_files:
+            directory = canonical_path.parent
+            if directory not in drive_ids_by_directory:
+                drive_ids_by_directory[directory] = DriveIOLimiter.getDriveID(directory)
+            target_files_by_drive.setdefault(drive_ids_by_directory[directory], []).append((canonical_path, original_path))
+
+        total_count = len(target_files)
+        processed_count = 0
+        start_time = time.monotonic()
+        last_logged_at = start_time
+        logging.info(f'Processing {total_count} recorded files on {len(target_files_by_drive)} drive(s)...')
+
+        # DB への書き込み待ちのメタデータ解析結果のキュー (None は終了の合図)
+        db_write_queue: asyncio.Queue[PendingRecordedMetadataWrite | None] = asyncio.Queue()
+
+        async def DBWriter() -> None:
+            """ キューに溜まったメタデータ解析結果を、1トランザクションでまとめて DB に書き込む """
+            is_finished = False
+            while is_finished is False:
+                pending_write = await db_write_queue.get()
+                if pending_write is None:
+                    break
+                # 前回の書き込み中に溜まった解析結果をまとめて取り出す
+                pending_writes = [pending_write]
+                while len(pending_writes) < self.BATCH_SCAN_DB_WRITE_BATCH_SIZE and not db_write_queue.empty():
+                    next_pending_write = db_write_queue.get_nowait()
+                    if next_pending_write is None:
+                        is_finished = True
+                        break
+                    pending_writes.append(next_pending_write)
+                try:
+                    async with transactions.in_transaction():
+                        for pending_write in pending_writes:
+                            await self.__saveRecordedMetadataToDB(pending_write.recorded_program, pending_write.existing_db_recorded_video)
+                    for pending_write in pending_writes:
+                        if not pending_write.future.done():
+                            pending_write.future.set_result(None)
+                except Exception:
+                    # まとめての書き込みに失敗した場合は、失敗した解析結果を特定できるよう1件ずつ書き込み直す
+                    for pending_write in pending_writes:
+                        try:
+                            await self.__saveRecordedMetadataToDB(pending_write.recorded_program, pending_write.existing_db_recorded_video)
+                            if not pending_write.future.done():
+                                pending_write.future.set_result(None)
+                        except Exception as ex:
+                            if not pending_write.future.done():
+                                pending_write.future.set_exception(ex)
+
+        async def DriveWorker(drive_target_files: Iterator[tuple[anyio.Path, anyio.Path]], executor: concurrent.futures.ProcessPoolExecutor) -> None:
+            """ 同一ドライブ上の録画ファイルを順に処理するワーカー """
+            nonlocal processed_count, last_logged_at
+            # 同一ドライブの各ワーカーで1つのイテレーターを共有し、処理対象の録画ファイルを順に取り出す
+            for canonical_path, original_path in drive_target_files:
+                try:
+                    await self.processRecordedFile(
+                        file_path = canonical_path,
+                        original_path = original_path,
+                        existing_db_recorded_videos = existing_db_recorded_videos,
+                        executor = executor,
+                        db_write_queue = db_write_queue,
+                    )
+                except Exception as ex:
+                    logging.error(f'{original_path}: Failed to process recorded file:', exc_info=ex)
+
+                # 処理の進捗をログに出力
+                processed_count += 1
+                now = time.monotonic()
+                if now - last_logged_at >= self.BATCH_SCAN_PROGRESS_LOG_INTERVAL_SECONDS or processed_count == total_count:
+                    last_logged_at = now
+                    files_per_second = processed_count / max(now - start_time, 0.001)
+                    eta_seconds = (total_count - processed_count) / files_per_second
+                    logging.info(
+                        f'Batch scan progress: {processed_count}/{total_count} files '
+                        f'({files_per_second:.1f} files/sec, ETA {int(eta_seconds // 60):02d}:{int(eta_seconds % 60):02d})'
+                    )
+
+        # メタデータ解析を行うプロセスプールは、一括スキャンの間使い回す
+        ## 録画ファイルごとにプロセスを起動し直すと、起動と app モジュールの読み込みに毎回時間がかかる
+        ## with 文で括ることで、with 文を抜けたときに ProcessPoolExecutor がクリーンアップされるようにする
+        cpu_count = psutil.cpu_count(logical=True) or 4  # 取得できない場合は4コアと仮定
+        max_workers = max(1, min(cpu_count // 2, len(target_files_by_drive) * self.BATCH_SCAN_WORKERS_PER_DRIVE))
+        db_writer_task = asyncio.create_task(DBWriter())
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                workers: list[Coroutine[Any, Any, None]] = []
+                for drive_target_files in target_files_by_drive.values():
+                    drive_target_files_iterator = iter(drive_target_files)
+                    for _ in range(self.BATCH_SCAN_WORKERS_PER_DRIVE):
+                        workers.append(DriveWorker(drive_target_files_iterator, executor))
+                await asyncio.gather(*workers)
+        finally:
+            await db_write_queue.put(None)
+            await db_writer_task
+
+        elapsed_time = time.monotonic() - start_time
+        logging.info(f'Processed {total_count} recorded files in {elapsed_time:.1f} sec. ({total_count / max(elapsed_time, 0.001):.1f} files/sec)')
+
+
     async def processRecordedFile(
         self,
         file_path: anyio.Path,
@@ -447,6 +735,8 @@ class RecordedScanTask:
         existing_db_recorded_videos: dict[anyio.Path, RecordedVideoSummary] | None = None,
         force_update: bool = False,
         wait_background_analysis: bool = False,
+        executor: concurrent.futures.ProcessPoolExecutor | None = None,
+        db_write_queue: asyncio.Queue[PendingRecordedMetadataWrite | None] | None = None,
     ) -> None:
         """
         指定された録画ファイルのメタデータを解析し、DB に永続化する
@@ -459,6 +749,8 @@ class RecordedScanTask:
                 (ファイル変更イベントから呼ばれた場合、watchfiles 初期化時に取得した全レコードと今で状態が一致しているとは限らないため、None が入る)
             force_update (bool): 既に DB に登録されている録画ファイルのメタデータを強制的に再解析するかどうか (デフォルト: False)
             wait_background_analysis (bool): バックグラウンド解析が完了するまで待つかどうか (デフォルト: False)
+            executor (concurrent.futures.ProcessPoolExecutor | None): メタデータ解析に使うプロセスプール (一括スキャンから呼ばれた場合のみ指定され、None の場合は都度プロセスを起動する)
+            db_write_queue (asyncio.Queue[PendingRecordedMetadataWrite | None] | None): メタデータ解析結果をまとめて DB に書き込むためのキュー (一括スキャンから呼ばれた場合のみ指定され、None の場合は即座に書き込む)
         """
 
         # ファイルパスに対応するロックを取得または作成
@@ -542,6 +834,26 @@ class RecordedScanTask:
                         )
                         existing_recorded_video_summary.file_path = file_path_str
 
+                # 同じファイルパスの既存レコードがない場合、録画ファイルが見つからなくなったレコードに同一内容のものがないか照合する
+                ## 録画ファイルが移動・リネームされただけであれば、既存のレコードを移動先のパスに付け替えてメタデータ解析を省略する
+                ## キーフレーム情報・CM 区間情報はレコードに、サムネイルはハッシュをファイル名として保存されているため、再解析せずにそのまま引き継がれる
+                if force_update is False and existing_recorded_video_summary is None:
+                    moved_recorded_video_summary = await self.__findMovedRecordedVideo(file_path, file_size)
+                    if moved_recorded_video_summary is not None:
+                        old_file_path_str = moved_recorded_video_summary.file_path
+                        await RecordedVideo.filter(id=moved_recorded_video_summary.id).update(
+                            file_path = file_path_str,
+                            file_created_at = file_created_at,
+                            file_modified_at = file_modified_at,
+                        )
+                        await AnalysisJobQueue().relocateJobs(old_file_path_str, file_path_str)
+                        # 一括スキャンから呼ばれた場合は、移動前のパスのレコードが存在しない録画ファイルのレコードとして削除されないようにする
+                        if existing_db_recorded_videos is not None:
+                            existing_db_recorded_videos.pop(anyio.Path(old_file_path_str), None)
+                        self._recording_files.pop(file_path, None)  # もし録画中扱いであればここで削除
+                        logging.info(f'{file_path}: Moved from {old_file_path_str}. Reused existing metadata.')
+                        return
+
                 # 同じファイルパスの既存レコードがあり、ファイルの基本情報（作成日時、更新日時、サイズ）が前回と一致した場合、
                 # ファイル内容は変更されておらず、レコード内容は更新不要と判断してスキップ
                 ## こうすることで、録画済みファイルに対しては HDD への I/O 負荷が高いハッシュ算出やメタデータ解析処理を省略できる
@@ -588,11 +900,15 @@ class RecordedScanTask:
                 ## メタデータ解析処理は実装上同期 I/O で実装されており、また CPU-bound な処理のため、別プロセスで実行している
                 ## with 文で括ることで、with 文を抜けたときに ProcessPoolExecutor がクリーンアップされるようにする
                 ## さもなければサーバーの終了後もプロセスが残り続けてゾンビプロセス化し、メモリリークを引き起こしてしまう
+                ## 一括スキャンから呼ばれた場合は、一括スキャンの間使い回すプロセスプールで実行する
                 loop = asyncio.get_running_loop()
                 analyzer = MetadataAnalyzer(pathlib.Path(str(file_path)))  # anyio.Path -> pathlib.Path に変換
                 try:
-                    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                    if executor is not None:
                         recorded_program = await loop.run_in_executor(executor, analyzer.analyze)
+                    else:
+                        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as process_executor:
+                            recorded_program = await loop.run_in_executor(process_executor, analyzer.analyze)
                     if recorded_program is None:
                         logging.error(f'{file_path}: Failed to analyze metadata.')
                         # メタデータ解析に失敗したがこの時点ですでに DB にエントリが存在している場合は、UI から判別できるようステータスを更新する
@@ -654,20 +970,38 @@ class RecordedScanTask:
                     # status を Recorded に設定
                     # MetadataAnalyzer 側で既に Recorded に設定されているが、念のため
                     recorded_program.recorded_video.status = 'Recorded'
-                    # 録画完了後のバックグラウンド解析タスクを開始
-                    if file_path not in self._background_tasks:
-                        task = asyncio.create_task(self.__runBackgroundAnalysis(recorded_program))
-                        self._background_tasks[file_path] = task
 
                 # DB に永続化
                 # メタデータ解析後の最新のデータベース情報を使う
-                await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video_after_analyze)
+                ## 一括スキャンから呼ばれた場合は、ほかの録画ファイルの解析結果とまとめて書き込まれるのを待つ
+                if db_write_queue is not None:
+                    future: asyncio.Future[None] = loop.create_future()
+                    await db_write_queue.put(PendingRecordedMetadataWrite(
+                        recorded_program = recorded_program,
+                        existing_db_recorded_video = existing_db_recorded_video_after_analyze,
+                        future = future,
+                    ))
+                    await future
+                else:
+                    await self.__saveRecordedMetadataToDB(recorded_program, existing_db_recorded_video_after_analyze)
                 logging.info(f'{file_path}: {"Updated" if existing_db_recorded_video_after_analyze else "Saved"} metadata to DB. (status: {recorded_program.recorded_video.status})')
 
-                # wait_background_analysis が True の場合のみ、バックグラウンド解析タスクが完了するまで待つ
-                # 録画番組メタデータ再解析 API では、API レスポンスの返却をもってメタデータ再解析が完全に完了したことをユーザーに伝える必要があるため
-                if wait_background_analysis is True and file_path in self._background_tasks:
-                    await self._background_tasks[file_path]
+                # 録画完了後のバックグラウンド解析 (キーフレーム解析・CM 区間検出・サムネイル生成) のジョブを追加
+                ## ジョブは DB に記録されたレコードを元に実行されるため、DB に永続化した後に追加する
+                ## 再解析を要求された録画ファイル > 録画が完了したばかりの録画ファイル > 一括スキャンで見つかった録画ファイルの順に優先して実行される
+                if recorded_program.recorded_video.status == 'Recorded':
+                    if wait_background_analysis is True:
+                        analysis_priority = AnalysisJobQueue.PRIORITY_USER_REQUEST
+                    elif db_write_queue is not None:
+                        analysis_priority = AnalysisJobQueue.PRIORITY_BACKLOG
+                    else:
+                        analysis_priority = AnalysisJobQueue.PRIORITY_NEW_RECORDING
+                    analysis_job_id = await AnalysisJobQueue().enqueue('RecordedAnalysis', file_path_str, analysis_priority)
+
+                    # wait_background_analysis が True の場合のみ、バックグラウンド解析のジョブが完了するまで待つ
+                    # 録画番組メタデータ再解析 API では、API レスポンスの返却をもってメタデータ再解析が完全に完了したことをユーザーに伝える必要があるため
+                    if wait_background_analysis is True:
+                        await AnalysisJobQueue().waitForJobs([analysis_job_id])
 
             except Exception as ex:
                 logging.error(f'{file_path}: Error processing file inside lock:', exc_info=ex)
@@ -844,42 +1178,87 @@ class RecordedScanTask:
             await db_recorded_video.save()
 
 
-    async def __runBackgroundAnalysis(self, recorded_program: schemas.RecordedProgram) -> None:
+    async def __indexRecordingKeyFrames(self, file_path: anyio.Path, recording_info: FileRecordingInfo) -> None:
         """
-        録画完了後のバックグラウンド解析タスク
-        - キーフレーム解析
-        - サムネイル生成
-        - CM区間検出
-        など、時間のかかる処理を非同期に同時実行する
+        録画中ファイルのキーフレーム情報を前回解析した位置の続きから解析し、新たに見つかったキーフレームをメモリ上のキーフレーム情報に追記する
+        録画完了後のキーフレーム解析を待たずに、録画中の番組を先頭から追っかけ再生できるようにするためのもの
+        DB へは RECORDING_KEYFRAME_SAVE_INTERVAL_SECONDS 秒ごとに、PAT/PMT インデックスとあわせてまとめて保存する
+        録画完了後は、KeyFrameAnalyzer によって改めて録画ファイル全体のキーフレーム情報が解析される
 
         Args:
-            recorded_program (schemas.RecordedProgram): 解析対象の録画番組情報
+            file_path (anyio.Path): 録画中ファイルのパス
+            recording_info (FileRecordingInfo): 録画中ファイルの状態
         """
 
-        # 録画ファイルのパスを anyio.Path に変換
-        file_path = anyio.Path(recorded_program.recorded_video.file_path)
-
         try:
-            logging.info(f'{file_path}: Starting background analysis task...')
-            # ProcessLimiter で稼働中のバックグラウンドタスクの同時実行数を CPU コア数の 50% に制限
-            async with ProcessLimiter.getSemaphore('RecordedScanTask'):
-                # DriveIOLimiter で同一 HDD に対してのバックグラウンドタスクの同時実行数を原則1セッションに制限
-                async with DriveIOLimiter.getSemaphore(file_path):
-                    await asyncio.gather(
-                        # 録画ファイルのキーフレーム情報を解析し DB に保存
-                        KeyFrameAnalyzer(file_path, recorded_program.recorded_video.container_format).analyzeAndSave(),
-                        # 録画ファイルの CM 区間を検出し DB に保存
-                        CMSectionsDetector(file_path, recorded_program.recorded_video.duration).detectAndSave(),
-                        # シークバー用サムネイルとリスト表示用の代表サムネイルの両方を生成
-                        ThumbnailGenerator.fromRecordedProgram(recorded_program).generateAndSave(),
-                    )
-            logging.info(f'{file_path}: Background analysis task completed.')
+            # 初回はインデクサーを作成する
+            if recording_info.keyframe_indexer is None:
+                # DB に録画中として登録済みの MPEG-TS 形式のファイルのみが対象
+                db_recorded_video = await RecordedVideo.get_or_none(file_path=str(file_path))
+                if (db_recorded_video is None or
+                    db_recorded_video.status != 'Recording' or
+                    db_recorded_video.container_format != 'MPEG-TS'):
+                    return
+
+                # サーバーの再起動などで DB に以前保存したキーフレーム情報が残っている場合は、最後のキーフレームの位置から解析を再開する
+                recording_info.keyframe_indexer = TSKeyFrameIndexer(
+                    file_path,
+                    db_recorded_video.key_frames,
+                    db_recorded_video.pat_pmt_index,
+                )
+                recording_info.key_frames = db_recorded_video.key_frames
+                recording_info.key_frames_saved_at = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+                recording_info.recorded_video_id = db_recorded_video.id
+
+            # 前回解析した位置の続きから、新たに追記された部分のみを解析する
+            ## 解析処理は同期 I/O で実装されているため、スレッドで実行する
+            key_frames = await asyncio.to_thread(recording_info.keyframe_indexer.index)
+            if len(key_frames) > 0:
+                recording_info.key_frames.extend(key_frames)
+                logging.debug(f'{file_path}: Appended {len(key_frames)} keyframes of the recording file. (total {len(recording_info.key_frames)} keyframes)')
+
+            # 前回 DB に保存してから RECORDING_KEYFRAME_SAVE_INTERVAL_SECONDS 秒以上経過していれば、DB にキーフレーム情報を保存する
+            now = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+            if (recording_info.key_frames_saved_at is not None and
+                (now - recording_info.key_frames_saved_at).total_seconds() < self.RECORDING_KEYFRAME_SAVE_INTERVAL_SECONDS):
+                return
+            recording_info.key_frames_saved_at = now
+            ## 解析中に録画が完了し、録画ファイル全体のキーフレーム情報で上書きされている場合もあるため、録画中の場合のみ更新する
+            await RecordedVideo.filter(id=recording_info.recorded_video_id, status='Recording').update(
+                key_frames = recording_info.key_frames,
+                pat_pmt_index = recording_info.keyframe_indexer.pat_pmt_index,
+            )
 
+        except FileNotFoundError:
+            # ファイルが既に削除されている場合
+            pass
         except Exception as ex:
-            logging.error(f'{file_path}: Error in background analysis task:', exc_info=ex)
+            logging.error(f'{file_path}: Error indexing keyframes of the recording file:', exc_info=ex)
         finally:
             # 完了したタスクを管理対象から削除
-            self._background_tasks.pop(file_path, None)
+            self._keyframe_index_tasks.pop(file_path, None)
+
+
+    def getRecordingKeyFrames(self, file_path: str, after_offset: int) -> tuple[list[schemas.KeyFrame], list[schemas.PATPMTEntry]] | None:
+        """
+        録画中ファイルのメモリ上のキーフレーム情報のうち、指定された位置より後ろのキーフレームのみを取得する
+        追っかけ再生中の VideoStream が、プレイリストの再読み込みのたびに DB からキーフレーム情報全体を読み直さずに済むようにするためのもの
+
+        Args:
+            file_path (str): 録画中ファイルのパス (RecordedVideo.file_path)
+            after_offset (int): 前回までに取得したキーフレームのうち、最後のキーフレームのファイル内の位置 (-1 ですべてを取得する)
+
+        Returns:
+            tuple[list[schemas.KeyFrame], list[schemas.PATPMTEntry]] | None: 新たなキーフレーム情報と、現時点の PAT/PMT インデックス (録画中ファイルとして解析中でない場合は None)
+        """
+
+        recording_info = self._recording_files.get(anyio.Path(file_path))
+        if recording_info is None or recording_info.keyframe_indexer is None:
+            return None
+
+        # キーフレーム情報はファイル内の位置の昇順に並んでいるため、二分探索で新たなキーフレームの開始位置を求める
+        start_index = bisect.bisect_right(recording_info.key_frames, after_offset, key=lambda key_frame: key_frame['offset'])
+        return recording_info.key_frames[start_index:], list(recording_info.keyframe_indexer.pat_pmt_index)
 
 
     async def watchRecordedFolders(self) -> None:
@@ -901,8 +1280,10 @@ class RecordedScanTask:
                 if not self._is_running:
                     break
 
-                # 変更があったファイルごとに処理
-                for change_type, file_path_str in changes:
+                # 変更があったファイルごとに、変更イベントを処理待ちとして登録する
+                ## 変更イベントの処理自体は、ファイルごとに変更イベントが途絶えるまで待ってから別タスクでまとめて行う
+                ## 移動・リネームでは削除イベントと追加イベントが順不同で同時に届くため、削除イベントを先に登録する
+                for change_type, file_path_str in sorted(changes, key=lambda change: change[0] != Change.deleted):
                     if not self._is_running:
                         break
 
@@ -910,21 +1291,12 @@ class RecordedScanTask:
                     # Mac の metadata ファイルをスキップ
                     if file_path.name.startswith('._'):
                         continue
-                    # シンボリックリンクを含むパスは実体に解決して処理する
-                    canonical_path = await self.resolveRecordedPath(file_path)
-                    if await canonical_path.is_dir():
-                        continue
-                    # 対象拡張子のファイル以外は無視
-                    if canonical_path.suffix.lower() not in self.SCAN_TARGET_EXTENSIONS:
-                        continue
-
                     try:
-                        # 追加 or 変更イベント
-                        if change_type == Change.added or change_type == Change.modified:
-                            await self.__handleFileChange(canonical_path, original_file_path=file_path)
-                        # 削除イベント
-                        elif change_type == Change.deleted:
-                            await self.__handleFileDeletion(canonical_path, original_file_path=file_path)
+                        # シンボリックリンクを含むパスは実体に解決して処理する
+                        canonical_path = await self.__resolveWatchedPath(file_path, change_type)
+                        if canonical_path is None:
+                            continue
+                        self.__scheduleFileChange(canonical_path, file_path, change_type)
                     except Exception as ex:
                         logging.error(f'{file_path}: Error handling file change:', exc_info=ex)
 
@@ -938,9 +1310,158 @@ class RecordedScanTask:
                 await completion_check_task
             except asyncio.CancelledError:
                 pass
+            # 処理待ちの変更イベントを破棄する
+            file_change_tasks = list(self._file_change_tasks.values())
+            for file_change_task in file_change_tasks:
+                file_change_task.cancel()
+            await asyncio.gather(*file_change_tasks, return_exceptions=True)
+            self._file_change_tasks.clear()
+            self._pending_file_changes.clear()
+            # 猶予時間の経過を待っているレコードの削除を取りやめる
+            deferred_deletion_tasks = list(self._deferred_deletion_tasks.values())
+            for deferred_deletion_task in deferred_deletion_tasks:
+                deferred_deletion_task.cancel()
+            await asyncio.gather(*deferred_deletion_tasks, return_exceptions=True)
             logging.info('File system watch of recording folders has been stopped.')
 
 
+    async def __resolveWatchedPath(self, file_path: anyio.Path, change_type: Change) -> anyio.Path | None:
+        """
+        ファイルシステム監視で検知したパスのシンボリックリンクを解決し、処理対象の録画ファイルであれば実体のパスを返す
+        解決結果はキャッシュし、録画中ファイルへの絶え間ない変更イベントではシンボリックリンクの解決とディレクトリ判定を省略する
+
+        Args:
+            file_path (anyio.Path): 監視で検知したファイルパス
+            change_type (Change): 変更の種類
+
+        Returns:
+            anyio.Path | None: シンボリックリンクを解決した実体のパス (処理対象の録画ファイルでない場合は None)
+        """
+
+        file_path_str = str(file_path)
+
+        # 追加・削除イベントでは、シンボリックリンクの参照先が変わっている可能性があるためキャッシュを破棄する
+        if change_type != Change.modified:
+            cached_path = self._resolved_path_cache.pop(file_path_str, None)
+            # 削除されたパスはもう解決できないため、キャッシュされていた実体のパスを使う
+            if change_type == Change.deleted and cached_path is not None:
+                return cached_path
+        else:
+            cached_path = self._resolved_path_cache.get(file_path_str)
+            if cached_path is not None:
+                return cached_path
+
+        canonical_path = await self.resolveRecordedPath(file_path)
+        if await canonical_path.is_dir():
+            return None
+        # 対象拡張子のファイル以外は無視
+        if canonical_path.suffix.lower() not in self.SCAN_TARGET_EXTENSIONS:
+            return None
+
+        if change_type != Change.deleted:
+            self._resolved_path_cache[file_path_str] = canonical_path
+        return canonical_path
+
+
+    def __scheduleFileChange(self, file_path: anyio.Path, original_file_path: anyio.Path, change_type: Change) -> None:
+        """
+        ファイルの変更イベントを処理待ちとして登録する
+        同じファイルへの処理待ちの変更イベントが既にある場合は、最後に受け取った変更イベントに集約する
+
+        Args:
+            file_path (anyio.Path): 解決後のファイルパス
+            original_file_path (anyio.Path): 監視で検知した元のファイルパス
+            change_type (Change): 変更の種類
+        """
+
+        now = time.monotonic()
+
+        # 録画中ファイルの場合は、録画完了の判定に使うため変更イベントを受け取った日時を記録する
+        recording_info = self._recording_files.get(file_path)
+        if recording_info is not None and change_type != Change.deleted:
+            recording_info.last_event_at = datetime.now(tz=ZoneInfo('Asia/Tokyo'))
+
+        pending_change = self._pending_file_changes.get(file_path)
+        if pending_change is not None:
+            pending_change.change_type = change_type
+            pending_change.original_file_path = original_file_path
+            pending_change.last_event_at = now
+        else:
+            self._pending_file_changes[file_path] = PendingFileChange(
+                change_type = change_type,
+                original_file_path = original_file_path,
+                first_event_at = now,
+                last_event_at = now,
+            )
+
+        # 変更イベントを集約して処理するタスクがなければ起動する
+        if file_path not in self._file_change_tasks:
+            self._file_change_tasks[file_path] = asyncio.create_task(self.__processPendingFileChange(file_path))
+
+
+    async def __processPendingFileChange(self, file_path: anyio.Path) -> None:
+        """
+        ファイルへの変更イベントが FILE_CHANGE_DEBOUNCE_SECONDS 秒間途絶えるまで (最大 FILE_CHANGE_MAX_DEFER_SECONDS 秒) 待ち、
+        集約した変更イベントを1回だけ処理する
+        異なるファイルへの変更イベントは、FILE_CHANGE_MAX_CONCURRENCY 件まで並行して処理する
+
+        Args:
+            file_path (anyio.Path): 解決後のファイルパス
+        """
+
+        try:
+            # 変更イベントが途絶えるまで待つ
+            while True:
+                pending_change = self._pending_file_changes[file_path]
+                process_at = min(
+                    pending_change.last_event_at + self.FILE_CHANGE_DEBOUNCE_SECONDS,
+                    pending_change.first_event_at + self.FILE_CHANGE_MAX_DEFER_SECONDS,
+                )
+                wait_seconds = process_at - time.monotonic()
+                if wait_seconds <= 0:
+                    break
+                await asyncio.sleep(wait_seconds)
+
+            # 処理中に受け取った変更イベントは、新たな処理待ちとして別のタスクで処理する
+            self._pending_file_changes.pop(file_path, None)
+            self._file_change_tasks.pop(file_path, None)
+
+            # 移動・リネームでは削除イベントと追加イベントが同時に届くため、追加イベントは処理待ち・処理中の削除イベントを処理し終えてから処理する
+            ## 先に追加イベントを処理すると、移動前のレコードがまだ照合対象に登録されておらず、移動先の録画ファイルを改めて解析してしまう
+            ## 削除イベントの処理にもセマフォが必要なため、セマフォを取得する前に待つ
+            if pending_change.change_type == Change.deleted:
+                current_task = asyncio.current_task()
+                assert current_task is not None
+                self._file_deletion_tasks.add(cast(asyncio.Task[None], current_task))
+            else:
+                deletion_tasks = set(self._file_deletion_tasks)
+                for pending_file_path, pending_file_change in self._pending_file_changes.items():
+                    pending_task = self._file_change_tasks.get(pending_file_path)
+                    if pending_file_change.change_type == Change.deleted and pending_task is not None:
+                        deletion_tasks.add(pending_task)
+                if len(deletion_tasks) > 0:
+                    await asyncio.wait(deletion_tasks)
+
+            async with self._file_change_semaphore:
+                if not self._is_running:
+                    return
+                try:
+                    # 追加 or 変更イベント
+                    if pending_change.change_type == Change.added or pending_change.change_type == Change.modified:
+                        await self.__handleFileChange(file_path, original_file_path=pending_change.original_file_path)
+                    # 削除イベント
+                    elif pending_change.change_type == Change.deleted:
+                        await self.__handleFileDeletion(file_path, original_file_path=pending_change.original_file_path)
+                except Exception as ex:
+                    logging.error(f'{pending_change.original_file_path}: Error handling file change:', exc_info=ex)
+
+        finally:
+            # キャンセルされた場合なども、このタスクが管理対象に残らないようにする
+            if self._file_change_tasks.get(file_path) is asyncio.current_task():
+                self._file_change_tasks.pop(file_path, None)
+            self._file_deletion_tasks.discard(cast(asyncio.Task[None], asyncio.current_task()))
+
+
     async def __handleFileChange(self, file_path: anyio.Path, original_file_path: anyio.Path | None = None) -> None:
         """
         ファイル追加・変更イベントを受け取り、適切な頻度で __processFile() を呼び出す
@@ -1057,10 +1578,30 @@ class RecordedScanTask:
                 if db_recorded_video is None and original_file_path is not None:
                     db_recorded_video = await RecordedVideo.get_or_none(file_path=str(original_file_path))
                 if db_recorded_video is not None:
-                    # RecordedVideo の親テーブルである RecordedProgram を削除すると、
-                    # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
-                    await db_recorded_video.recorded_program.delete()
-                    logging.info(f'{file_path}: Deleted record for removed file.')
+                    # 録画済みの録画ファイルのレコードは、移動・リネームされた場合に移動先のパスへ付け替えられるよう、猶予時間の経過後に削除する
+                    if db_recorded_video.status == 'Recorded' and self.MOVE_DETECTION_GRACE_SECONDS > 0:
+                        recorded_video_summary = RecordedVideoSummary(
+                            id = db_recorded_video.id,
+                            file_path = db_recorded_video.file_path,
+                            created_at = db_recorded_video.created_at,
+                            recorded_program_id = db_recorded_video.recorded_program_id,
+                            status = db_recorded_video.status,
+                            file_created_at = db_recorded_video.file_created_at,
+                            file_modified_at = db_recorded_video.file_modified_at,
+                            file_size = db_recorded_video.file_size,
+                            file_hash = db_recorded_video.file_hash,
+                        )
+                        if recorded_video_summary.id not in self._deferred_deletion_tasks:
+                            self.__addMissingRecordedVideo(recorded_video_summary)
+                            self._deferred_deletion_tasks[recorded_video_summary.id] = asyncio.create_task(
+                                self.__deleteMissingRecordedVideoLater(recorded_video_summary),
+                            )
+                            logging.info(f'{file_path}: File removed. The record will be deleted in {self.MOVE_DETECTION_GRACE_SECONDS} seconds unless the file was moved.')
+                    else:
+                        # RecordedVideo の親テーブルである RecordedProgram を削除すると、
+                        # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
+                        await db_recorded_video.recorded_program.delete()
+                        logging.info(f'{file_path}: Deleted record for removed file.')
 
             except Exception as ex:
                 logging.error(f'{file_path}: Error handling file deletion inside lock:', exc_info=ex)
@@ -1071,10 +1612,123 @@ class RecordedScanTask:
                         self._file_locks.pop(file_path, None)
 
 
+    def __addMissingRecordedVideo(self, recorded_video_summary: RecordedVideoSummary) -> None:
+        """
+        録画ファイルが見つからなくなった録画済みのレコードを、移動・リネームの照合対象として索引に登録する
+
+        Args:
+            recorded_video_summary (RecordedVideoSummary): 録画ファイルが見つからなくなったレコードのサマリーデータ
+        """
+
+        # 既知のハッシュ衝突が発生しうるレコードは、別の録画ファイルに誤って付け替えないよう照合対象にしない
+        if recorded_video_summary.file_hash in self.KNOWN_COLLISION_FILE_HASHES:
+            return
+
+        fingerprint = (recorded_video_summary.file_size, recorded_video_summary.file_hash)
+        self._missing_recorded_videos.setdefault(fingerprint, []).append(recorded_video_summary)
+        self._missing_recorded_video_sizes[recorded_video_summary.file_size] += 1
+
+
+    def __removeMissingRecordedVideo(self, recorded_video_summary: RecordedVideoSummary) -> bool:
+        """
+        録画ファイルが見つからなくなった録画済みのレコードを、移動・リネームの照合対象から除く
+
+        Args:
+            recorded_video_summary (RecordedVideoSummary): 照合対象から除くレコードのサマリーデータ
+
+        Returns:
+            bool: 照合対象から除いた場合は True (既に移動先の録画ファイルに付け替えられているなど、照合対象にない場合は False)
+        """
+
+        fingerprint = (recorded_video_summary.file_size, recorded_video_summary.file_hash)
+        candidates = self._missing_recorded_videos.get(fingerprint)
+        if candidates is None or all(candidate.id != recorded_video_summary.id for candidate in candidates):
+            return False
+
+        candidates[:] = [candidate for candidate in candidates if candidate.id != recorded_video_summary.id]
+        if len(candidates) == 0:
+            self._missing_recorded_videos.pop(fingerprint, None)
+        self._missing_recorded_video_sizes[recorded_video_summary.file_size] -= 1
+        if self._missing_recorded_video_sizes[recorded_video_summary.file_size] <= 0:
+            self._missing_recorded_video_sizes.pop(recorded_video_summary.file_size, None)
+        return True
+
+
+    async def __findMovedRecordedVideo(self, file_path: anyio.Path, file_size: int) -> RecordedVideoSummary | None:
+        """
+        追加された録画ファイルと同じファイルサイズ・ハッシュを持つ、録画ファイルが見つからなくなった録画済みのレコードを探す
+        見つかったレコードは照合対象から除かれるため、呼び出し元で移動先のパスに付け替える必要がある
+
+        Args:
+            file_path (anyio.Path): 追加された録画ファイルのパス
+            file_size (int): 追加された録画ファイルのファイルサイズ
+
+        Returns:
+            RecordedVideoSummary | None: 移動・リネーム前の録画ファイルのレコードのサマリーデータ (見つからなかった場合は None)
+        """
+
+        # 同じファイルサイズのレコードがなければ、ハッシュを算出するまでもなく移動・リネームされた録画ファイルではない
+        if self._missing_recorded_video_sizes.get(file_size, 0) == 0:
+            return None
+
+        # FFprobe による解析を行わずに、メタデータ解析時と同じ方法でハッシュを算出する
+        ## ファイルの数箇所を読み込むだけなので、別スレッドで実行する
+        file_hash = await asyncio.to_thread(MetadataAnalyzer(pathlib.Path(str(file_path))).calculateFingerprint)
+        if file_hash is None:
+            return None
+
+        for candidate in list(self._missing_recorded_videos.get((file_size, file_hash), [])):
+            # 移動前のパスに録画ファイルが存在する場合は、移動ではなくコピーされた録画ファイルのため付け替えない
+            if await self.isFileExists(anyio.Path(candidate.file_path)):
+                continue
+            # ハッシュの算出中に別のタスクによって照合対象から除かれていないか確認する
+            if self.__removeMissingRecordedVideo(candidate) is True:
+                return candidate
+
+        return None
+
+
+    async def __deleteMissingRecordedVideoLater(self, recorded_video_summary: RecordedVideoSummary) -> None:
+        """
+        ファイル削除イベントを受け取った録画ファイルのレコードを、MOVE_DETECTION_GRACE_SECONDS 秒後に DB から削除する
+        それまでに移動先の録画ファイルに付け替えられた場合や、同じパスに録画ファイルが戻された場合は削除しない
+
+        Args:
+            recorded_video_summary (RecordedVideoSummary): 削除対象のレコードのサマリーデータ
+        """
+
+        file_path = anyio.Path(recorded_video_summary.file_path)
+        try:
+            await asyncio.sleep(self.MOVE_DETECTION_GRACE_SECONDS)
+
+            # 照合対象から除かれている場合は、既に移動先の録画ファイルに付け替えられている
+            if self.__removeMissingRecordedVideo(recorded_video_summary) is False:
+                return
+            if await self.isFileExists(file_path):
+                return
+
+            # RecordedVideo の親テーブルである RecordedProgram を削除すると、
+            # CASCADE 制約により RecordedVideo も同時に削除される (Channel は親テーブルにあたるため削除されない)
+            ## 猶予時間の間にレコードが別のパスに付け替えられていないことを確認してから削除する
+            if await RecordedVideo.filter(id=recorded_video_summary.id, file_path=recorded_video_summary.file_path).exists():
+                await RecordedProgram.filter(id=recorded_video_summary.recorded_program_id).delete()
+                logging.info(f'{file_path}: Deleted record for removed file.')
+
+        except asyncio.CancelledError:
+            # サーバーの終了時に削除されなかったレコードは、次回起動時の一括スキャンで改めて照合・削除される
+            self.__removeMissingRecordedVideo(recorded_video_summary)
+            raise
+        except Exception as ex:
+            logging.error(f'{file_path}: Error deleting record for removed file:', exc_info=ex)
+        finally:
+            self._deferred_deletion_tasks.pop(recorded_video_summary.id, None)
+
+
     async def __checkRecordingCompletion(self) -> None:
         """
         録画 (またはファイルコピー) の完了状態を定期的にチェックする
-        - 30秒間ファイルの更新がない場合に録画完了 (またはファイルコピー完了) と判断
+        - ファイルシステム監視で RECORDING_COMPLETE_SECONDS 秒間変更イベントを受け取っていないファイルのみ、stat して録画完了かを確認する
+        - RECORDING_COMPLETE_SECONDS 秒以上ファイルの更新がなく、ファイルサイズも変化していない場合に録画完了 (またはファイルコピー完了) と判断
         - 完了したファイルは再度メタデータを解析して DB に保存
         """
 
@@ -1084,17 +1738,36 @@ class RecordedScanTask:
                 completed_files: list[anyio.Path] = []
 
                 # 録画中ファイルをチェック
-                for file_path, recording_info in self._recording_files.items():
+                for file_path, recording_info in list(self._recording_files.items()):
                     try:
-                        # ファイルの現在の状態を取得
-                        stat = await file_path.stat()
-                        current_modified = datetime.fromtimestamp(stat.st_mtime, tz=ZoneInfo('Asia/Tokyo'))
-                        current_size = stat.st_size
-
-                        # RECORDING_COMPLETE_SECONDS 秒以上更新がなく、かつファイルサイズが変化していない場合は録画完了と判断
-                        if ((now - current_modified).total_seconds() >= self.RECORDING_COMPLETE_SECONDS and
-                            current_size == recording_info.file_size):
-                            completed_files.append(file_path)
+                        # 変更イベントが届き続けているファイルは録画中なので stat しない
+                        ## 変更イベントをまだ受け取っていないファイルは、録画中とマークした日時から起算する
+                        last_event_at = recording_info.last_event_at or recording_info.last_checked
+                        if (now - last_event_at).total_seconds() >= self.RECORDING_COMPLETE_SECONDS:
+                            # 変更イベントが途絶えたファイルの現在の状態を取得
+                            stat = await file_path.stat()
+                            current_modified = datetime.fromtimestamp(stat.st_mtime, tz=ZoneInfo('Asia/Tokyo'))
+                            current_size = stat.st_size
+
+                            # RECORDING_COMPLETE_SECONDS 秒以上更新がなく、かつファイルサイズが変化していない場合は録画完了と判断
+                            if ((now - current_modified).total_seconds() >= self.RECORDING_COMPLETE_SECONDS and
+                                current_size == recording_info.file_size):
+                                completed_files.append(file_path)
+                                continue
+
+                            # 変更イベントが届かない環境 (一部のネットワークドライブなど) では、stat の結果から更新を検知する
+                            ## 次に確認するのは、さらに RECORDING_COMPLETE_SECONDS 秒経過した後になる
+                            recording_info.last_event_at = now
+                            recording_info.file_size = current_size
+
+                        # まだ録画中のファイルは、追っかけ再生できるよう RECORDING_KEYFRAME_INDEX_INTERVAL_SECONDS 秒ごとにキーフレーム情報を追記する
+                        if (file_path not in self._keyframe_index_tasks and
+                            (recording_info.keyframe_indexed_at is None or
+                             (now - recording_info.keyframe_indexed_at).total_seconds() >= self.RECORDING_KEYFRAME_INDEX_INTERVAL_SECONDS)):
+                            recording_info.keyframe_indexed_at = now
+                            self._keyframe_index_tasks[file_path] = asyncio.create_task(
+                                self.__indexRecordingKeyFrames(file_path, recording_info),
+                            )
                     except FileNotFoundError:
                         # ファイルが削除された場合は記録から削除
                         completed_files.append(file_path)
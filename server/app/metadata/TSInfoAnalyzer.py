@@ -1,14 +1,16 @@
 
 import asyncio
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
 from datetime import datetime, timedelta
-from io import BufferedReader, BytesIO
+from io import BufferedReader, BytesIO, FileIO
+from itertools import chain
 from pathlib import Path
 from typing import Any, Literal, cast
 from zoneinfo import ZoneInfo
 
 import ariblib
 import ariblib.event
+import numpy as np
 from ariblib.descriptors import (
     AudioComponentDescriptor,
     ServiceDescriptor,
@@ -30,6 +32,94 @@ from app.utils import ClosestMultiple
 from app.utils.TSInformation import TSInformation
 
 
+class PIDFilteredTransportStreamFile(ariblib.TransportStreamFile):
+    """
+    ariblib.TransportStreamFile を継承し、必要な PID の TS パケットのみを ariblib に渡すクラス
+    ariblib はチャンクごとにすべての TS パケットを Python のループで走査するため、映像・音声パケットが大半を占める録画ファイルでは非常に遅い
+    チャンクを NumPy の配列として読み込み、PID の抽出と絞り込みをまとめて行うことで、Python で処理する TS パケットを PSI/SI のものだけに減らす
+    TODO: 物理ファイル以外を受け取れるよう ariblib を変更すべき
+    このやり方は ariblib の内部実装 (sections() が __iter__() で TS パケットを取得すること) を仮定しているのでよくない
+    """
+
+    def __init__(self, stream: Any, chunk_size: int = 10000) -> None:
+        """
+        TS ファイルを開く
+
+        Args:
+            stream (Any): TS データのストリーム (FileIO や BytesIO)
+            chunk_size (int): 一度に読み込む TS パケットの数
+        """
+
+        BufferedReader.__init__(self, stream)
+        self.chunk_size = chunk_size
+        self._callbacks = dict()
+        # 現在実行中の sections() が必要とする PID (None のときはすべての TS パケットを返す)
+        self._target_pids: set[int] | None = None
+
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.iterPackets(self._target_pids)
+
+
+    def sections(self, *Sections: Any) -> Iterator[Any]:
+        """
+        TS ファイルから指定されたセクションを取り出す
+        ariblib の実装をそのまま使うが、__iter__() からは各セクションの PID の TS パケットのみが返される
+
+        Args:
+            *Sections (Any): 取り出すセクションのクラス
+
+        Returns:
+            Iterator[Any]: 取り出したセクション
+        """
+
+        self._target_pids = set(chain.from_iterable(Section._pids for Section in Sections))
+        try:
+            yield from super().sections(*Sections)
+        finally:
+            self._target_pids = None
+
+
+    def iterPackets(self, target_pids: set[int] | None, include_pcr_packets: bool = False, end_offset: int | None = None) -> Iterator[bytes]:
+        """
+        現在の位置から TS パケットを読み込み、指定された PID の TS パケットのみを返す
+
+        Args:
+            target_pids (set[int] | None): 返す TS パケットの PID (None のときはすべての TS パケットを返す)
+            include_pcr_packets (bool): PID に関わらず、PCR を含む TS パケットも返すかどうか
+            end_offset (int | None): この位置より後ろは読み込まない (ファイル後半がゼロ埋めされている場合に指定する)
+
+        Returns:
+            Iterator[bytes]: TS パケット
+        """
+
+        target_pid_array = np.array(sorted(target_pids), dtype=np.uint16) if target_pids is not None else None
+        while True:
+            read_size = ts.PACKET_SIZE * self.chunk_size
+            if end_offset is not None:
+                read_size = min(read_size, (end_offset - self.tell()) // ts.PACKET_SIZE * ts.PACKET_SIZE)
+            if read_size < ts.PACKET_SIZE:
+                break
+            chunk = self.read(read_size)
+            packet_count = len(chunk) // ts.PACKET_SIZE
+            if packet_count == 0:
+                break
+
+            # チャンクを (TS パケット数, 188) の行列として扱い、同期バイトと PID をまとめて判定する
+            packets = np.frombuffer(chunk, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE).reshape(packet_count, ts.PACKET_SIZE)
+            mask = packets[:, 0] == ts.SYNC_BYTE[0]
+            if target_pid_array is not None:
+                packet_pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+                pid_mask = np.isin(packet_pids, target_pid_array)
+                if include_pcr_packets is True:
+                    # アダプテーションフィールドがあり、adaptation_field_length が 0 より大きく、PCR_flag が立っている TS パケット
+                    pid_mask |= (((packets[:, 3] & 0x20) != 0) & (packets[:, 4] > 0) & ((packets[:, 5] & 0x10) != 0))
+                mask &= pid_mask
+
+            for index in np.flatnonzero(mask).tolist():
+                yield chunk[index * ts.PACKET_SIZE:(index + 1) * ts.PACKET_SIZE]
+
+
 class TSInfoAnalyzer:
     """
     録画 TS ファイルや録画データ関連ファイルに含まれる番組情報を解析するクラス
@@ -62,7 +152,8 @@ class TSInfoAnalyzer:
             ## 188 * 10000 バイト (≒ 1.88MB) ごとに分割して読み込む
             ## 現状 ariblib は先頭が sync_byte でない or 途中で同期が壊れる (破損した TS パケットが存在する) TS ファイルを想定していないため、
             ## ariblib に入力する録画ファイルは必ず正常な TS ファイルである必要がある
-            self.ts = ariblib.tsopen(self.recorded_video.file_path, chunk=10000)
+            ## ariblib には PSI/SI の TS パケットのみを渡す
+            self.ts = PIDFilteredTransportStreamFile(FileIO(self.recorded_video.file_path), chunk_size=10000)
 
         # それ以外の場合、存在すれば PSI/SI 書庫 (.psc) を読み込んで仮想 TS ファイルを作成する
         else:
@@ -93,21 +184,29 @@ class TSInfoAnalyzer:
                             if time_sec > 60:
                                 return True
 
-                        i = 0
-                        while i < len(section):
-                            # TS パケットに変換
-                            packets.append(0x47)
-                            packets.append((0x40 if i == 0 else 0) | pid >> 8)
-                            packets.append(pid & 0xff)
+                        # TS パケットに変換
+                        ## 最初の TS パケットはヘッダー (4 バイト) と pointer_field (1 バイト) の後ろに 183 バイト、
+                        ## 以降の TS パケットはヘッダーの後ろに 184 バイトずつセクションを格納し、余りは 0xff で埋める
+                        packet_count = 1 + (max(len(section) - 183, 0) + 183) // 184
+                        packets_offset = len(packets)
+                        packets.extend(b'\xff' * (ts.PACKET_SIZE * packet_count))
+                        section_offset = 0
+                        for packet_index in range(packet_count):
+                            packet_offset = packets_offset + packet_index * ts.PACKET_SIZE
                             counters[pid] = (counters[pid] + 1) & 0x0f if pid in counters else 0
-                            packets.append(0x10 | counters[pid])
-                            if i == 0:
-                                packets.append(0)
-                            while len(packets) % 188 != 0 and i < len(section):
-                                packets.append(section[i])
-                                i += 1
-                            while len(packets) % 188 != 0:
-                                packets.append(0xff)
+                            packets[packet_offset:packet_offset + 4] = bytes((
+                                0x47,
+                                (0x40 if packet_index == 0 else 0) | pid >> 8,
+                                pid & 0xff,
+                                0x10 | counters[pid],
+                            ))
+                            payload_offset = packet_offset + 4
+                            if packet_index == 0:
+                                packets[payload_offset] = 0
+                                payload_offset += 1
+                            payload_size = min(packet_offset + ts.PACKET_SIZE - payload_offset, len(section) - section_offset)
+                            packets[payload_offset:payload_offset + payload_size] = section[section_offset:section_offset + payload_size]
+                            section_offset += payload_size
                         return True
 
                     # PAT, NIT, SDT, TOT, EIT を取り出す
@@ -118,17 +217,9 @@ class TSInfoAnalyzer:
             except Exception:
                 pass
 
-            # TODO: 物理ファイル以外を受け取れるよう ariblib を変更すべき
-            # このやり方は ariblib の内部実装を仮定しているのでよくない
-            class TransportStreamFileWorkaround(ariblib.TransportStreamFile):
-                def __init__(self, stream: Any):
-                    BufferedReader.__init__(self, stream)
-                    self.chunk_size = 1
-                    self._callbacks = dict()
-
             # コンストラクタは失敗しない設計なので packets が空でも入力する
             # ここで self.end_ts_offset に 0 がセットされた時、TSInfoAnalyzer.analyze() は常に None を返す
-            self.ts = TransportStreamFileWorkaround(BytesIO(packets))
+            self.ts = PIDFilteredTransportStreamFile(BytesIO(packets))
             self.end_ts_offset = len(packets)
 
 
@@ -204,15 +295,9 @@ class TSInfoAnalyzer:
                 # PSI セクション開始時点 (PUSI) の PCR 値を保持し、そのセクションに対する経過時間算出に用いる
                 pcr_at_section_start_sec: float | None = None
 
-                # end_ts_offset 以降はゼロ埋めである可能性が高いため、読み取りを制限する
-                read_bytes = 0
-                while True:
-                    packet = self.ts.read(ts.PACKET_SIZE)
-                    if packet is None or len(packet) < ts.PACKET_SIZE:
-                        break
-                    read_bytes += ts.PACKET_SIZE
-                    if read_bytes > self.end_ts_offset:
-                        break
+                # TOT (PID 0x14) と PCR を含む TS パケットのみを読み込む
+                ## end_ts_offset 以降はゼロ埋めである可能性が高いため、読み取りを制限する
+                for packet in self.ts.iterPackets({0x14}, include_pcr_packets=True, end_offset=self.end_ts_offset):
 
                     # PCR を追跡
                     pcr_val = ts.pcr(packet)
@@ -813,16 +898,17 @@ class TSInfoAnalyzer:
             logging.warning(f'{self.recorded_video.file_path}: Failed to read TS sample for PID analysis:', exc_info=ex)
             return None
 
-        pid_counts: dict[int, int] = {}
-        offset = 0
-        while offset + ts.PACKET_SIZE <= len(sample_data):
-            if sample_data[offset] != ts.SYNC_BYTE[0]:
-                offset += 1
-                continue
-            packet = sample_data[offset:offset + ts.PACKET_SIZE]
-            packet_pid = pid(packet)
-            pid_counts[packet_pid] = pid_counts.get(packet_pid, 0) + 1
-            offset += ts.PACKET_SIZE
+        # 最初の同期バイトの位置から TS パケット単位で区切り、同期バイトで始まる TS パケットの PID をまとめて数える
+        sample_array = np.frombuffer(sample_data, dtype=np.uint8)
+        sync_byte_indices = np.flatnonzero(sample_array == ts.SYNC_BYTE[0])
+        if len(sync_byte_indices) == 0:
+            return None
+        sync_offset = int(sync_byte_indices[0])
+        packet_count = (len(sample_array) - sync_offset) // ts.PACKET_SIZE
+        packets = sample_array[sync_offset:sync_offset + packet_count * ts.PACKET_SIZE].reshape(packet_count, ts.PACKET_SIZE)
+        packets = packets[packets[:, 0] == ts.SYNC_BYTE[0]]
+        packet_pids, packet_pid_counts = np.unique(((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2], return_counts=True)
+        pid_counts: dict[int, int] = dict(zip(packet_pids.tolist(), packet_pid_counts.tolist()))
 
         if len(pid_counts) == 0:
             return None
@@ -0,0 +1,548 @@
+
+import base64
+from collections.abc import Callable
+from pathlib import Path
+from typing import ClassVar
+
+import anyio
+import numpy as np
+from biim.mpeg2ts import ts
+from biim.mpeg2ts.parser import SectionParser
+from biim.mpeg2ts.pat import PATSection
+from biim.mpeg2ts.pmt import PMTSection
+
+from app import schemas
+
+
+class TSKeyFrameIndexer:
+    """
+    MPEG-TS 形式の録画ファイルから、映像 PID の PES ヘッダーと ES の先頭だけを見てキーフレームの位置と DTS を抽出するクラス
+    解析状態を保持しているため、録画中のファイルに対して index() を繰り返し呼び出すと、前回解析した位置の続きから追記された部分のみを解析できる
+    キーフレームの解析と同時に、PAT/PMT の内容が変化する位置 (PAT/PMT インデックス) も記録する
+    """
+
+    # 一度に読み込むデータのサイズ (バイト)
+    ## 大きめに読み込むことで、NumPy による PID の抽出を一度に多くの TS パケットに対して行えるようにする
+    READ_SIZE: ClassVar[int] = ts.PACKET_SIZE * 32768  # 約 6MB
+
+    # フレームの種別を判定するために ES データを確認する最大サイズ (バイト)
+    ## これを超えてもフレームの種別を判定できない場合は、キーフレームではないとみなす
+    ES_PROBE_MAX_BYTES: ClassVar[int] = 64 * 1024
+
+    # 33bit タイムスタンプが一周する値
+    TIMESTAMP_WRAP: ClassVar[int] = 1 << 33
+
+    # PMT の stream_type
+    STREAM_TYPE_MPEG2: ClassVar[int] = 0x02
+    STREAM_TYPE_H264: ClassVar[int] = 0x1B
+    STREAM_TYPE_H265: ClassVar[int] = 0x24
+
+
+    def __init__(
+        self,
+        file_path: anyio.Path | Path | str,
+        key_frames: list[schemas.KeyFrame] | None = None,
+        pat_pmt_index: list[schemas.PATPMTEntry] | None = None,
+    ) -> None:
+        """
+        MPEG-TS 形式の録画ファイルのキーフレーム情報を抽出するクラスを初期化する
+
+        Args:
+            file_path (anyio.Path | Path | str): 解析対象の録画ファイルのパス
+            key_frames (list[schemas.KeyFrame] | None, optional): 以前に抽出済みのキーフレーム情報 (指定された場合は最後のキーフレームの位置から解析を再開する). Defaults to None.
+            pat_pmt_index (list[schemas.PATPMTEntry] | None, optional): 以前に抽出済みの PAT/PMT インデックス (解析を再開する場合に引き継ぐ). Defaults to None.
+        """
+
+        self.file_path = str(file_path)
+        if key_frames is None:
+            key_frames = []
+        if pat_pmt_index is None:
+            pat_pmt_index = []
+
+        # 次に解析する TS パケットのファイル内の位置
+        ## 以前に抽出済みのキーフレーム情報がある場合は、最後のキーフレームの位置から解析を再開する
+        self.next_offset: int = key_frames[-1]['offset'] if len(key_frames) > 0 else 0
+        # 以前に抽出済みのキーフレームのうち、最後のキーフレームのファイル内の位置
+        ## 解析を再開した場合、この位置以前のキーフレームは重複するため出力しない
+        self._resume_offset: int = key_frames[-1]['offset'] if len(key_frames) > 0 else -1
+        # 最後に取得した DTS (33bit の折り返しを補正したもの)
+        self._last_dts: int | None = key_frames[-1]['dts'] if len(key_frames) > 0 else None
+
+        # PAT/PMT の解析状態
+        self._pat_parser: SectionParser[PATSection] = SectionParser(PATSection)
+        self._pmt_parser: SectionParser[PMTSection] = SectionParser(PMTSection)
+        self._pmt_pid: int | None = None
+        self._video_pid: int | None = None
+        self._video_stream_type: int | None = None
+
+        # PAT/PMT の内容が変化する位置と、その時点の PAT/PMT の TS パケットのリスト
+        ## PAT/PMT は 100ms 程度の間隔で繰り返し送出されるが、内容が変化した時点のみを記録するため、結果は通常数件程度に収まる
+        ## 解析を再開した場合、再開位置以前の PAT/PMT インデックスは引き継ぐ
+        self.pat_pmt_index: list[schemas.PATPMTEntry] = [entry for entry in pat_pmt_index if entry['offset'] < self.next_offset]
+        # 現在組み立て中のセクションの TS パケットと、その先頭パケットのファイル内の位置
+        self._pat_packets: list[bytes] = []
+        self._pat_offset: int = 0
+        self._pmt_packets: list[bytes] = []
+        self._pmt_offset: int = 0
+        # 最後に取得できた PAT の TS パケットと、その先頭パケットのファイル内の位置
+        self._latest_pat_packets: list[bytes] | None = None
+        self._latest_pat_offset: int = 0
+        # 最後に記録した PAT/PMT の内容 (CC を除いた TS パケットのデータ)
+        ## 解析を再開した場合は、引き継いだ最後のエントリの内容とし、再開後に同じ内容の PAT/PMT を重複して記録しないようにする
+        self._last_pat_pmt_key: bytes | None = None
+        if len(self.pat_pmt_index) > 0:
+            last_packets = base64.b64decode(self.pat_pmt_index[-1]['packets'])
+            self._last_pat_pmt_key = b''.join(
+                last_packets[packet_offset + 4:packet_offset + ts.PACKET_SIZE]
+                for packet_offset in range(0, len(last_packets), ts.PACKET_SIZE)
+            )
+
+        # 現在フレームの種別を判定中の映像 PES の状態
+        self._is_pes_probing: bool = False
+        self._pes_offset: int = 0
+        self._pes_dts: int = 0
+        self._pes_random_access_indicator: bool = False
+        self._pes_es = bytearray()
+
+        # 最後に見つかった映像 PES のファイル内の位置と DTS
+        self._last_pes_offset: int | None = None
+        self._last_pes_dts: int | None = None
+
+
+    def index(self, is_final: bool = False, chunk_callback: Callable[[memoryview], None] | None = None) -> list[schemas.KeyFrame]:
+        """
+        前回解析した位置から現在のファイル末尾までを解析し、新たに見つかったキーフレーム情報を返す (同期関数)
+        録画中のファイルでは末尾の TS パケットが書き込み途中の場合があるため、完全な TS パケットのみを解析し、残りは次回に持ち越す
+        読み込み用のバッファは使い回し、TS パケットの配列もバッファをそのまま参照するため、ファイルサイズに関わらずメモリ使用量は一定に保たれる
+        chunk_callback を指定すると、ファイルから読み込んだデータを読み込んだ順にそのまま渡す
+        キーフレームの解析と同じ1回のシーケンシャルな読み込みで、サムネイル生成などほかの解析処理にもデータを供給するためのもの
+
+        Args:
+            is_final (bool, optional): 録画が完了したファイルの末尾までの解析かどうか (True の場合、最後のフレームがキーフレームでなくてもシーク用に追加する). Defaults to False.
+            chunk_callback (Callable[[memoryview], None] | None, optional): 読み込んだデータを受け取るコールバック (渡される memoryview は読み込み用のバッファを参照しているため、コールバック内で消費すること). Defaults to None.
+
+        Returns:
+            list[schemas.KeyFrame]: 新たに見つかったキーフレーム情報のリスト
+        """
+
+        key_frames: list[schemas.KeyFrame] = []
+
+        # 読み込み用のバッファ
+        ## filled はバッファ内の有効なデータのサイズ、buffer_offset はバッファの先頭のファイル内の位置
+        buffer = bytearray(self.READ_SIZE)
+        buffer_view = memoryview(buffer)
+        filled = 0
+        buffer_offset = self.next_offset
+
+        with open(self.file_path, 'rb') as file:
+            file.seek(self.next_offset)
+
+            while True:
+                read_size = file.readinto(buffer_view[filled:])
+                if not read_size:
+                    break
+                if chunk_callback is not None:
+                    chunk_callback(buffer_view[filled:filled + read_size])
+                filled += read_size
+
+                # バッファ内の完全な TS パケットを処理する
+                ## 同期バイトが途中で崩れている場合は、崩れている TS パケットまでを処理してから再同期し、残りを処理する
+                position = 0
+                while True:
+                    position = self.findTSPacketAlignment(buffer, position, filled)
+                    packet_count = (filled - position) // ts.PACKET_SIZE
+                    if packet_count == 0:
+                        break
+                    packets = np.frombuffer(buffer, dtype=np.uint8, count=packet_count * ts.PACKET_SIZE, offset=position) \
+                        .reshape(packet_count, ts.PACKET_SIZE)
+                    broken_indices = np.flatnonzero(packets[:, 0] != ts.SYNC_BYTE[0])
+                    if len(broken_indices) > 0:
+                        packet_count = int(broken_indices[0])
+                        packets = packets[:packet_count]
+
+                    # PAT/PMT/映像の TS パケットのインデックスを求める
+                    ## 大半を占める音声や字幕などの TS パケットは Python レベルでは一切触らない
+                    pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+                    current_pids = (self._pmt_pid, self._video_pid)
+                    indices = np.flatnonzero(self.__getTargetPIDMask(pids))
+                    cursor = 0
+                    while cursor < len(indices):
+                        index = int(indices[cursor])
+                        cursor += 1
+                        packet_position = position + index * ts.PACKET_SIZE
+                        packet = bytes(buffer_view[packet_position:packet_position + ts.PACKET_SIZE])
+                        self.__processPacket(packet, buffer_offset + packet_position, key_frames)
+
+                        # PMT や映像の PID が変わった場合、以降の TS パケットのインデックスを求め直す
+                        if (self._pmt_pid, self._video_pid) != current_pids:
+                            current_pids = (self._pmt_pid, self._video_pid)
+                            indices = index + 1 + np.flatnonzero(self.__getTargetPIDMask(pids[index + 1:]))
+                            cursor = 0
+
+                    del packets, pids
+                    position += packet_count * ts.PACKET_SIZE
+                    if len(broken_indices) == 0:
+                        break
+
+                # 末尾の TS パケットに満たないデータをバッファの先頭に移し、続きを読み込む
+                remaining = filled - position
+                buffer[:remaining] = buffer[position:filled]
+                buffer_offset += position
+                filled = remaining
+
+        # 末尾の書き込み途中の TS パケットは次回解析する
+        self.next_offset = buffer_offset
+
+        # 録画が完了したファイルでは、最後のフレームがキーフレームでない場合もシーク用に追加する
+        ## ffprobe でキーフレーム情報を解析していた頃の挙動に合わせている
+        if (is_final is True and
+            self._last_pes_offset is not None and self._last_pes_dts is not None and
+            self._last_pes_offset > self._resume_offset and
+            (len(key_frames) == 0 or key_frames[-1]['offset'] != self._last_pes_offset)):
+            key_frames.append({
+                'offset': self._last_pes_offset,
+                'dts': self._last_pes_dts,
+            })
+
+        return key_frames
+
+
+    @staticmethod
+    def findTSPacketAlignment(data: bytes | bytearray, start: int, end: int) -> int:
+        """
+        指定された範囲内で、同期バイトが TS パケットサイズの間隔で並んでいる (TS パケット境界である) 最初の位置を探す
+
+        Args:
+            data (bytes | bytearray): 探索対象のデータ
+            start (int): 探索を開始する位置
+            end (int): 探索範囲の終端 (この位置を含まない)
+
+        Returns:
+            int: TS パケット境界の位置 (見つからなかった場合は end)
+        """
+
+        offset = data.find(ts.SYNC_BYTE, start, end)
+        while offset != -1:
+            # 188 バイト先と 376 バイト先の同期バイトを確認し、TS パケット境界であるか検証する
+            ## 範囲外の位置は次回の読み込みで検証されるので、ここでは妥当とみなす
+            is_aligned = True
+            for next_offset in (offset + ts.PACKET_SIZE, offset + ts.PACKET_SIZE * 2):
+                if next_offset < end and data[next_offset] != ts.SYNC_BYTE[0]:
+                    is_aligned = False
+                    break
+            if is_aligned is True:
+                return offset
+            offset = data.find(ts.SYNC_BYTE, offset + 1, end)
+
+        return end
+
+
+    def __getTargetPIDMask(self, pids: np.ndarray) -> np.ndarray:
+        """
+        TS パケットの PID の配列から、解析対象 (PAT/PMT/映像) の TS パケットのマスクを取得する
+
+        Args:
+            pids (np.ndarray): TS パケットの PID の配列
+
+        Returns:
+            np.ndarray: 解析対象の TS パケットであれば True となるマスク
+        """
+
+        mask = pids == 0x00
+        if self._pmt_pid is not None:
+            mask |= pids == self._pmt_pid
+        if self._video_pid is not None:
+            mask |= pids == self._video_pid
+        return mask
+
+
+    def __processPacket(self, packet: bytes, packet_offset: int, key_frames: list[schemas.KeyFrame]) -> None:
+        """
+        PAT/PMT/映像の TS パケットを1つ処理し、キーフレームが見つかれば key_frames に追加する
+
+        Args:
+            packet (bytes): TS パケット
+            packet_offset (int): TS パケットのファイル内の位置
+            key_frames (list[schemas.KeyFrame]): 見つかったキーフレーム情報の追加先
+        """
+
+        pid = ts.pid(packet)
+
+        # PAT
+        if pid == 0x00:
+            if ts.payload_unit_start_indicator(packet):
+                self._pat_packets = []
+                self._pat_offset = packet_offset
+            self._pat_packets.append(packet)
+            self._pat_parser.push(packet)
+            for pat in self._pat_parser:
+                if pat.CRC32() != 0:
+                    continue
+                self._latest_pat_packets = self._pat_packets
+                self._latest_pat_offset = self._pat_offset
+                for program_number, program_map_pid in pat:
+                    if program_number != 0:
+                        self._pmt_pid = program_map_pid
+                        break
+            return
+
+        # PMT
+        if pid == self._pmt_pid:
+            if ts.payload_unit_start_indicator(packet):
+                self._pmt_packets = []
+                self._pmt_offset = packet_offset
+            self._pmt_packets.append(packet)
+            self._pmt_parser.push(packet)
+            for pmt in self._pmt_parser:
+                if pmt.CRC32() != 0:
+                    continue
+                self.__recordPATPMT()
+                for stream_type, elementary_pid, _ in pmt:
+                    if stream_type in (self.STREAM_TYPE_MPEG2, self.STREAM_TYPE_H264, self.STREAM_TYPE_H265):
+                        # 映像の PID が変わった場合は判定中の PES を破棄する
+                        if elementary_pid != self._video_pid:
+                            self._is_pes_probing = False
+                        self._video_pid = elementary_pid
+                        self._video_stream_type = stream_type
+                        break
+            return
+
+        # 映像
+        if pid != self._video_pid:
+            return
+        payload_offset = self.getTSPayloadOffset(packet)
+
+        # PES の先頭を含む TS パケット
+        if ts.payload_unit_start_indicator(packet):
+            # 前の PES の種別を判定できないまま次の PES が始まった場合、前の PES はキーフレームではないとみなす
+            self._is_pes_probing = False
+            pes_header = self.parsePESHeader(packet, payload_offset)
+            if pes_header is None:
+                return
+            timestamp, es_offset = pes_header
+            self._is_pes_probing = True
+            self._pes_offset = packet_offset
+            self._pes_dts = self.__unwrapTimestamp(timestamp)
+            self._pes_random_access_indicator = self.hasRandomAccessIndicator(packet)
+            self._pes_es = bytearray(packet[es_offset:])
+            self._last_pes_offset = self._pes_offset
+            self._last_pes_dts = self._pes_dts
+
+        # PES の続きの TS パケット (まだ種別を判定中の場合のみ ES データを連結する)
+        elif self._is_pes_probing is True:
+            self._pes_es += packet[payload_offset:]
+        else:
+            return
+
+        # ES データの先頭からフレームの種別を判定する
+        assert self._video_stream_type is not None
+        is_key_frame = self.detectKeyFrame(self._pes_es, self._video_stream_type)
+        if is_key_frame is None:
+            if len(self._pes_es) <= self.ES_PROBE_MAX_BYTES:
+                return
+            # ES データを解析しても判定できない場合のみ、random_access_indicator を採用する
+            is_key_frame = self._pes_random_access_indicator
+        self._is_pes_probing = False
+        self._pes_es = bytearray()
+
+        # 解析を再開した場合、以前に抽出済みのキーフレームは出力しない
+        if is_key_frame is True and self._pes_offset > self._resume_offset:
+            key_frames.append({
+                'offset': self._pes_offset,
+                'dts': self._pes_dts,
+            })
+
+
+    def __recordPATPMT(self) -> None:
+        """
+        直近に取得した PAT/PMT の内容が前回記録したものから変化していれば、PAT/PMT インデックスに記録する
+        エンコード開始時に、開始位置以前で最も近いエントリの TS パケットを先頭に付加することで、ファイルを遡って PAT/PMT を探す必要がなくなる
+        """
+
+        if self._latest_pat_packets is None:
+            return
+
+        # 内容の比較用に、CC (Continuity Counter) を含むヘッダーを除いた TS パケットのデータを連結する
+        key = b''.join(packet[4:] for packet in self._latest_pat_packets + self._pmt_packets)
+        if key == self._last_pat_pmt_key:
+            return
+        self._last_pat_pmt_key = key
+
+        # 解析を再開した場合、以前に解析済みの位置の PAT/PMT や、既にインデックスに含まれる位置の PAT/PMT は記録しない
+        if self._pmt_offset <= self._resume_offset:
+            return
+        if len(self.pat_pmt_index) > 0 and self._pmt_offset <= self.pat_pmt_index[-1]['offset']:
+            return
+        self.pat_pmt_index.append({
+            'offset': self._pmt_offset,
+            'pat_offset': self._latest_pat_offset,
+            'pmt_offset': self._pmt_offset,
+            'packets': base64.b64encode(b''.join(self._latest_pat_packets + self._pmt_packets)).decode('ascii'),
+        })
+
+
+    def __unwrapTimestamp(self, timestamp: int) -> int:
+        """
+        33bit のタイムスタンプを、前回取得したタイムスタンプからの連続性を保つよう折り返しを補正する
+
+        Args:
+            timestamp (int): 33bit のタイムスタンプ
+
+        Returns:
+            int: 折り返しを補正したタイムスタンプ
+        """
+
+        if self._last_dts is None:
+            self._last_dts = timestamp
+            return timestamp
+
+        unwrapped = self._last_dts - (self._last_dts % self.TIMESTAMP_WRAP) + timestamp
+        if unwrapped < self._last_dts - self.TIMESTAMP_WRAP // 2:
+            unwrapped += self.TIMESTAMP_WRAP
+        elif unwrapped > self._last_dts + self.TIMESTAMP_WRAP // 2:
+            unwrapped -= self.TIMESTAMP_WRAP
+        self._last_dts = unwrapped
+        return unwrapped
+
+
+    @staticmethod
+    def getTSPayloadOffset(packet: bytes) -> int:
+        """
+        TS パケット内のペイロードの開始位置を取得する
+
+        Args:
+            packet (bytes): TS パケット
+
+        Returns:
+            int: ペイロードの開始位置 (ペイロードがない場合は TS パケットサイズ)
+        """
+
+        adaptation_field_control = (packet[3] >> 4) & 0x03
+        if (adaptation_field_control & 0x01) == 0:
+            return ts.PACKET_SIZE
+        if (adaptation_field_control & 0x02) != 0:
+            return min(4 + 1 + packet[4], ts.PACKET_SIZE)
+        return 4
+
+
+    @staticmethod
+    def hasRandomAccessIndicator(packet: bytes) -> bool:
+        """
+        TS パケットのアダプテーションフィールドの random_access_indicator が立っているかを返す
+
+        Args:
+            packet (bytes): TS パケット
+
+        Returns:
+            bool: random_access_indicator が立っているかどうか
+        """
+
+        adaptation_field_control = (packet[3] >> 4) & 0x03
+        if (adaptation_field_control & 0x02) == 0 or packet[4] == 0:
+            return False
+        return (packet[5] & 0x40) != 0
+
+
+    @staticmethod
+    def parsePESHeader(packet: bytes, payload_offset: int) -> tuple[int, int] | None:
+        """
+        PES の先頭を含む TS パケットから、PES ヘッダーの 33bit タイムスタンプと ES データの開始位置を取得する
+
+        Args:
+            packet (bytes): payload_unit_start_indicator が立っている TS パケット
+            payload_offset (int): TS パケット内のペイロードの開始位置
+
+        Returns:
+            tuple[int, int] | None: (DTS (DTS がなければ PTS), TS パケット内の ES データの開始位置) / PES ヘッダーを解析できなかった場合は None
+        """
+
+        def ParseTimestamp(data: bytes, offset: int) -> int:
+            """ PES ヘッダー内の 5 バイトのタイムスタンプフィールドをパースする """
+            return (((data[offset + 0] >> 1) & 0x07) << 30) | \
+                (data[offset + 1] << 22) | \
+                (((data[offset + 2] >> 1) & 0x7F) << 15) | \
+                (data[offset + 3] << 7) | \
+                ((data[offset + 4] >> 1) & 0x7F)
+
+        payload = packet[payload_offset:]
+        if len(payload) < 14 or payload[0:3] != b'\x00\x00\x01':
+            return None
+
+        # PTS_DTS_flags (0b10: PTS のみ, 0b11: PTS と DTS)
+        pts_dts_flags = (payload[7] >> 6) & 0x03
+        if (pts_dts_flags & 0x02) == 0:
+            return None
+        timestamp = ParseTimestamp(payload, 9)
+        if pts_dts_flags == 0x03 and len(payload) >= 19:
+            timestamp = ParseTimestamp(payload, 14)
+
+        return (timestamp, min(payload_offset + 9 + payload[8], ts.PACKET_SIZE))
+
+
+    @classmethod
+    def detectKeyFrame(cls, es_data: bytes | bytearray, stream_type: int) -> bool | None:
+        """
+        映像 PES の ES データの先頭から、そのフレームがキーフレームかを判定する
+        ffprobe がキーフレームとみなすフレームに合わせ、以下をキーフレームとして扱う
+        - MPEG-2: I ピクチャ
+        - H.264: IDR ピクチャ、またはリカバリポイント SEI が付加されたピクチャ
+        - H.265: IRAP ピクチャ (BLA/IDR/CRA)
+
+        Args:
+            es_data (bytes | bytearray): 映像 PES の先頭からの ES データ (途中までで良い)
+            stream_type (int): PMT の stream_type
+
+        Returns:
+            bool | None: キーフレームかどうか (まだ判定に必要なデータが揃っていない場合は None)
+        """
+
+        # MPEG-2: ピクチャヘッダーの picture_coding_type (1: I, 2: P, 3: B) を確認する
+        if stream_type == cls.STREAM_TYPE_MPEG2:
+            offset = es_data.find(b'\x00\x00\x01\x00')
+            if offset == -1 or offset + 5 >= len(es_data):
+                return None
+            return ((es_data[offset + 5] >> 3) & 0x07) == 1
+
+        # H.264 / H.265: アクセスユニットの最初の VCL NAL ユニットの種別を確認する
+        has_recovery_point = False
+        offset = es_data.find(b'\x00\x00\x01')
+        while offset != -1 and offset + 3 < len(es_data):
+            nal_header = es_data[offset + 3]
+            if stream_type == cls.STREAM_TYPE_H265:
+                nal_unit_type = (nal_header >> 1) & 0x3F
+                # VCL NAL ユニット (0 ~ 31)
+                if nal_unit_type < 32:
+                    return 16 <= nal_unit_type <= 21
+            else:
+                nal_unit_type = nal_header & 0x1F
+                # VCL NAL ユニット (1 ~ 5)
+                if 1 <= nal_unit_type <= 5:
+                    return nal_unit_type == 5 or has_recovery_point
+                # SEI NAL ユニットに含まれる SEI メッセージの中に、リカバリポイント SEI (payloadType = 6) があるかを確認する
+                if nal_unit_type == 6:
+                    nal_end = es_data.find(b'\x00\x00\x01', offset + 3)
+                    nal_end = len(es_data) if nal_end == -1 else nal_end
+                    position = offset + 4
+                    while position < nal_end and es_data[position] != 0x80:  # rbsp_trailing_bits
+                        payload_type = 0
+                        while position < nal_end and es_data[position] == 0xFF:
+                            payload_type += 255
+                            position += 1
+                        if position >= nal_end:
+                            break
+                        payload_type += es_data[position]
+                        position += 1
+                        payload_size = 0
+                        while position < nal_end and es_data[position] == 0xFF:
+                            payload_size += 255
+                            position += 1
+                        if position >= nal_end:
+                            break
+                        payload_size += es_data[position]
+                        position += 1 + payload_size
+                        if payload_type == 6:
+                            has_recovery_point = True
+                            break
+            offset = es_data.find(b'\x00\x00\x01', offset + 3)
+
+        return None
@@ -2,11 +2,12 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import bisect
 import concurrent.futures
 import math
 import pathlib
 import random
-import subprocess
 import time
 from typing import ClassVar, Literal, cast
 
@@ -33,6 +34,8 @@ class ThumbnailGenerator:
     MAX_INTERVAL_SEC: ClassVar[float] = 30.0  # 最大間隔 (30秒)
     TILE_SCALE: ClassVar[tuple[int, int]] = (480, 270)  # タイル化時の1フレーム解像度 (width, height)
     TILE_COLS: ClassVar[int] = 34   # WebP の最大サイズ制限 (16383px) を考慮し、1行あたりの最大フレーム数を設定
+    KEY_FRAME_MAX_READ_SIZE: ClassVar[int] = 8 * 1024 * 1024  # キーフレーム位置から候補フレームを抽出する際に、1つのキーフレームあたりに読み込む最大サイズ (8MB)
+    MAX_MISSING_CANDIDATE_FRAMES: ClassVar[int] = 2  # 動画末尾付近で抽出できなくても許容する候補フレームの最大数 (これを超えて足りない場合は抽出失敗とみなす)
 
     # WebP 出力の設定
     WEBP_QUALITY: ClassVar[int] = 68  # WebP 品質 (0-100)
@@ -137,6 +140,8 @@ class ThumbnailGenerator:
         duration_sec: float,
         candidate_time_ranges: list[tuple[float, float]],
         face_detection_mode: Literal['Human', 'Anime'] | None = None,
+        key_frames: list[schemas.KeyFrame] | None = None,
+        pat_pmt_index: list[schemas.PATPMTEntry] | None = None,
     ) -> None:
         """
         プレイヤーのシークバー用タイル画像と、候補区間内で最も良い1枚の代表サムネイルを生成するクラスを初期化する
@@ -148,6 +153,8 @@ class ThumbnailGenerator:
             duration_sec (float): 動画の再生時間(秒)
             candidate_time_ranges (list[tuple[float, float]]): 代表サムネ候補とする区間 [(start, end), ...]
             face_detection_mode (Literal['Human', 'Anime'] | None): 顔検出モード (デフォルト: None)
+            key_frames (list[schemas.KeyFrame] | None): 解析済みのキーフレーム情報 (指定時は MPEG-TS の候補フレームをキーフレームの位置から直接抽出する) (デフォルト: None)
+            pat_pmt_index (list[schemas.PATPMTEntry] | None): 解析済みの PAT/PMT の位置情報 (デフォルト: None)
         """
 
         self.file_path = file_path
@@ -155,6 +162,8 @@ class ThumbnailGenerator:
         self.duration_sec = duration_sec
         self.candidate_intervals = candidate_time_ranges
         self.face_detection_mode = face_detection_mode
+        self.key_frames = key_frames if key_frames is not None else []
+        self.pat_pmt_index = pat_pmt_index if pat_pmt_index is not None else []
 
         # 動画の長さに応じて適切なタイル化間隔を計算
         self.tile_interval_sec = self.__calculateTileInterval(duration_sec)
@@ -165,12 +174,20 @@ class ThumbnailGenerator:
 
 
     @classmethod
-    def fromRecordedProgram(cls, recorded_program: schemas.RecordedProgram) -> ThumbnailGenerator:
+    def fromRecordedProgram(
+        cls,
+        recorded_program: schemas.RecordedProgram,
+        key_frames: list[schemas.KeyFrame] | None = None,
+        pat_pmt_index: list[schemas.PATPMTEntry] | None = None,
+    ) -> ThumbnailGenerator:
         """
         RecordedProgram から ThumbnailGenerator を初期化する
+        schemas.RecordedVideo はデータ量の多いキーフレーム情報を含まないため、必要に応じて DB から取得したものを別途渡す
 
         Args:
             recorded_program (schemas.RecordedProgram): 録画番組情報
+            key_frames (list[schemas.KeyFrame] | None): 解析済みのキーフレーム情報 (デフォルト: None)
+            pat_pmt_index (list[schemas.PATPMTEntry] | None): 解析済みの PAT/PMT の位置情報 (デフォルト: None)
 
         Returns:
             ThumbnailGenerator: 初期化された ThumbnailGenerator インスタンス
@@ -270,16 +287,19 @@ class ThumbnailGenerator:
             duration_sec = duration_sec,
             candidate_time_ranges = candidate_time_ranges,
             face_detection_mode = face_detection_mode,
+            key_frames = key_frames,
+            pat_pmt_index = pat_pmt_index,
         )
 
 
-    async def generateAndSave(self, skip_tile_if_exists: bool = False) -> None:
+    async def generateAndSave(self, skip_tile_if_exists: bool = False, candidate_tile: NDArray[np.uint8] | None = None) -> None:
         """
         プレイヤーのシークバー用サムネイルタイル画像を生成し、
         さらに候補区間内のフレームから最も良い1枚を選び、代表サムネイルとして出力する
 
         Args:
             skip_tile_if_exists (bool): True の場合、既に存在する場合はサムネイルタイルの生成をスキップするかどうか (デフォルト: False)
+            candidate_tile (NDArray[np.uint8] | None): readCandidateFramesFromStream() で各候補フレームを抽出済みのタイル画像 (指定時は録画ファイルからの抽出を省略する) (デフォルト: None)
         """
 
         start_time = time.time()
@@ -301,7 +321,7 @@ class ThumbnailGenerator:
                 logging.info(f'{self.file_path}: Seekbar thumbnail tile already exists. Skipping generation.')
             else:
                 ## まだシークバー用サムネイルタイルが生成されていなければ生成
-                if not await self.__generateThumbnailTile():
+                if not await self.__generateThumbnailTile(candidate_tile):
                     logging.error(f'{self.file_path}: Failed to generate seekbar thumbnail tile.')
                     return
                 logging.info(f'{self.file_path}: Seekbar thumbnail generation completed. ({time.time() - start_time:.2f} sec)')
@@ -330,6 +350,168 @@ class ThumbnailGenerator:
             return
 
 
+    async def startCandidateFrameSampler(self) -> asyncio.subprocess.Process:
+        """
+        標準入力から MPEG-TS 形式の録画データを受け取り、シークバー用サムネイルタイルの各候補フレームを
+        BGR24 形式の生の画素データとして標準出力に連続して書き出す FFmpeg プロセスを起動する
+        ほかの解析処理のために録画ファイルを先頭から読み込む際に、同じデータを標準入力に流し込むことで、
+        候補フレームごとに録画ファイルをシークして読み込む必要がなくなる
+        標準入力を閉じた後、readCandidateFramesFromStream() で各候補フレームを並べたタイル画像を取得できる
+
+        Returns:
+            asyncio.subprocess.Process: 起動した FFmpeg プロセス
+        """
+
+        return await self.__startCandidateFrameExtractor(None)
+
+
+    async def readCandidateFramesFromStream(self, process: asyncio.subprocess.Process) -> NDArray[np.uint8] | None:
+        """
+        startCandidateFrameSampler() で起動した FFmpeg プロセスが書き出す各候補フレームを、プロセスの終了まで読み込む
+
+        Args:
+            process (asyncio.subprocess.Process): startCandidateFrameSampler() で起動した FFmpeg プロセス
+
+        Returns:
+            NDArray[np.uint8] | None: 各候補フレームを時系列順に並べたタイル画像 (BGR) (失敗時は None)
+        """
+
+        return await self.__readCandidateFramesIntoTile(process)
+
+
+    async def __startCandidateFrameExtractor(self, input_path: anyio.Path | None, select_all_frames: bool = False) -> asyncio.subprocess.Process:
+        """
+        録画ファイル (または標準入力) を先頭から1回だけデコードし、シークバー用サムネイルタイルの各候補フレームを
+        BGR24 形式の生の画素データとして標準出力に連続して書き出す FFmpeg プロセスを起動する
+        候補フレームごとに FFmpeg を起動・シークする代わりに、select フィルターで各候補フレームの開始位置以降で最初の I フレームを選択する
+
+        Args:
+            input_path (anyio.Path | None): 入力する録画ファイルのパス (None の場合は標準入力から MPEG-TS 形式のデータを受け取る)
+            select_all_frames (bool): デコードしたすべての I フレームを出力するかどうか (候補フレームのキーフレームのみを標準入力に流し込む場合に指定する) (デフォルト: False)
+
+        Returns:
+            asyncio.subprocess.Process: 起動した FFmpeg プロセス
+        """
+
+        width, height = self.TILE_SCALE
+
+        # これまでに選択したフレーム数を selected_n として、次の候補フレームの開始位置 (selected_n * 間隔 (秒)) 以降で最初のフレームを選択する
+        ## prev_selected_n は「前回選択したフレームの入力フレーム番号」であり選択済みのフレーム数ではないため、ここでは使えない
+        ## (-skip_frame nointra 指定時は I フレームごとに番号が進むため、2枚目以降の選択位置が大きく後ろにずれてしまう)
+        ## select フィルターの t は入力の開始時刻を 0 とした秒数なので、-ss で候補フレームを抽出していた頃と同じ位置になる
+        ## シングルクォートで括ることで、式中のカンマがフィルターの区切りとして解釈されないようにしている
+        select_expression = f'gte(t,selected_n*{self.tile_interval_sec})'
+
+        if input_path is None:
+            input_format = 'mpegts'
+        else:
+            input_format = 'mpegts' if self.container_format == 'MPEG-TS' else 'mp4'
+
+        return await asyncio.create_subprocess_exec(
+            LIBRARY_PATH['FFmpeg'],
+            *[
+                # 非対話モードで実行し、不意のフリーズを回避する
+                '-nostdin',
+                # 入力フォーマットを指定
+                '-f', input_format,
+                # I フレームのみをデコードする (nokey ではなく nointra でないと一部フレームが緑色になる…)
+                '-skip_frame', 'nointra',
+                # 入力ファイル (または標準入力からパイプ入力)
+                '-i', 'pipe:0' if input_path is None else str(input_path),
+                # 音声・字幕ストリームを無効化し若干の高速化を図る
+                '-an', '-sn',
+                # 各候補フレームを選択し、画像サイズを調整（タイル化時に各画像は self.TILE_SCALE になるように）
+                '-vf', f'scale={width}:{height}' if select_all_frames is True else f"select='{select_expression}',scale={width}:{height}",
+                # 選択したフレームを複製・間引きせずにそのまま出力する
+                '-fps_mode', 'passthrough',
+                # 画像としてエンコードせず、OpenCV と同じ BGR24 形式の生の画素データをそのまま出力する
+                '-pix_fmt', 'bgr24',
+                # スレッド数を自動で設定する
+                '-threads', 'auto',
+                # 標準出力にパイプ出力する
+                '-f', 'rawvideo',
+                'pipe:1',
+            ],
+            # 標準入力・標準出力・標準エラー出力をパイプで受け渡す
+            ## 録画ファイルから読み込む場合、明示的に標準入力を無効化しないと、親プロセスの標準入力が引き継がれてしまう
+            stdin = asyncio.subprocess.PIPE if input_path is None else asyncio.subprocess.DEVNULL,
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.PIPE,
+        )
+
+
+    async def __readCandidateFramesIntoTile(
+        self,
+        process: asyncio.subprocess.Process,
+        frame_tile_positions: list[range] | None = None,
+    ) -> NDArray[np.uint8] | None:
+        """
+        __startCandidateFrameExtractor() で起動した FFmpeg プロセスが書き出す各候補フレームの画素データを、
+        あらかじめ確保したタイル画像の該当する位置に直接書き込む
+        動画末尾付近で候補フレームが MAX_MISSING_CANDIDATE_FRAMES 枚以内だけ足りない場合、その位置は黒画像のままになる
+        それ以上足りない場合は、タイル画像の大半が黒画像になってしまうため失敗とする
+
+        Args:
+            process (asyncio.subprocess.Process): __startCandidateFrameExtractor() で起動した FFmpeg プロセス
+            frame_tile_positions (list[range] | None): 出力される各フレームを書き込むタイル上の位置 (None の場合は出力順にそのまま書き込む) (デフォルト: None)
+
+        Returns:
+            NDArray[np.uint8] | None: 各候補フレームを時系列順に並べたタイル画像 (BGR) (失敗時は None)
+        """
+
+        assert process.stdout is not None and process.stderr is not None
+
+        # 標準エラー出力が詰まらないよう、並行して読み込む
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        # タイル画像全体を黒画像として確保し、候補フレームを1枚読み込むたびにその位置に書き込む
+        width, height = self.TILE_SCALE
+        num_candidates, tile_rows = self.__calculateTileLayout()
+        tile = np.zeros((height * tile_rows, width * self.TILE_COLS, 3), dtype=np.uint8)
+        frame_size = width * height * 3
+        frame_count = 0
+        while True:
+            try:
+                frame_data = await process.stdout.readexactly(frame_size)
+            except asyncio.IncompleteReadError:
+                break
+            # 候補フレーム数を超えるフレームは、FFmpeg が詰まらないよう読み捨てる
+            ## 複数の候補フレームが同じキーフレームに解決された場合は、そのすべての位置に同じフレームを書き込む
+            if frame_tile_positions is None:
+                tile_positions = range(frame_count, frame_count + 1) if frame_count < num_candidates else range(0)
+            else:
+                tile_positions = frame_tile_positions[frame_count] if frame_count < len(frame_tile_positions) else range(0)
+            for tile_position in tile_positions:
+                row, col = divmod(tile_position, self.TILE_COLS)
+                tile[row * height:(row + 1) * height, col * width:(col + 1) * width] = \
+                    np.frombuffer(frame_data, dtype=np.uint8).reshape(height, width, 3)
+            frame_count += 1
+
+        stderr = await stderr_task
+        await process.wait()
+        if process.returncode != 0:
+            error_message = stderr.decode('utf-8', errors='ignore')
+            logging.error(f'{self.file_path}: FFmpeg candidate frame extraction failed with return code {process.returncode}. Error: {error_message}')
+            return None
+        if frame_count == 0:
+            logging.error(f'{self.file_path}: No candidate frames were extracted.')
+            return None
+        # 書き込む位置が指定されている場合、フレーム数が一致しないと各フレームの位置がずれるため失敗とする
+        if frame_tile_positions is not None and frame_count != len(frame_tile_positions):
+            logging.warning(f'{self.file_path}: Extracted {frame_count} frames from {len(frame_tile_positions)} key frames. Frame positions cannot be determined.')
+            return None
+
+        # 動画末尾付近はその先に I フレームがないことが多いため、候補フレームが数枚足りないのは正常
+        ## それを超えて足りない場合は、途中の候補フレームを取りこぼしているため失敗とし、呼び出し元で別の方法にフォールバックさせる
+        extracted_count = min(frame_count, num_candidates) if frame_tile_positions is None else frame_tile_positions[-1].stop
+        if num_candidates - extracted_count > self.MAX_MISSING_CANDIDATE_FRAMES:
+            logging.warning(f'{self.file_path}: Extracted only {extracted_count}/{num_candidates} candidate frames.')
+            return None
+        if extracted_count < num_candidates:
+            logging.debug(f'{self.file_path}: Extracted {extracted_count}/{num_candidates} candidate frames. The rest are filled with black.')
+        return tile
+
+
     def __calculateTileInterval(self, duration_sec: float) -> float:
         """
         動画の長さに応じて適切なタイル化間隔を計算する
@@ -371,47 +553,118 @@ class ThumbnailGenerator:
         return interval
 
 
-    def __formatTime(self, seconds: float) -> str:
+    def __calculateTileLayout(self) -> tuple[int, int]:
         """
-        秒数を HH:MM:SS または HH:MM:SS.xx 形式の文字列に変換するヘルパー関数。
-        秒数が整数に近い場合は HH:MM:SS、そうでなければ小数第2位まで出力する。
+        動画の長さと tile_interval_sec から、シークバー用サムネイルタイルの候補フレーム数と行数を算出する
+        列数は self.TILE_COLS 固定
 
-        Args:
-            seconds (float): 秒数
+        Returns:
+            tuple[int, int]: 候補フレーム数とタイルの行数
+        """
+
+        # ceil() を使うことで、端数でも切り捨てずに確実にすべての区間をカバー
+        num_candidates = max(1, math.ceil(self.duration_sec / self.tile_interval_sec))
+        tile_rows = math.ceil(num_candidates / self.TILE_COLS)
+        return num_candidates, tile_rows
+
+
+    async def __extractCandidateFramesFromKeyFrames(self) -> NDArray[np.uint8] | None:
+        """
+        キーフレーム情報から各候補フレームの開始位置以降で最初のキーフレームのバイト位置を求め、
+        そのキーフレームから次のキーフレームまで (1 GOP 分) だけを録画ファイルから前方に向かって順に読み込み、FFmpeg の標準入力に流し込む
+        FFmpeg に時刻でシークさせると MPEG-TS では二分探索のためのランダムアクセスが候補フレームごとに発生するが、
+        この方法では候補フレームごとに1回のシーケンシャルな読み込みで済み、録画ファイル全体をデコードする必要もない
 
         Returns:
-            str: フォーマットされた時間文字列
+            NDArray[np.uint8] | None: 各候補フレームを時系列順に並べたタイル画像 (BGR) (失敗時は None)
         """
-        hrs = int(seconds // 3600)
-        mins = int((seconds % 3600) // 60)
-        secs = seconds % 60
-        # 整数に近い場合は小数部を省略
-        if abs(secs - round(secs)) < 0.001:
-            return f'{hrs:02}:{mins:02}:{int(secs):02}'
-        else:
-            return f'{hrs:02}:{mins:02}:{secs:05.2f}'
 
+        # 各キーフレームの最初のキーフレームからの経過時間 (秒) を計算する
+        ## dts は 90kHz 単位で、ラップアラウンドはキーフレーム解析時に補正済み
+        first_dts = self.key_frames[0]['dts']
+        key_frame_times = [(key_frame['dts'] - first_dts) / 90000 for key_frame in self.key_frames]
+
+        # 各候補フレームの開始位置以降で最初のキーフレームを求め、キーフレームごとにタイル上の位置をまとめる
+        ## 動画末尾付近でその先にキーフレームがない候補フレームは、全体をデコードする場合と同様に黒画像のままにする
+        num_candidates, _ = self.__calculateTileLayout()
+        key_frame_indexes: list[int] = []
+        frame_tile_positions: list[range] = []
+        for candidate_index in range(num_candidates):
+            key_frame_index = bisect.bisect_left(key_frame_times, candidate_index * self.tile_interval_sec)
+            if key_frame_index >= len(self.key_frames):
+                break
+            if len(key_frame_indexes) > 0 and key_frame_indexes[-1] == key_frame_index:
+                frame_tile_positions[-1] = range(frame_tile_positions[-1].start, candidate_index + 1)
+            else:
+                key_frame_indexes.append(key_frame_index)
+                frame_tile_positions.append(range(candidate_index, candidate_index + 1))
+        if len(key_frame_indexes) == 0:
+            return None
+
+        file_size = (await self.file_path.stat()).st_size
+        pat_pmt_offsets = [entry['offset'] for entry in self.pat_pmt_index]
+        process = await self.__startCandidateFrameExtractor(None, select_all_frames=True)
+        assert process.stdin is not None
+        stdin = process.stdin
+
+        async def FeedKeyFrames() -> None:
+            """ 各候補フレームのキーフレームから次のキーフレームまでを、有効な PAT/PMT を付加して FFmpeg の標準入力に書き込む """
+            try:
+                async with await anyio.open_file(self.file_path, 'rb') as file:
+                    for key_frame_index in key_frame_indexes:
+                        start_offset = self.key_frames[key_frame_index]['offset']
+                        end_offset = self.key_frames[key_frame_index + 1]['offset'] \
+                            if key_frame_index + 1 < len(self.key_frames) else file_size
+                        # キーフレームの位置以前で最も近い PAT/PMT を付加し、途中から読み込んでも FFmpeg がストリームを認識できるようにする
+                        ## キーフレーム解析時に PAT/PMT の位置が解析されていない場合は付加しない (FFmpeg は後続の PAT/PMT から認識できる)
+                        pat_pmt_entry_index = max(0, bisect.bisect_right(pat_pmt_offsets, start_offset) - 1)
+                        if len(self.pat_pmt_index) > 0:
+                            stdin.write(base64.b64decode(self.pat_pmt_index[pat_pmt_entry_index]['packets']))
+                        await file.seek(start_offset)
+                        stdin.write(await file.read(min(end_offset - start_offset, self.KEY_FRAME_MAX_READ_SIZE)))
+                        await stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # FFmpeg が途中で終了した場合は、以降のデータを書き込まない (失敗は __readCandidateFramesIntoTile() で検知される)
+                pass
+            except OSError as ex:
+                # 録画ファイルの読み込みに失敗した場合も、フレーム数の不一致として __readCandidateFramesIntoTile() で検知される
+                logging.warning(f'{self.file_path}: Failed to read key frames from the recorded file:', exc_info=ex)
+            finally:
+                # 標準入力を閉じ、FFmpeg に入力の終端を伝える
+                stdin.close()
+
+        feed_task = asyncio.create_task(FeedKeyFrames())
+        try:
+            candidate_tile = await self.__readCandidateFramesIntoTile(process, frame_tile_positions)
+        except BaseException:
+            # キャンセルされた場合などは FFmpeg を終了させてから戻る
+            feed_task.cancel()
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            raise
+        await feed_task
+        return candidate_tile
 
-    async def __generateThumbnailTile(self) -> bool:
+
+    async def __generateThumbnailTile(self, candidate_tile: NDArray[np.uint8] | None = None) -> bool:
         """
-        FFmpeg を使い、録画ファイルから各候補フレームを直列に抽出し、メモリ上で OpenCV によるタイル化を行う実装
-        ・各候補フレームは、指定オフセットから1フレームのみ抽出することで全編のデコードと I/O 負荷の増大を回避
-        ・抽出時は個別コマンドで出力をパイプで受け取り、中間ファイルを作らずメモリ上で画像変換を実施
-        ・全候補画像は OpenCV の hconcat/vconcat を用いてタイル状に連結し、最終的なサムネイルタイル画像としてディスク出力する
+        FFmpeg を使い、録画ファイルから各候補フレームを抽出してタイル状に並べたシークバー用サムネイルタイル画像を保存する
+        ・各候補フレームは1回の FFmpeg の実行でまとめて抽出し、BGR24 形式の生の画素データを直接タイル画像の該当する位置に書き込む
+        ・タイル画像も中間フォーマットを介さず生の画素データのまま FFmpeg に渡し、WebP または JPEG として保存する
+        ・抽出済みのタイル画像が渡された場合は、録画ファイルからの抽出を省略してそのまま保存する
+
+        Args:
+            candidate_tile (NDArray[np.uint8] | None): 各候補フレームを抽出済みのタイル画像 (BGR) (デフォルト: None)
 
         Returns:
             bool: 成功時は True、失敗時は False
         """
 
         try:
-            # 動画の長さと tile_interval_sec から候補フレーム数を算出
-            # ※ ceil() を使うことで、端数でも切り捨てずに確実にすべての区間をカバー
-            num_candidates = math.ceil(self.duration_sec / self.tile_interval_sec)
-            if num_candidates < 1:
-                num_candidates = 1
-
-            # タイルの行数を計算（列数は self.TILE_COLS 固定）
-            tile_rows = math.ceil(num_candidates / self.TILE_COLS)
+            # タイル画像全体のサイズを計算
+            _, tile_rows = self.__calculateTileLayout()
             width, height = self.TILE_SCALE
             total_width = width * self.TILE_COLS
             total_height = height * tile_rows
@@ -422,237 +675,33 @@ class ThumbnailGenerator:
                 self.seekbar_thumbnails_tile_path = self.seekbar_thumbnails_tile_path.with_suffix('.jpg')
                 logging.warning(f'{self.file_path}: Image size ({total_width}x{total_height}) exceeds WebP limits. Falling back to JPEG.')
 
-            # 各候補フレーム抽出の開始位置（秒）を算出（動画末尾の場合は調整する）
-            candidate_offsets = []
-            for i in range(num_candidates):
-                offset = i * self.tile_interval_sec
-                # もし候補フレームの開始位置 + 0.01秒が動画長を超える場合、抽出可能な位置に調整する
-                if offset + 0.01 > self.duration_sec:
-                    offset = max(0, self.duration_sec - 0.02)
-                candidate_offsets.append(offset)
-
             # 万が一出力先ディレクトリが無い場合は作成 (通常存在するはず)
             thumbnails_dir = anyio.Path(str(THUMBNAILS_DIR))
             if not await thumbnails_dir.is_dir():
                 await thumbnails_dir.mkdir(parents=True, exist_ok=True)
 
-            # 非同期キューの準備
-            frame_queue: asyncio.Queue[tuple[float, bytes]] = asyncio.Queue()
-
-            # エラー通知用のイベント
-            error_event = asyncio.Event()
-
-            async def ExtractSingleFrame(offset: float, worker_name: str) -> bytes | None:
-                """ FFmpeg を使い1フレームを抽出する共通処理 """
-
-                # オフセットを HH:MM:SS または HH:MM:SS.xx 形式に変換
-                formatted_offset = self.__formatTime(offset)
-
-                # 個別に1枚抽出するための FFmpeg コマンドを実行
-                ## 試行錯誤の結果、数フレーム読み取るだけのためにハードウェアアクセラレーションを使うと
-                ## HW デコーダーの初期化などでむしろ遅くなることが判明したため、-hwaccel はあえて指定していない
-                process = await asyncio.create_subprocess_exec(
-                    LIBRARY_PATH['FFmpeg'],
-                    *[
-                        # 上書きを許可
-                        '-y',
-                        # 非対話モードで実行し、不意のフリーズを回避する
-                        '-nostdin',
-                        # 入力フォーマットを指定
-                        '-f', 'mpegts' if self.container_format == 'MPEG-TS' else 'mp4',
-                        # I フレームのみをデコードする (nokey ではなく nointra でないと一部フレームが緑色になる…)
-                        '-skip_frame', 'nointra',
-                        # 抽出開始位置
-                        '-ss', formatted_offset,
-                        # 入力ファイル
-                        '-i', str(self.file_path),
-                        # 音声ストリームを無効化し若干の高速化を図る
-                        '-an',
-                        # 画像サイズを調整（タイル化時に各画像は self.TILE_SCALE になるように）
-                        '-vf', f'scale={width}:{height}',
-                        # 1フレーム分のみ抽出する
-                        '-frames:v', '1',
-                        # エンコード負荷低減のため、中間フォーマットには PNG を使う
-                        '-codec:v', 'png',
-                        # スレッド数を自動で設定する
-                        '-threads', 'auto',
-                        # 標準出力にパイプ出力する
-                        '-f', 'image2pipe',
-                        'pipe:1',
-                    ],
-                    # 明示的に標準入力を無効化しないと、親プロセスの標準入力が引き継がれてしまう
-                    stdin = asyncio.subprocess.DEVNULL,
-                    # 標準出力・標準エラー出力をパイプで受け取る
-                    stdout = asyncio.subprocess.PIPE,
-                    stderr = asyncio.subprocess.PIPE,
-                )
-
-                # プロセス終了を待ち、エラー出力を取得
-                stdout, stderr = await process.communicate()
-                if process.returncode != 0:
-                    error_message = stderr.decode('utf-8', errors='ignore')
-                    logging.error(f'{self.file_path}: [{worker_name}] FFmpeg candidate extraction failed at offset {formatted_offset} with error: {error_message}')
-                    return None
-
-                # PNG バイナリをそのまま返す
-                return stdout
-
-            async def ExtractFramesWorker(
-                offsets: list[float],
-                worker_name: str,
-                start_delay: float = 0.0
-            ) -> None:
-                """ フレーム抽出ワーカー """
-                try:
-                    # オフセットを WORKER_SYNC_COUNT 個ずつに分割
-                    for i in range(0, len(offsets), WORKER_SYNC_COUNT):
-                        # バッチの開始時にディレイを適用
-                        if start_delay > 0:
-                            await asyncio.sleep(start_delay)
-
-                        batch_offsets = offsets[i:i + WORKER_SYNC_COUNT]
-
-                        for offset in batch_offsets:
-                            # エラーチェック（他のワーカーでエラーが発生していたら終了）
-                            if error_event.is_set():
-                                return
-
-                            # FFmpegでフレーム抽出
-                            frame = await ExtractSingleFrame(offset, worker_name)
-                            if frame is None:
-                                error_event.set()
-                                return
-
-                            # キューに結果を格納
-                            await frame_queue.put((offset, frame))
-
-                            # 同期カウンターをインクリメント
-                            nonlocal sync_counter
-                            sync_counter += 1
-                            if sync_counter >= sync_target:
-                                # 同期イベントを発火
-                                sync_event.set()
-
-                        try:
-                            # 同期イベントが発火するまで待機（キャンセル可能）
-                            await asyncio.wait_for(sync_event.wait(), timeout=30.0)
-                        except (TimeoutError, asyncio.CancelledError):
-                            # キャンセルまたはタイムアウト時は即座に終了
-                            return
-                        finally:
-                            # 次のバッチに向けて同期イベントをクリア
-                            sync_event.clear()
-                            # 同期カウンターをリセット
-                            sync_counter = 0
-
-                except asyncio.CancelledError:
-                    # キャンセル時は即座に終了
-                    return
-                except Exception as ex:
-                    logging.error(f'{self.file_path}: [{worker_name}] Unexpected error:', exc_info=ex)
-                    error_event.set()
-
-            try:
-                # オフセットを WORKER_COUNT 個に分割 (0,5,10,...), (1,6,11,...), (2,7,12,...), (3,8,13,...), (4,9,14,...)
-                # 1プロセスの実行に約1秒弱かかるため、WORKER_DELAY 秒間隔で起動することで
-                # プロセス起動のタイミングを分散させつつ、なるべくシーケンシャルなアクセスになるよう調整
-                WORKER_COUNT = 5
-                WORKER_DELAY = 0.18
-                # 同期を取る間隔（各ワーカーがこの数だけフレームを取得したら同期を取る）
-                WORKER_SYNC_COUNT = 10
-
-                # オフセットをワーカー数で分割
-                worker_offsets = [
-                    candidate_offsets[i::WORKER_COUNT] for i in range(WORKER_COUNT)
-                ]
-
-                # 同期用のイベント
-                sync_event = asyncio.Event()
-                sync_counter = 0
-                sync_target = WORKER_COUNT * WORKER_SYNC_COUNT
-
-                # WORKER_COUNT 個のワーカーを WORKER_DELAY 秒間隔で起動
+            # 各候補フレームを抽出する
+            ## 録画ファイルを1回だけ読み込む解析パイプラインで抽出済みのタイル画像があれば、それを使う
+            ## MPEG-TS でキーフレーム情報が解析済みの場合は、各候補フレームのキーフレームの位置だけを読み込んで抽出する
+            if candidate_tile is None and self.container_format == 'MPEG-TS' and len(self.key_frames) > 0:
                 start_time = time.time()
-                workers = [
-                    ExtractFramesWorker(worker_offsets[i], f'Worker {i}', start_delay=i * WORKER_DELAY)
-                    for i in range(WORKER_COUNT)
-                ]
-
-                # 全フレームの収集を待機
-                frames_dict: dict[float, bytes] = {}
-                expected_frames = len(candidate_offsets)
-
-                # ワーカータスクを開始
-                worker_tasks = [asyncio.create_task(w) for w in workers]
-
-                try:
-                    # フレーム収集ループ
-                    while len(frames_dict) < expected_frames:
-                        if error_event.is_set():
-                            # エラーが発生した場合は中断
-                            raise RuntimeError('Error occurred in worker task')
-
-                        try:
-                            # タイムアウト付きでキューから結果を取得
-                            offset, frame = await asyncio.wait_for(frame_queue.get(), timeout=30.0)
-                            frames_dict[offset] = frame
-                            # 進捗をログ出力
-                            # logging.debug(
-                            #     f'{self.file_path}: Frame collected {len(frames_dict)}/{expected_frames} '
-                            #     f'(offset: {self.__formatTime(offset)})'
-                            # )
-
-                            # 全フレームの収集が完了したら、残りのワーカータスクをキャンセル
-                            if len(frames_dict) >= expected_frames:
-                                # 全ワーカーをキャンセル
-                                for task in worker_tasks:
-                                    task.cancel()
-                                # キャンセルされたタスクの完了を待機（エラーは無視）
-                                await asyncio.gather(*worker_tasks, return_exceptions=True)
-                                break
-
-                        except TimeoutError:
-                            # タイムアウト時はエラーとして扱う
-                            raise RuntimeError('Timeout while waiting for frame')
-
-                except Exception as ex:
-                    # エラー発生時は全ワーカーを確実にキャンセル
-                    error_event.set()
-                    for task in worker_tasks:
-                        task.cancel()
-                    # キャンセルされたタスクの完了を待機
-                    await asyncio.gather(*worker_tasks, return_exceptions=True)
-                    raise ex
-
-                # 時系列順にフレームを並べ直す
-                png_frames = [
-                    frames_dict[offset] for offset in candidate_offsets
-                ]
-                logging.debug(
-                    f'{self.file_path}: All frames collected and sorted in chronological order. ({time.time() - start_time:.2f} sec)'
-                )
+                candidate_tile = await self.__extractCandidateFramesFromKeyFrames()
+                if candidate_tile is None:
+                    logging.warning(f'{self.file_path}: Failed to extract candidate frames from key frames. Falling back to extraction from the whole file.')
+                else:
+                    logging.debug(f'{self.file_path}: All candidate frames extracted from key frames. ({time.time() - start_time:.2f} sec)')
+            if candidate_tile is None:
+                start_time = time.time()
+                candidate_tile = await self.__readCandidateFramesIntoTile(await self.__startCandidateFrameExtractor(self.file_path))
+                if candidate_tile is None:
+                    return False
+                logging.debug(f'{self.file_path}: All candidate frames extracted. ({time.time() - start_time:.2f} sec)')
 
-            except Exception as ex:
-                logging.error(f'{self.file_path}: Error in parallel thumbnail generation:', exc_info=ex)
+            # タイル画像を FFmpeg で WebP または JPEG として保存
+            if not await self.__saveTileImage(candidate_tile, use_webp):
+                logging.error(f'{self.file_path}: Failed to save tile image.')
                 return False
 
-            # PNG 画像のフレームを繋ぎ合わせてタイル画像を生成し、FFmpeg で WebP または JPEG として保存
-            ## CPU バウンドな処理なので、イベントループをブロックしないよう ProcessPoolExecutor で実行する
-            loop = asyncio.get_running_loop()
-            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
-                success = await loop.run_in_executor(
-                    executor,
-                    self._generateAndSaveTileImage,
-                    png_frames,
-                    tile_rows,
-                    height,
-                    width,
-                    use_webp,
-                )
-                if not success:
-                    logging.error(f'{self.file_path}: Failed to generate and save tile image.')
-                    return False
-
             return True
 
         except Exception as ex:
@@ -660,128 +709,65 @@ class ThumbnailGenerator:
             return False
 
 
-    def _generateAndSaveTileImage(
-        self,
-        png_frames: list[bytes],
-        tile_rows: int,
-        height: int,
-        width: int,
-        use_webp: bool,
-    ) -> bool:
+    async def __saveTileImage(self, tile_image: NDArray[np.uint8], use_webp: bool) -> bool:
         """
-        PNG フレームからタイル画像を生成し、WebP または JPEG として保存する
-        ProcessPoolExecutor で実行されるため、あえて prefix のアンダースコアは1つとしている
+        タイル画像の BGR24 形式の画素データをそのまま FFmpeg に渡し、WebP または JPEG として保存する
 
         Args:
-            png_frames (list[bytes]): PNG フレームのバイナリデータのリスト
-            tile_rows (int): タイルの行数
-            height (int): タイルの高さ
-            width (int): タイルの幅
+            tile_image (NDArray[np.uint8]): タイル画像 (BGR)
             use_webp (bool): WebP として保存するかどうか (False の場合は JPEG)
 
         Returns:
             bool: 成功時は True、失敗時は False
         """
 
-        try:
-            # PNG フレームを OpenCV の画像データに変換
-            candidate_images = []
-            for i in range(len(png_frames)):
-                frame = None
-                if not png_frames[i]:
-                    # 動画末尾付近はその先に I フレームがないことが多くこのときその要素は空になる
-                    # この条件は頻繁なので、先頭要素でなく以降の要素がすべて空であるなら警告は出さない
-                    for j in range(i, len(png_frames)):
-                        if j == 0 or png_frames[j]:
-                            logging.warning(f'{self.file_path}: Failed to extract PNG frame. Using black image instead.')
-                            break
-                else:
-                    try:
-                        # PNG バイナリを numpy 配列に変換
-                        image_data = np.frombuffer(png_frames[i], dtype=np.uint8)
-                        # OpenCV で画像デコード
-                        frame = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
-                        if frame is None:
-                            logging.warning(f'{self.file_path}: Failed to decode PNG frame. Using black image instead.')
-                    except Exception as ex:
-                        logging.warning(f'{self.file_path}: Exception occurred while decoding PNG frame. Using black image instead:', exc_info=ex)
-                if frame is None:
-                    # 黒画像を代わりに使用
-                    frame = np.zeros((height, width, 3), dtype=np.uint8)
-                candidate_images.append(frame)
-
-            # OpenCV を用いてタイル化処理を行う
-            rows = []
-            num_cols = self.TILE_COLS
-            for r in range(tile_rows):
-                row_images = candidate_images[r * num_cols: (r + 1) * num_cols]
-                # 最終行が列数に満たない場合、黒画像で埋める
-                if len(row_images) < num_cols:
-                    black_image = np.zeros((height, width, 3), dtype=np.uint8)
-                    while len(row_images) < num_cols:
-                        row_images.append(black_image)
-                row_concat = cv2.hconcat(row_images)
-                rows.append(row_concat)
-            tile_image = cv2.vconcat(rows)
-
-            # タイル画像を PNG としてメモリ上にエンコード
-            _, tile_png_data = cv2.imencode('.png', tile_image)
-            if tile_png_data is None:
-                logging.error(f'{self.file_path}: Failed to encode tile image as PNG.')
-                return False
-
-            # FFmpeg でタイル画像を WebP または JPEG に圧縮保存
-            # これで最終的なタイル画像がディスクへ書き込まれる
-            process = subprocess.Popen(
-                [
-                    LIBRARY_PATH['FFmpeg'],
-                    # 上書きを許可
-                    '-y',
-                    # 非対話モードで実行し、不意のフリーズを回避する
-                    '-nostdin',
-                    # 入力フォーマットを指定
-                    '-f', 'image2pipe',
-                    # 入力コーデックを指定
-                    '-codec:v', 'png',
-                    # 標準入力からパイプ入力
-                    '-i', 'pipe:0',
-                    # WebP または JPEG 出力設定
-                    *([
-                        '-codec:v', 'webp',
-                        '-quality', str(self.WEBP_QUALITY),  # 品質設定
-                        '-compression_level', str(self.WEBP_COMPRESSION),  # 圧縮レベル
-                        '-preset', 'picture',  # 写真向けプリセット
-                    ] if use_webp else [
-                        '-codec:v', 'mjpeg',
-                        '-qmin', '1',  # 最小品質
-                        '-qmax', '1',  # 最大品質
-                        '-qscale:v', str(int((100 - self.JPEG_QUALITY) / 4)),  # 品質設定 (JPEG の場合は 1-31 のスケール)
-                    ]),
-                    # スレッド数を自動で設定する
-                    '-threads', 'auto',
-                    # 出力ファイル
-                    str(self.seekbar_thumbnails_tile_path),
-                ],
-                # 明示的に標準入力を有効化
-                stdin = subprocess.PIPE,
-                # 標準出力・標準エラー出力をパイプで受け取る
-                stdout = subprocess.PIPE,
-                stderr = subprocess.PIPE,
-            )
-
-            # 画像データを標準入力に書き込み、プロセス終了を待つ
-            _, stderr_data = process.communicate(input=tile_png_data.tobytes())
-            if process.returncode != 0:
-                error_message = stderr_data.decode('utf-8', errors='ignore')
-                logging.error(f'{self.file_path}: FFmpeg tile image compression failed with error: {error_message}')
-                return False
-
-            return True
+        tile_height, tile_width, _ = tile_image.shape
+        process = await asyncio.create_subprocess_exec(
+            LIBRARY_PATH['FFmpeg'],
+            *[
+                # 上書きを許可
+                '-y',
+                # 非対話モードで実行し、不意のフリーズを回避する
+                '-nostdin',
+                # 入力フォーマットを指定 (BGR24 形式の生の画素データ)
+                '-f', 'rawvideo',
+                '-pix_fmt', 'bgr24',
+                '-video_size', f'{tile_width}x{tile_height}',
+                # 標準入力からパイプ入力
+                '-i', 'pipe:0',
+                # WebP または JPEG 出力設定
+                *([
+                    '-codec:v', 'webp',
+                    '-quality', str(self.WEBP_QUALITY),  # 品質設定
+                    '-compression_level', str(self.WEBP_COMPRESSION),  # 圧縮レベル
+                    '-preset', 'picture',  # 写真向けプリセット
+                ] if use_webp else [
+                    '-codec:v', 'mjpeg',
+                    '-qmin', '1',  # 最小品質
+                    '-qmax', '1',  # 最大品質
+                    '-qscale:v', str(int((100 - self.JPEG_QUALITY) / 4)),  # 品質設定 (JPEG の場合は 1-31 のスケール)
+                ]),
+                # スレッド数を自動で設定する
+                '-threads', 'auto',
+                # 出力ファイル
+                str(self.seekbar_thumbnails_tile_path),
+            ],
+            # 標準入力・標準出力・標準エラー出力をパイプで受け渡す
+            stdin = asyncio.subprocess.PIPE,
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.PIPE,
+        )
 
-        except Exception as ex:
-            logging.error(f'{self.file_path}: Error in tile image generation and saving:', exc_info=ex)
+        # 画素データをコピーせずに標準入力に書き込み、プロセス終了を待つ
+        ## 1次元の memoryview にしておかないと、書き込みきれなかった残りを切り出す際にバイト単位で切り出されない
+        _, stderr_data = await process.communicate(input=memoryview(np.ascontiguousarray(tile_image).reshape(-1)))
+        if process.returncode != 0:
+            error_message = stderr_data.decode('utf-8', errors='ignore')
+            logging.error(f'{self.file_path}: FFmpeg tile image compression failed with error: {error_message}')
             return False
 
+        return True
+
 
     async def __extractBestFrameFromThumbnailTile(self) -> NDArray[np.uint8] | None:
         """
@@ -0,0 +1,14 @@
+
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "recorded_videos" ADD COLUMN "pat_pmt_index" JSON NOT NULL DEFAULT '[]';
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "recorded_videos" DROP COLUMN "pat_pmt_index";
+    """
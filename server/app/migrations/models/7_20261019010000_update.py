@@ -0,0 +1,29 @@
+
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "analysis_jobs" (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            "job_type" VARCHAR(255) NOT NULL,
+            "file_path" TEXT NOT NULL,
+            "priority" INT NOT NULL,
+            "status" VARCHAR(255) NOT NULL,
+            "attempts" INT NOT NULL DEFAULT 0,
+            "last_error" TEXT,
+            "next_run_at" TIMESTAMP NOT NULL,
+            "started_at" TIMESTAMP,
+            "finished_at" TIMESTAMP,
+            "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            "updated_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS "analysis_jobs_status_next_run_at" ON "analysis_jobs" ("status", "next_run_at");
+        CREATE INDEX IF NOT EXISTS "analysis_jobs_file_path" ON "analysis_jobs" ("file_path");
+    """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "analysis_jobs";
+    """
@@ -0,0 +1,34 @@
+
+# Type Hints を指定できるように
+# ref: https://stackoverflow.com/a/33533514/17124142
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Literal, cast
+
+from tortoise import fields
+from tortoise.fields import Field as TortoiseField
+from tortoise.models import Model as TortoiseModel
+
+
+class AnalysisJob(TortoiseModel):
+
+    # データベース上のテーブル名
+    class Meta(TortoiseModel.Meta):
+        table: str = 'analysis_jobs'
+
+    id = fields.IntField(pk=True)
+    # RecordedAnalysis: キーフレーム解析・CM 区間検出・サムネイル生成を録画ファイルの1回の読み込みでまとめて行う
+    job_type = cast(TortoiseField[Literal['RecordedAnalysis', 'KeyFrameAnalysis', 'CMSectionsDetection', 'ThumbnailGeneration']], fields.CharField(255))
+    file_path = fields.TextField()
+    # 値が大きいジョブほど優先して実行される
+    priority = fields.IntField()
+    status = cast(TortoiseField[Literal['Queued', 'Running', 'Completed', 'Failed']], fields.CharField(255))
+    attempts = fields.IntField(default=0)
+    last_error = cast(TortoiseField[str | None], fields.TextField(null=True))
+    # リトライ待ちのジョブは、この日時以降に実行される
+    next_run_at = fields.DatetimeField()
+    started_at = cast(TortoiseField[datetime | None], fields.DatetimeField(null=True))
+    finished_at = cast(TortoiseField[datetime | None], fields.DatetimeField(null=True))
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
@@ -12,7 +12,7 @@ from tortoise.fields import Field as TortoiseField
 from tortoise.models import Model as TortoiseModel
 
 from app.models.RecordedProgram import RecordedProgram
-from app.schemas import CMSection, KeyFrame
+from app.schemas import CMSection, KeyFrame, PATPMTEntry
 
 
 class RecordedVideo(TortoiseModel):
@@ -53,6 +53,10 @@ class RecordedVideo(TortoiseModel):
     cm_sections = cast(TortoiseField[list[CMSection] | None],
         # None は未解析状態を表す ([] は解析したが CM 区間がなかった/検出に失敗したことを表す)
         fields.JSONField(default=None, encoder=lambda x: json.dumps(x, ensure_ascii=False), null=True))  # type: ignore
+    # 録画ファイル内で PAT/PMT の内容が変化する位置と、その時点の PAT/PMT の TS パケット (MPEG-TS 形式のみ)
+    ## エンコード開始時に PAT/PMT を探すためにファイルを遡って読む必要がなくなる
+    pat_pmt_index = cast(TortoiseField[list[PATPMTEntry]],
+        fields.JSONField(default=[], encoder=lambda x: json.dumps(x, ensure_ascii=False)))  # type: ignore
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
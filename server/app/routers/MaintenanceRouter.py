@@ -6,8 +6,7 @@ import signal
 import sys
 import threading
 import time
-from collections.abc import Coroutine
-from typing import Annotated, Any, Literal
+from typing import Annotated, Literal
 
 import anyio
 import psutil
@@ -25,16 +24,14 @@ from app.constants import (
     RESTART_REQUIRED_LOCK_PATH,
     THUMBNAILS_DIR,
 )
-from app.metadata.CMSectionsDetector import CMSectionsDetector
-from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.metadata.AnalysisJobQueue import AnalysisJobQueue
 from app.metadata.RecordedScanTask import RecordedScanTask
-from app.metadata.ThumbnailGenerator import ThumbnailGenerator
 from app.models.Channel import Channel
 from app.models.Program import Program
-from app.models.RecordedProgram import RecordedProgram
 from app.models.RecordedVideo import RecordedVideo
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentAdminUser, GetCurrentUser
+from app.utils.DriveIOLimiter import DriveIOLimiter
 
 
 # ルーター
@@ -236,9 +233,10 @@ async def BackgroundAnalysisAPI():
         # キーフレーム情報が未生成、またはサムネイルが未生成の録画ファイルを取得
         db_recorded_videos = await RecordedVideo.filter(status='Recorded')
 
-        # 各録画ファイルに対して直列にバックグラウンド解析タスクを実行
-        ## HDD は並列アクセスが遅いため、随時直列に実行していった方が結果的に早いことが多い
-        ## すべて直列なので ProcessLimiter や DriveIOLimiter での制限は掛けていない
+        # 各録画ファイルの未解析の項目ごとに、バックグラウンド解析のジョブを追加する
+        ## ジョブは録画が完了したばかりの録画ファイルのジョブより後回しにされ、ProcessLimiter と DriveIOLimiter の制限の範囲内で実行される
+        analysis_job_queue = AnalysisJobQueue()
+        job_ids: list[int] = []
         for db_recorded_video in db_recorded_videos:
             file_path = anyio.Path(db_recorded_video.file_path)
             try:
@@ -246,45 +244,37 @@ async def BackgroundAnalysisAPI():
                     logging.warning(f'{file_path}: File not found. Skipping...')
                     continue
 
-                # キーフレーム情報解析とサムネイル生成を同時に実行
-                tasks: list[Coroutine[Any, Any, None]] = []
-
-                # キーフレーム情報が未解析の場合、タスクに追加
+                # キーフレーム情報が未解析の場合、ジョブを追加
                 if not db_recorded_video.has_key_frames:
-                    tasks.append(KeyFrameAnalyzer(file_path, db_recorded_video.container_format).analyzeAndSave())
+                    job_ids.append(await analysis_job_queue.enqueue(
+                        'KeyFrameAnalysis', db_recorded_video.file_path, AnalysisJobQueue.PRIORITY_BACKLOG,
+                    ))
 
-                # CM 区間情報が未解析の場合、タスクに追加
+                # CM 区間情報が未解析の場合、ジョブを追加
                 ## cm_sections が [] の時は「解析はしたが CM 区間がなかった/検出に失敗した」ことを表している
                 ## CM 区間解析はかなり計算コストが高い処理のため、一度解析に失敗した録画ファイルは再解析しない
                 if db_recorded_video.cm_sections is None:
-                    tasks.append(CMSectionsDetector(
-                        file_path = anyio.Path(db_recorded_video.file_path),
-                        duration_sec = db_recorded_video.duration,
-                    ).detectAndSave())
+                    job_ids.append(await analysis_job_queue.enqueue(
+                        'CMSectionsDetection', db_recorded_video.file_path, AnalysisJobQueue.PRIORITY_BACKLOG,
+                    ))
 
-                # サムネイルが未生成の場合、タスクに追加
+                # サムネイルが未生成の場合、ジョブを追加
                 # どちらか片方だけがないパターンも考えられるので、その場合もサムネイル生成を実行する
                 thumbnail_tile_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{db_recorded_video.file_hash}_tile.webp'
                 thumbnail_path = anyio.Path(str(THUMBNAILS_DIR)) / f'{db_recorded_video.file_hash}.webp'
                 if (not await thumbnail_tile_path.is_file()) or (not await thumbnail_path.is_file()):
-                    # 録画番組情報を取得
-                    db_recorded_program = await RecordedProgram.all() \
-                        .select_related('recorded_video') \
-                        .select_related('channel') \
-                        .get_or_none(id=db_recorded_video.id)
-                    if db_recorded_program is not None:
-                        # RecordedProgram モデルを schemas.RecordedProgram に変換
-                        recorded_program = schemas.RecordedProgram.model_validate(db_recorded_program, from_attributes=True)
-                        tasks.append(ThumbnailGenerator.fromRecordedProgram(recorded_program).generateAndSave())
-
-                # タスクが存在する場合、同時実行
-                if tasks:
-                    await asyncio.gather(*tasks)
+                    job_ids.append(await analysis_job_queue.enqueue(
+                        'ThumbnailGeneration', db_recorded_video.file_path, AnalysisJobQueue.PRIORITY_BACKLOG,
+                    ))
 
             except Exception as ex:
                 logging.error(f'{file_path}: Error in background analysis:', exc_info=ex)
                 continue
 
+        # 追加したジョブがすべて完了するまで待つ
+        logging.info(f'Enqueued {len(job_ids)} background analysis jobs.')
+        await analysis_job_queue.waitForJobs(job_ids)
+
         # すべての録画ファイルのバックグラウンド解析が完了した
         logging.info('Manual background analysis has finished processing all recorded files.')
         background_analysis_task = None  # 再度新しいタスクを作成できるように None にする
@@ -303,6 +293,42 @@ async def BackgroundAnalysisAPI():
         )
 
 
+@router.get(
+    '/background-analysis-status',
+    summary = 'バックグラウンド解析ジョブキュー状態取得 API',
+    response_description = 'バックグラウンド解析のジョブキューの状態。',
+    response_model = schemas.AnalysisJobQueueStatus,
+)
+async def BackgroundAnalysisStatusAPI():
+    """
+    バックグラウンド解析 (キーフレーム解析・CM 区間検出・サムネイル生成) のジョブキューの深さとスループットを取得する。<br>
+    このメンテナンス機能は管理者ユーザーでなくてもアクセスできる。
+    """
+
+    return await AnalysisJobQueue().getStatus()
+
+
+@router.get(
+    '/drive-io-status',
+    summary = 'ドライブ I/O 状態取得 API',
+    response_description = '録画フォルダがあるドライブごとの種類・負荷とバックグラウンドタスクの実行状況。',
+    response_model = list[schemas.DriveIOStatus],
+)
+async def DriveIOStatusAPI():
+    """
+    録画フォルダがあるドライブごとに、デバイスの種類 (回転型かどうか)・読み込みスループット・レイテンシ・使用率と、<br>
+    バックグラウンドタスクの同時実行数・フォアグラウンドの読み込みの数を取得する。<br>
+    このメンテナンス機能は管理者ユーザーでなくてもアクセスできる。
+    """
+
+    # 録画フォルダがあるドライブのスケジューラーを作成しておく
+    ## getScheduler() はファイルのパスを受け取るため、録画フォルダ直下のファイルのパスとして渡す
+    for recorded_folder in Config().video.recorded_folders:
+        DriveIOLimiter.getScheduler(anyio.Path(recorded_folder) / '_')
+
+    return [drive_io_scheduler.getStatus() for drive_io_scheduler in DriveIOLimiter.getAllSchedulers()]
+
+
 @router.post(
     '/restart',
     summary = 'サーバー再起動 API',
@@ -1,5 +1,4 @@
 
-import asyncio
 import json
 from typing import Annotated
 
@@ -7,10 +6,10 @@ from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from fastapi.responses import Response
 from sse_starlette.sse import EventSourceResponse
 
-from app import logging
-from app.constants import QUALITY, QUALITY_TYPES
+from app import logging, schemas
+from app.constants import QUALITY, VIDEO_PASSTHROUGH_QUALITY, VIDEO_QUALITY_TYPES
 from app.models.RecordedProgram import RecordedProgram
-from app.streams.VideoStream import VideoStream
+from app.streams.VideoStream import VideoStream, VideoStreamSegmentMemoryBudget
 
 
 # ルーター
@@ -37,9 +36,23 @@ async def ValidateVideoID(video_id: Annotated[int, Path(description='録画番
     return recorded_program
 
 
-async def ValidateQuality(quality: Annotated[str, Path(description='映像の品質。ex: 1080p')]) -> QUALITY_TYPES:
+async def ValidateQuality(
+    recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
+    quality: Annotated[str, Path(description='映像の品質。ex: 1080p (再エンコードせずに配信する場合は original)')],
+) -> VIDEO_QUALITY_TYPES:
     """ 映像の品質のバリデーション """
 
+    # 再エンコードせずに配信する品質が指定された場合
+    ## 映像をそのまま配信するため、ブラウザで再生できる H.264 / H.265 の録画ファイルのみ対応する
+    if quality == VIDEO_PASSTHROUGH_QUALITY:
+        if recorded_program.recorded_video.video_codec == 'MPEG-2':
+            logging.error(f'[VideoStreamsRouter][ValidateQuality] Specified quality is not available for MPEG-2 video. [quality: {quality}]')
+            raise HTTPException(
+                status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail = 'Specified quality is not available for MPEG-2 video',
+            )
+        return VIDEO_PASSTHROUGH_QUALITY
+
     # 指定された品質が存在するか確認
     if quality not in QUALITY:
         logging.error(f'[VideoStreamsRouter][ValidateQuality] Specified quality was not found. [quality: {quality}]')
@@ -51,6 +64,77 @@ async def ValidateQuality(quality: Annotated[str, Path(description='映像の品
     return quality
 
 
+@router.get(
+    '/metrics',
+    summary = '録画番組 HLS セグメントメモリ使用状況 API',
+    response_description = '全録画視聴セッションでの HLS セグメントのメモリ使用状況。',
+    response_model = schemas.VideoStreamMetrics,
+)
+async def VideoHLSMetricsAPI():
+    """
+    全録画視聴セッションで保持しているエンコード済み HLS セグメントのメモリ使用状況を取得する。<br>
+    メモリ使用量の上限を超えたために破棄 / 一時ファイルに退避されたセグメントの数と、<br>
+    直近のセッションで最初のセグメントを返すまでにかかった平均時間 (事前準備の有無別) も返す。
+    """
+
+    return VideoStreamSegmentMemoryBudget.getMetrics()
+
+
+@router.get(
+    '/{video_id}/master-playlist',
+    summary = '録画番組 HLS M3U8 マスタープレイリスト API',
+    response_class = Response,
+    responses = {
+        status.HTTP_200_OK: {
+            'description': '録画番組のアダプティブビットレート再生用 HLS M3U8 マスタープレイリスト。',
+            'content': {'application/vnd.apple.mpegurl': {}},
+        }
+    }
+)
+async def VideoHLSMasterPlaylistAPI(
+    recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
+    session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
+    is_hevc: Annotated[bool, Query(description='H.265 / HEVC の画質で構成するかどうか。')] = False,
+    cache_key: Annotated[str | None, Query(description='キャッシュ制御用のキー。')] = None,
+):
+    """
+    録画番組のアダプティブビットレート再生用の HLS M3U8 マスタープレイリストを返す。<br>
+    マスタープレイリストには元映像の解像度以下の各画質のプレイリストが含まれ、クライアントは回線状況に応じて画質を自動で切り替えられる。<br>
+    各画質のセグメント境界は一致しており、各画質のエンコードはその画質のセグメントが要求された時点で初めて開始される。<br>
+    同時にエンコードされるのは最後にセグメントが要求された1画質のみで、ほかの画質のエンコードは中断される。<br>
+    再生中は、この API と同じセッション ID を指定して録画番組 HLS マスター Keep-Alive API を定期的に呼び出さなければならない。
+    """
+
+    # HLS M3U8 マスタープレイリストを取得
+    master_playlist = VideoStream.getMasterPlaylist(session_id, recorded_program, is_hevc, cache_key)
+    return Response(
+        content = master_playlist,
+        media_type = 'application/vnd.apple.mpegurl',
+        headers = {
+            'Cache-Control': 'max-age=0',
+        },
+    )
+
+
+@router.put(
+    '/{video_id}/master-keep-alive',
+    summary = '録画番組 HLS マスター Keep-Alive API',
+    status_code = status.HTTP_204_NO_CONTENT,
+)
+async def VideoHLSMasterKeepAliveAPI(
+    recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
+    session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
+):
+    """
+    アダプティブビットレート再生で、クライアントが現在利用している画質の HLS セグメントの生成を継続するための API 。<br>
+    一定時間プレイリストやセグメントが要求されていない画質の HLS セグメントの生成は継続されず、一定時間後に停止される。<br>
+    ただし最後にプレイリストやセグメントが要求された画質は、一時停止中などで一定時間要求がなくても維持される。
+    """
+
+    # 現在利用されている画質の録画視聴セッションのアクティブ状態を維持する
+    VideoStream.keepAliveRenditions(session_id)
+
+
 @router.get(
     '/{video_id}/{quality}/playlist',
     summary = '録画番組 HLS M3U8 プレイリスト API',
@@ -64,7 +148,7 @@ async def ValidateQuality(quality: Annotated[str, Path(description='映像の品
 )
 async def VideoHLSPlaylistAPI(
     recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
-    quality: Annotated[QUALITY_TYPES, Depends(ValidateQuality)],
+    quality: Annotated[VIDEO_QUALITY_TYPES, Depends(ValidateQuality)],
     session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
     cache_key: Annotated[str | None, Query(description='キャッシュ制御用のキー。')] = None,
 ):
@@ -100,7 +184,7 @@ async def VideoHLSPlaylistAPI(
 )
 async def VideoHLSSegmentAPI(
     recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
-    quality: Annotated[QUALITY_TYPES, Depends(ValidateQuality)],
+    quality: Annotated[VIDEO_QUALITY_TYPES, Depends(ValidateQuality)],
     session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
     sequence: Annotated[int, Query(description='HLS セグメントの 0 スタートのシーケンス番号。')],
     cache_key: Annotated[str | None, Query(description='キャッシュ制御用のキー。')],
@@ -147,7 +231,7 @@ async def VideoHLSSegmentAPI(
 )
 async def VideoHLSBufferAPI(
     recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
-    quality: Annotated[QUALITY_TYPES, Depends(ValidateQuality)],
+    quality: Annotated[VIDEO_QUALITY_TYPES, Depends(ValidateQuality)],
     session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
 ):
     """
@@ -182,28 +266,48 @@ async def VideoHLSBufferAPI(
 
         while True:
 
-            # 現在のバッファ範囲を取得
-            buffer_range = video_stream.getBufferRange()
+            # バッファ範囲が以前の結果から変化するまで待機する
+            ## HLS セグメントのエンコード状態が変わった時に VideoStream から通知されるため、ポーリングは行わない
+            buffer_range = await video_stream.waitForBufferRangeUpdate(previous_buffer_range)
+            logging.info(f'[VideoHLSBufferAPI] Buffer range updated. [begin: {buffer_range[0]}, end: {buffer_range[1]}]')
+            yield {
+                'event': 'buffer_range_update',  # buffer_range_update イベントを設定
+                'data': json.dumps({
+                    'begin': buffer_range[0],
+                    'end': buffer_range[1],
+                }),
+            }
+
+            # 取得結果を保存
+            previous_buffer_range = buffer_range
+
+    # EventSourceResponse でイベントストリームを配信する
+    return EventSourceResponse(generator())
 
-            # 以前の結果と異なっている場合のみレスポンスを返す
-            if previous_buffer_range != buffer_range:
-                logging.info(f'[VideoHLSBufferAPI] Buffer range updated. [begin: {buffer_range[0]}, end: {buffer_range[1]}]')
-                yield {
-                    'event': 'buffer_range_update',  # buffer_range_update イベントを設定
-                    'data': json.dumps({
-                        'begin': buffer_range[0],
-                        'end': buffer_range[1],
-                    }),
-                }
 
-                # 取得結果を保存
-                previous_buffer_range = buffer_range
+@router.put(
+    '/{video_id}/{quality}/prepare',
+    summary = '録画番組 HLS 事前準備 API',
+    status_code = status.HTTP_204_NO_CONTENT,
+)
+async def VideoHLSPrepareAPI(
+    recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
+    quality: Annotated[VIDEO_QUALITY_TYPES, Depends(ValidateQuality)],
+    session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
+    position: Annotated[float, Query(description='再生を開始する位置 (秒) 。', ge=0)] = 0.0,
+):
+    """
+    録画番組の再生開始に先立って、指定された再生位置を含む HLS セグメントのエンコードを投機的に開始する API 。<br>
+    番組詳細ページを開いた時などに呼び出しておくことで、再生開始時に最初のセグメントが返るまでの待ち時間を短縮できる。<br>
+    再生時は、この API と同じセッション ID ・画質でプレイリストを取得する必要がある。<br>
+    一定時間内にプレイリストやセグメントが要求されなかった場合、開始したエンコードは破棄される。
+    """
 
-            # ビジーにならないように、0.1秒ごとにチェックする
-            await asyncio.sleep(0.1)
+    # 録画視聴セッションを取得
+    video_stream = VideoStream(session_id, recorded_program, quality)
 
-    # EventSourceResponse でイベントストリームを配信する
-    return EventSourceResponse(generator())
+    # 指定された再生位置を含む HLS セグメントのエンコードを開始する
+    await video_stream.prepare(position)
 
 
 @router.put(
@@ -213,7 +317,7 @@ async def VideoHLSBufferAPI(
 )
 async def VideoHLSKeepAliveAPI(
     recorded_program: Annotated[RecordedProgram, Depends(ValidateVideoID)],
-    quality: Annotated[QUALITY_TYPES, Depends(ValidateQuality)],
+    quality: Annotated[VIDEO_QUALITY_TYPES, Depends(ValidateQuality)],
     session_id: Annotated[str, Query(description='セッション ID（クライアント側で適宜生成したランダム値を指定する）。')],
 ):
     """
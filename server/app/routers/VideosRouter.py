@@ -1,4 +1,6 @@
 
+import base64
+import bisect
 import json
 import pathlib
 from email.utils import parsedate
@@ -26,7 +28,9 @@ from app.metadata.ThumbnailGenerator import ThumbnailGenerator
 from app.models.RecordedProgram import RecordedProgram
 from app.models.User import User
 from app.routers.UsersRouter import GetCurrentAdminUser
+from app.utils.ClipFileResponse import ClipFileResponse
 from app.utils.DriveIOLimiter import DriveIOLimiter
+from app.utils.ForegroundFileResponse import ForegroundFileResponse
 from app.utils.JikkyoClient import JikkyoClient
 
 
@@ -706,13 +710,164 @@ async def VideoDownloadAPI(
     filename = pathlib.Path(file_path).name
 
     # MPEG-TS ファイルをダウンロードさせる
-    return FileResponse(
+    ## ダウンロード中は同じドライブ上のバックグラウンド解析よりも録画ファイルの読み込みを優先させる
+    return ForegroundFileResponse(
         path = file_path,
         filename = filename,
         media_type = 'video/mp2t',
     )
 
 
+@router.get(
+    '/{video_id}/clip',
+    summary = '録画番組クリップダウンロード API',
+    response_description = '録画番組の指定された時間範囲を切り出した MPEG-TS ファイル。',
+    response_class = ClipFileResponse,
+    responses = {
+        200: {'content': {'video/mp2t': {}}},
+        206: {'content': {'video/mp2t': {}}},
+        422: {'description': 'Specified video_id was not found or the clip range is invalid'},
+    },
+)
+async def VideoClipDownloadAPI(
+    recorded_program: Annotated[RecordedProgram, Depends(GetRecordedProgram)],
+    start: Annotated[float, Query(description='切り出しを開始する時刻 (録画ファイル内の最初のキーフレームからの秒数で、録画番組の再生位置と同じ基準) 。', ge=0)],
+    end: Annotated[float, Query(description='切り出しを終了する時刻 (録画ファイル内の最初のキーフレームからの秒数で、録画番組の再生位置と同じ基準) 。', gt=0)],
+    skip_cm: Annotated[bool, Query(description='CM 区間を取り除くかどうか。CM 区間が未解析の場合は無視される。')] = False,
+):
+    """
+    指定された録画番組の MPEG-TS ファイルから、指定された時間範囲を再エンコードせずに切り出してダウンロードする。<br>
+    切り出し範囲はキーフレーム単位に広げられ、先頭には切り出し開始位置で有効な PAT/PMT が付加される。<br>
+    CM 区間を取り除く場合、各つなぎ目には PAT/PMT と、PCR の不連続 (discontinuity_indicator) を示す TS パケットが挿入される。<br>
+    HTTP Range リクエストにも対応している。キーフレーム情報が解析済みの MPEG-TS 形式の録画ファイルのみ対応する。
+    """
+
+    recorded_video = recorded_program.recorded_video
+
+    # MPEG-4 形式の録画ファイルはキーフレーム情報にバイトオフセットが含まれないため、切り出せない
+    if recorded_video.container_format != 'MPEG-TS':
+        logging.error(f'[VideosRouter][VideoClipDownloadAPI] Clip download is only available for MPEG-TS files. [video_id: {recorded_program.id}]')
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = 'Clip download is only available for MPEG-TS files',
+        )
+    if not recorded_video.has_key_frames:
+        logging.error(f'[VideosRouter][VideoClipDownloadAPI] Keyframe information is not available. [video_id: {recorded_program.id}]')
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = 'Keyframe information is not available',
+        )
+    if start >= end:
+        logging.error(f'[VideosRouter][VideoClipDownloadAPI] Invalid clip range. [video_id: {recorded_program.id}, start: {start}, end: {end}]')
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = 'Invalid clip range',
+        )
+
+    # 各キーフレームの最初のキーフレームからの時刻 (秒) と、ファイル内の位置 (バイト)
+    ## 録画番組の再生位置 (CM 区間の時刻など) と同じく、最初のキーフレームの DTS を 0 秒とする
+    key_frames = recorded_video.key_frames
+    key_frame_times = [(key_frame['dts'] - key_frames[0]['dts']) / 90000 for key_frame in key_frames]
+    file_size = (await anyio.Path(recorded_video.file_path).stat()).st_size
+
+    def GetByteRange(range_start: float, range_end: float) -> tuple[int, int]:
+        """ 指定された時間範囲を含む、キーフレーム単位のバイト範囲を返す """
+        # 開始時刻以前で最も近いキーフレームから
+        start_index = max(0, bisect.bisect_right(key_frame_times, range_start) - 1)
+        # 終了時刻以降で最も近いキーフレームの直前まで (終了時刻が最後のキーフレーム以降ならファイル末尾まで)
+        end_index = bisect.bisect_left(key_frame_times, range_end)
+        end_offset = key_frames[end_index]['offset'] if end_index < len(key_frames) else file_size
+        return (key_frames[start_index]['offset'], end_offset)
+
+    # 切り出す時間範囲を求める
+    ## CM 区間を取り除く場合は、切り出す時間範囲から CM 区間を除いた複数の時間範囲に分割する
+    time_ranges: list[tuple[float, float]] = [(start, end)]
+    if skip_cm is True and recorded_video.cm_sections:
+        for cm_section in sorted(recorded_video.cm_sections, key=lambda section: section['start_time']):
+            new_time_ranges: list[tuple[float, float]] = []
+            for range_start, range_end in time_ranges:
+                if cm_section['end_time'] <= range_start or cm_section['start_time'] >= range_end:
+                    new_time_ranges.append((range_start, range_end))
+                    continue
+                if range_start < cm_section['start_time']:
+                    new_time_ranges.append((range_start, cm_section['start_time']))
+                if cm_section['end_time'] < range_end:
+                    new_time_ranges.append((cm_section['end_time'], range_end))
+            time_ranges = new_time_ranges
+    if len(time_ranges) == 0:
+        logging.error(f'[VideosRouter][VideoClipDownloadAPI] Clip range consists only of CM sections. [video_id: {recorded_program.id}, start: {start}, end: {end}]')
+        raise HTTPException(
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail = 'Clip range consists only of CM sections',
+        )
+
+    # 時間範囲をキーフレーム単位のバイト範囲に変換し、重なる範囲は結合する
+    file_ranges: list[tuple[int, int]] = []
+    for range_start, range_end in time_ranges:
+        byte_start, byte_end = GetByteRange(range_start, range_end)
+        if len(file_ranges) > 0 and byte_start <= file_ranges[-1][1]:
+            file_ranges[-1] = (file_ranges[-1][0], max(file_ranges[-1][1], byte_end))
+        else:
+            file_ranges.append((byte_start, byte_end))
+
+    def GetPATPMTPackets(offset: int) -> bytes:
+        """ 指定されたバイト位置で有効な PAT/PMT の TS パケットを返す """
+        pat_pmt_entry = recorded_video.pat_pmt_index[0]
+        for entry in recorded_video.pat_pmt_index:
+            if entry['offset'] > offset:
+                break
+            pat_pmt_entry = entry
+        return base64.b64decode(pat_pmt_entry['packets'])
+
+    def GetDiscontinuityPackets(pat_pmt_packets: bytes) -> bytes:
+        """ PMT に記載された PCR_PID に、discontinuity_indicator を立てたアダプテーションフィールドのみの TS パケットを生成して返す """
+        pcr_pids: list[int] = []
+        for packet_offset in range(0, len(pat_pmt_packets) - 188 + 1, 188):
+            packet = pat_pmt_packets[packet_offset:packet_offset + 188]
+            pid = ((packet[1] & 0x1F) << 8) | packet[2]
+            # PAT 以外で、payload_unit_start_indicator が立っていてペイロードのみを持つ TS パケットのセクション先頭を見る
+            if pid == 0x0000 or (packet[1] & 0x40) == 0 or ((packet[3] >> 4) & 0x03) != 0x01:
+                continue
+            section = packet[5 + packet[4]:]
+            # table_id が PMT (0x02) のセクションから PCR_PID を取り出す
+            if len(section) < 10 or section[0] != 0x02:
+                continue
+            pcr_pid = ((section[8] & 0x1F) << 8) | section[9]
+            if pcr_pid != 0x1FFF and pcr_pid not in pcr_pids:
+                pcr_pids.append(pcr_pid)
+        # adaptation_field_control = 0b10 (アダプテーションフィールドのみ) 、adaptation_field_length = 183 、discontinuity_indicator = 1
+        ## 残りはスタッフィングバイト (0xFF) で埋める
+        return b''.join(
+            bytes([0x47, (pcr_pid >> 8) & 0x1F, pcr_pid & 0xFF, 0x20, 183, 0x80]) + b'\xff' * 182
+            for pcr_pid in pcr_pids
+        )
+
+    # 切り出し開始位置で有効な PAT/PMT を先頭に付加する
+    ## CM 区間を取り除いて複数のバイト範囲をつなぎ合わせる場合、つなぎ目で PCR/PTS/DTS が不連続になるため、
+    ## 2つ目以降のバイト範囲の直前には、その位置で有効な PAT/PMT と、PCR_PID に discontinuity_indicator を立てた TS パケットを付加する
+    ## PCR_PID 以外の PID の continuity_counter もつなぎ目で飛ぶが、一般的なプレイヤーはパケットロスとして扱い、そのまま再生できる
+    ## キーフレーム解析時に PAT/PMT の位置が解析されていない場合は何も付加しない (多くのプレイヤーは後続の PAT/PMT から再生できるが、
+    ## つなぎ目の不連続は通知されないため、プレイヤーによってはつなぎ目で再生が一時的に乱れることがある)
+    prefix = b''
+    range_prefixes: list[bytes] = [b''] * len(file_ranges)
+    if len(recorded_video.pat_pmt_index) > 0:
+        prefix = GetPATPMTPackets(file_ranges[0][0])
+        for index in range(1, len(file_ranges)):
+            pat_pmt_packets = GetPATPMTPackets(file_ranges[index][0])
+            range_prefixes[index] = pat_pmt_packets + GetDiscontinuityPackets(pat_pmt_packets)
+
+    # 切り出した MPEG-TS ファイルをダウンロードさせる
+    filename = f'{pathlib.Path(recorded_video.file_path).stem}_{int(start)}-{int(end)}{"_nocm" if skip_cm else ""}.ts'
+    return ClipFileResponse(
+        path = recorded_video.file_path,
+        file_ranges = file_ranges,
+        prefix = prefix,
+        range_prefixes = range_prefixes,
+        filename = filename,
+        media_type = 'video/mp2t',
+    )
+
+
 @router.get(
     '/{video_id}/jikkyo',
     summary = '録画番組過去ログコメント API',
@@ -843,11 +998,16 @@ async def VideoThumbnailRegenerateAPI(
         # RecordedProgram モデルを schemas.RecordedProgram に変換
         recorded_program_schema = schemas.RecordedProgram.model_validate(recorded_program, from_attributes=True)
 
-        # DriveIOLimiter で同一 HDD に対してのバックグラウンドタスクの同時実行数を原則1セッションに制限
+        # DriveIOLimiter で同一ドライブに対してのバックグラウンドタスクの同時実行数を、ドライブの種類と負荷に応じて制限
         file_path = anyio.Path(recorded_program.recorded_video.file_path)
-        async with DriveIOLimiter.getSemaphore(file_path):
+        async with DriveIOLimiter.getScheduler(file_path):
             # サムネイル画像の再生成を実行
-            generator = ThumbnailGenerator.fromRecordedProgram(recorded_program_schema)
+            ## 解析済みのキーフレーム情報があれば、各候補フレームをキーフレームの位置から直接抽出する
+            generator = ThumbnailGenerator.fromRecordedProgram(
+                recorded_program_schema,
+                key_frames = recorded_program.recorded_video.key_frames,
+                pat_pmt_index = recorded_program.recorded_video.pat_pmt_index,
+            )
             await generator.generateAndSave()
 
     except Exception as ex:
@@ -164,6 +164,12 @@ class CMSection(TypedDict):
     start_time: float
     end_time: float
 
+class PATPMTEntry(TypedDict):
+    offset: int
+    pat_offset: int
+    pmt_offset: int
+    packets: str
+
 # ***** 録画番組 *****
 
 class RecordedProgram(PydanticModel):
@@ -327,6 +333,47 @@ class LiveStreamStatuses(BaseModel):
     Standby: dict[str, LiveStreamStatus]
     Offline: dict[str, LiveStreamStatus]
 
+# ***** 録画ストリーム *****
+
+class VideoStreamMetrics(BaseModel):
+    session_count: int
+    memory_segment_count: int
+    memory_bytes: int
+    memory_limit_bytes: int
+    unread_memory_bytes: int
+    spilled_segment_count: int
+    spilled_bytes: int
+    evicted_segment_count: int
+    total_spilled_segment_count: int
+    prepared_session_count: int
+    prepared_time_to_first_segment_seconds: float | None
+    unprepared_session_count: int
+    unprepared_time_to_first_segment_seconds: float | None
+
+# ***** メンテナンス *****
+
+class AnalysisJobQueueStatus(BaseModel):
+    queued_count: int
+    retry_waiting_count: int
+    running_count: int
+    failed_count: int
+    completed_count_last_hour: int
+    jobs_per_hour: float
+    average_processing_seconds: float | None
+
+class DriveIOStatus(BaseModel):
+    drive_id: str
+    device_name: str | None
+    is_rotational: bool | None
+    member_count: int
+    background_capacity: int
+    background_active_count: int
+    background_waiting_count: int
+    foreground_reader_count: int
+    read_bytes_per_second: float | None
+    read_latency_ms: float | None
+    utilization: float | None
+
 # ***** 録画予約 *****
 
 # 以下は EDCB の生のデータモデルをフロントエンドが扱いやすいようモダンに整形し、KonomiTV 独自のプロパティを追加したもの
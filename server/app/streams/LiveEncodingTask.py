@@ -34,6 +34,7 @@ from app.streams.LivePSIDataArchiver import LivePSIDataArchiver
 from app.utils import GetMirakurunAPIEndpointURL
 from app.utils.edcb.EDCBTuner import EDCBTuner
 from app.utils.edcb.PipeStreamReader import PipeStreamReader
+from app.utils.ProcessLimiter import ProcessLimiter
 
 
 if TYPE_CHECKING:
@@ -966,6 +967,14 @@ class LiveEncodingTask:
         # エンコーダーの出力ログのリスト
         lines: list[str] = []
 
+        # ProcessLimiter にエンコーダーの進捗を報告する際のキーと、実時間でエンコードするために必要なフレームレート
+        ## BS4K と 60fps の画質では 59.94fps 、それ以外では 29.97fps でエンコードされる
+        encoder_key = f'Live: {self.live_stream.live_stream_id}'
+        if channel.type == 'BS4K' or QUALITY[self.live_stream.quality].is_60fps is True:
+            target_fps = 60000 / 1001
+        else:
+            target_fps = 30000 / 1001
+
         async def EncoderObServer() -> None:
 
             # 1つ上のスコープ (Enclosing Scope) の変数を書き替えるために必要
@@ -1049,6 +1058,14 @@ class LiveEncodingTask:
                         await encoder_log.write(line.strip('\r\n') + '\n')
                         await encoder_log.flush()
 
+                # エンコード済みのフレーム数を ProcessLimiter に報告する
+                ## エンコードが実時間に追いついていない場合は、バックグラウンド解析などの外部プロセスの同時実行数が減らされる
+                ## ラジオチャンネルでは映像をエンコードしないため報告しない
+                if channel.is_radiochannel is False:
+                    frame_count_match = re.search(r'frame=\s*([0-9]+)', line) if ENCODER_TYPE == 'FFmpeg' else re.search(r'([0-9]+) frames: ', line)
+                    if frame_count_match is not None:
+                        ProcessLimiter.reportEncoderProgress(encoder_key, int(frame_count_match.group(1)), target_fps)
+
                 # ライブストリームのステータスを取得
                 live_stream_status = self.live_stream.getStatus()
 
@@ -1334,6 +1351,9 @@ class LiveEncodingTask:
         except Exception:
             pass
 
+        # ProcessLimiter に報告したエンコーダーの進捗を破棄する
+        ProcessLimiter.clearEncoderProgress(encoder_key)
+
         # すべての視聴中クライアントのライブストリームへの接続を切断する
         self.live_stream.disconnectAll()
 
@@ -4,23 +4,32 @@
 from __future__ import annotations
 
 import asyncio
+import base64
 import math
 import os
 import sys
+import time
 from typing import TYPE_CHECKING, ClassVar, Literal, cast
 
+import anyio
+import numpy as np
 from biim.mpeg2ts import ts
-from biim.mpeg2ts.h264 import H264PES
-from biim.mpeg2ts.h265 import H265PES
-from biim.mpeg2ts.packetize import packetize_pes, packetize_section
-from biim.mpeg2ts.parser import PESParser, SectionParser
+from biim.mpeg2ts.packetize import packetize_section
+from biim.mpeg2ts.parser import SectionParser
 from biim.mpeg2ts.pat import PATSection
-from biim.mpeg2ts.pes import PES
 from biim.mpeg2ts.pmt import PMTSection
+from numpy.typing import NDArray
 
 from app import logging
 from app.config import Config
-from app.constants import LIBRARY_PATH, QUALITY, QUALITY_TYPES
+from app.constants import (
+    LIBRARY_PATH,
+    QUALITY,
+    QUALITY_TYPES,
+    VIDEO_PASSTHROUGH_QUALITY,
+)
+from app.metadata.TSKeyFrameIndexer import TSKeyFrameIndexer
+from app.utils.DriveIOLimiter import DriveIOLimiter
 
 
 if TYPE_CHECKING:
@@ -38,6 +47,17 @@ class VideoEncodingTask:
     ## この数を超えた場合はエンコードタスクを再起動しない（無限ループを避ける）
     MAX_RETRY_COUNT: ClassVar[int] = 10  # 10回まで
 
+    # エンコーダーの出力を一度に読み取る最大サイズ (バイト)
+    ## TS パケット単位で処理するため、TS パケットサイズの倍数にしている
+    ENCODER_OUTPUT_READ_SIZE: ClassVar[int] = ts.PACKET_SIZE * 1024
+
+    # 映像 PES が IDR/CRA フレームかを判定するために、最初の VCL NAL ユニットを探す ES データの最大サイズ (バイト)
+    ## この範囲内に VCL NAL ユニットが見つからない場合は IDR/CRA フレームではないとみなす
+    RANDOM_ACCESS_PROBE_MAX_BYTES: ClassVar[int] = 64 * 1024
+
+    # 録画中の番組を追っかけ再生している場合に、録画ファイルの末尾に達してからデータが追記されたかを確認する間隔 (秒)
+    RECORDING_FEED_POLL_INTERVAL: ClassVar[float] = 0.5  # 0.5秒
+
 
     def __init__(self, video_stream: VideoStream) -> None:
         """
@@ -70,6 +90,7 @@ class VideoEncodingTask:
     def buildFFmpegOptions(self,
         quality: QUALITY_TYPES,
         output_ts_offset: float,
+        force_key_frame_times: list[float] | None = None,
     ) -> list[str]:
         """
         FFmpeg に渡すオプションを組み立てる
@@ -77,6 +98,7 @@ class VideoEncodingTask:
         Args:
             quality (QUALITY_TYPES): 映像の品質
             output_ts_offset (float): 出力 TS のタイムスタンプオフセット (秒)
+            force_key_frame_times (list[float] | None): キーフレームを強制的に挿入するエンコード開始位置からの時刻 (秒) のリスト
 
         Returns:
             list[str]: FFmpeg に渡すオプションが連なる配列
@@ -148,6 +170,11 @@ class VideoEncodingTask:
             options.append(f'-vf scale={video_width}:{video_height}')
             options.append(f'-g {int(self.GOP_LENGTH_SECOND * int_fps)}')
 
+        ## GOP 長より短い HLS セグメントの境界にキーフレームを強制的に挿入する
+        ## 再生開始直後の短いセグメントを、計画通りの位置で分割できるようにするため
+        if force_key_frame_times is not None and len(force_key_frame_times) > 0:
+            options.append(f'-force_key_frames {",".join(f"{time:.3f}" for time in force_key_frame_times)}')
+
         # 音声
         ## 音声が 5.1ch かどうかに関わらず、ステレオにダウンミックスする
         options.append(f'-acodec aac -aac_coder twoloop -ac 2 -ab {QUALITY[quality].audio_bitrate} -ar 48000 -af volume=2.0')
@@ -353,6 +380,157 @@ class VideoEncodingTask:
         return result
 
 
+    @staticmethod
+    def findTSPacketAlignment(data: bytes | bytearray) -> int:
+        """
+        同期バイトが TS パケットサイズの間隔で並んでいる (TS パケット境界である) 最初の位置を探す
+
+        Args:
+            data (bytes | bytearray): 探索対象のデータ
+
+        Returns:
+            int: TS パケット境界の位置 (見つからなかった場合はデータ長)
+        """
+
+        offset = data.find(ts.SYNC_BYTE)
+        while offset != -1:
+            # 188 バイト先と 376 バイト先の同期バイトを確認し、TS パケット境界であるか検証する
+            ## データ末尾を超える位置は次回の読み込みで検証されるので、ここでは妥当とみなす
+            is_aligned = True
+            for next_offset in (offset + ts.PACKET_SIZE, offset + ts.PACKET_SIZE * 2):
+                if next_offset < len(data) and data[next_offset] != ts.SYNC_BYTE[0]:
+                    is_aligned = False
+                    break
+            if is_aligned is True:
+                return offset
+            offset = data.find(ts.SYNC_BYTE, offset + 1)
+
+        return len(data)
+
+
+    @staticmethod
+    def getTSPayloadOffset(packet: bytes) -> int:
+        """
+        TS パケット内のペイロードの開始位置を取得する
+
+        Args:
+            packet (bytes): TS パケット
+
+        Returns:
+            int: ペイロードの開始位置 (ペイロードがない場合は TS パケットサイズ)
+        """
+
+        adaptation_field_control = (packet[3] >> 4) & 0x03
+        if (adaptation_field_control & 0x01) == 0:
+            return ts.PACKET_SIZE
+        if (adaptation_field_control & 0x02) != 0:
+            return min(4 + 1 + packet[4], ts.PACKET_SIZE)
+        return 4
+
+
+    @classmethod
+    def parseVideoPESHeader(cls, packet: bytes) -> tuple[int, int] | None:
+        """
+        PES の先頭を含む TS パケットから、PES ヘッダーの 33bit タイムスタンプと ES データの開始位置を取得する
+        PES 全体を組み立てずに、先頭の TS パケットだけを見てタイムスタンプを得るためのもの
+
+        Args:
+            packet (bytes): payload_unit_start_indicator が立っている TS パケット
+
+        Returns:
+            tuple[int, int] | None: (DTS (DTS がなければ PTS), TS パケット内の ES データの開始位置) / PES ヘッダーを解析できなかった場合は None
+        """
+
+        def ParseTimestamp(data: bytes, offset: int) -> int:
+            """ PES ヘッダー内の 5 バイトのタイムスタンプフィールドをパースする """
+            return (((data[offset + 0] >> 1) & 0x07) << 30) | \
+                (data[offset + 1] << 22) | \
+                (((data[offset + 2] >> 1) & 0x7F) << 15) | \
+                (data[offset + 3] << 7) | \
+                ((data[offset + 4] >> 1) & 0x7F)
+
+        payload_offset = cls.getTSPayloadOffset(packet)
+        payload = packet[payload_offset:]
+        if len(payload) < 14 or payload[0:3] != b'\x00\x00\x01':
+            return None
+
+        # PTS_DTS_flags (0b10: PTS のみ, 0b11: PTS と DTS)
+        pts_dts_flags = (payload[7] >> 6) & 0x03
+        if (pts_dts_flags & 0x02) == 0:
+            return None
+        timestamp = ParseTimestamp(payload, 9)
+        if pts_dts_flags == 0x03 and len(payload) >= 19:
+            timestamp = ParseTimestamp(payload, 14)
+
+        return (timestamp, min(payload_offset + 9 + payload[8], ts.PACKET_SIZE))
+
+
+    @staticmethod
+    def detectRandomAccessNALUnit(es_data: bytes | bytearray, is_hevc: bool, is_passthrough: bool = False) -> bool | None:
+        """
+        映像 PES の ES データの最初の VCL NAL ユニットから、(H.264: IDR, H.265: IDR/CRA) フレームかを判定する
+        アクセスユニットの最初の VCL NAL ユニットの種別がそのフレームの種別を表すため、それより後の NAL ユニットは見る必要がない
+        再エンコードを行わない場合は、HLS セグメントの分割位置の計画に使ったキーフレーム情報と同じ基準 (TSKeyFrameIndexer.detectKeyFrame()) で判定する
+        (H.264 のリカバリポイント SEI 付きの I フレームや H.265 の BLA フレームもキーフレームとして記録されているため、
+        IDR/CRA のみで分割すると計画した分割位置と実際の分割位置がずれてしまう)
+
+        Args:
+            es_data (bytes | bytearray): 映像 PES の先頭からの ES データ (途中までで良い)
+            is_hevc (bool): 映像が H.265 かどうか
+            is_passthrough (bool): 再エンコードを行わずに配信しているかどうか (デフォルト: False)
+
+        Returns:
+            bool | None: IDR/CRA フレームかどうか (まだ VCL NAL ユニットが見つからない場合は None)
+        """
+
+        # 再エンコードを行わない場合は、キーフレーム解析と同じ基準で判定する
+        if is_passthrough is True:
+            return TSKeyFrameIndexer.detectKeyFrame(
+                es_data, TSKeyFrameIndexer.STREAM_TYPE_H265 if is_hevc is True else TSKeyFrameIndexer.STREAM_TYPE_H264,
+            )
+
+        offset = es_data.find(b'\x00\x00\x01')
+        while offset != -1 and offset + 3 < len(es_data):
+            nal_header = es_data[offset + 3]
+            if is_hevc is True:
+                nal_unit_type = (nal_header >> 1) & 0x3F
+                # VCL NAL ユニット (0 ~ 31)
+                if nal_unit_type < 32:
+                    # biim に合わせて IDR/CRA のみを採用 (BLA は除外)
+                    return nal_unit_type in (19, 20, 21)
+            else:
+                nal_unit_type = nal_header & 0x1F
+                # VCL NAL ユニット (1 ~ 5)
+                if 1 <= nal_unit_type <= 5:
+                    return nal_unit_type == 5
+            offset = es_data.find(b'\x00\x00\x01', offset + 3)
+
+        return None
+
+
+    def getForceKeyFrameTimes(self, segments: tuple[VideoStreamSegment, ...], start_sequence: int) -> list[float]:
+        """
+        エンコード開始位置以降で、GOP 長より短い HLS セグメントの境界の時刻 (エンコード開始位置からの秒数) を取得する
+        再生開始直後の短いセグメントは通常の GOP 長ではキーフレームが足りず計画通りに分割できないため、エンコーダーにキーフレームを強制させる
+
+        Args:
+            segments (tuple[VideoStreamSegment, ...]): HLS セグメントのリスト
+            start_sequence (int): エンコードを開始するセグメントのシーケンス番号
+
+        Returns:
+            list[float]: キーフレームを強制的に挿入する時刻 (秒) のリスト
+        """
+
+        force_key_frame_times: list[float] = []
+        start_dts = segments[start_sequence].start_dts
+        for segment in segments[start_sequence:-1]:
+            if segment.duration_seconds >= self.GOP_LENGTH_SECOND:
+                continue
+            next_segment = segments[segment.sequence_index + 1]
+            force_key_frame_times.append((next_segment.start_dts - start_dts) / ts.HZ)
+        return force_key_frame_times
+
+
     async def run(self, start_sequence: int) -> None:
         """
         エンコードタスクを実行する
@@ -368,14 +546,24 @@ class VideoEncodingTask:
         CONFIG = Config()
         ENCODER_TYPE = CONFIG.general.encoder
 
+        # 再エンコードを行わずに配信するかどうか
+        ## 有効な場合はエンコーダーを起動せず、tsreadex で音声・字幕を正規化しただけの TS を、元の映像のキーフレーム位置で HLS セグメントに分割する
+        ## H.264 / H.265 の録画ファイルのみが対象 (VideoStreamsRouter でバリデーション済み)
+        is_passthrough = self.video_stream.quality == VIDEO_PASSTHROUGH_QUALITY
+
         # 新しいエンコードタスクを起動させた時点で既にエンコード済みのセグメントは使えなくなるので、すべてリセットする
         for segment in self.video_stream.segments:
             if segment.encode_status != 'Pending':
                 await segment.resetState()
 
+        # HLS セグメントのリストを取得
+        ## VideoStream.segments は呼び出すたびにタプルを生成するため、エンコードタスク中は一度取得したものを使い回す
+        ## 録画中の番組を追っかけ再生している場合を除き、HLS セグメントのリスト自体はエンコードタスクの実行中に変更されることはない
+        segments = self.video_stream.segments
+
         # 処理対象の VideoStreamSegment を取得し、エンコード中状態に設定
         current_sequence = start_sequence
-        current_segment: VideoStreamSegment = self.video_stream.segments[current_sequence]
+        current_segment: VideoStreamSegment = segments[current_sequence]
         current_segment.encode_status = 'Encoding'
         logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Starting the Encoder...')
 
@@ -396,6 +584,11 @@ class VideoEncodingTask:
         # 切り出した HLS セグメント用 MPEG-TS パケットを一時的に保持するバッファ
         encoded_segment = bytearray()
 
+        # エンコードタスクの実行中は録画ファイルをフォアグラウンドで読み込むことを DriveIOLimiter に通知し、
+        # 同じドライブ上で実行されるバックグラウンド解析よりも録画ファイルの読み込みを優先させる
+        drive_io_scheduler = DriveIOLimiter.getScheduler(anyio.Path(self.video_stream.recorded_program.recorded_video.file_path))
+        drive_io_scheduler.beginForegroundRead()
+
         try:
             # 最大 MAX_RETRY_COUNT 回までリトライする
             while self._retry_count < self.MAX_RETRY_COUNT:
@@ -403,16 +596,13 @@ class VideoEncodingTask:
                 # MPEG-TS セクションパーサーを初期化
                 pat_parser: SectionParser[PATSection] = SectionParser(PATSection)
                 pmt_parser: SectionParser[PMTSection] = SectionParser(PMTSection)
-                video_parser: PESParser[PES] = PESParser(PES)
-                audio_parser: PESParser[PES] = PESParser(PES)
                 # PID と CC (Continuity Counter) をリセット
+                ## PAT/PMT 以外の TS パケットはエンコーダーの出力をそのままセグメントに追加するため、CC もエンコーダーのものを引き継ぐ
                 pmt_pid: int | None = None
                 pat_cc: int = 0
                 pmt_cc: int = 0
                 video_pid: int | None = None
-                video_cc: int = 0
                 audio_pid: int | None = None
-                audio_cc: int = 0
 
                 # 録画ファイルが MPEG-4 形式の場合、psisimux で MPEG-TS に変換し、
                 # TS ファイル入力の代わりに psisimux からの出力を tsreadex への入力として渡す
@@ -459,112 +649,129 @@ class VideoEncodingTask:
                 else:
                     assert file is not None
 
-                    # セグメント開始位置から遡る範囲を計算（最大 5000 パケット、ただしファイル先頭は超えない）
-                    max_lookback_bytes = 188 * 5000  # 5000 パケット分
-                    search_start_pos = max(0, current_segment.start_file_position - max_lookback_bytes)
-                    search_end_pos = current_segment.start_file_position
-
-                    # 探索範囲のデータを読み込む
-                    file.seek(search_start_pos)
-                    search_data = file.read(search_end_pos - search_start_pos)
-
-                    # PAT/PMT を抽出（セグメント開始位置に最も近いものを保持）
-                    temp_pat_parser = SectionParser(PATSection)
-                    temp_pmt_parser = SectionParser(PMTSection)
-                    temp_pmt_pid: int | None = None
-
-                    # 最もセグメント開始位置に近い PAT/PMT を保持
-                    closest_pat_packet: bytes | None = None
-                    closest_pmt_packet: bytes | None = None
-                    closest_pat_distance = float('inf')
-                    closest_pmt_distance = float('inf')
-
-                    # TS パケットを1つずつ処理
-                    offset = 0
-                    while offset + 188 <= len(search_data):
-                        # 同期バイトを探す
-                        if search_data[offset] != ts.SYNC_BYTE[0]:
-                            offset += 1
-                            continue
-
-                        # 188 バイト先 (必要であればさらに 188 バイト先) の同期バイトを確認し、TS パケット境界であるか検証する
-                        is_aligned = True
-                        next_offset = offset + 188
-                        if next_offset < len(search_data) and search_data[next_offset] != ts.SYNC_BYTE[0]:
-                            is_aligned = False
-                        second_offset = offset + 376
-                        if is_aligned is True and second_offset < len(search_data) and search_data[second_offset] != ts.SYNC_BYTE[0]:
-                            is_aligned = False
-                        if is_aligned is False:
-                            offset += 1
-                            continue
-
-                        packet = search_data[offset:offset + 188]
-                        pid = ts.pid(packet)
-
-                        # 現在のパケットの実際のファイル位置
-                        current_file_pos = search_start_pos + offset
-                        distance = abs(current_file_pos - current_segment.start_file_position)
-
-                        # PAT (PID 0x00)
-                        if pid == 0x00:
-                            temp_pat_parser.push(packet)
-                            for pat in temp_pat_parser:
-                                if pat.CRC32() == 0:
-                                    # セグメント開始位置により近い場合、または開始位置以前で最も近い場合は更新
-                                    if current_file_pos <= current_segment.start_file_position:
-                                        # 開始位置以前の PAT を優先（より近いものに更新）
-                                        if closest_pat_packet is None or distance < closest_pat_distance:
+                    # キーフレーム解析時に PAT/PMT の位置が解析済みの場合は、セグメント開始位置以前で最も近い PAT/PMT をそのまま使う
+                    ## ファイルを遡って PAT/PMT を探す必要がなくなるため、シークのたびに発生する I/O と解析処理を省ける
+                    pat_pmt_index = self.video_stream.recorded_program.recorded_video.pat_pmt_index
+                    if len(pat_pmt_index) > 0:
+                        pat_pmt_entry = pat_pmt_index[0]
+                        for entry in pat_pmt_index:
+                            if entry['offset'] > current_segment.start_file_position:
+                                break
+                            pat_pmt_entry = entry
+                        initial_pat_pmt_data = base64.b64decode(pat_pmt_entry['packets'])
+                        logging.info(
+                            f'{self.video_stream.log_prefix}[Segment {current_sequence}] '
+                            f'Using indexed PAT/PMT (PAT at {pat_pmt_entry["pat_offset"]}, PMT at {pat_pmt_entry["pmt_offset"]})'
+                        )
+
+                    # PAT/PMT の位置が未解析の場合は、セグメント開始位置からファイルを遡って PAT/PMT を探す
+                    else:
+                        # セグメント開始位置から遡る範囲を計算（最大 5000 パケット、ただしファイル先頭は超えない）
+                        max_lookback_bytes = 188 * 5000  # 5000 パケット分
+                        search_start_pos = max(0, current_segment.start_file_position - max_lookback_bytes)
+                        search_end_pos = current_segment.start_file_position
+
+                        # 探索範囲のデータを読み込む
+                        file.seek(search_start_pos)
+                        search_data = file.read(search_end_pos - search_start_pos)
+
+                        # PAT/PMT を抽出（セグメント開始位置に最も近いものを保持）
+                        temp_pat_parser = SectionParser(PATSection)
+                        temp_pmt_parser = SectionParser(PMTSection)
+                        temp_pmt_pid: int | None = None
+
+                        # 最もセグメント開始位置に近い PAT/PMT を保持
+                        closest_pat_packet: bytes | None = None
+                        closest_pmt_packet: bytes | None = None
+                        closest_pat_distance = float('inf')
+                        closest_pmt_distance = float('inf')
+
+                        # TS パケットを1つずつ処理
+                        offset = 0
+                        while offset + 188 <= len(search_data):
+                            # 同期バイトを探す
+                            if search_data[offset] != ts.SYNC_BYTE[0]:
+                                offset += 1
+                                continue
+
+                            # 188 バイト先 (必要であればさらに 188 バイト先) の同期バイトを確認し、TS パケット境界であるか検証する
+                            is_aligned = True
+                            next_offset = offset + 188
+                            if next_offset < len(search_data) and search_data[next_offset] != ts.SYNC_BYTE[0]:
+                                is_aligned = False
+                            second_offset = offset + 376
+                            if is_aligned is True and second_offset < len(search_data) and search_data[second_offset] != ts.SYNC_BYTE[0]:
+                                is_aligned = False
+                            if is_aligned is False:
+                                offset += 1
+                                continue
+
+                            packet = search_data[offset:offset + 188]
+                            pid = ts.pid(packet)
+
+                            # 現在のパケットの実際のファイル位置
+                            current_file_pos = search_start_pos + offset
+                            distance = abs(current_file_pos - current_segment.start_file_position)
+
+                            # PAT (PID 0x00)
+                            if pid == 0x00:
+                                temp_pat_parser.push(packet)
+                                for pat in temp_pat_parser:
+                                    if pat.CRC32() == 0:
+                                        # セグメント開始位置により近い場合、または開始位置以前で最も近い場合は更新
+                                        if current_file_pos <= current_segment.start_file_position:
+                                            # 開始位置以前の PAT を優先（より近いものに更新）
+                                            if closest_pat_packet is None or distance < closest_pat_distance:
+                                                closest_pat_packet = packet
+                                                closest_pat_distance = distance
+                                                # PMT の PID を取得
+                                                for program_number, program_map_pid in pat:
+                                                    if program_number != 0:
+                                                        temp_pmt_pid = program_map_pid
+                                                        break
+                                        elif closest_pat_packet is None:
+                                            # 開始位置以前に PAT が見つからなかった場合のフォールバック
                                             closest_pat_packet = packet
                                             closest_pat_distance = distance
-                                            # PMT の PID を取得
                                             for program_number, program_map_pid in pat:
                                                 if program_number != 0:
                                                     temp_pmt_pid = program_map_pid
                                                     break
-                                    elif closest_pat_packet is None:
-                                        # 開始位置以前に PAT が見つからなかった場合のフォールバック
-                                        closest_pat_packet = packet
-                                        closest_pat_distance = distance
-                                        for program_number, program_map_pid in pat:
-                                            if program_number != 0:
-                                                temp_pmt_pid = program_map_pid
-                                                break
-                                    break
+                                        break
 
-                        # PMT
-                        elif temp_pmt_pid is not None and pid == temp_pmt_pid:
-                            temp_pmt_parser.push(packet)
-                            for pmt in temp_pmt_parser:
-                                if pmt.CRC32() == 0:
-                                    # セグメント開始位置により近い場合、または開始位置以前で最も近い場合は更新
-                                    if current_file_pos <= current_segment.start_file_position:
-                                        # 開始位置以前の PMT を優先（より近いものに更新）
-                                        if closest_pmt_packet is None or distance < closest_pmt_distance:
+                            # PMT
+                            elif temp_pmt_pid is not None and pid == temp_pmt_pid:
+                                temp_pmt_parser.push(packet)
+                                for pmt in temp_pmt_parser:
+                                    if pmt.CRC32() == 0:
+                                        # セグメント開始位置により近い場合、または開始位置以前で最も近い場合は更新
+                                        if current_file_pos <= current_segment.start_file_position:
+                                            # 開始位置以前の PMT を優先（より近いものに更新）
+                                            if closest_pmt_packet is None or distance < closest_pmt_distance:
+                                                closest_pmt_packet = packet
+                                                closest_pmt_distance = distance
+                                        elif closest_pmt_packet is None:
+                                            # 開始位置以前に PMT が見つからなかった場合のフォールバック
                                             closest_pmt_packet = packet
                                             closest_pmt_distance = distance
-                                    elif closest_pmt_packet is None:
-                                        # 開始位置以前に PMT が見つからなかった場合のフォールバック
-                                        closest_pmt_packet = packet
-                                        closest_pmt_distance = distance
-                                    break
-
-                        offset += 188
+                                        break
 
-                    # PAT/PMT が両方見つかった場合のみ使用
-                    if closest_pat_packet is not None and closest_pmt_packet is not None:
-                        initial_pat_pmt_data = closest_pat_packet + closest_pmt_packet
-                        logging.info(
-                            f'{self.video_stream.log_prefix}[Segment {current_sequence}] '
-                            f'Extracted PAT/PMT (PAT at -{closest_pat_distance} bytes, PMT at -{closest_pmt_distance} bytes)'
-                        )
-                    else:
-                        logging.warning(
-                            f'{self.video_stream.log_prefix}[Segment {current_sequence}] '
-                            f'Failed to extract complete PAT/PMT '
-                            f'(PAT: {"found" if closest_pat_packet else "not found"}, '
-                            f'PMT: {"found" if closest_pmt_packet else "not found"})'
-                        )
+                            offset += 188
+
+                        # PAT/PMT が両方見つかった場合のみ使用
+                        if closest_pat_packet is not None and closest_pmt_packet is not None:
+                            initial_pat_pmt_data = closest_pat_packet + closest_pmt_packet
+                            logging.info(
+                                f'{self.video_stream.log_prefix}[Segment {current_sequence}] '
+                                f'Extracted PAT/PMT (PAT at -{closest_pat_distance} bytes, PMT at -{closest_pmt_distance} bytes)'
+                            )
+                        else:
+                            logging.warning(
+                                f'{self.video_stream.log_prefix}[Segment {current_sequence}] '
+                                f'Failed to extract complete PAT/PMT '
+                                f'(PAT: {"found" if closest_pat_packet else "not found"}, '
+                                f'PMT: {"found" if closest_pmt_packet else "not found"})'
+                            )
 
                     # 実際のセグメント開始位置にシーク
                     file.seek(current_segment.start_file_position)
@@ -602,20 +809,26 @@ class VideoEncodingTask:
                     ## +8: FFmpeg のエラーを防ぐため、変換後のストリームの PTS が単調増加となるように調整する
                     ## +4 は FFmpeg 6.1 以降不要になった (付与していると字幕が表示されなくなる) ため、
                     ## FFmpeg 4.4 系に依存している Linux 版 HWEncC 利用時のみ付与する
-                    '-d', '13' if ENCODER_TYPE != 'FFmpeg' and sys.platform == 'linux' else '9',
+                    ## 再エンコードを行わない場合は FFmpeg を経由しないため、+4 は付与しない
+                    '-d', '13' if is_passthrough is False and ENCODER_TYPE != 'FFmpeg' and sys.platform == 'linux' else '9',
                     # 標準入力からの入力を受け付ける
                     '-',
                 ]
 
                 # tsreadex の読み込み用パイプと書き込み用パイプを作成
-                tsreadex_read_pipe, tsreadex_write_pipe = os.pipe()
+                ## 再エンコードを行わない場合はエンコーダーを起動せず、tsreadex の出力を直接読み取る
+                tsreadex_read_pipe: int | None = None
+                tsreadex_write_pipe: int = asyncio.subprocess.PIPE
+                if is_passthrough is False:
+                    tsreadex_read_pipe, tsreadex_write_pipe = os.pipe()
 
                 # MPEG-TS を処理する場合で、直前に PAT/PMT を抽出できた場合
                 # PAT/PMT を先頭に加えて tsreadex に入力する
-                if initial_pat_pmt_data is not None:
+                ## 録画中の番組を追っかけ再生している場合も、録画ファイルの末尾に達した後に追記されたデータを入力し続けるため、こちらで入力する
+                if initial_pat_pmt_data is not None or (file is not None and self.video_stream.is_recording is True):
                     # PAT/PMT を先頭に加えた TS データ用の読み込み用パイプと書き込み用パイプを作成
                     tsreadex_stdin_read, tsreadex_stdin_write = os.pipe()
-                    pat_pmt_data: bytes = initial_pat_pmt_data
+                    pat_pmt_data: bytes = initial_pat_pmt_data or b''
 
                     def FeedTSStream() -> None:
                         """PAT/PMT を先頭に付加したデータを tsreadex のパイプに流し込む (同期関数)"""
@@ -643,6 +856,11 @@ class VideoEncodingTask:
                                     break
                                 chunk = file.read(chunk_size)
                                 if not chunk:
+                                    # 録画中の番組を追っかけ再生している場合は、録画ファイルにデータが追記されるのを待つ
+                                    ## 録画が完了すると VideoStream 側で is_recording が False になり、ファイル末尾で入力を終える
+                                    if self.video_stream.is_recording is True:
+                                        time.sleep(self.RECORDING_FEED_POLL_INTERVAL)
+                                        continue
                                     break
                                 WriteAllToPipe(tsreadex_stdin_write, chunk)
                         except BrokenPipeError:
@@ -689,12 +907,21 @@ class VideoEncodingTask:
                     )
 
                 # tsreadex の書き込み用パイプを閉じる
-                os.close(tsreadex_write_pipe)
+                if is_passthrough is False:
+                    os.close(tsreadex_write_pipe)
+
+                # 再エンコードを行わない場合はエンコーダーを起動しない
+                if is_passthrough is True:
+                    logging.info(f'{self.video_stream.log_prefix} Passthrough mode. The encoder will not be started.')
 
                 # FFmpeg
-                if ENCODER_TYPE == 'FFmpeg':
+                elif ENCODER_TYPE == 'FFmpeg':
                     # オプションを取得
-                    encoder_options = self.buildFFmpegOptions(self.video_stream.quality, output_ts_offset)
+                    encoder_options = self.buildFFmpegOptions(
+                        cast(QUALITY_TYPES, self.video_stream.quality),
+                        output_ts_offset,
+                        self.getForceKeyFrameTimes(segments, start_sequence),
+                    )
                     logging.info(f'{self.video_stream.log_prefix} FFmpeg Commands:\nffmpeg {" ".join(encoder_options)}')
 
                     # エンコーダープロセスを作成・実行
@@ -708,7 +935,7 @@ class VideoEncodingTask:
                 # HWEncC
                 else:
                     # オプションを取得
-                    encoder_options = self.buildHWEncCOptions(self.video_stream.quality, ENCODER_TYPE, output_ts_offset)
+                    encoder_options = self.buildHWEncCOptions(cast(QUALITY_TYPES, self.video_stream.quality), ENCODER_TYPE, output_ts_offset)
                     logging.info(f'{self.video_stream.log_prefix} {ENCODER_TYPE} Commands:\n{ENCODER_TYPE} {" ".join(encoder_options)}')
 
                     # エンコーダープロセスを作成・実行
@@ -719,8 +946,12 @@ class VideoEncodingTask:
                         stderr = asyncio.subprocess.PIPE,  # ストリーム出力
                     )
 
-                # エンコーダーの出力を読み取り、MPEG-TS パーサーでパースする
-                assert self._encoder_process is not None and self._encoder_process.stdout is not None
+                # エンコーダーの出力を読み取り、MPEG-TS パケット単位でセグメントに振り分ける
+                ## 再エンコードを行わない場合は tsreadex の出力をそのまま読み取る
+                if is_passthrough is True:
+                    assert self._tsreadex_process is not None and self._tsreadex_process.stdout is not None
+                else:
+                    assert self._encoder_process is not None and self._encoder_process.stdout is not None
 
                 # 最新の PAT と PMT を保持
                 latest_pat: PATSection | None = None
@@ -734,6 +965,22 @@ class VideoEncodingTask:
                 encoded_segment = bytearray()
                 # セグメント境界を IDR/CRA に合わせるためのフラグ
                 is_split_pending = False
+                # 映像が H.265 かどうか (IDR/CRA 判定に使う NAL ユニットの形式が異なる)
+                is_hevc_video = False
+
+                # セグメント境界の候補となる映像 PES の、encoded_segment 内での開始位置 (バイト)
+                ## 分割予定時刻に到達した映像 PES のみ、最初の VCL NAL ユニットが見つかるまで ES データを probing_pes_es に溜めて
+                ## IDR/CRA かを判定し、IDR/CRA であればこの位置でセグメントを分割する
+                probing_pes_position: int | None = None
+                probing_pes_es = bytearray()
+                # 現在のセグメントに含まれる音声 PES の開始位置 (バイト)
+                ## セグメント分割時、分割位置をまたぐ音声 PES を丸ごと次のセグメントに移すために使う
+                audio_pes_positions: list[int] = []
+
+                # エンコーダーから読み取ったが、まだ TS パケット単位で処理していないデータ
+                unprocessed_data = bytearray()
+                # 最終セグメントまで到達したかどうか
+                is_reached_final_segment = False
 
                 # PTS/DTS の 33bit ラップアラウンドを展開して、DB に保存されている ffprobe の単調増加 DTS に合わせる
                 ## ffmpeg/ffprobe は 2^33 を超えた場合も内部的に単調増加の DTS として扱うため、
@@ -745,219 +992,299 @@ class VideoEncodingTask:
                 # エンコードタスク開始時点のセグメント開始 DTS を保存しておく
                 first_segment_start_dts: int = current_segment.start_dts
 
-                while True:
+                # 個別に処理する必要のある TS パケットのインデックスを求める
+                ## PAT/PMT と、映像・音声 PES の先頭パケットのみを個別に処理し、それ以外の TS パケットはそのままスライスで追加する
+                ## 映像 PES の IDR/CRA 判定中は、判定に必要な後続の映像パケットも個別に処理する
+                ## PMT/映像/音声の PID が判明するまでは、全パケットを個別に処理する
+                ## PID と判定中の映像 PES の状態は呼び出した時点の値を参照するため、読み込みループの外で一度だけ定義する
+                def GetSpecialPacketIndices(pids: NDArray[np.uint16], pusi_flags: NDArray[np.bool_], start_index: int) -> list[int]:
+                    """ start_index 以降で個別に処理する必要のある TS パケットのインデックスを返す """
+                    if pmt_pid is None or video_pid is None or audio_pid is None:
+                        return list(range(start_index, len(pids)))
+                    target_pids = pids[start_index:]
+                    target_pusi_flags = pusi_flags[start_index:]
+                    is_video_packets = target_pids == video_pid
+                    if probing_pes_position is None:
+                        is_video_packets &= target_pusi_flags
+                    special_mask = (target_pids == 0x00) | (target_pids == pmt_pid) | is_video_packets | \
+                        ((target_pids == audio_pid) & target_pusi_flags)
+                    return (np.flatnonzero(special_mask) + start_index).tolist()
+
+                while is_reached_final_segment is False:
                     # エンコードタスクがキャンセルされた場合、処理を中断する
                     if self._is_cancelled is True:
                         break
 
                     # エンコーダーの出力読み取りタイムアウトをチェック
+                    ## 録画中の番組を追っかけ再生している場合、録画ファイルの末尾ではデータの追記を待つため出力が途切れうるのでチェックしない
                     current_time = asyncio.get_running_loop().time()
-                    if current_time - last_read_time > read_timeout:
+                    if self.video_stream.is_recording is False and current_time - last_read_time > read_timeout:
                         logging.warning(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoder output read timeout.')
                         break
 
-                    # 同期バイトを探す
-                    isEOF = False
-                    while True:
-                        try:
-                            # この時点で既にエンコーダープロセスが終了していたら処理中断
-                            if self._encoder_process is None:
-                                break
-                            sync_byte = await self._encoder_process.stdout.readexactly(1)
-                            if sync_byte == ts.SYNC_BYTE:
-                                break
-                            elif sync_byte == b'':
-                                isEOF = True
-                                break
-                        except asyncio.IncompleteReadError:
-                            isEOF = True
-                        break
-                    if isEOF:
-                        break
-
-                    # TS パケットを読み込む
+                    # エンコーダーの出力をまとめて読み込む
+                    ## 1パケットずつ readexactly() すると、TS パケット1つごとに2回イベントループを経由することになり非常に遅い
                     try:
-                        # この時点で既にエンコーダープロセスが終了していたら処理中断
-                        if self._encoder_process is None:
+                        # この時点で既にエンコーダープロセス (再エンコードを行わない場合は tsreadex プロセス) が終了していたら処理中断
+                        output_process = self._tsreadex_process if is_passthrough is True else self._encoder_process
+                        if output_process is None or output_process.stdout is None:
                             break
-                        packet = ts.SYNC_BYTE + await self._encoder_process.stdout.readexactly(ts.PACKET_SIZE - 1)
-                        last_read_time = current_time  # 正常に読み取れた場合はタイムアウトをリセット
-                    except asyncio.IncompleteReadError:
+                        chunk = await output_process.stdout.read(self.ENCODER_OUTPUT_READ_SIZE)
+                    except Exception:
                         break
+                    if not chunk:
+                        break  # EOF
+                    last_read_time = current_time  # 正常に読み取れた場合はタイムアウトをリセット
+                    unprocessed_data += chunk
+
+                    # 同期バイトが 188 バイト間隔で並ぶ位置までデータを読み捨てる
+                    sync_offset = self.findTSPacketAlignment(unprocessed_data)
+                    if sync_offset > 0:
+                        del unprocessed_data[:sync_offset]
+                    packet_count = len(unprocessed_data) // ts.PACKET_SIZE
+                    if packet_count == 0:
+                        continue
 
-                    # PID を取得
-                    pid = ts.pid(packet)
-
-                    # PAT (Program Association Table)
-                    if pid == 0x00:
-                        pat_parser.push(packet)
-                        for pat in pat_parser:
-                            if pat.CRC32() != 0:
-                                continue
-                            latest_pat = pat
-
-                            # PMT の PID を取得
-                            for program_number, program_map_pid in pat:
-                                if program_number == 0:
+                    # 今回処理する TS パケットを切り出す
+                    ## NumPy の配列ビューが参照している間は bytearray をリサイズできないため、bytes にコピーしてから処理する
+                    block = bytes(unprocessed_data[:packet_count * ts.PACKET_SIZE])
+                    del unprocessed_data[:packet_count * ts.PACKET_SIZE]
+                    packets = np.frombuffer(block, dtype=np.uint8).reshape(packet_count, ts.PACKET_SIZE)
+
+                    # 同期バイトが途中で崩れている場合、崩れている TS パケットより前だけを処理し、残りは次回再同期する
+                    broken_indices = np.flatnonzero(packets[:, 0] != ts.SYNC_BYTE[0])
+                    if len(broken_indices) > 0:
+                        packet_count = int(broken_indices[0])
+                        unprocessed_data[0:0] = block[packet_count * ts.PACKET_SIZE + 1:]
+                        packets = packets[:packet_count]
+
+                    # 全 TS パケットの PID と payload_unit_start_indicator をまとめて算出する
+                    pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+                    pusi_flags = (packets[:, 1] & 0x40) != 0
+
+                    # 個別に処理する必要のある TS パケットのインデックスを求める
+                    special_indices = GetSpecialPacketIndices(pids, pusi_flags, 0)
+                    special_cursor = 0
+                    next_packet_index = 0  # まだ encoded_segment に追加していない TS パケットのインデックス
+                    while special_cursor < len(special_indices):
+                        index = special_indices[special_cursor]
+                        special_cursor += 1
+
+                        # 直前の個別処理パケットから今回のパケットまでの間にある TS パケットはそのまま追加する
+                        if next_packet_index < index:
+                            encoded_segment += block[next_packet_index * ts.PACKET_SIZE:index * ts.PACKET_SIZE]
+                        next_packet_index = index + 1
+
+                        packet = block[index * ts.PACKET_SIZE:(index + 1) * ts.PACKET_SIZE]
+                        pid = int(pids[index])
+                        is_pid_state_changed = False
+                        is_probe_state_changed = False
+
+                        # PAT (Program Association Table)
+                        if pid == 0x00:
+                            pat_parser.push(packet)
+                            for pat in pat_parser:
+                                if pat.CRC32() != 0:
                                     continue
-                                pmt_pid = program_map_pid
-
-                            # PAT を再構築して candidate に追加
-                            for packet in packetize_section(pat, False, False, 0, 0, pat_cc):
-                                encoded_segment += packet
-                                pat_cc = (pat_cc + 1) & 0x0F
-
-                    # PMT (Program Map Table)
-                    elif pid == pmt_pid:
-                        pmt_parser.push(packet)
-                        for pmt in pmt_parser:
-                            if pmt.CRC32() != 0:
-                                continue
-                            latest_pmt = pmt
-
-                            # ストリームの PID を取得
-                            for stream_type, elementary_pid, _ in pmt:
-                                if stream_type == 0x1b:  # H.264
-                                    if video_pid is None:
-                                        video_pid = elementary_pid
-                                        # H.264 映像 PES を解析できるようパーサーを差し替える
-                                        video_parser = PESParser(H264PES)
-                                        logging.debug(f'{self.video_stream.log_prefix} H.264 PID: 0x{elementary_pid:04x}')
-                                elif stream_type == 0x24:  # H.265
-                                    if video_pid is None:
-                                        video_pid = elementary_pid
-                                        # H.265 映像 PES を解析できるようパーサーを差し替える
-                                        video_parser = PESParser(H265PES)
-                                        logging.debug(f'{self.video_stream.log_prefix} H.265 PID: 0x{elementary_pid:04x}')
-                                elif stream_type == 0x0F:  # AAC
-                                    if audio_pid is None:
-                                        audio_pid = elementary_pid
-                                        logging.debug(f'{self.video_stream.log_prefix} AAC PID: 0x{elementary_pid:04x}')
-                            # PMT を再構築して candidate に追加
-                            for packet in packetize_section(pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
-                                encoded_segment += packet
-                                pmt_cc = (pmt_cc + 1) & 0x0F
-
-                    # 映像ストリーム
-                    elif pid == video_pid:
-                        video_parser.push(packet)
-                        for video in video_parser:
-                            # 現在の PES の 33bit タイムスタンプ (DTS 優先, 90kHz)
-                            current_timestamp_33bit = cast(int, video.dts() or video.pts())
-
-                            # 最初のフレームでアンカーを確定
-                            if first_video_timestamp_33bit is None:
-                                first_video_timestamp_33bit = current_timestamp_33bit
-                                last_video_timestamp_33bit = current_timestamp_33bit
-
-                            # wrap-around 検出 (大きく逆行した場合のみ wrap とみなす)
-                            assert last_video_timestamp_33bit is not None
-                            if current_timestamp_33bit < last_video_timestamp_33bit and (last_video_timestamp_33bit - current_timestamp_33bit) > (ts.PCR_CYCLE // 2):
-                                wrap_offset_ticks += ts.PCR_CYCLE
-                            last_video_timestamp_33bit = current_timestamp_33bit
-
-                            # 単調増加となるよう展開した現在の DTS (DB 上の単調増加 DTS に揃える)
-                            assert first_video_timestamp_33bit is not None
-                            current_timestamp_unwrapped = first_segment_start_dts + (current_timestamp_33bit - first_video_timestamp_33bit + wrap_offset_ticks)
-
-                            # Future がまだ未完了の場合にのみ実行
-                            if current_segment is not None:
-                                # 判定に用いる次セグメント開始時刻
-                                next_segment_start_timestamp = current_segment.start_dts + round(current_segment.duration_seconds * ts.HZ)
-                                # logging.debug(
-                                #     f'{self.video_stream.log_prefix} Current Timestamp: {current_timestamp_unwrapped} / '
-                                #     f'Next Segment Start Timestamp: {next_segment_start_timestamp}'
-                                # )
-
-                                # 現在の映像 PES が (H.264: IDR, H.265: IDR/CRA) フレームかを判定
-                                def _has_idr_frame(pes: PES) -> bool:
-                                    try:
-                                        if isinstance(pes, H264PES):
-                                            for ebsp in pes.ebsps:
-                                                nal_unit_type = ebsp[0] & 0x1f
-                                                if nal_unit_type == 0x05:
-                                                    return True
-                                        elif isinstance(pes, H265PES):
-                                            for ebsp in pes.ebsps:
-                                                nal_unit_type = (ebsp[0] >> 1) & 0x3f
-                                                # biim に合わせて IDR/CRA のみを採用 (BLA は除外)
-                                                if nal_unit_type in (19, 20, 21):
-                                                    return True
-                                    except Exception:
-                                        pass
-                                    return False
-                                has_idr_frame = _has_idr_frame(video)
-
-                                # 次のセグメントの開始時刻以上になったら、現在のセグメントを確定して次のセグメントへ移行
-                                is_reached_planned_boundary = (current_timestamp_unwrapped >= next_segment_start_timestamp)
-                                is_should_finalize_now = False
-                                if is_split_pending is True:
-                                    # 次に来た (H.264: IDR, H.265: IDR/CRA) フレームで確定する
-                                    if has_idr_frame:
-                                        is_should_finalize_now = True
-                                else:
-                                    if is_reached_planned_boundary is True:
-                                        if has_idr_frame:
-                                            is_should_finalize_now = True
-                                        else:
-                                            # (H.264: IDR, H.265: IDR/CRA) フレームまで現在のセグメントを延長
-                                            is_split_pending = True
-
-                                # 無事セグメントを安全に分割できる地点に到達したので、現在のセグメントを確定
-                                if is_should_finalize_now is True:
-                                    if not current_segment.encoded_segment_ts_future.done():
-                                        current_segment.encoded_segment_ts_future.set_result(bytes(encoded_segment))
-                                    current_segment.encode_status = 'Completed'
-                                    logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded HLS Segment.')
-
-                                    # 次のセグメントへ移行
-                                    current_sequence += 1
-
-                                    # 最終セグメントの場合はループを抜ける
-                                    if current_sequence >= len(self.video_stream.segments):
-                                        logging.info(f'{self.video_stream.log_prefix} Reached the final segment.')
-                                        break
-
-                                    # 新しいセグメント用のデータと状態を初期化
-                                    ## ここで encoded_segment は空の bytearray にリセットされる
-                                    logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoding...')
-                                    current_segment = self.video_stream.segments[current_sequence]
-                                    current_segment.encode_status = 'Encoding'
-                                    encoded_segment = bytearray()
-                                    is_split_pending = False
-
-                                    # 新しいセグメントの先頭に PAT と PMT を追加
-                                    if latest_pat is not None:
-                                        for packet in packetize_section(latest_pat, False, False, 0, 0, pat_cc):
-                                            encoded_segment += packet
-                                            pat_cc = (pat_cc + 1) & 0x0F
-                                    if latest_pmt is not None:
-                                        for packet in packetize_section(latest_pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
-                                            encoded_segment += packet
-                                            pmt_cc = (pmt_cc + 1) & 0x0F
-
-                            # 現在の映像 PES をパケット化して、現在処理対象のセグメントに追加
-                            for packet in packetize_pes(video, False, False, cast(int, video_pid), 0, video_cc):
-                                encoded_segment += packet
-                                video_cc = (video_cc + 1) & 0x0F
-
-                    # 音声ストリーム
-                    elif pid == audio_pid:
-                        audio_parser.push(packet)
-                        for audio in audio_parser:
-                            # PES パケットを再構築して candidate に追加
-                            for packet in packetize_pes(audio, False, False, cast(int, audio_pid), 0, audio_cc):
-                                encoded_segment += packet
-                                audio_cc = (audio_cc + 1) & 0x0F
-
-                    # その他のパケット
-                    else:
-                        encoded_segment += packet
+                                latest_pat = pat
+
+                                # PMT の PID を取得
+                                previous_pmt_pid = pmt_pid
+                                for program_number, program_map_pid in pat:
+                                    if program_number == 0:
+                                        continue
+                                    pmt_pid = program_map_pid
+                                is_pid_state_changed = is_pid_state_changed or (previous_pmt_pid != pmt_pid)
+
+                                # PAT を再構築してセグメントに追加
+                                for pat_packet in packetize_section(pat, False, False, 0, 0, pat_cc):
+                                    encoded_segment += pat_packet
+                                    pat_cc = (pat_cc + 1) & 0x0F
+
+                        # PMT (Program Map Table)
+                        elif pid == pmt_pid:
+                            pmt_parser.push(packet)
+                            for pmt in pmt_parser:
+                                if pmt.CRC32() != 0:
+                                    continue
+                                latest_pmt = pmt
+
+                                # ストリームの PID を取得
+                                for stream_type, elementary_pid, _ in pmt:
+                                    if stream_type == 0x1b:  # H.264
+                                        if video_pid is None:
+                                            video_pid = elementary_pid
+                                            is_hevc_video = False
+                                            is_pid_state_changed = True
+                                            logging.debug(f'{self.video_stream.log_prefix} H.264 PID: 0x{elementary_pid:04x}')
+                                    elif stream_type == 0x24:  # H.265
+                                        if video_pid is None:
+                                            video_pid = elementary_pid
+                                            is_hevc_video = True
+                                            is_pid_state_changed = True
+                                            logging.debug(f'{self.video_stream.log_prefix} H.265 PID: 0x{elementary_pid:04x}')
+                                    elif stream_type == 0x0F:  # AAC
+                                        if audio_pid is None:
+                                            audio_pid = elementary_pid
+                                            is_pid_state_changed = True
+                                            logging.debug(f'{self.video_stream.log_prefix} AAC PID: 0x{elementary_pid:04x}')
+                                # PMT を再構築してセグメントに追加
+                                for pmt_packet in packetize_section(pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
+                                    encoded_segment += pmt_packet
+                                    pmt_cc = (pmt_cc + 1) & 0x0F
+
+                        # 音声ストリーム (PES の先頭パケットのみ)
+                        elif pid == audio_pid:
+                            if pusi_flags[index]:
+                                audio_pes_positions.append(len(encoded_segment))
+                            encoded_segment += packet
+
+                        # 映像ストリーム (PES の先頭パケットと、IDR/CRA 判定中の後続パケットのみ)
+                        elif pid == video_pid:
+                            is_random_access: bool | None = None  # None は判定不能 (判定中) を表す
+                            if pusi_flags[index]:
+                                # 前の映像 PES の判定がまだ終わっていない場合、最初の VCL NAL ユニットが見つからなかったので IDR/CRA ではないとみなす
+                                if probing_pes_position is not None:
+                                    probing_pes_position = None
+                                    probing_pes_es.clear()
+                                    is_split_pending = True
+                                    is_probe_state_changed = True
+
+                                # PES ヘッダーから 33bit タイムスタンプ (DTS 優先, 90kHz) を取得する
+                                pes_header = self.parseVideoPESHeader(packet)
+                                if pes_header is not None:
+                                    current_timestamp_33bit, es_start_offset = pes_header
+
+                                    # 最初のフレームでアンカーを確定
+                                    if first_video_timestamp_33bit is None:
+                                        first_video_timestamp_33bit = current_timestamp_33bit
+                                        last_video_timestamp_33bit = current_timestamp_33bit
+
+                                    # wrap-around 検出 (大きく逆行した場合のみ wrap とみなす)
+                                    assert last_video_timestamp_33bit is not None
+                                    if current_timestamp_33bit < last_video_timestamp_33bit and (last_video_timestamp_33bit - current_timestamp_33bit) > (ts.PCR_CYCLE // 2):
+                                        wrap_offset_ticks += ts.PCR_CYCLE
+                                    last_video_timestamp_33bit = current_timestamp_33bit
+
+                                    # 単調増加となるよう展開した現在の DTS (DB 上の単調増加 DTS に揃える)
+                                    current_timestamp_unwrapped = first_segment_start_dts + (current_timestamp_33bit - first_video_timestamp_33bit + wrap_offset_ticks)
+
+                                    # 判定に用いる次セグメント開始時刻
+                                    next_segment_start_timestamp = current_segment.start_dts + round(current_segment.duration_seconds * ts.HZ)
+
+                                    # 分割待ち中か、次のセグメントの開始時刻以上になった場合のみ、この PES が (H.264: IDR, H.265: IDR/CRA) フレームかを判定する
+                                    ## それ以外の映像 PES は NAL ユニットを一切解析しない
+                                    if is_split_pending is True or current_timestamp_unwrapped >= next_segment_start_timestamp:
+                                        probing_pes_position = len(encoded_segment)
+                                        probing_pes_es = bytearray(packet[es_start_offset:])
+                                        is_probe_state_changed = True
+                                        is_random_access = self.detectRandomAccessNALUnit(probing_pes_es, is_hevc_video, is_passthrough)
+
+                            elif probing_pes_position is not None:
+                                # IDR/CRA 判定中の映像 PES の後続パケットの ES データを追加して再判定する
+                                probing_pes_es += packet[self.getTSPayloadOffset(packet):]
+                                is_random_access = self.detectRandomAccessNALUnit(probing_pes_es, is_hevc_video, is_passthrough)
+                                # 一定サイズ以上探しても VCL NAL ユニットが見つからない場合は IDR/CRA ではないとみなす
+                                if is_random_access is None and len(probing_pes_es) > self.RANDOM_ACCESS_PROBE_MAX_BYTES:
+                                    is_random_access = False
+
+                            # 現在の映像パケットを現在のセグメントに追加
+                            encoded_segment += packet
+
+                            # (H.264: IDR, H.265: IDR/CRA) フレームでなかった場合は、次に来た IDR/CRA フレームで分割する
+                            if is_random_access is False:
+                                probing_pes_position = None
+                                probing_pes_es.clear()
+                                is_split_pending = True
+                                is_probe_state_changed = True
+
+                            # 無事セグメントを安全に分割できる地点に到達したので、映像 PES の開始位置で現在のセグメントを確定
+                            elif is_random_access is True:
+                                assert probing_pes_position is not None
+                                split_position = probing_pes_position
+                                probing_pes_position = None
+                                probing_pes_es.clear()
+                                is_probe_state_changed = True
+
+                                # 分割位置より前の直近の音声 PES が分割位置をまたいでいる場合、その音声 PES の TS パケットを次のセグメントの先頭に移す
+                                ## 各セグメントに不完全な音声 PES が含まれないようにするための処理
+                                carried_audio_packets = bytearray()
+                                audio_pes_positions_before_split = [position for position in audio_pes_positions if position < split_position]
+                                if audio_pid is not None and len(audio_pes_positions_before_split) > 0:
+                                    carry_start = audio_pes_positions_before_split[-1]
+                                    carry_packets = np.frombuffer(bytes(encoded_segment[carry_start:split_position]), dtype=np.uint8) \
+                                        .reshape(-1, ts.PACKET_SIZE)
+                                    carry_pids = ((carry_packets[:, 1].astype(np.uint16) & 0x1F) << 8) | carry_packets[:, 2]
+                                    is_audio_packets = carry_pids == audio_pid
+                                    carried_audio_packets = bytearray(carry_packets[is_audio_packets].tobytes())
+                                    encoded_segment[carry_start:split_position] = carry_packets[~is_audio_packets].tobytes()
+                                    split_position -= len(carried_audio_packets)
+                                    audio_pes_positions = [position for position in audio_pes_positions if position != carry_start]
+                                    audio_pes_positions = [
+                                        position - len(carried_audio_packets) if position > carry_start else position
+                                        for position in audio_pes_positions
+                                    ]
+
+                                # 分割位置以降のデータは次のセグメントに持ち越す
+                                next_segment_data = encoded_segment[split_position:]
+                                del encoded_segment[split_position:]
+
+                                await self.video_stream.completeSegment(current_segment, bytes(encoded_segment))
+                                logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded HLS Segment.')
+
+                                # 次のセグメントへ移行
+                                current_sequence += 1
+
+                                # 録画中の番組を追っかけ再生している場合は、エンコードタスクの開始後に追加された HLS セグメントを取得し直す
+                                if current_sequence >= len(segments) and self.video_stream.is_recording is True:
+                                    segments = self.video_stream.segments
+
+                                # 最終セグメントの場合はループを抜ける
+                                if current_sequence >= len(segments):
+                                    logging.info(f'{self.video_stream.log_prefix} Reached the final segment.')
+                                    is_reached_final_segment = True
+                                    break
 
-                    # 最終セグメントの場合はループを抜ける
-                    if current_sequence >= len(self.video_stream.segments):
+                                # 新しいセグメント用のデータと状態を初期化
+                                logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Encoding...')
+                                current_segment = segments[current_sequence]
+                                current_segment.encode_status = 'Encoding'
+                                encoded_segment = bytearray()
+                                is_split_pending = False
+
+                                # 新しいセグメントの先頭に PAT と PMT を追加
+                                if latest_pat is not None:
+                                    for pat_packet in packetize_section(latest_pat, False, False, 0, 0, pat_cc):
+                                        encoded_segment += pat_packet
+                                        pat_cc = (pat_cc + 1) & 0x0F
+                                if latest_pmt is not None:
+                                    for pmt_packet in packetize_section(latest_pmt, False, False, cast(int, pmt_pid), 0, pmt_cc):
+                                        encoded_segment += pmt_packet
+                                        pmt_cc = (pmt_cc + 1) & 0x0F
+
+                                # 持ち越した音声 PES と、分割位置以降のデータを追加
+                                new_audio_pes_positions: list[int] = []
+                                if len(carried_audio_packets) > 0:
+                                    new_audio_pes_positions.append(len(encoded_segment))
+                                    encoded_segment += carried_audio_packets
+                                shift = len(encoded_segment) - split_position
+                                new_audio_pes_positions += [position + shift for position in audio_pes_positions if position >= split_position]
+                                audio_pes_positions = new_audio_pes_positions
+                                encoded_segment += next_segment_data
+
+                        # PID が判明した場合や IDR/CRA 判定の状態が変わった場合、個別に処理すべきパケットが変わるので再計算する
+                        if is_pid_state_changed is True or is_probe_state_changed is True:
+                            special_indices = GetSpecialPacketIndices(pids, pusi_flags, next_packet_index)
+                            special_cursor = 0
+
+                    # 最終セグメントまで到達した場合は、残りのパケットは不要なので捨てる
+                    if is_reached_final_segment is True:
                         break
 
+                    # 最後の個別処理パケット以降の TS パケットをそのまま追加する
+                    if next_packet_index < packet_count:
+                        encoded_segment += block[next_packet_index * ts.PACKET_SIZE:packet_count * ts.PACKET_SIZE]
+
                 # エンコーダープロセスを終了
                 if self._encoder_process is not None:
                     try:
@@ -1018,7 +1345,7 @@ class VideoEncodingTask:
                     if self._retry_count < self.MAX_RETRY_COUNT:
                         logging.warning(f'{self.video_stream.log_prefix} Failed to get video/audio PID. Retrying... ({self._retry_count}/{self.MAX_RETRY_COUNT})')
                         # エンコーダーのデバッグログが有効な場合のみ、全てのログを出力
-                        if CONFIG.general.debug_encoder is True:
+                        if CONFIG.general.debug_encoder is True and self._encoder_process is not None:
                             logging.debug(f'{self.video_stream.log_prefix} Encoder stderr:')
                             assert self._encoder_process.stderr is not None
                             while True:
@@ -1049,6 +1376,7 @@ class VideoEncodingTask:
                 break
 
         finally:
+            drive_io_scheduler.endForegroundRead()
             if not file:
                 # psisimux プロセスを強制終了する
                 if self._psisimux_process is not None:
@@ -1104,8 +1432,7 @@ class VideoEncodingTask:
 
             # 最後のセグメントが完了していない場合は、現在のバッファを future にセット
             if current_segment is not None and not current_segment.encoded_segment_ts_future.done():
-                current_segment.encoded_segment_ts_future.set_result(bytes(encoded_segment))
-                current_segment.encode_status = 'Completed'
+                await self.video_stream.completeSegment(current_segment, bytes(encoded_segment))
                 logging.info(f'{self.video_stream.log_prefix}[Segment {current_sequence}] Successfully Encoded Final HLS Segment.')
 
             # エンコードタスクでのすべての処理を完了した
@@ -6,7 +6,11 @@ from __future__ import annotations
 
 import asyncio
 import math
+import os
+import tempfile
+import time
 import uuid
+from collections import OrderedDict, deque
 from collections.abc import Callable
 from dataclasses import dataclass
 from typing import ClassVar, Literal
@@ -14,11 +18,20 @@ from typing import ClassVar, Literal
 from biim.mpeg2ts import ts
 from fastapi import HTTPException, status
 
-from app import logging
-from app.constants import QUALITY_TYPES
+from app import logging, schemas
+from app.config import Config
+from app.constants import (
+    QUALITY,
+    QUALITY_TYPES,
+    VIDEO_PASSTHROUGH_QUALITY,
+    VIDEO_QUALITY_TYPES,
+)
+from app.metadata.RecordedScanTask import RecordedScanTask
 from app.models.RecordedProgram import RecordedProgram
+from app.schemas import KeyFrame
 from app.streams.VideoEncodingTask import VideoEncodingTask
 from app.utils import SetTimeout
+from app.utils.ProcessLimiter import ProcessLimiter
 
 
 @dataclass
@@ -45,6 +58,14 @@ class VideoStreamSegment:
     # HLS セグメントのエンコード済み MPEG-TS データが既にクライアントによって読み取られているかを表すフラグ
     ## このフラグが True の VideoStreamSegment は、メモリ節約のため順に破棄される (readed と意図的に過去形にしている)
     is_encoded_segment_ts_future_readed: bool = False
+    # HLS セグメントのエンコード済み MPEG-TS データのサイズ (バイト)
+    encoded_segment_ts_size: int = 0
+    # メモリ使用量の上限を超えたため、エンコード済み MPEG-TS データを一時ファイルに退避している場合のファイルパス
+    ## 退避中は encoded_segment_ts_future には空のデータがセットされ、実際のデータはこのファイルから読み出す
+    spilled_file_path: str | None = None
+    # HLS セグメントのエンコード状態が Completed になった時 / Completed から戻った時に呼び出されるコールバック
+    ## VideoStream がエンコード済みのバッファ範囲を差分更新するために使う
+    on_completion_changed: Callable[[VideoStreamSegment], None] | None = None
 
     async def resetState(self) -> None:
         """
@@ -54,9 +75,250 @@ class VideoStreamSegment:
         """
         if not self.encoded_segment_ts_future.done():
             self.encoded_segment_ts_future.set_result(b'')  # 前の Future がまだ完了していない場合は空のデータで完了させる
+        # メモリ使用量の管理対象から外し、一時ファイルに退避していればそれも削除する
+        VideoStreamSegmentMemoryBudget.release(self)
+        is_completed = self.encode_status == 'Completed'
         self.encode_status = 'Pending'
         self.encoded_segment_ts_future = asyncio.Future()  # asyncio.Future を再初期化
         self.is_encoded_segment_ts_future_readed = False
+        self.encoded_segment_ts_size = 0
+        if is_completed is True and self.on_completion_changed is not None:
+            self.on_completion_changed(self)
+
+
+class VideoStreamSegmentMemoryBudget:
+    """
+    全録画視聴セッションのエンコード済み HLS セグメントが使うメモリの総量を制限するクラス
+    上限を超えた場合は、読み取り済みか再生位置より前にあるセグメントのうち、最も長くアクセスされていないセグメントから順に破棄
+    (設定によっては一時ファイルに退避) する
+    まだ読み取られていない再生位置以降のセグメントは、破棄すると要求された時にエンコードをやり直すことになるため破棄せず、
+    それらを含めても上限を超える場合にのみ一時ファイルに退避する (退避できなかった場合は一時的に上限を超えて保持する)
+    """
+
+    # メモリ上に保持するエンコード済み HLS セグメントの合計サイズの上限 (バイト)
+    MAX_MEMORY_BYTES: ClassVar[int] = 512 * 1024 * 1024  # 512MB
+
+    # 上限を超えた HLS セグメントを破棄する代わりに、一時ファイルに退避するかどうか
+    ## 退避したセグメントは再エンコードせずに一時ファイルから読み出せるが、その分ディスク容量を消費する
+    SPILL_TO_TEMP_FILE: ClassVar[bool] = False
+
+    # メモリ上にデータを保持している HLS セグメントを、アクセスされた順 (古い順) に格納する辞書
+    ## キーは VideoStreamSegment の id() で、値は (録画視聴セッション, HLS セグメント) のタプル
+    __segments: ClassVar[OrderedDict[int, tuple[VideoStream, VideoStreamSegment]]] = OrderedDict()
+
+    # 一時ファイルに退避している HLS セグメント
+    __spilled_segments: ClassVar[dict[int, VideoStreamSegment]] = {}
+
+    # メモリ上に保持しているエンコード済み HLS セグメントの合計サイズ (バイト)
+    __memory_bytes: ClassVar[int] = 0
+
+    # 上限を超えたために破棄 / 一時ファイルに退避した HLS セグメントの累計数
+    __evicted_count: ClassVar[int] = 0
+    __spilled_count: ClassVar[int] = 0
+
+
+    @classmethod
+    async def add(cls, video_stream: VideoStream, segment: VideoStreamSegment) -> None:
+        """
+        エンコードが完了した HLS セグメントを管理対象に追加し、上限を超えていれば古いセグメントから破棄する
+
+        Args:
+            video_stream (VideoStream): HLS セグメントが属する録画視聴セッション
+            segment (VideoStreamSegment): エンコードが完了した HLS セグメント
+        """
+
+        cls.release(segment)
+        cls.__segments[id(segment)] = (video_stream, segment)
+        cls.__memory_bytes += segment.encoded_segment_ts_size
+
+        # 上限を超えている間、古いセグメントから順に破棄する
+        ## 今追加したセグメントと、一時ファイルへの退避に失敗したセグメントは破棄対象にしない
+        skipped_segment_ids: set[int] = set()
+        while cls.__memory_bytes > cls.MAX_MEMORY_BYTES:
+            victim: tuple[VideoStream, VideoStreamSegment] | None = None
+            is_unread_victim = False
+            # 読み取り済みか、再生位置より前にあるセグメントを優先して破棄する
+            for candidate_stream, candidate_segment in cls.__segments.values():
+                if candidate_segment is segment or id(candidate_segment) in skipped_segment_ids:
+                    continue
+                if (candidate_segment.is_encoded_segment_ts_future_readed is True or
+                    candidate_segment.sequence_index < candidate_stream.playback_sequence):
+                    victim = (candidate_stream, candidate_segment)
+                    break
+            # そのようなセグメントがなければ、まだ読み取られていない再生位置以降のセグメントを一時ファイルに退避する
+            ## 破棄するとそのセグメントが要求された時にエンコードタスクを再起動することになり、メモリが逼迫している間エンコードがやり直され続けてしまう
+            if victim is None:
+                for candidate_stream, candidate_segment in cls.__segments.values():
+                    if candidate_segment is not segment and id(candidate_segment) not in skipped_segment_ids:
+                        victim = (candidate_stream, candidate_segment)
+                        is_unread_victim = True
+                        break
+            if victim is None:
+                break
+
+            victim_stream, victim_segment = victim
+            if is_unread_victim is True:
+                # 退避できなかった場合は、破棄せずに上限を超えて保持する
+                if await cls.__spill(victim_stream, victim_segment, reset_on_failure=False) is False:
+                    skipped_segment_ids.add(id(victim_segment))
+            elif cls.SPILL_TO_TEMP_FILE is True:
+                await cls.__spill(victim_stream, victim_segment)
+            else:
+                await victim_segment.resetState()
+                cls.__evicted_count += 1
+                logging.info(f'{victim_stream.log_prefix}[Segment {victim_segment.sequence_index}] '
+                             f'Reset segment data to keep memory usage within the budget.')
+
+
+    @classmethod
+    def touch(cls, segment: VideoStreamSegment) -> None:
+        """
+        HLS セグメントがアクセスされたことを記録し、破棄される順番を最後に回す
+
+        Args:
+            segment (VideoStreamSegment): アクセスされた HLS セグメント
+        """
+
+        if id(segment) in cls.__segments:
+            cls.__segments.move_to_end(id(segment))
+
+
+    @classmethod
+    def release(cls, segment: VideoStreamSegment) -> None:
+        """
+        HLS セグメントを管理対象から外す
+        一時ファイルに退避していた場合は、そのファイルも削除する
+
+        Args:
+            segment (VideoStreamSegment): 管理対象から外す HLS セグメント
+        """
+
+        if cls.__segments.pop(id(segment), None) is not None:
+            cls.__memory_bytes -= segment.encoded_segment_ts_size
+        cls.__spilled_segments.pop(id(segment), None)
+        if segment.spilled_file_path is not None:
+            try:
+                os.remove(segment.spilled_file_path)
+            except OSError:
+                pass
+            segment.spilled_file_path = None
+
+
+    @classmethod
+    async def readSpilledSegment(cls, segment: VideoStreamSegment) -> bytes:
+        """
+        一時ファイルに退避した HLS セグメントのデータを読み出す
+
+        Args:
+            segment (VideoStreamSegment): 一時ファイルに退避した HLS セグメント
+
+        Returns:
+            bytes: エンコード済み MPEG-TS データ (読み出せなかった場合は空のデータ)
+        """
+
+        spilled_file_path = segment.spilled_file_path
+        if spilled_file_path is None:
+            return b''
+
+        def Read() -> bytes:
+            with open(spilled_file_path, 'rb') as file:
+                return file.read()
+
+        try:
+            return await asyncio.to_thread(Read)
+        except OSError as ex:
+            logging.error(f'[Segment {segment.sequence_index}] Failed to read spilled segment data:', exc_info=ex)
+            return b''
+
+
+    @classmethod
+    async def __spill(cls, video_stream: VideoStream, segment: VideoStreamSegment, reset_on_failure: bool = True) -> bool:
+        """
+        HLS セグメントのデータを一時ファイルに書き出し、メモリ上のデータを解放する
+
+        Args:
+            video_stream (VideoStream): HLS セグメントが属する録画視聴セッション
+            segment (VideoStreamSegment): 一時ファイルに退避する HLS セグメント
+            reset_on_failure (bool): 書き出せなかった場合にセグメントを破棄するかどうか (False の場合はメモリ上に保持し続ける) (デフォルト: True)
+
+        Returns:
+            bool: 一時ファイルに退避できた場合は True
+        """
+
+        # 書き込み中に他のタスクから再度破棄対象に選ばれないよう、先に管理対象から外しておく
+        cls.__segments.pop(id(segment), None)
+        cls.__memory_bytes -= segment.encoded_segment_ts_size
+        encoded_segment_ts_future = segment.encoded_segment_ts_future
+        encoded_segment_ts = encoded_segment_ts_future.result()
+
+        def Write() -> str:
+            fd, path = tempfile.mkstemp(prefix='KonomiTV-VideoSegment-', suffix='.ts')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(encoded_segment_ts)
+            return path
+
+        try:
+            spilled_file_path = await asyncio.to_thread(Write)
+        except OSError as ex:
+            logging.error(f'{video_stream.log_prefix}[Segment {segment.sequence_index}] Failed to spill segment data:', exc_info=ex)
+            # 書き出せなかった場合は通常通り破棄する
+            if reset_on_failure is True:
+                await segment.resetState()
+                cls.__evicted_count += 1
+            # 破棄しない場合は、書き込み中にリセットされていなければ再び管理対象に戻す
+            elif segment.encoded_segment_ts_future is encoded_segment_ts_future:
+                cls.__segments[id(segment)] = (video_stream, segment)
+                cls.__memory_bytes += segment.encoded_segment_ts_size
+            return False
+
+        # 書き込み中にセグメントがリセットされた場合は、書き出したファイルは不要
+        if segment.encoded_segment_ts_future is not encoded_segment_ts_future:
+            try:
+                os.remove(spilled_file_path)
+            except OSError:
+                pass
+            return True
+
+        # 先に退避先を設定してから Future を差し替える (getSegment() は Future の完了後に退避先を確認する)
+        segment.spilled_file_path = spilled_file_path
+        segment.encoded_segment_ts_future = asyncio.Future()
+        segment.encoded_segment_ts_future.set_result(b'')
+        cls.__spilled_segments[id(segment)] = segment
+        cls.__spilled_count += 1
+        logging.info(f'{video_stream.log_prefix}[Segment {segment.sequence_index}] Spilled segment data to a temporary file.')
+        return True
+
+
+    @classmethod
+    def getMetrics(cls) -> schemas.VideoStreamMetrics:
+        """
+        録画視聴セッション全体の HLS セグメントのメモリ使用状況と、最初のセグメントを返すまでにかかった時間の統計を取得する
+
+        Returns:
+            schemas.VideoStreamMetrics: HLS セグメントのメモリ使用状況と、最初のセグメントを返すまでにかかった時間の統計
+        """
+
+        prepared_session_count, prepared_time_to_first_segment_seconds = VideoStream.getTimeToFirstSegmentStatistics(True)
+        unprepared_session_count, unprepared_time_to_first_segment_seconds = VideoStream.getTimeToFirstSegmentStatistics(False)
+
+        return schemas.VideoStreamMetrics(
+            session_count = len(VideoStream.getAllVideoStreams()),
+            memory_segment_count = len(cls.__segments),
+            memory_bytes = cls.__memory_bytes,
+            memory_limit_bytes = cls.MAX_MEMORY_BYTES,
+            unread_memory_bytes = sum(
+                segment.encoded_segment_ts_size for _, segment in cls.__segments.values()
+                if segment.is_encoded_segment_ts_future_readed is False
+            ),
+            spilled_segment_count = len(cls.__spilled_segments),
+            spilled_bytes = sum(segment.encoded_segment_ts_size for segment in cls.__spilled_segments.values()),
+            evicted_segment_count = cls.__evicted_count,
+            total_spilled_segment_count = cls.__spilled_count,
+            prepared_session_count = prepared_session_count,
+            prepared_time_to_first_segment_seconds = prepared_time_to_first_segment_seconds,
+            unprepared_session_count = unprepared_session_count,
+            unprepared_time_to_first_segment_seconds = unprepared_time_to_first_segment_seconds,
+        )
 
 
 class VideoStream:
@@ -72,13 +334,40 @@ class VideoStream:
     # エンコードする HLS セグメントの最低長さ (秒)
     SEGMENT_DURATION_SECONDS: ClassVar[float] = float(6)  # 6秒
 
+    # 再生開始直後の HLS セグメントの最低長さ (秒)
+    ## 先頭から順に適用され、これを超えた分のセグメントには SEGMENT_DURATION_SECONDS が適用される
+    ## 最初のセグメントを短くすることで、再生開始までの待ち時間を短縮する
+    ## いずれもキーフレーム単位で区切るため、実際のセグメント長はキーフレーム間隔に応じてこれより長くなる
+    ## GOP 長より短いセグメントの境界にキーフレームを強制的に挿入できるのは FFmpeg のみのため、
+    ## HWEncC でエンコードする場合は適用しない (元の映像のキーフレーム位置で分割する無変換の画質では常に適用する)
+    STARTUP_SEGMENT_DURATIONS: ClassVar[tuple[float, ...]] = (1.0, 1.0, 2.0, 2.0, 4.0)
+
+    # 事前準備 (prepare()) で開始したエンコードを、クライアントが実際に再生を開始しなかった場合に破棄するまでの時間 (秒)
+    PREPARE_TIMEOUT: ClassVar[float] = float(30)  # 30秒
+
+    # アダプティブビットレート再生で、この時間以上プレイリストやセグメントが要求されていない画質の録画視聴セッションは
+    # 維持せずにタイムアウトさせる (秒)
+    ## クライアントが選択していない画質のエンコードを無駄に続けないようにするため
+    ABR_RENDITION_IDLE_TIMEOUT: ClassVar[float] = float(30)  # 30秒
+
+    # 録画中の番組を追っかけ再生している場合に、DB から最新のキーフレーム情報を取得し直す最短の間隔 (秒)
+    ## 録画中の番組では、プレイリストが要求されるたびに新たに追記されたキーフレームから HLS セグメントを追加する
+    RECORDING_REFRESH_INTERVAL: ClassVar[float] = float(3)  # 3秒
+
     # 録画視聴セッションのインスタンスが入る、セッション ID をキーとした辞書
     # この辞書に録画視聴セッションに関する全てのデータが格納されている
     __instances: ClassVar[dict[str, VideoStream]] = {}
 
+    # 直近の録画視聴セッションで、最初の HLS セグメントが要求されてから返すまでにかかった時間 (秒) の履歴
+    ## 事前準備の効果を計測するため、事前準備されたセッションとそうでないセッションで分けて記録する
+    __time_to_first_segment_history: ClassVar[dict[bool, deque[float]]] = {
+        True: deque(maxlen=100),
+        False: deque(maxlen=100),
+    }
+
 
     # 必ずセッション ID ごとに1つのインスタンスになるように (Singleton)
-    def __new__(cls, session_id: str, recorded_program: RecordedProgram, quality: QUALITY_TYPES) -> VideoStream:
+    def __new__(cls, session_id: str, recorded_program: RecordedProgram, quality: VIDEO_QUALITY_TYPES) -> VideoStream:
 
         # まだ同じセッション ID のインスタンスがないときだけ、インスタンスを生成する
         if session_id not in cls.__instances:
@@ -93,15 +382,55 @@ class VideoStream:
             instance.recorded_program = recorded_program
             instance.quality = quality
 
+            # アダプティブビットレート再生の各画質の録画視聴セッションであれば、マスタープレイリストのセッション ID
+            ## 各画質の録画視聴セッション ID はマスタープレイリストのセッション ID から導出されるため、逆に取り出せる
+            instance._master_session_id = cls.getMasterSessionID(session_id, quality)
+
             # 基準となる DTS (最初のキーフレームの DTS)
             instance._base_dts = 0
 
+            # 再生開始直後の HLS セグメントを STARTUP_SEGMENT_DURATIONS に従って短くするかどうか
+            ## HWEncC は GOP 長が固定で、計画した位置にキーフレームを挿入できないため短くしない
+            instance._use_startup_segments = quality == VIDEO_PASSTHROUGH_QUALITY or Config().general.encoder == 'FFmpeg'
+
+            # エンコード済み (Completed) の HLS セグメントのうち、最初と最後のセグメントのシーケンス番号
+            ## HLS セグメントのエンコード状態が変わるたびに差分更新し、getBufferRange() で全セグメントを走査せずに済むようにする
+            instance._first_completed_sequence = None
+            instance._last_completed_sequence = None
+
+            # バッファ範囲が更新された時にセットされるイベント
+            ## 一度セットされたイベントは使い捨てで、セットと同時に新しいイベントに差し替えられる
+            instance._buffer_range_updated_event = asyncio.Event()
+
             # HLS セグメントを格納するリスト
             instance._segments = []
 
+            # 録画中の番組を追っかけ再生しているかどうか
+            ## True の間はプレイリストを EVENT 型として返し、キーフレーム情報が追記されるたびに HLS セグメントを追加していく
+            instance._is_recording = recorded_program.recorded_video.status == 'Recording'
+            instance._last_refreshed_at = time.monotonic()
+
+            # キーフレーム情報から HLS セグメントを作成する途中の状態
+            ## 録画中の番組ではキーフレーム情報が随時追記されるため、続きから HLS セグメントを作成できるよう保持しておく
+            instance._last_key_frame = None
+            instance._segment_start_frame = None
+            instance._accumulated_duration = 0.0
+
             # 現在実行中のエンコードタスク
             instance._encoding_task = VideoEncodingTask(instance)
 
+            # 最後にプレイリストかセグメントが要求された時刻 (UNIX タイムスタンプ)
+            instance._last_accessed_at = time.time()
+
+            # 事前準備 (prepare()) によってエンコードが開始されたセッションかどうか
+            instance._is_prepared = False
+
+            # 最初の HLS セグメントをすでに返したかどうか
+            instance._is_first_segment_served = False
+
+            # 最後に要求された HLS セグメントのシーケンス番号 (現在の再生位置)
+            instance._playback_sequence = 0
+
             # キャンセルされない限り SESSION_TIMEOUT 秒後にインスタンスを破棄するタイマー
             # cancel_destroy_timer() を呼び出すことでタイマーをキャンセルできる
             instance._cancel_destroy_timer = SetTimeout(lambda: asyncio.create_task(instance.destroy()), cls.SESSION_TIMEOUT)
@@ -127,27 +456,213 @@ class VideoStream:
         return cls.__instances[session_id]
 
 
-    def __init__(self, session_id: str, recorded_program: RecordedProgram, quality: QUALITY_TYPES) -> None:
+    def __init__(self, session_id: str, recorded_program: RecordedProgram, quality: VIDEO_QUALITY_TYPES) -> None:
         """
         録画視聴セッションのインスタンスを取得する
 
         Args:
             session_id (str): セッション ID
             recorded_program (RecordedProgram): 録画番組の情報
-            quality (QUALITY_TYPES): 映像の品質 (1080p-60fps ~ 240p)
+            quality (VIDEO_QUALITY_TYPES): 映像の品質 (1080p-60fps ~ 240p, original)
         """
 
         # インスタンス変数の型ヒントを定義
         # Singleton のためインスタンスの生成は __new__() で行うが、__init__() も定義しておかないと補完がうまく効かない
         self.session_id: str
         self.recorded_program: RecordedProgram
-        self.quality: QUALITY_TYPES
+        self.quality: VIDEO_QUALITY_TYPES
+        self._master_session_id: str | None
         self._base_dts: int
+        self._use_startup_segments: bool
+        self._first_completed_sequence: int | None
+        self._last_completed_sequence: int | None
+        self._buffer_range_updated_event: asyncio.Event
         self._segments: list[VideoStreamSegment]
+        self._is_recording: bool
+        self._last_refreshed_at: float
+        self._last_key_frame: KeyFrame | None
+        self._segment_start_frame: KeyFrame | None
+        self._accumulated_duration: float
         self._encoding_task: VideoEncodingTask
+        self._last_accessed_at: float
+        self._is_prepared: bool
+        self._is_first_segment_served: bool
+        self._playback_sequence: int
         self._cancel_destroy_timer: Callable[[], None]
 
 
+    @classmethod
+    def getAllVideoStreams(cls) -> list[VideoStream]:
+        """
+        全ての録画視聴セッションのインスタンスを取得する
+
+        Returns:
+            list[VideoStream]: 録画視聴セッションのインスタンスの入ったリスト
+        """
+
+        return list(cls.__instances.values())
+
+
+    @classmethod
+    def getTimeToFirstSegmentStatistics(cls, is_prepared: bool) -> tuple[int, float | None]:
+        """
+        直近の録画視聴セッションで、最初の HLS セグメントが要求されてから返すまでにかかった時間の統計を取得する
+
+        Args:
+            is_prepared (bool): 事前準備されたセッションの統計を取得するかどうか
+
+        Returns:
+            tuple[int, float | None]: (記録されているセッション数, 平均時間 (秒, 記録がない場合は None))
+        """
+
+        history = cls.__time_to_first_segment_history[is_prepared]
+        if len(history) == 0:
+            return (0, None)
+        return (len(history), sum(history) / len(history))
+
+
+    @staticmethod
+    def getRenditionSessionID(session_id: str, quality: QUALITY_TYPES) -> str:
+        """
+        アダプティブビットレート再生で、各画質の録画視聴セッションに割り当てるセッション ID を取得する
+        録画視聴セッションは画質ごとに別のインスタンスとなるため、クライアントが指定したセッション ID に画質を付加して区別する
+
+        Args:
+            session_id (str): クライアントが指定したセッション ID
+            quality (QUALITY_TYPES): 映像の品質
+
+        Returns:
+            str: 各画質の録画視聴セッションのセッション ID
+        """
+
+        return f'{session_id}-abr-{quality}'
+
+
+    @staticmethod
+    def getMasterSessionID(session_id: str, quality: VIDEO_QUALITY_TYPES) -> str | None:
+        """
+        アダプティブビットレート再生の各画質の録画視聴セッション ID から、マスタープレイリストのセッション ID を取得する
+        getRenditionSessionID() の逆変換で、対応付けを保持しておく必要がないため、要求されなかった画質の情報が残り続けることもない
+
+        Args:
+            session_id (str): 録画視聴セッションのセッション ID
+            quality (VIDEO_QUALITY_TYPES): 映像の品質
+
+        Returns:
+            str | None: マスタープレイリストのセッション ID (アダプティブビットレート再生の録画視聴セッションでない場合は None)
+        """
+
+        suffix = f'-abr-{quality}'
+        if session_id.endswith(suffix) and len(session_id) > len(suffix):
+            return session_id[:-len(suffix)]
+        return None
+
+
+    @classmethod
+    def getMasterPlaylist(cls, session_id: str, recorded_program: RecordedProgram, is_hevc: bool, cache_key: str | None = None) -> str:
+        """
+        アダプティブビットレート再生用の HLS M3U8 マスタープレイリストを取得する
+        各画質のプレイリストはすべて同じキーフレーム情報からセグメントを算出するため、セグメント境界は全画質で一致する
+        各画質の録画視聴セッションは、クライアントがその画質のプレイリストを要求した時点で初めて生成される
+        各画質のエンコードはそれぞれ独立したエンコーダーで行うが、同時にエンコードするのはセグメントが最後に要求された1画質のみとし、
+        画質の数に応じて CPU 負荷や録画ファイルの読み込みが増えないようにしている
+
+        Args:
+            session_id (str): クライアントが指定したセッション ID
+            recorded_program (RecordedProgram): 録画番組の情報
+            is_hevc (bool): H.265 / HEVC の画質のみを含めるかどうか (False の場合は H.264 の画質のみを含める)
+            cache_key (str | None): キャッシュ制御用のキー (None の場合は新しいキーを生成する)
+
+        Returns:
+            str: HLS M3U8 マスタープレイリスト
+        """
+
+        # キャッシュキーが指定されていない場合は UUID の - で区切って一番左側のみを使う
+        if cache_key is None:
+            cache_key = uuid.uuid4().hex.split('-')[0]
+
+        # 含める画質を選ぶ
+        ## 60fps の画質は倍のフレームレートでエンコードする分重いため含めない
+        qualities: list[QUALITY_TYPES] = [
+            quality_name for quality_name, quality in QUALITY.items()
+            if quality.is_hevc is is_hevc and quality.is_60fps is False
+        ]
+        ## 元映像の解像度を超える画質は含めない (すべて超える場合は最も低い画質のみを含める)
+        source_height = recorded_program.recorded_video.video_resolution_height
+        filtered_qualities = [quality_name for quality_name in qualities if QUALITY[quality_name].height <= source_height]
+        qualities = filtered_qualities if len(filtered_qualities) > 0 else qualities[-1:]
+
+        def ParseBitrate(bitrate: str) -> int:
+            """ '9500K' のようなビットレート指定を bps 単位の整数に変換する """
+            if bitrate.upper().endswith('K'):
+                return int(float(bitrate[:-1]) * 1000)
+            if bitrate.upper().endswith('M'):
+                return int(float(bitrate[:-1]) * 1000 * 1000)
+            return int(bitrate)
+
+        # HLS M3U8 マスタープレイリストを生成
+        master_playlist = ''
+        master_playlist += '#EXTM3U\n'
+        master_playlist += '#EXT-X-VERSION:6\n'
+        master_playlist += '#EXT-X-INDEPENDENT-SEGMENTS\n'
+        for quality_name in qualities:
+            quality = QUALITY[quality_name]
+            bandwidth = ParseBitrate(quality.video_bitrate_max) + ParseBitrate(quality.audio_bitrate)
+            average_bandwidth = ParseBitrate(quality.video_bitrate) + ParseBitrate(quality.audio_bitrate)
+            codecs = 'hvc1.1.6.L120.90,mp4a.40.2' if quality.is_hevc is True else 'avc1.640028,mp4a.40.2'
+            master_playlist += (
+                f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={average_bandwidth},'
+                f'RESOLUTION={quality.width}x{quality.height},CODECS="{codecs}"\n'
+            )
+            # 各画質のプレイリストの URL (マスタープレイリストの URL からの相対パス)
+            rendition_session_id = cls.getRenditionSessionID(session_id, quality_name)
+            master_playlist += f'{quality_name}/playlist?session_id={rendition_session_id}&cache_key={cache_key}\n'
+
+        return master_playlist
+
+
+    @classmethod
+    def getRenditions(cls, session_id: str) -> list[VideoStream]:
+        """
+        アダプティブビットレート再生で、生成済みの各画質の録画視聴セッションのインスタンスを取得する
+
+        Args:
+            session_id (str): クライアントが指定したセッション ID
+
+        Returns:
+            list[VideoStream]: 各画質の録画視聴セッションのインスタンスの入ったリスト
+        """
+
+        instances: list[VideoStream] = []
+        for quality_name in QUALITY:
+            instance = cls.__instances.get(cls.getRenditionSessionID(session_id, quality_name))
+            if instance is not None:
+                instances.append(instance)
+        return instances
+
+
+    @classmethod
+    def keepAliveRenditions(cls, session_id: str) -> None:
+        """
+        アダプティブビットレート再生で、クライアントが現在利用している画質の録画視聴セッションのアクティブ状態を維持する
+        ABR_RENDITION_IDLE_TIMEOUT 秒以上プレイリストやセグメントが要求されていない画質の録画視聴セッションは維持せず、
+        SESSION_TIMEOUT 秒後に自動的に破棄されるに任せる
+        ただし最後にプレイリストやセグメントが要求された画質は、一時停止中などで長時間要求がなくても現在再生中の画質として維持する
+
+        Args:
+            session_id (str): クライアントが指定したセッション ID
+        """
+
+        instances = cls.getRenditions(session_id)
+        if len(instances) == 0:
+            return
+        current_time = time.time()
+        active_instance = max(instances, key=lambda instance: instance._last_accessed_at)
+        for instance in instances:
+            if instance is active_instance or current_time - instance._last_accessed_at < cls.ABR_RENDITION_IDLE_TIMEOUT:
+                instance.keepAlive()
+
+
     @property
     def log_prefix(self) -> str:
         """
@@ -166,6 +681,24 @@ class VideoStream:
         return tuple(self._segments)
 
 
+    @property
+    def playback_sequence(self) -> int:
+        """
+        最後に要求された HLS セグメントのシーケンス番号 (現在の再生位置)
+        これより前のセグメントは、シークしない限り再び要求されることはない
+        """
+        return self._playback_sequence
+
+
+    @property
+    def is_recording(self) -> bool:
+        """
+        録画中の番組を追っかけ再生しているかどうか
+        True の間は、録画ファイルの末尾に達してもデータが追記されるのを待つ必要がある
+        """
+        return self._is_recording
+
+
     def keepAlive(self) -> None:
         """
         録画視聴セッションのアクティブ状態を維持する
@@ -189,11 +722,11 @@ class VideoStream:
 
         # エンコード済みの全セグメントの範囲を計算する
         # エンコード済み (Completed) のセグメントのみを対象とする
-        encoded_segments = [s for s in self._segments if s.encode_status == 'Completed']
-        if encoded_segments:
+        ## 最初と最後のエンコード済みセグメントは、エンコード状態が変わるたびに差分更新されている
+        if self._first_completed_sequence is not None and self._last_completed_sequence is not None:
             # エンコード済みの最初のセグメントの開始時刻から最後のセグメントの終了時刻までを計算
-            first_segment = encoded_segments[0]
-            last_segment = encoded_segments[-1]
+            first_segment = self._segments[self._first_completed_sequence]
+            last_segment = self._segments[self._last_completed_sequence]
             buffer_start = (first_segment.start_dts - self._base_dts) / ts.HZ
             buffer_end = (last_segment.start_dts - self._base_dts) / ts.HZ + last_segment.duration_seconds
             return (buffer_start, buffer_end)
@@ -202,6 +735,76 @@ class VideoStream:
             return (0, 0)
 
 
+    async def waitForBufferRangeUpdate(self, previous_buffer_range: tuple[float, float]) -> tuple[float, float]:
+        """
+        バッファ範囲が previous_buffer_range から変化するまで待機し、変化後のバッファ範囲を返す
+        HLS セグメントのエンコード状態が変わった時に通知されるため、ポーリングは行わない
+
+        Args:
+            previous_buffer_range (tuple[float, float]): 前回取得したバッファ範囲
+
+        Returns:
+            tuple[float, float]: 変化後のバッファ範囲 (開始時刻, 終了時刻)
+        """
+
+        while True:
+            # イベントを先に取得してからバッファ範囲を確認することで、確認直後の更新を取りこぼさないようにする
+            event = self._buffer_range_updated_event
+            buffer_range = self.getBufferRange()
+            if buffer_range != previous_buffer_range:
+                return buffer_range
+            await event.wait()
+
+
+    def __onSegmentCompletionChanged(self, segment: VideoStreamSegment) -> None:
+        """
+        HLS セグメントのエンコード状態が Completed になった時 / Completed から戻った時に呼び出され、バッファ範囲を差分更新する
+
+        Args:
+            segment (VideoStreamSegment): エンコード状態が変わった HLS セグメント
+        """
+
+        previous_buffer_range = self.getBufferRange()
+        sequence = segment.sequence_index
+
+        # エンコード済みになった場合は、最初と最後のセグメントを広げる
+        if segment.encode_status == 'Completed':
+            if self._first_completed_sequence is None or sequence < self._first_completed_sequence:
+                self._first_completed_sequence = sequence
+            if self._last_completed_sequence is None or sequence > self._last_completed_sequence:
+                self._last_completed_sequence = sequence
+
+        # エンコード済みでなくなったのが最初か最後のセグメントの場合は、次にエンコード済みのセグメントまで範囲を狭める
+        ## 通常は読み取り済みの古いセグメントから順にリセットされるため、走査はすぐに終わる
+        elif self._first_completed_sequence is not None and self._last_completed_sequence is not None:
+            first, last = self._first_completed_sequence, self._last_completed_sequence
+            if sequence == first:
+                while first <= last and self._segments[first].encode_status != 'Completed':
+                    first += 1
+            if sequence == last:
+                while last >= first and self._segments[last].encode_status != 'Completed':
+                    last -= 1
+            if first > last:
+                self._first_completed_sequence = None
+                self._last_completed_sequence = None
+            else:
+                self._first_completed_sequence = first
+                self._last_completed_sequence = last
+
+        # バッファ範囲が変わった場合のみ、待機している購読者に通知する
+        if self.getBufferRange() != previous_buffer_range:
+            self.__notifyBufferRangeUpdated()
+
+
+    def __notifyBufferRangeUpdated(self) -> None:
+        """
+        バッファ範囲が更新されたことを、waitForBufferRangeUpdate() で待機している購読者に通知する
+        """
+
+        self._buffer_range_updated_event.set()
+        self._buffer_range_updated_event = asyncio.Event()
+
+
     async def getVirtualPlaylist(self, cache_key: str | None = None) -> str:
         """
         仮想 HLS M3U8 プレイリストを取得する
@@ -216,9 +819,21 @@ class VideoStream:
 
         # セッションのアクティブ状態を維持する
         self.keepAlive()
+        self._last_accessed_at = time.time()
+
+        # まだキーフレーム情報から HLS セグメントリストを作成していなければ、VideoStreamSegment を作成する
+        if self._last_key_frame is None:
+            # 録画中の番組では、DB に保存されていない新しいキーフレーム情報がメモリ上にあるため、録画フォルダの監視タスクから取得する
+            ## 監視タスクで解析中でない場合は、セッション開始後にキーフレーム情報が保存されている可能性があるため、DB から取得し直す
+            if self._is_recording is True:
+                self._last_refreshed_at = time.monotonic()
+                recording_key_frames = RecordedScanTask().getRecordingKeyFrames(self.recorded_program.recorded_video.file_path, -1)
+                if recording_key_frames is not None:
+                    self.recorded_program.recorded_video.key_frames, self.recorded_program.recorded_video.pat_pmt_index = recording_key_frames
+                elif len(self.recorded_program.recorded_video.key_frames) < 2:
+                    await self.recorded_program.recorded_video.refresh_from_db(fields=['status', 'key_frames', 'pat_pmt_index'])
+                    self._is_recording = self.recorded_program.recorded_video.status == 'Recording'
 
-        # まだ HLS セグメントリストが空なら、キーフレーム情報から VideoStreamSegment を作成する
-        if len(self._segments) == 0:
             # キーフレーム情報が存在しない場合は500エラー
             if not self.recorded_program.recorded_video.has_key_frames:
                 logging.error(f'{self.log_prefix} Keyframe information is not available.')
@@ -239,56 +854,13 @@ class VideoStream:
             # 最初のキーフレームの DTS を基準として保存する
             self._base_dts = key_frames[0]['dts']
 
-            # キーフレーム間隔の最大値を計算する
-            max_key_frame_interval = 0.0
-            for i in range(1, len(key_frames)):
-                current_frame = key_frames[i - 1]
-                next_frame = key_frames[i]
-                interval = (next_frame['dts'] - current_frame['dts']) / ts.HZ
-                max_key_frame_interval = max(max_key_frame_interval, interval)
-
-            segment_sequence = 0
-            accumulated_duration: float = 0.0
-            # セグメントの開始フレーム（フレーム情報全体を保持）
-            segment_start_frame = key_frames[0]
-
-            # キーフレーム情報を先頭から順に処理し、各間隔を累積していく
-            for i in range(1, len(key_frames)):
-                current_frame = key_frames[i - 1]
-                next_frame = key_frames[i]
-                # 各キーフレーム間の時間差を算出
-                duration = (next_frame['dts'] - current_frame['dts']) / ts.HZ
-                accumulated_duration += duration
-
-                # キーフレーム間隔が SEGMENT_DURATION_SECONDS 以上になったら、新しいセグメントに切り替える
-                if accumulated_duration >= self.SEGMENT_DURATION_SECONDS:
-                    self._segments.append(VideoStreamSegment(
-                        sequence_index = segment_sequence,
-                        start_file_position = segment_start_frame['offset'],
-                        start_dts = segment_start_frame['dts'],
-                        duration_seconds = accumulated_duration,
-                        encode_status = 'Pending',
-                        encoded_segment_ts_future = asyncio.Future(),
-                    ))
-                    segment_sequence += 1
-                    # 次のセグメントの開始フレームとして、現在の next_frame を設定
-                    segment_start_frame = next_frame
-                    accumulated_duration = 0.0
-
-            # ループ後に、残りの時間がある場合は最後のセグメントとして追加
-            if accumulated_duration > 0:
-                self._segments.append(VideoStreamSegment(
-                    sequence_index = segment_sequence,
-                    start_file_position = segment_start_frame['offset'],
-                    start_dts = segment_start_frame['dts'],
-                    duration_seconds = accumulated_duration,
-                    encode_status = 'Pending',
-                    encoded_segment_ts_future = asyncio.Future(),
-                ))
+            # キーフレーム情報から HLS セグメントを作成する
+            ## 録画中の番組では、最後のキーフレーム以降はまだ書き込まれていないため、最後の HLS セグメントは作成しない
+            self.__extendSegments(key_frames, is_final=not self._is_recording)
 
             # HLS セグメント長の最小値・最大値・平均値をロギング
             # 最後のセグメントの長さは通常 SEGMENT_DURATION_SECONDS と一致しないので統計から除外している
-            if len(self._segments) > 0:
+            if len(self._segments) > 1:
                 min_duration = min(segment.duration_seconds for segment in self._segments[:-1])
                 max_duration = max(segment.duration_seconds for segment in self._segments[:-1])
                 avg_duration = sum(segment.duration_seconds for segment in self._segments[:-1]) / (len(self._segments) - 1)
@@ -296,6 +868,10 @@ class VideoStream:
                     f'{self.log_prefix} Total {len(self._segments)} segments (min: {min_duration:.2f}s, max: {max_duration:.2f}s, avg: {avg_duration:.2f}s)'
                 )
 
+        # 録画中の番組を追っかけ再生している場合は、新たに追記されたキーフレーム情報から HLS セグメントを追加する
+        elif self._is_recording is True and time.monotonic() - self._last_refreshed_at >= self.RECORDING_REFRESH_INTERVAL:
+            await self.__refreshRecordingSegments()
+
         # キャッシュキーが指定されていない場合は UUID の - で区切って一番左側のみを使う
         if cache_key is None:
             cache_key = uuid.uuid4().hex.split('-')[0]
@@ -304,10 +880,14 @@ class VideoStream:
         virtual_playlist = ''
         virtual_playlist += '#EXTM3U\n'
         virtual_playlist += '#EXT-X-VERSION:6\n'
-        virtual_playlist += '#EXT-X-PLAYLIST-TYPE:VOD\n'
+        # 録画中の番組では、HLS セグメントが随時追加されていく EVENT 型のプレイリストとして返す
+        virtual_playlist += f'#EXT-X-PLAYLIST-TYPE:{"EVENT" if self._is_recording else "VOD"}\n'
 
         # HLS セグメントの実時間の最大値を指定する (小数点以下は切り上げ)
-        target_duration = max(s.duration_seconds for s in self._segments)
+        ## EVENT 型のプレイリストでは後から追加される HLS セグメントの方が長い場合があるため、余裕を持たせる
+        target_duration = max((s.duration_seconds for s in self._segments), default=self.SEGMENT_DURATION_SECONDS)
+        if self._is_recording is True:
+            target_duration = max(target_duration, self.SEGMENT_DURATION_SECONDS * 2)
         virtual_playlist += f'#EXT-X-TARGETDURATION:{math.ceil(target_duration)}\n'
 
         # 事前に算出したセグメントをすべて記述する
@@ -317,10 +897,101 @@ class VideoStream:
             # キャッシュ避けのためにキャッシュキーを付与する
             virtual_playlist += f'segment?session_id={self.session_id}&sequence={segment.sequence_index}&cache_key={cache_key}\n'
 
-        virtual_playlist += '#EXT-X-ENDLIST\n'
+        # 録画中の番組では、まだ HLS セグメントが追加されるためプレイリストを終端しない
+        if self._is_recording is False:
+            virtual_playlist += '#EXT-X-ENDLIST\n'
         return virtual_playlist
 
 
+    def __extendSegments(self, key_frames: list[KeyFrame], is_final: bool) -> None:
+        """
+        キーフレーム情報から VideoStreamSegment を作成し、HLS セグメントのリストの末尾に追加する
+        前回までに処理したキーフレームの続きとして処理するため、録画中の番組では新たに追記されたキーフレームのみを渡せばよい
+
+        Args:
+            key_frames (list[KeyFrame]): 前回までに処理したキーフレームより後ろのキーフレーム情報
+            is_final (bool): 録画ファイルの末尾までのキーフレーム情報かどうか (True の場合は、残りの時間を最後のセグメントとして追加する)
+        """
+
+        def GetSegmentDuration(sequence: int) -> float:
+            """ 指定されたシーケンス番号の HLS セグメントの最低長さ (秒) を返す """
+            if self._use_startup_segments is True and sequence < len(self.STARTUP_SEGMENT_DURATIONS):
+                return self.STARTUP_SEGMENT_DURATIONS[sequence]
+            return self.SEGMENT_DURATION_SECONDS
+
+        def AppendSegment(start_frame: KeyFrame, duration_seconds: float) -> None:
+            """ HLS セグメントをリストの末尾に追加する """
+            self._segments.append(VideoStreamSegment(
+                sequence_index = len(self._segments),
+                start_file_position = start_frame['offset'],
+                start_dts = start_frame['dts'],
+                duration_seconds = duration_seconds,
+                encode_status = 'Pending',
+                encoded_segment_ts_future = asyncio.Future(),
+                on_completion_changed = self.__onSegmentCompletionChanged,
+            ))
+
+        # キーフレーム情報を先頭から順に処理し、各間隔を累積していく
+        for next_frame in key_frames:
+            # 最初のキーフレームはセグメントの開始フレームとする
+            if self._last_key_frame is None or self._segment_start_frame is None:
+                self._last_key_frame = next_frame
+                self._segment_start_frame = next_frame
+                continue
+
+            # 各キーフレーム間の時間差を算出
+            self._accumulated_duration += (next_frame['dts'] - self._last_key_frame['dts']) / ts.HZ
+            self._last_key_frame = next_frame
+
+            # キーフレーム間隔がセグメントの最低長さ (通常は SEGMENT_DURATION_SECONDS) 以上になったら、新しいセグメントに切り替える
+            if self._accumulated_duration >= GetSegmentDuration(len(self._segments)):
+                AppendSegment(self._segment_start_frame, self._accumulated_duration)
+                # 次のセグメントの開始フレームとして、現在の next_frame を設定
+                self._segment_start_frame = next_frame
+                self._accumulated_duration = 0.0
+
+        # 録画ファイルの末尾までのキーフレーム情報であれば、残りの時間を最後のセグメントとして追加
+        if is_final is True and self._segment_start_frame is not None and self._accumulated_duration > 0:
+            AppendSegment(self._segment_start_frame, self._accumulated_duration)
+            self._accumulated_duration = 0.0
+
+
+    async def __refreshRecordingSegments(self) -> None:
+        """
+        録画中の番組を追っかけ再生している場合に、新たに追記されたキーフレームから HLS セグメントを追加する
+        録画中は録画フォルダの監視タスクが保持するメモリ上のキーフレーム情報から、新しいキーフレームのみを取得する
+        監視タスクでの解析が終わった後は、DB から最新の録画状態とキーフレーム情報を取得し直す
+        録画が完了していれば最後のセグメントを追加し、以降は通常の録画番組と同様に扱う
+        """
+
+        self._last_refreshed_at = time.monotonic()
+        recorded_video = self.recorded_program.recorded_video
+
+        # 前回までに処理したキーフレームより後ろのキーフレームのみを処理する
+        ## 録画完了後のキーフレーム解析で解析し直された場合も、既存のキーフレームの位置は変わらない
+        last_offset = self._last_key_frame['offset'] if self._last_key_frame is not None else -1
+        recording_key_frames = RecordedScanTask().getRecordingKeyFrames(recorded_video.file_path, last_offset)
+        if recording_key_frames is not None:
+            new_key_frames, recorded_video.pat_pmt_index = recording_key_frames
+            is_recording = True
+        else:
+            try:
+                await recorded_video.refresh_from_db(fields=['status', 'key_frames', 'pat_pmt_index'])
+            except Exception as ex:
+                logging.warning(f'{self.log_prefix} Failed to refresh keyframes of the recording program:', exc_info=ex)
+                return
+            new_key_frames = [key_frame for key_frame in recorded_video.key_frames if key_frame['offset'] > last_offset]
+            is_recording = recorded_video.status == 'Recording'
+
+        previous_segment_count = len(self._segments)
+        self.__extendSegments(new_key_frames, is_final=not is_recording)
+        self._is_recording = is_recording
+        if len(self._segments) > previous_segment_count:
+            logging.info(f'{self.log_prefix} Added {len(self._segments) - previous_segment_count} segments of the recording program. (total {len(self._segments)} segments)')
+        if is_recording is False:
+            logging.info(f'{self.log_prefix} The recording program has finished recording.')
+
+
     async def getSegment(self, segment_sequence: int) -> bytes | None:
         """
         エンコードされた HLS セグメントを取得する
@@ -336,6 +1007,7 @@ class VideoStream:
 
         # セッションのアクティブ状態を維持する
         self.keepAlive()
+        self._last_accessed_at = time.time()
 
         # セグメントのシーケンス番号が不正な場合は None を返す
         if segment_sequence < 0 or segment_sequence >= len(self._segments):
@@ -343,24 +1015,38 @@ class VideoStream:
 
         # シーケンス番号に対応する HLS セグメントを取得する
         segment = self._segments[segment_sequence]
+        self._playback_sequence = segment_sequence
 
         # 当該セグメントのエンコードがまだ完了していない場合は、エンコードタスクを非同期で開始する
+        requested_at = time.monotonic()
         if segment.encode_status == 'Pending':
-            # 既存のエンコードタスクをキャンセル
-            await self._encoding_task.cancel()
-            logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Previous Encoding Task Canceled.')
-
-            # 新しいエンコードタスクのインスタンスを初期化
-            ## エンコードタスクは基本使い回せないので、再度新しく初期化する
-            self._encoding_task = VideoEncodingTask(self)
-
-            # 新しいエンコードタスクを開始
-            asyncio.create_task(self._encoding_task.run(segment_sequence))
-            logging.info(f'{self.log_prefix}[Segment {segment_sequence}] New Encoding Task Started.')
+            await self.__startEncodingTask(segment_sequence)
 
         # セグメントデータの Future が完了したらそのデータを返す
-        encoded_segment_ts = await asyncio.shield(segment.encoded_segment_ts_future)
+        ## エンコードの完了を待っている間は、ProcessLimiter でバックグラウンド解析などの外部プロセスの同時実行数を減らす
+        if segment.encoded_segment_ts_future.done() is False:
+            ProcessLimiter.beginEncodeWait()
+            try:
+                encoded_segment_ts = await asyncio.shield(segment.encoded_segment_ts_future)
+            finally:
+                ProcessLimiter.endEncodeWait()
+        else:
+            encoded_segment_ts = segment.encoded_segment_ts_future.result()
+
+        # このセッションで最初に返す HLS セグメントであれば、要求されてから返すまでにかかった時間を記録する
+        if self._is_first_segment_served is False:
+            self._is_first_segment_served = True
+            time_to_first_segment = time.monotonic() - requested_at
+            self.__time_to_first_segment_history[self._is_prepared].append(time_to_first_segment)
+            logging.info(
+                f'{self.log_prefix}[Segment {segment_sequence}] Time to first segment: {time_to_first_segment:.3f}s '
+                f'({"prepared" if self._is_prepared else "not prepared"})'
+            )
+        # メモリ使用量の上限を超えたため一時ファイルに退避されている場合は、一時ファイルから読み出す
+        if segment.spilled_file_path is not None:
+            encoded_segment_ts = await VideoStreamSegmentMemoryBudget.readSpilledSegment(segment)
         segment.is_encoded_segment_ts_future_readed = True
+        VideoStreamSegmentMemoryBudget.touch(segment)
 
         # 読み取り済みのセグメントが MAX_READED_SEGMENTS 個以上ある場合、一番古いセグメントのデータを初期化する
         readed_segments = [s for s in self._segments if s.is_encoded_segment_ts_future_readed]
@@ -373,18 +1059,128 @@ class VideoStream:
         return encoded_segment_ts
 
 
+    async def prepare(self, position_seconds: float = 0.0) -> None:
+        """
+        再生開始に先立って、指定された再生位置を含む HLS セグメントのエンコードを投機的に開始する
+        クライアントが番組詳細ページを開いた時などに呼び出すことで、再生開始時に最初のセグメントが返るまでの待ち時間を短縮する
+        PREPARE_TIMEOUT 秒以内にプレイリストやセグメントが要求されなかった場合、この録画視聴セッションは自動的に破棄される
+
+        Args:
+            position_seconds (float): 再生を開始する位置 (秒)
+        """
+
+        # まだ HLS セグメントリストが作成されていなければ作成する
+        await self.getVirtualPlaylist()
+
+        # 録画中の番組で、まだ HLS セグメントを1つも作成できていない場合は何もしない
+        if len(self._segments) == 0:
+            return
+
+        # 再生開始位置を含む HLS セグメントを探す
+        segment_sequence = 0
+        for segment in self._segments:
+            if (segment.start_dts - self._base_dts) / ts.HZ > position_seconds:
+                break
+            segment_sequence = segment.sequence_index
+
+        # 当該セグメントのエンコードがまだ開始されていなければ、エンコードタスクを開始する
+        if self._segments[segment_sequence].encode_status == 'Pending':
+            self._is_prepared = True
+            await self.__startEncodingTask(segment_sequence)
+            logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Prepared the Encoding Task speculatively.')
+
+        # クライアントが再生を開始するまで待つため、通常より長い PREPARE_TIMEOUT 秒後に破棄されるように設定する
+        ## プレイリストやセグメントが要求された時点で keepAlive() が呼ばれ、通常のタイムアウトに戻る
+        self._cancel_destroy_timer()
+        self._cancel_destroy_timer = SetTimeout(lambda: asyncio.create_task(self.destroy()), self.PREPARE_TIMEOUT)
+
+
+    async def __startEncodingTask(self, segment_sequence: int) -> None:
+        """
+        既存のエンコードタスクをキャンセルし、指定されたセグメントから新たにエンコードタスクを開始する
+
+        Args:
+            segment_sequence (int): エンコードを開始するセグメントのシーケンス番号
+        """
+
+        # 既存のエンコードタスクをキャンセル
+        await self._encoding_task.cancel()
+        logging.info(f'{self.log_prefix}[Segment {segment_sequence}] Previous Encoding Task Canceled.')
+
+        # アダプティブビットレート再生では、ほかの画質のエンコードを中断し、同時にエンコードするのは1画質のみとする
+        ## クライアントが画質を切り替えた後も以前の画質のエンコードを続けると、画質の数だけデコード・エンコードと読み込みが重複する
+        if self._master_session_id is not None:
+            for rendition in self.getRenditions(self._master_session_id):
+                if rendition is not self:
+                    await rendition.__suspendEncodingTask()
+
+        # 新しいエンコードタスクのインスタンスを初期化
+        ## エンコードタスクは基本使い回せないので、再度新しく初期化する
+        self._encoding_task = VideoEncodingTask(self)
+
+        # 新しいエンコードタスクを開始
+        asyncio.create_task(self._encoding_task.run(segment_sequence))
+        logging.info(f'{self.log_prefix}[Segment {segment_sequence}] New Encoding Task Started.')
+
+
+    async def __suspendEncodingTask(self) -> None:
+        """
+        実行中のエンコードタスクを中断する
+        エンコード中のセグメントは Pending に戻し、再度要求された時にそのセグメントから新たにエンコードタスクを開始できるようにする
+        エンコード済みのセグメントはそのまま保持する
+        """
+
+        # エンコード中のセグメントがなければ、エンコードタスクは既に終了している
+        encoding_segments = [segment for segment in self._segments if segment.encode_status == 'Encoding']
+        if len(encoding_segments) == 0:
+            return
+        await self._encoding_task.cancel()
+        for segment in encoding_segments:
+            await segment.resetState()
+        logging.info(f'{self.log_prefix} Encoding Task Suspended because another quality is being encoded.')
+
+
+    async def completeSegment(self, segment: VideoStreamSegment, encoded_segment_ts: bytes) -> None:
+        """
+        HLS セグメントのエンコードが完了したことを記録し、エンコード済みの MPEG-TS データをセットする
+        VideoEncodingTask から呼び出される
+
+        Args:
+            segment (VideoStreamSegment): エンコードが完了した HLS セグメント
+            encoded_segment_ts (bytes): エンコード済みの MPEG-TS データ
+        """
+
+        if segment.encoded_segment_ts_future.done():
+            return
+        segment.encoded_segment_ts_future.set_result(encoded_segment_ts)
+        segment.encode_status = 'Completed'
+        segment.encoded_segment_ts_size = len(encoded_segment_ts)
+        self.__onSegmentCompletionChanged(segment)
+
+        # 全録画視聴セッションでのメモリ使用量の管理対象に追加する
+        await VideoStreamSegmentMemoryBudget.add(self, segment)
+
+
     async def destroy(self) -> None:
         """
         録画視聴セッションで実行中のエンコードなどの処理を終了し、録画視聴セッションを破棄する
         ユーザーが番組の視聴を終了した (keepAlive() が呼び出されなくなった) 場合に自動的に呼び出される
         """
 
+        # サーバーの終了時など、タイムアウト前に破棄される場合に備えてタイマーをキャンセルする
+        self._cancel_destroy_timer()
+
         # 起動中のエンコードタスクがあればキャンセルする
         # この時点ですでにエンコードを完了して終了している場合もある
         await self._encoding_task.cancel()
 
-        # すべての HLS セグメントを削除する
+        # すべての HLS セグメントをメモリ使用量の管理対象から外してから削除する
+        for segment in self._segments:
+            VideoStreamSegmentMemoryBudget.release(segment)
         self._segments = []
+        self._first_completed_sequence = None
+        self._last_completed_sequence = None
+        self.__notifyBufferRangeUpdated()
 
         # アクティブな間保持されていたインスタンスを削除する
         ## これにより、このインスタンスには誰も参照できなくなるため、ガベージコレクションによりメモリから解放される (はず)
@@ -0,0 +1,241 @@
+
+import os
+import re
+from collections.abc import Mapping
+from typing import BinaryIO
+from urllib.parse import quote
+
+import anyio
+from fastapi.responses import PlainTextResponse, Response
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+
+from app.utils.DriveIOLimiter import DriveIOLimiter
+
+
+class ClipFileResponse(Response):
+    """
+    ファイルの一部のバイト範囲 (複数可) を連結し、先頭や各バイト範囲の直前に任意のデータを付加したものを1つのファイルとして返すレスポンス
+    録画ファイルの一部を切り出して返すために使う
+    データはメモリに読み込まずにストリーミングし、ASGI サーバーが対応していれば zerocopysend 拡張 (sendfile) でファイルから直接送信する
+    HTTP Range リクエスト (単一範囲のみ) にも対応する
+    """
+
+    # zerocopysend 拡張が使えない場合に、一度に読み込んで送信するデータのサイズ (バイト)
+    CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+    def __init__(
+        self,
+        path: str,
+        file_ranges: list[tuple[int, int]],
+        prefix: bytes = b'',
+        range_prefixes: list[bytes] | None = None,
+        filename: str | None = None,
+        media_type: str = 'application/octet-stream',
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        """
+        ファイルの一部を切り出して返すレスポンスを初期化する
+
+        Args:
+            path (str): 切り出すファイルのパス
+            file_ranges (list[tuple[int, int]]): 切り出すバイト範囲 (開始位置, 終了位置 (この位置を含まない)) のリスト
+            prefix (bytes, optional): 切り出したデータの先頭に付加するデータ. Defaults to b''.
+            range_prefixes (list[bytes] | None, optional): 各バイト範囲の直前に付加するデータのリスト (file_ranges と同じ長さ). Defaults to None.
+            filename (str | None, optional): ダウンロード時のファイル名. Defaults to None.
+            media_type (str, optional): MIME タイプ. Defaults to 'application/octet-stream'.
+            headers (Mapping[str, str] | None, optional): カスタムのヘッダー. Defaults to None.
+        """
+
+        self.path = path
+        if range_prefixes is None:
+            range_prefixes = [b''] * len(file_ranges)
+        if len(range_prefixes) != len(file_ranges):
+            raise ValueError('range_prefixes must have the same length as file_ranges')
+
+        # 送信するデータを、付加するデータ (bytes) とファイルのバイト範囲 (tuple[int, int]) を送信順に並べたリストとして保持する
+        ## 空のバイト範囲は、その直前に付加するデータごと取り除く
+        self.parts: list[bytes | tuple[int, int]] = []
+        if len(prefix) > 0:
+            self.parts.append(prefix)
+        for (range_start, range_end), range_prefix in zip(file_ranges, range_prefixes):
+            if range_end <= range_start:
+                continue
+            if len(range_prefix) > 0:
+                self.parts.append(range_prefix)
+            self.parts.append((range_start, range_end))
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.body = b''
+        self.init_headers(headers)
+        self.headers.setdefault('accept-ranges', 'bytes')
+        if filename is not None:
+            self.headers.setdefault('content-disposition', f'attachment; filename*=utf-8\'\'{quote(filename)}')
+
+        # 付加するデータと、切り出すバイト範囲を連結した全体のサイズ
+        self.content_length = sum(self.getPartLength(part) for part in self.parts)
+        self.headers['content-length'] = str(self.content_length)
+
+
+    def parseRangeHeader(self, http_range: str) -> tuple[int, int] | None:
+        """
+        Range ヘッダーを解析し、返すべき範囲を取得する
+        複数の範囲が指定された場合は、範囲指定を無視して全体を返す (RFC 9110 で許容されている)
+
+        Args:
+            http_range (str): Range ヘッダーの値
+
+        Returns:
+            tuple[int, int] | None: 返すべき範囲 (開始位置, 終了位置 (この位置を含まない)) 、範囲指定を無視する場合は None
+
+        Raises:
+            ValueError: 範囲が満たせない場合
+        """
+
+        match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', http_range)
+        if match is None:
+            return None
+        start_text, end_text = match.groups()
+        if start_text == '' and end_text == '':
+            return None
+
+        # bytes=-N (末尾 N バイト)
+        if start_text == '':
+            suffix_length = int(end_text)
+            if suffix_length == 0:
+                raise ValueError('Range not satisfiable')
+            return (max(0, self.content_length - suffix_length), self.content_length)
+
+        start = int(start_text)
+        end = self.content_length if end_text == '' else min(int(end_text) + 1, self.content_length)
+        if start >= self.content_length or start >= end:
+            raise ValueError('Range not satisfiable')
+        return (start, end)
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        send_header_only: bool = scope['method'].upper() == 'HEAD'
+
+        # Range ヘッダーが指定されている場合は、その範囲のみを返す
+        start, end = 0, self.content_length
+        http_range = Headers(scope=scope).get('range')
+        if http_range is not None:
+            try:
+                content_range = self.parseRangeHeader(http_range)
+            except ValueError:
+                response = PlainTextResponse(status_code=416, headers={'Content-Range': f'*/{self.content_length}'})
+                return await response(scope, receive, send)
+            if content_range is not None:
+                start, end = content_range
+                self.status_code = 206
+                self.headers['content-range'] = f'bytes {start}-{end - 1}/{self.content_length}'
+                self.headers['content-length'] = str(end - start)
+
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if send_header_only is True or start >= end:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            return
+
+        # ASGI サーバーが zerocopysend 拡張に対応している場合は、sendfile でファイルから直接送信する
+        is_zerocopy_supported = 'http.response.zerocopysend' in scope.get('extensions', {})
+
+        # 最後のデータ (more_body = False) を送信済みかどうか
+        is_completed = False
+
+        # 付加するデータと切り出すバイト範囲のうち、返すべき範囲に含まれる部分を順に送信する
+        ## position は全体での、現在の部分の開始位置
+        ## 送信中は録画ファイルをフォアグラウンドで読み込むことを DriveIOLimiter に通知し、バックグラウンド解析よりも優先させる
+        position = 0
+        drive_io_scheduler = DriveIOLimiter.getScheduler(anyio.Path(self.path))
+        drive_io_scheduler.beginForegroundRead()
+        try:
+            with open(self.path, 'rb') as file:
+                for part in self.parts:
+                    part_length = self.getPartLength(part)
+                    send_start = max(start, position)
+                    send_end = min(end, position + part_length)
+                    part_offset = send_start - position
+                    position += part_length
+                    if send_start >= send_end:
+                        continue
+
+                    # 付加するデータはそのまま送信する
+                    if isinstance(part, bytes):
+                        is_completed = send_end >= end
+                        await send({
+                            'type': 'http.response.body',
+                            'body': part[part_offset:part_offset + (send_end - send_start)],
+                            'more_body': not is_completed,
+                        })
+                        continue
+
+                    # sendfile でファイルから直接送信する
+                    offset = part[0] + part_offset
+                    if is_zerocopy_supported is True:
+                        is_completed = send_end >= end
+                        await send({
+                            'type': 'http.response.zerocopysend',
+                            'file': file.fileno(),
+                            'offset': offset,
+                            'count': send_end - send_start,
+                            'more_body': not is_completed,
+                        })
+                        continue
+
+                    # CHUNK_SIZE ずつ読み込んで送信する
+                    remaining = send_end - send_start
+                    while remaining > 0:
+                        chunk = await anyio.to_thread.run_sync(self.readAt, file, min(remaining, self.CHUNK_SIZE), offset)
+                        if not chunk:
+                            break  # ファイルが途中で切り詰められている
+                        offset += len(chunk)
+                        remaining -= len(chunk)
+                        is_completed = remaining == 0 and send_end >= end
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': not is_completed})
+        finally:
+            drive_io_scheduler.endForegroundRead()
+
+        # ファイルが途中で切り詰められていた場合などに備え、必ずレスポンスを完了させる
+        if is_completed is False:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+    @staticmethod
+    def getPartLength(part: bytes | tuple[int, int]) -> int:
+        """
+        送信するデータの一部 (付加するデータ or ファイルのバイト範囲) のサイズを取得する
+
+        Args:
+            part (bytes | tuple[int, int]): 付加するデータ、またはファイルのバイト範囲 (開始位置, 終了位置 (この位置を含まない))
+
+        Returns:
+            int: サイズ (バイト)
+        """
+
+        if isinstance(part, bytes):
+            return len(part)
+        return part[1] - part[0]
+
+
+    @staticmethod
+    def readAt(file: BinaryIO, size: int, offset: int) -> bytes:
+        """
+        ファイルの指定された位置からデータを読み込む (同期関数)
+
+        Args:
+            file (BinaryIO): 読み込むファイル
+            size (int): 読み込むサイズ (バイト)
+            offset (int): 読み込みを開始する位置 (バイト)
+
+        Returns:
+            bytes: 読み込んだデータ
+        """
+
+        # os.pread() が使える環境ではファイルポインタを動かさずに読み込む
+        if hasattr(os, 'pread'):
+            return os.pread(file.fileno(), size, offset)
+        file.seek(offset)
+        return file.read(size)
@@ -1,24 +1,247 @@
-
 from __future__ import annotations
 
 import asyncio
+import os
 import sys
-from typing import ClassVar
+import time
+from typing import Any, ClassVar
 
 import anyio
 import psutil
 
+from app import schemas
+
+
+class DriveIOScheduler:
+    """
+    1つのドライブ (マウントポイント) に対するバックグラウンドタスクの同時実行数を、デバイスの種類と負荷に応じて調整するスケジューラー
+    - /sys/block から HDD (回転型) か SSD・NVMe (非回転型) かを判定し、基本の同時実行数を決める (RAID や LVM では構成するディスクの数も考慮する)
+    - /proc/diskstats (psutil) からデバイスの読み込みスループット・レイテンシ・使用率を計測する
+    - ライブ視聴・録画番組の視聴やダウンロードなどのフォアグラウンドの読み込み中は、バックグラウンドタスクの同時実行数を絞る
+    同時実行数を絞っても実行中のバックグラウンドタスクは中断されず、新たなバックグラウンドタスクの開始のみが待たされる
+    """
+
+    # 非回転型 (SSD・NVMe) のデバイスで同時に実行できるバックグラウンドタスクの数
+    NON_ROTATIONAL_BACKGROUND_CONCURRENCY: ClassVar[int] = 4
+
+    # フォアグラウンドの読み込み中に、デバイスが飽和していると判断する読み込みレイテンシ (ミリ秒)
+    ROTATIONAL_LATENCY_TARGET_MS: ClassVar[float] = 40.0
+    NON_ROTATIONAL_LATENCY_TARGET_MS: ClassVar[float] = 5.0
+
+    # フォアグラウンドの読み込み中に、デバイスが飽和していると判断する使用率
+    SATURATED_UTILIZATION: ClassVar[float] = 0.8
+
+    # デバイスの負荷を計測し直す間隔 (秒)
+    STATISTICS_INTERVAL_SECONDS: ClassVar[float] = 2.0
+
+    # バックグラウンドタスクの開始を待っている間に、同時実行数を計算し直す間隔 (秒)
+    CAPACITY_RECHECK_INTERVAL_SECONDS: ClassVar[float] = 1.0
+
+
+    def __init__(self, drive_id: str, device_name: str | None, is_rotational: bool | None, member_count: int) -> None:
+        """
+        ドライブのスケジューラーを初期化する
+
+        Args:
+            drive_id (str): ドライブ識別子 (Windows) またはマウントポイント (Linux)
+            device_name (str | None): /proc/diskstats 上のブロックデバイス名 (ネットワークドライブや Windows などで特定できない場合は None)
+            is_rotational (bool | None): 回転型のデバイスかどうか (判定できない場合は None)
+            member_count (int): RAID や LVM を構成するディスクの数 (単一のディスクの場合は 1)
+        """
+
+        self.drive_id = drive_id
+        self.device_name = device_name
+        self.is_rotational = is_rotational
+        self.member_count = member_count
+
+        # 実行中・開始待ちのバックグラウンドタスクの数と、フォアグラウンドの読み込みの数
+        self._background_active_count = 0
+        self._background_waiting_count = 0
+        self._foreground_reader_count = 0
+        self._condition: asyncio.Condition | None = None
+
+        # 計測したデバイスの負荷
+        self._last_counters: Any | None = None
+        self._last_counters_at: float | None = None
+        self._read_bytes_per_second: float | None = None
+        self._read_latency_ms: float | None = None
+        self._utilization: float | None = None
+
+
+    @property
+    def base_capacity(self) -> int:
+        """ フォアグラウンドの読み込みがないときに同時に実行できるバックグラウンドタスクの数 """
+        # 回転型のデバイスはシークが遅いため、ディスク1台につき1つまでに制限する
+        if self.is_rotational is True:
+            return max(self.member_count, 1)
+        if self.is_rotational is False:
+            return self.NON_ROTATIONAL_BACKGROUND_CONCURRENCY
+        # 種類を判定できないデバイス (ネットワークドライブなど) は、従来通り1つまでに制限する
+        return 1
+
+
+    def getBackgroundCapacity(self) -> int:
+        """
+        現在の負荷で同時に実行できるバックグラウンドタスクの数を取得する
+
+        Returns:
+            int: 同時に実行できるバックグラウンドタスクの数
+        """
+
+        self.updateStatistics()
+        capacity = self.base_capacity
+        if self._foreground_reader_count == 0:
+            return capacity
+
+        # フォアグラウンドの読み込みのレイテンシや使用率が目標を超えている場合は、デバイスが飽和していると判断する
+        latency_target_ms = self.NON_ROTATIONAL_LATENCY_TARGET_MS if self.is_rotational is False else self.ROTATIONAL_LATENCY_TARGET_MS
+        is_saturated = ((self._read_latency_ms is not None and self._read_latency_ms >= latency_target_ms) or
+                        (self._utilization is not None and self._utilization >= self.SATURATED_UTILIZATION))
+
+        # 回転型のデバイスでは、フォアグラウンドの読み込みの数だけ同時実行数を減らし、飽和している場合は新たに開始させない
+        if self.is_rotational is not False:
+            return 0 if is_saturated else max(capacity - self._foreground_reader_count, 1)
+        # 非回転型のデバイスでは、飽和している場合のみ同時実行数を半分にする
+        return max(capacity // 2, 1) if is_saturated else capacity
+
+
+    def updateStatistics(self) -> None:
+        """
+        前回の計測からの /proc/diskstats (psutil) の差分から、デバイスの読み込みスループット・レイテンシ・使用率を計測する
+        STATISTICS_INTERVAL_SECONDS 秒以内に計測済みの場合は何もしない
+        """
+
+        if self.device_name is None:
+            return
+        if self._last_counters_at is not None and time.monotonic() - self._last_counters_at < self.STATISTICS_INTERVAL_SECONDS:
+            return
+
+        all_counters, counters_at = DriveIOLimiter.getDiskIOCounters()
+        counters = all_counters.get(self.device_name)
+        if counters is None or counters_at == self._last_counters_at:
+            return
+        if self._last_counters is not None and self._last_counters_at is not None:
+            elapsed = counters_at - self._last_counters_at
+            read_count = counters.read_count - self._last_counters.read_count
+            self._read_bytes_per_second = (counters.read_bytes - self._last_counters.read_bytes) / elapsed
+            # 読み込みがなかった場合のレイテンシは 0 とする
+            self._read_latency_ms = (counters.read_time - self._last_counters.read_time) / read_count if read_count > 0 else 0.0
+            # busy_time は Linux でのみ取得できる
+            if hasattr(counters, 'busy_time'):
+                self._utilization = min(max((counters.busy_time - self._last_counters.busy_time) / (elapsed * 1000), 0.0), 1.0)
+        self._last_counters = counters
+        self._last_counters_at = counters_at
+
+
+    def locked(self) -> bool:
+        """
+        新たなバックグラウンドタスクをすぐに開始できないかどうかを取得する
+
+        Returns:
+            bool: すぐに開始できない場合は True
+        """
+
+        return self._background_active_count >= self.getBackgroundCapacity()
+
+
+    async def acquire(self) -> None:
+        """
+        バックグラウンドタスクを開始できるようになるまで待つ
+        """
+
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        self._background_waiting_count += 1
+        try:
+            async with self._condition:
+                # 同時実行数はフォアグラウンドの読み込みやデバイスの負荷によって変わるため、定期的に計算し直す
+                while self._background_active_count >= self.getBackgroundCapacity():
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=self.CAPACITY_RECHECK_INTERVAL_SECONDS)
+                    except TimeoutError:
+                        pass
+                self._background_active_count += 1
+        finally:
+            self._background_waiting_count -= 1
+
+
+    async def release(self) -> None:
+        """
+        バックグラウンドタスクの終了を通知する
+        """
+
+        assert self._condition is not None
+        async with self._condition:
+            self._background_active_count -= 1
+            self._condition.notify_all()
+
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.release()
+
+
+    def beginForegroundRead(self) -> None:
+        """
+        フォアグラウンドの読み込み (ライブ視聴・録画番組の視聴・ダウンロードなど) の開始を通知する
+        endForegroundRead() が呼ばれるまで、バックグラウンドタスクの同時実行数が絞られる
+        """
+
+        self._foreground_reader_count += 1
+
+
+    def endForegroundRead(self) -> None:
+        """
+        フォアグラウンドの読み込みの終了を通知する
+        """
+
+        self._foreground_reader_count = max(self._foreground_reader_count - 1, 0)
+
+
+    def getStatus(self) -> schemas.DriveIOStatus:
+        """
+        ドライブの種類・負荷とバックグラウンドタスクの実行状況を取得する
+
+        Returns:
+            schemas.DriveIOStatus: ドライブの状態
+        """
+
+        return schemas.DriveIOStatus(
+            drive_id = self.drive_id,
+            device_name = self.device_name,
+            is_rotational = self.is_rotational,
+            member_count = self.member_count,
+            background_capacity = self.getBackgroundCapacity(),
+            background_active_count = self._background_active_count,
+            background_waiting_count = self._background_waiting_count,
+            foreground_reader_count = self._foreground_reader_count,
+            read_bytes_per_second = self._read_bytes_per_second,
+            read_latency_ms = self._read_latency_ms,
+            utilization = self._utilization,
+        )
+
 
 class DriveIOLimiter:
     """
-    HDD ごとの同時実行を制限するクラス
-    同一 HDD に対して同時に1つまでしかバックグラウンドタスクを実行できないようにする
+    ドライブごとのバックグラウンドタスクの同時実行を制限するクラス
+    ドライブごとに DriveIOScheduler を作成し、デバイスの種類と負荷に応じた数までしかバックグラウンドタスクを実行できないようにする
     """
 
-    # クラス変数として Semaphore の辞書を保持
+    # クラス変数として DriveIOScheduler の辞書を保持
     # key: ドライブ識別子 (Windows) またはマウントポイント (Linux)
-    # value: その HDD 用の Semaphore
-    _drive_semaphores: ClassVar[dict[str, asyncio.Semaphore]] = {}
+    # value: そのドライブ用の DriveIOScheduler
+    _drive_schedulers: ClassVar[dict[str, DriveIOScheduler]] = {}
+
+    # ディレクトリとドライブ識別子のマッピングのキャッシュ
+    ## getDriveID() はマウントポイントの一覧を毎回取得するため、フォアグラウンドの読み込みのたびに呼ばないようにする
+    _drive_id_cache: ClassVar[dict[str, str]] = {}
+
+    # psutil.disk_io_counters() の結果のキャッシュ (ドライブごとに /proc/diskstats を読み直さないようにする)
+    _disk_io_counters: ClassVar[dict[str, Any]] = {}
+    _disk_io_counters_at: ClassVar[float | None] = None
 
 
     @staticmethod
@@ -71,28 +294,120 @@ class DriveIOLimiter:
 
 
     @classmethod
-    def getSemaphore(cls, path: anyio.Path) -> asyncio.Semaphore:
+    def getScheduler(cls, path: anyio.Path) -> DriveIOScheduler:
         """
-        指定されたパスの HDD 用の Semaphore を取得する
-        同一 HDD に対して同時に1つまでしかバックグラウンドタスクを実行できないようにする
+        指定されたパスのドライブ用の DriveIOScheduler を取得する
+        バックグラウンドタスクは async with で囲んで実行し、フォアグラウンドの読み込みは beginForegroundRead() / endForegroundRead() で通知する
 
         Args:
             path (anyio.Path): 対象ファイルパス
 
         Returns:
-            asyncio.Semaphore: 対応する HDD 用の Semaphore
+            DriveIOScheduler: 対応するドライブ用の DriveIOScheduler
         """
 
         # ドライブの識別子を取得
-        drive_id = cls.getDriveID(path)
+        directory = str(path.parent)
+        drive_id = cls._drive_id_cache.get(directory)
+        if drive_id is None:
+            drive_id = cls.getDriveID(path)
+            cls._drive_id_cache[directory] = drive_id
+
+        # ドライブごとのスケジューラーがなければ、デバイスの種類を判定して作成
+        if drive_id not in cls._drive_schedulers:
+            device_name, is_rotational, member_count = cls.detectDevice(drive_id)
+            cls._drive_schedulers[drive_id] = DriveIOScheduler(drive_id, device_name, is_rotational, member_count)
+
+        return cls._drive_schedulers[drive_id]
+
+
+    @classmethod
+    def getAllSchedulers(cls) -> list[DriveIOScheduler]:
+        """
+        これまでに作成されたすべてのドライブの DriveIOScheduler を取得する
 
-        # HDD ごとのセマフォがなければ作成
-        if drive_id not in cls._drive_semaphores:
-            # 同時に1つのタスクしか実行できないようにする
-            cls._drive_semaphores[drive_id] = asyncio.Semaphore(1)
+        Returns:
+            list[DriveIOScheduler]: DriveIOScheduler のリスト
+        """
+
+        return list(cls._drive_schedulers.values())
+
+
+    @staticmethod
+    def detectDevice(drive_id: str) -> tuple[str | None, bool | None, int]:
+        """
+        マウントポイントに対応するブロックデバイスを特定し、/sys/block から回転型のデバイスかどうかを判定する
+        RAID (md) や LVM (dm) などの場合は、構成するディスクを辿って判定する
+
+        Args:
+            drive_id (str): マウントポイント (Linux)
+
+        Returns:
+            tuple[str | None, bool | None, int]: (/proc/diskstats 上のブロックデバイス名, 回転型のデバイスかどうか, 構成するディスクの数)
+                (Windows やネットワークドライブなど、特定できない場合は (None, None, 1))
+        """
+
+        if psutil.WINDOWS:
+            return (None, None, 1)
+
+        try:
+            device = next((partition.device for partition in psutil.disk_partitions(all=True) if partition.mountpoint == drive_id), None)
+            if device is None or not device.startswith('/dev/'):
+                return (None, None, 1)
+            # /dev/mapper/* などのシンボリックリンクを dm-0 などの実体に解決する
+            device_name = os.path.basename(os.path.realpath(device))
+            if not os.path.exists(f'/sys/class/block/{device_name}'):
+                return (device_name, None, 1)
+
+            def CollectDisks(block_name: str) -> list[str]:
+                """ ブロックデバイスを構成する (パーティションではない) ディスクの名前を再帰的に取得する """
+                block_path = os.path.realpath(f'/sys/class/block/{block_name}')
+                # パーティションの場合は親のディスクを使う
+                if os.path.exists(os.path.join(block_path, 'partition')):
+                    block_path = os.path.dirname(block_path)
+                slaves_path = os.path.join(block_path, 'slaves')
+                slaves = os.listdir(slaves_path) if os.path.isdir(slaves_path) else []
+                if len(slaves) > 0:
+                    return [disk for slave in slaves for disk in CollectDisks(slave)]
+                return [os.path.basename(block_path)]
+
+            disks = sorted(set(CollectDisks(device_name)))
+            rotational_disks: list[str] = []
+            for disk in disks:
+                with open(f'/sys/block/{disk}/queue/rotational') as file:
+                    if file.read().strip() == '1':
+                        rotational_disks.append(disk)
+
+            # 1台でも回転型のディスクを含む場合は、回転型のデバイスとして扱う
+            if len(rotational_disks) > 0:
+                return (device_name, True, len(rotational_disks))
+            return (device_name, False, len(disks))
+
+        except Exception:
+            return (None, None, 1)
+
+
+    @classmethod
+    def getDiskIOCounters(cls) -> tuple[dict[str, Any], float]:
+        """
+        ブロックデバイスごとの I/O 統計情報を取得する
+        DriveIOScheduler.STATISTICS_INTERVAL_SECONDS 秒以内に取得済みの場合は、前回の結果を返す
+
+        Returns:
+            tuple[dict[str, Any], float]: (ブロックデバイス名と psutil の I/O 統計情報のマッピング, 取得した時刻 (time.monotonic() の値))
+        """
 
-        return cls._drive_semaphores[drive_id]
+        now = time.monotonic()
+        if cls._disk_io_counters_at is None or now - cls._disk_io_counters_at >= DriveIOScheduler.STATISTICS_INTERVAL_SECONDS:
+            try:
+                cls._disk_io_counters = psutil.disk_io_counters(perdisk=True, nowrap=True) or {}
+            except Exception:
+                cls._disk_io_counters = {}
+            cls._disk_io_counters_at = now
+        assert cls._disk_io_counters_at is not None
+        return cls._disk_io_counters, cls._disk_io_counters_at
 
 
 if __name__ == '__main__':
     print(DriveIOLimiter.getDriveID(anyio.Path(sys.argv[1])))
+    print(DriveIOLimiter.detectDevice(DriveIOLimiter.getDriveID(anyio.Path(sys.argv[1]))))
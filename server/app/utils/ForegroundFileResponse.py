@@ -0,0 +1,22 @@
+
+import anyio
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from app.utils.DriveIOLimiter import DriveIOLimiter
+
+
+class ForegroundFileResponse(FileResponse):
+    """
+    ファイルの送信中に、ファイルをフォアグラウンドで読み込んでいることを DriveIOLimiter に通知する FileResponse
+    録画ファイルのダウンロード中に、同じドライブ上で実行されるバックグラウンド解析よりもダウンロードを優先させるために使う
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        drive_io_scheduler = DriveIOLimiter.getScheduler(anyio.Path(self.path))
+        drive_io_scheduler.beginForegroundRead()
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            drive_io_scheduler.endForegroundRead()
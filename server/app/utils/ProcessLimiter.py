@@ -1,32 +1,213 @@
+from __future__ import annotations
 
 import asyncio
-from typing import ClassVar
+import time
+from dataclasses import dataclass
+from typing import Any, ClassVar
 
 import psutil
 
+from app import logging
+
+
+@dataclass(slots=True)
+class EncoderProgress:
+    """
+    ProcessLimiter.reportEncoderProgress() で報告されたエンコーダーの進捗
+    - target_fps: エンコーダーが実時間で処理するために必要なフレームレート
+    - window_started_at: 現在の計測区間の開始時刻 (time.monotonic() の値)
+    - window_frame_count: 現在の計測区間の開始時点でのエンコード済みフレーム数
+    - fps: 直近の計測区間で計測したエンコード速度 (まだ計測できていない場合は None)
+    - reported_at: 最後に進捗が報告された時刻 (time.monotonic() の値)
+    """
+
+    target_fps: float
+    window_started_at: float
+    window_frame_count: int
+    fps: float | None
+    reported_at: float
+
+
+class ProcessSemaphore:
+    """
+    外部プロセスの同時実行数を、CPU の空き具合とライブ視聴・録画番組の視聴のエンコードの状況に応じて増減させるセマフォ
+    - ライブ視聴のエンコーダーが実時間に追いつけていない場合や、録画番組の視聴でエンコードが完了していない HLS セグメントを
+      クライアントが待っている場合は、同時実行数を半分ずつ減らす (0 まで減らす)
+    - CPU 使用率が高い場合は同時実行数を1つずつ減らし、CPU に余裕がある場合は最大同時実行数まで1つずつ増やす
+    同時実行数を減らしても実行中のプロセスは中断されず、新たなプロセスの開始のみが待たされる
+    """
+
+    # CPU が混雑していると判断する CPU 使用率
+    CPU_BUSY_UTILIZATION: ClassVar[float] = 0.85
+
+    # CPU に余裕があると判断する CPU 使用率
+    CPU_IDLE_UTILIZATION: ClassVar[float] = 0.6
+
+    # 同時実行数を計算し直す間隔 (秒)
+    CAPACITY_UPDATE_INTERVAL_SECONDS: ClassVar[float] = 2.0
+
+    # プロセスの開始を待っている間に、同時実行数を計算し直す間隔 (秒)
+    CAPACITY_RECHECK_INTERVAL_SECONDS: ClassVar[float] = 1.0
+
+
+    def __init__(self, process_key: str, max_capacity: int) -> None:
+        """
+        セマフォを初期化する
+
+        Args:
+            process_key (str): プロセスを識別するキー
+            max_capacity (int): 負荷がないときに同時に実行できるプロセスの数
+        """
+
+        self.process_key = process_key
+        self.max_capacity = max_capacity
+
+        # 現在の同時実行数と、実行中のプロセスの数
+        self._capacity = max_capacity
+        self._capacity_updated_at: float | None = None
+        self._active_count = 0
+        self._released_event: asyncio.Event | None = None
+
+
+    @property
+    def capacity(self) -> int:
+        """ 現在の負荷で同時に実行できるプロセスの数 """
+        self.updateCapacity()
+        return self._capacity
+
+
+    def updateCapacity(self) -> None:
+        """
+        CPU 使用率とエンコードの状況から、同時実行数を増減させる
+        CAPACITY_UPDATE_INTERVAL_SECONDS 秒以内に計算済みの場合は何もしない
+        """
+
+        now = time.monotonic()
+        if self._capacity_updated_at is not None and now - self._capacity_updated_at < self.CAPACITY_UPDATE_INTERVAL_SECONDS:
+            return
+        self._capacity_updated_at = now
+
+        previous_capacity = self._capacity
+        cpu_utilization = ProcessLimiter.getCPUUtilization()
+
+        # ライブ視聴・録画番組の視聴のエンコードが追いついていない場合は、同時実行数を半分にする
+        ## 0 まで減らし、エンコードが追いつくまでは新たなプロセスを開始させない
+        if ProcessLimiter.isEncodeUnderPressure() is True:
+            self._capacity = self._capacity // 2
+        # CPU が混雑している場合は、同時実行数を1つ減らす
+        ## このセマフォで実行しているプロセス自体が CPU を使っていることもあるため、エンコードが追いついている限りは1つは実行できるようにする
+        elif cpu_utilization is not None and cpu_utilization >= self.CPU_BUSY_UTILIZATION:
+            self._capacity = max(self._capacity - 1, min(self._capacity, 1))
+        # CPU に余裕がある場合は、同時実行数を1つ増やす
+        ## 0 まで減らしていた場合は、CPU が混雑していなければ1つから再開する
+        elif (cpu_utilization is None or cpu_utilization < self.CPU_IDLE_UTILIZATION or self._capacity == 0):
+            self._capacity = min(self._capacity + 1, self.max_capacity)
+
+        if self._capacity != previous_capacity:
+            cpu_utilization_text = f'{cpu_utilization * 100:.0f}%' if cpu_utilization is not None else 'unknown'
+            logging.debug(
+                f'[ProcessLimiter] {self.process_key}: Capacity changed from {previous_capacity} to {self._capacity}. '
+                f'(CPU: {cpu_utilization_text})'
+            )
+            # 同時実行数が増えた場合は、開始を待っているプロセスを起こす
+            if self._capacity > previous_capacity and self._released_event is not None:
+                self._released_event.set()
+
+
+    def locked(self) -> bool:
+        """
+        新たなプロセスをすぐに開始できないかどうかを取得する
+
+        Returns:
+            bool: すぐに開始できない場合は True
+        """
+
+        return self._active_count >= self.capacity
+
+
+    async def acquire(self) -> None:
+        """
+        プロセスを開始できるようになるまで待つ
+        """
+
+        if self._released_event is None:
+            self._released_event = asyncio.Event()
+        # 同時実行数は CPU 使用率やエンコードの状況によって変わるため、定期的に計算し直す
+        while self._active_count >= self.capacity:
+            self._released_event.clear()
+            try:
+                await asyncio.wait_for(self._released_event.wait(), timeout=self.CAPACITY_RECHECK_INTERVAL_SECONDS)
+            except TimeoutError:
+                pass
+        self._active_count += 1
+
+
+    def release(self) -> None:
+        """
+        プロセスの終了を通知する
+        """
+
+        self._active_count -= 1
+        if self._released_event is not None:
+            self._released_event.set()
+
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.release()
+
 
 class ProcessLimiter:
     """
-    外部プロセスの同時実行数を CPU コア数の 50% に制限するためのユーティリティクラス
+    外部プロセスの同時実行数を、CPU の空き具合とライブ視聴・録画番組の視聴のエンコードの状況に応じて制限するためのユーティリティクラス
+    負荷がないときは CPU 論理コア数の 50% まで同時に実行できる
     """
 
-    # クラス変数として Semaphore の辞書を保持
+    # エンコーダーが実時間に追いつけていないと判断する、エンコード速度と必要なフレームレートの比
+    ENCODER_FPS_DEFICIT_RATIO: ClassVar[float] = 0.9
+
+    # エンコーダーのエンコード速度を計測する区間の長さ (秒)
+    ENCODER_FPS_WINDOW_SECONDS: ClassVar[float] = 5.0
+
+    # エンコーダーの進捗の報告が途絶えてから、その進捗を無視するまでの時間 (秒)
+    ENCODER_PROGRESS_EXPIRE_SECONDS: ClassVar[float] = 10.0
+
+    # CPU 使用率を計測し直す間隔 (秒)
+    CPU_STATISTICS_INTERVAL_SECONDS: ClassVar[float] = 2.0
+
+    # クラス変数として ProcessSemaphore の辞書を保持
     # key: プロセスを識別するキー
-    # value: そのプロセス用の Semaphore
-    _semaphores: ClassVar[dict[str, asyncio.Semaphore]] = {}
+    # value: そのプロセス用の ProcessSemaphore
+    _semaphores: ClassVar[dict[str, ProcessSemaphore]] = {}
+
+    # エンコーダーの進捗
+    # key: エンコーダーを識別するキー
+    # value: そのエンコーダーの進捗
+    _encoder_progresses: ClassVar[dict[str, EncoderProgress]] = {}
+
+    # エンコードが完了していない HLS セグメントを待っているクライアントの数
+    _encode_waiting_count: ClassVar[int] = 0
+
+    # 計測した CPU 使用率
+    _last_cpu_times: ClassVar[Any | None] = None
+    _last_cpu_times_at: ClassVar[float | None] = None
+    _cpu_utilization: ClassVar[float | None] = None
 
 
     @classmethod
-    def getSemaphore(cls, process_key: str) -> asyncio.Semaphore:
+    def getSemaphore(cls, process_key: str) -> ProcessSemaphore:
         """
-        指定されたプロセス用の Semaphore を取得する
-        初回呼び出し時に CPU 論理コア数の 50% の Semaphore を作成する
+        指定されたプロセス用の ProcessSemaphore を取得する
+        初回呼び出し時に、最大同時実行数を CPU 論理コア数の 50% とした ProcessSemaphore を作成する
 
         Args:
             process_key (str): プロセスを識別するキー
 
         Returns:
-            asyncio.Semaphore: 指定されたプロセス用の Semaphore
+            ProcessSemaphore: 指定されたプロセス用の ProcessSemaphore
         """
 
         if process_key not in cls._semaphores:
@@ -34,6 +215,130 @@ class ProcessLimiter:
             cpu_count = psutil.cpu_count(logical=True)
             if cpu_count is None:
                 cpu_count = 4  # 取得できない場合は4コアと仮定
-            # 同時実行数を CPU コア数の 50% に制限
-            cls._semaphores[process_key] = asyncio.Semaphore(cpu_count // 2)
+            # 最大同時実行数を CPU コア数の 50% に制限
+            ## シングルコアの環境でも1つは実行できるようにする
+            cls._semaphores[process_key] = ProcessSemaphore(process_key, max(cpu_count // 2, 1))
         return cls._semaphores[process_key]
+
+
+    @classmethod
+    def reportEncoderProgress(cls, encoder_key: str, frame_count: int, target_fps: float) -> None:
+        """
+        ライブ視聴のエンコーダーの進捗 (エンコード済みのフレーム数) を報告する
+        ENCODER_FPS_WINDOW_SECONDS 秒ごとにエンコード速度を計測し、必要なフレームレートを下回っている場合は
+        エンコードが追いついていないと判断して、ほかの外部プロセスの同時実行数を減らす
+
+        Args:
+            encoder_key (str): エンコーダーを識別するキー
+            frame_count (int): エンコーダーの起動からエンコード済みのフレーム数
+            target_fps (float): エンコーダーが実時間で処理するために必要なフレームレート
+        """
+
+        now = time.monotonic()
+        progress = cls._encoder_progresses.get(encoder_key)
+
+        # 初回の報告時やエンコーダーが再起動された場合は、計測区間を開始する
+        if progress is None or frame_count < progress.window_frame_count:
+            cls._encoder_progresses[encoder_key] = EncoderProgress(
+                target_fps = target_fps,
+                window_started_at = now,
+                window_frame_count = frame_count,
+                fps = None,
+                reported_at = now,
+            )
+            return
+
+        progress.target_fps = target_fps
+        progress.reported_at = now
+
+        # 計測区間が終わったら、その区間のエンコード速度を計測して次の計測区間を開始する
+        ## FFmpeg が出力する fps はエンコーダーの起動からの平均値のため、直近のエンコード速度の計測には使わない
+        elapsed = now - progress.window_started_at
+        if elapsed >= cls.ENCODER_FPS_WINDOW_SECONDS:
+            progress.fps = (frame_count - progress.window_frame_count) / elapsed
+            progress.window_started_at = now
+            progress.window_frame_count = frame_count
+
+
+    @classmethod
+    def clearEncoderProgress(cls, encoder_key: str) -> None:
+        """
+        ライブ視聴のエンコーダーの終了を通知し、報告された進捗を破棄する
+
+        Args:
+            encoder_key (str): エンコーダーを識別するキー
+        """
+
+        cls._encoder_progresses.pop(encoder_key, None)
+
+
+    @classmethod
+    def beginEncodeWait(cls) -> None:
+        """
+        録画番組の視聴で、クライアントがエンコードが完了していない HLS セグメントを待ち始めたことを通知する
+        endEncodeWait() が呼ばれるまで、ほかの外部プロセスの同時実行数を減らす
+        """
+
+        cls._encode_waiting_count += 1
+
+
+    @classmethod
+    def endEncodeWait(cls) -> None:
+        """
+        録画番組の視聴で、クライアントが待っていた HLS セグメントのエンコードが完了した (または待つのをやめた) ことを通知する
+        """
+
+        cls._encode_waiting_count = max(cls._encode_waiting_count - 1, 0)
+
+
+    @classmethod
+    def isEncodeUnderPressure(cls) -> bool:
+        """
+        ライブ視聴・録画番組の視聴のエンコードが追いついていないかどうかを取得する
+
+        Returns:
+            bool: エンコードが追いついていない場合は True
+        """
+
+        # 録画番組の視聴で、クライアントがエンコードの完了を待っている
+        if cls._encode_waiting_count > 0:
+            return True
+
+        # ライブ視聴のエンコーダーのエンコード速度が、必要なフレームレートを下回っている
+        now = time.monotonic()
+        for encoder_key, progress in list(cls._encoder_progresses.items()):
+            # 進捗の報告が途絶えているエンコーダーは無視する
+            if now - progress.reported_at > cls.ENCODER_PROGRESS_EXPIRE_SECONDS:
+                cls._encoder_progresses.pop(encoder_key, None)
+                continue
+            if progress.fps is not None and progress.fps < progress.target_fps * cls.ENCODER_FPS_DEFICIT_RATIO:
+                return True
+
+        return False
+
+
+    @classmethod
+    def getCPUUtilization(cls) -> float | None:
+        """
+        前回の計測からの CPU 時間の差分から、システム全体の CPU 使用率を取得する
+        CPU_STATISTICS_INTERVAL_SECONDS 秒以内に計測済みの場合は、前回計測した値を返す
+
+        Returns:
+            float | None: CPU 使用率 (0.0 ~ 1.0) (まだ計測できていない場合は None)
+        """
+
+        now = time.monotonic()
+        if cls._last_cpu_times_at is not None and now - cls._last_cpu_times_at < cls.CPU_STATISTICS_INTERVAL_SECONDS:
+            return cls._cpu_utilization
+
+        cpu_times = psutil.cpu_times()
+        if cls._last_cpu_times is not None:
+            # アイドル時間と I/O 待ち時間 (Linux のみ) 以外を CPU を使用していた時間とする
+            total_time = sum(cpu_times) - sum(cls._last_cpu_times)
+            idle_time = ((cpu_times.idle + getattr(cpu_times, 'iowait', 0.0)) -
+                         (cls._last_cpu_times.idle + getattr(cls._last_cpu_times, 'iowait', 0.0)))
+            if total_time > 0:
+                cls._cpu_utilization = min(max(1.0 - idle_time / total_time, 0.0), 1.0)
+        cls._last_cpu_times = cpu_times
+        cls._last_cpu_times_at = now
+        return cls._cpu_utilization
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Usage: poetry run python -m misc.KeyFrameAnalyzerBenchmark /path/to/recorded_file.ts
+
+import asyncio
+import multiprocessing
+import time
+from pathlib import Path
+
+import anyio
+import psutil
+import typer
+
+from app.config import LoadConfig
+from app.metadata.KeyFrameAnalyzer import KeyFrameAnalyzer
+from app.metadata.TSKeyFrameIndexer import TSKeyFrameIndexer
+
+
+app = typer.Typer()
+
+def run_ffprobe(file_path: str) -> None:
+    LoadConfig(bypass_validation=True)  # 一度実行しておかないと設定値を参照できない
+    key_frames = asyncio.run(KeyFrameAnalyzer(anyio.Path(file_path), 'MPEG-TS').analyzeKeyFramesWithFFprobe())
+    print(f'  keyframes: {len(key_frames) if key_frames is not None else "failed"}')
+
+def run_indexer(file_path: str) -> None:
+    key_frames = TSKeyFrameIndexer(file_path).index(is_final=True)
+    print(f'  keyframes: {len(key_frames)}')
+
+def measure(target, file_path: str) -> tuple[float, float]:
+    """ 別プロセスで target を実行し、経過時間 (秒) と子プロセス (ffprobe など) を含めたピーク RSS (MiB) を返す """
+
+    process = multiprocessing.Process(target=target, args=(file_path,))
+    start_time = time.perf_counter()
+    process.start()
+    assert process.pid is not None
+    ps_process = psutil.Process(process.pid)
+    peak_rss = 0
+    while process.is_alive():
+        try:
+            rss = ps_process.memory_info().rss
+            for child in ps_process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            peak_rss = max(peak_rss, rss)
+        except psutil.Error:
+            pass
+        time.sleep(0.02)
+    process.join()
+    return time.perf_counter() - start_time, peak_rss / 1024 / 1024
+
+@app.command()
+def main(
+    recorded_file_path: Path = typer.Argument(..., exists=True, file_okay=True, dir_okay=False, readable=True, resolve_path=True),
+    repeat: int = typer.Option(1, help='計測を繰り返す回数。'),
+):
+    file_size = recorded_file_path.stat().st_size / 1024 / 1024
+    print(f'File: {recorded_file_path} ({file_size:.1f} MiB)')
+
+    results: dict[str, list[tuple[float, float]]] = {'ffprobe': [], 'TSKeyFrameIndexer': []}
+    for index in range(repeat):
+        for name, target in (('ffprobe', run_ffprobe), ('TSKeyFrameIndexer', run_indexer)):
+            print(f'[{index + 1}/{repeat}] {name}:')
+            elapsed, peak_rss = measure(target, str(recorded_file_path))
+            print(f'  wall time: {elapsed:.2f} sec / peak RSS: {peak_rss:.1f} MiB')
+            results[name].append((elapsed, peak_rss))
+
+    print('-' * 30)
+    for name, values in results.items():
+        average_elapsed = sum(value[0] for value in values) / len(values)
+        max_peak_rss = max(value[1] for value in values)
+        print(f'{name}: {average_elapsed:.2f} sec (avg) / {file_size / average_elapsed:.1f} MiB/s / peak RSS {max_peak_rss:.1f} MiB (max)')
+
+if __name__ == '__main__':
+    app()
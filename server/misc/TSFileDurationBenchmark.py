@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Usage: poetry run python -m misc.TSFileDurationBenchmark /path/to/recorded_folder [/path/to/recorded_file.ts ...]
+
+import time
+from pathlib import Path
+
+import typer
+from biim.mpeg2ts import ts
+
+from app.config import LoadConfig
+from app.metadata.MetadataAnalyzer import MetadataAnalyzer
+
+
+app = typer.Typer()
+
+def run_legacy(file_path: Path, search_block_size: int = 1024 * 1024) -> tuple[float, int] | None:
+    """ NumPy 化する前の MetadataAnalyzer.__calculateTSFileDuration() と同等の、1バイト・1パケットずつ Python で処理する実装 """
+
+    file_size = file_path.stat().st_size
+    with file_path.open('rb') as f:
+        head_data = f.read(search_block_size)
+        if head_data and head_data[0] != ts.SYNC_BYTE[0]:
+            corrected_offset = None
+            for idx in range(len(head_data)):
+                if head_data[idx] == ts.SYNC_BYTE[0]:
+                    corrected_offset = idx
+                    break
+            if corrected_offset is None:
+                return None
+            head_data = head_data[corrected_offset:]
+
+        first_timestamp: float | None = None
+        for i in range(0, len(head_data), ts.PACKET_SIZE):
+            packet = head_data[i : i + ts.PACKET_SIZE]
+            if len(packet) < ts.PACKET_SIZE:
+                break
+            if packet[0] != ts.SYNC_BYTE[0]:
+                continue
+            pcr_val = ts.pcr(packet)
+            if pcr_val is not None:
+                first_timestamp = pcr_val / ts.HZ
+                break
+        if first_timestamp is None:
+            return None
+
+        block_check_size = 4096
+        low = 0
+        high = file_size
+        zero_boundary = file_size
+        while low <= high:
+            mid = (low + high) // 2
+            f.seek(mid)
+            candidate = f.read(block_check_size)
+            if candidate and all(byte == 0 for byte in candidate):
+                zero_boundary = mid
+                high = mid - 1
+            else:
+                low = mid + 1
+        valid_data_end = zero_boundary if zero_boundary < file_size else file_size
+
+        start_offset = max(valid_data_end - search_block_size, 0)
+        start_offset = (start_offset // ts.PACKET_SIZE) * ts.PACKET_SIZE
+        f.seek(start_offset)
+        tail_chunk = f.read(valid_data_end - start_offset)
+        offset_in_chunk = 0
+        if tail_chunk and tail_chunk[0] != ts.SYNC_BYTE[0]:
+            for idx in range(len(tail_chunk)):
+                if tail_chunk[idx] == ts.SYNC_BYTE[0]:
+                    offset_in_chunk = idx
+                    break
+        valid_pcrs: list[float] = []
+        for j in range(offset_in_chunk, len(tail_chunk) - ts.PACKET_SIZE + 1, ts.PACKET_SIZE):
+            packet = tail_chunk[j : j + ts.PACKET_SIZE]
+            if packet[0] != ts.SYNC_BYTE[0]:
+                continue
+            pcr_val = ts.pcr(packet)
+            if pcr_val is not None:
+                valid_pcrs.append(pcr_val / ts.HZ)
+        if not valid_pcrs:
+            return None
+
+        last_timestamp = valid_pcrs[-1]
+        if last_timestamp < first_timestamp:
+            last_timestamp += ts.PCR_CYCLE / ts.HZ
+        return (last_timestamp - first_timestamp, valid_data_end)
+
+def run_numpy(file_path: Path) -> tuple[float, int] | None:
+    """ NumPy で TS パケットの同期・PCR の抽出・ゼロ埋め領域の検出を行う現在の実装 """
+    return MetadataAnalyzer(file_path)._MetadataAnalyzer__calculateTSFileDuration()  # type: ignore
+
+def measure(target, file_path: Path, repeat: int) -> tuple[float, tuple[float, int] | None]:
+    """ target を repeat 回実行し、最短の経過時間 (秒) と結果を返す (ページキャッシュの影響を揃えるため最短値を使う) """
+
+    best_elapsed = float('inf')
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = target(file_path)
+        best_elapsed = min(best_elapsed, time.perf_counter() - start_time)
+    return best_elapsed, result
+
+@app.command()
+def main(
+    paths: list[Path] = typer.Argument(..., exists=True, resolve_path=True, help='録画ファイル、または録画ファイルを含むフォルダのパス。'),
+    repeat: int = typer.Option(3, help='ファイルごとに計測を繰り返す回数。'),
+):
+    LoadConfig(bypass_validation=True)  # 一度実行しておかないと設定値を参照できない
+
+    # 計測対象の録画ファイルを列挙する
+    file_paths: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            file_paths.extend(sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() in ('.ts', '.m2ts')))
+        else:
+            file_paths.append(path)
+    if len(file_paths) == 0:
+        print('No recorded files found.')
+        raise typer.Exit(1)
+
+    total_legacy_elapsed = 0.0
+    total_numpy_elapsed = 0.0
+    mismatch_count = 0
+    for index, file_path in enumerate(file_paths):
+        file_size = file_path.stat().st_size / 1024 / 1024
+        legacy_elapsed, legacy_result = measure(run_legacy, file_path, repeat)
+        numpy_elapsed, numpy_result = measure(run_numpy, file_path, repeat)
+        total_legacy_elapsed += legacy_elapsed
+        total_numpy_elapsed += numpy_elapsed
+
+        # 両者の結果 (再生時間と有効な TS データの終了位置) が一致するかを確認する
+        is_matched = (legacy_result == numpy_result) or (
+            legacy_result is not None and numpy_result is not None and
+            abs(legacy_result[0] - numpy_result[0]) < 1e-6 and legacy_result[1] == numpy_result[1]
+        )
+        if is_matched is False:
+            mismatch_count += 1
+        print(f'[{index + 1}/{len(file_paths)}] {file_path.name} ({file_size:.1f} MiB)')
+        print(f'  legacy: {legacy_elapsed * 1000:.2f} ms / numpy: {numpy_elapsed * 1000:.2f} ms / '
+              f'result: {numpy_result} {"(matched)" if is_matched else f"(MISMATCH: legacy {legacy_result})"}')
+
+    print('-' * 30)
+    print(f'files: {len(file_paths)} / mismatches: {mismatch_count}')
+    print(f'legacy: {total_legacy_elapsed:.3f} sec (total) / {total_legacy_elapsed / len(file_paths) * 1000:.2f} ms (avg)')
+    print(f'numpy: {total_numpy_elapsed:.3f} sec (total) / {total_numpy_elapsed / len(file_paths) * 1000:.2f} ms (avg)')
+    if total_numpy_elapsed > 0:
+        print(f'speedup: {total_legacy_elapsed / total_numpy_elapsed:.1f}x')
+
+if __name__ == '__main__':
+    app()